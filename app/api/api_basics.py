@@ -1,4 +1,5 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import inspect
 import io
 import os
 from typing import List, Optional
@@ -12,7 +13,15 @@ from embeddings.documents import KnowledgeDocument
 from knowledge_manager import KnowledgeManager
 from llms.chats import ChatManager, ChatOptions, StreamingChat
 from llms.model_config import ModelConfig
+from config_values import is_enabled_value
 from llms.image_description_service import ImageDescriptionService
+from api.stream_coalescing import (
+    StreamCoalescingConfig,
+    acoalesce,
+    coalesce,
+    is_json_content,
+    is_text_content,
+)
 from prompts.prompts import PromptList
 from prompts.inspirations import InspirationsManager
 
@@ -44,6 +53,16 @@ def streaming_media_type() -> str:
     return "text/event-stream"
 
 
+def use_async_streaming(chat_session, method_name: str) -> bool:
+    """
+    Async streaming runs the response body on the event loop instead of a threadpool worker.
+    Falls back to the sync generators when SYNC_STREAMING=true or the session has no async variant.
+    """
+    if os.environ.get("SYNC_STREAMING", "false").lower() == "true":
+        return False
+    return inspect.isasyncgenfunction(getattr(chat_session, method_name, None))
+
+
 def streaming_headers(chat_session_key_value=None):
     headers = {
         "Connection": "keep-alive",
@@ -56,6 +75,14 @@ def streaming_headers(chat_session_key_value=None):
     return headers
 
 
+# Knowledge chats also stream the time of each retrieval stage if a request sets this header
+DEBUG_TIMINGS_HEADER = "X-Haiven-Debug-Timings"
+
+
+def wants_debug_timings(request: Request) -> bool:
+    return is_enabled_value(request.headers.get(DEBUG_TIMINGS_HEADER))
+
+
 class HaivenBaseApi:
     def __init__(
         self,
@@ -63,10 +90,12 @@ class HaivenBaseApi:
         chat_manager: ChatManager,
         model_config: ModelConfig,
         prompt_list: PromptList,
+        stream_coalescing: StreamCoalescingConfig = None,
     ):
         self.chat_manager = chat_manager
         self.model_config = model_config
         self.prompt_list = prompt_list
+        self.stream_coalescing = stream_coalescing or StreamCoalescingConfig()
 
     def _is_api_key_auth(self, request):
         """Check if the request is using API key authentication."""
@@ -102,6 +131,22 @@ class HaivenBaseApi:
                 return hashed_user_id
         return None
 
+    def prompt_allows_response_cache(self, prompt_list, prompt_id) -> bool:
+        """Prompts can opt out of the LLM response cache with `cache_response: false` in their frontmatter"""
+        prompt = prompt_list.get(prompt_id) if prompt_id else None
+        if prompt is None:
+            return True
+        return prompt.metadata.get("cache_response", True) is not False
+
+    def coalesce_stream(self, body, chat_category: str, is_content):
+        """Buffer content events of the response body into fewer writes, if enabled for the endpoint"""
+        config = self.stream_coalescing.for_endpoint(chat_category)
+        if not config.enabled:
+            return body
+        if inspect.isasyncgen(body):
+            return acoalesce(body, config, is_content)
+        return coalesce(body, config, is_content)
+
     def stream_json_chat(
         self,
         prompt,
@@ -114,6 +159,7 @@ class HaivenBaseApi:
         origin_url=None,
         model_config=None,
         userContext=None,
+        cache_responses=True,
     ):
         """Stream JSON chat with simplified event handling"""
         try:
@@ -138,10 +184,31 @@ class HaivenBaseApi:
                     error_response = {"data": f"[ERROR]: {error_msg}"}
                     yield json.dumps(error_response)
 
+            async def astream_with_events(chat_session, prompt):
+                try:
+                    async for event_str in chat_session.arun(prompt):
+                        if isinstance(event_str, dict):
+                            yield json.dumps(event_str)
+                        else:
+                            yield str(event_str)
+
+                except Exception as error:
+                    error_msg = (
+                        str(error).strip()
+                        or "Error while the model was processing the input"
+                    )
+                    print(f"[ERROR]: {error_msg}")
+                    error_response = {"data": f"[ERROR]: {error_msg}"}
+                    yield json.dumps(error_response)
+
             chat_session_key_value, chat_session = self.chat_manager.json_chat(
                 model_config=model_config or self.model_config,
                 session_id=chat_session_key_value,
-                options=ChatOptions(in_chunks=True, category=chat_category),
+                options=ChatOptions(
+                    in_chunks=True,
+                    category=chat_category,
+                    cache_responses=cache_responses,
+                ),
                 contexts=contexts or [],
                 user_context=userContext,
             )
@@ -156,8 +223,14 @@ class HaivenBaseApi:
                 userContext,
             )
 
+            if use_async_streaming(chat_session, "arun"):
+                body = astream_with_events(chat_session, prompt)
+            else:
+                body = stream_with_events(chat_session, prompt)
+            body = self.coalesce_stream(body, chat_category, is_json_content)
+
             return StreamingResponse(
-                stream_with_events(chat_session, prompt),
+                body,
                 media_type=streaming_media_type(),
                 headers=streaming_headers(chat_session_key_value),
             )
@@ -198,6 +271,8 @@ class HaivenBaseApi:
         origin_url=None,
         userContext=None,
         model_config=None,
+        cache_responses=True,
+        debug_timings=False,
     ):
         """Stream text chat with simplified event handling"""
         try:
@@ -209,7 +284,9 @@ class HaivenBaseApi:
                         for (
                             event_str,
                             sources_markdown,
-                        ) in chat_session.run_with_document(document_keys, prompt):
+                        ) in chat_session.run_with_document(
+                            document_keys, prompt, debug_timings
+                        ):
                             # Ensure we're yielding strings, not dicts
                             if isinstance(event_str, dict):
                                 yield json.dumps(event_str)
@@ -232,10 +309,42 @@ class HaivenBaseApi:
                     print(f"[ERROR]: {error_msg}")
                     yield f"[ERROR]: {error_msg}"
 
+            async def astream_with_events(chat_session: StreamingChat, prompt):
+                try:
+                    if document_keys:
+                        async for (
+                            event_str,
+                            sources_markdown,
+                        ) in chat_session.arun_with_document(
+                            document_keys, prompt, debug_timings
+                        ):
+                            if isinstance(event_str, dict):
+                                yield json.dumps(event_str)
+                            else:
+                                yield str(event_str)
+                    else:
+                        async for event_str in chat_session.arun(prompt):
+                            if isinstance(event_str, dict):
+                                yield json.dumps(event_str)
+                            else:
+                                yield str(event_str)
+
+                except Exception as error:
+                    error_msg = (
+                        str(error).strip()
+                        or "Error while the model was processing the input"
+                    )
+                    print(f"[ERROR]: {error_msg}")
+                    yield f"[ERROR]: {error_msg}"
+
             chat_session_key_value, chat_session = self.chat_manager.streaming_chat(
                 model_config=model_config or self.model_config,
                 session_id=chat_session_key_value,
-                options=ChatOptions(in_chunks=True, category=chat_category),
+                options=ChatOptions(
+                    in_chunks=True,
+                    category=chat_category,
+                    cache_responses=cache_responses,
+                ),
                 contexts=contexts or [],
                 user_context=userContext,
             )
@@ -250,8 +359,14 @@ class HaivenBaseApi:
                 userContext,
             )
 
+            if use_async_streaming(chat_session, "arun"):
+                body = astream_with_events(chat_session, prompt)
+            else:
+                body = stream_with_events(chat_session, prompt)
+            body = self.coalesce_stream(body, chat_category, is_text_content)
+
             return StreamingResponse(
-                stream_with_events(chat_session, prompt),
+                body,
                 media_type=streaming_media_type(),
                 headers=streaming_headers(chat_session_key_value),
             )
@@ -273,8 +388,11 @@ class ApiBasics(HaivenBaseApi):
         config_service: ConfigService,
         disclaimer_and_guidelines: DisclaimerAndGuidelinesService,
         inspirations_manager: InspirationsManager,
+        stream_coalescing: StreamCoalescingConfig = None,
     ):
-        super().__init__(app, chat_manager, model_config, prompts_guided)
+        super().__init__(
+            app, chat_manager, model_config, prompts_guided, stream_coalescing
+        )
         self.knowledge_manager = knowledge_manager
         self.prompts_chat = prompts_chat
         self.image_service = image_service
@@ -422,6 +540,10 @@ class ApiBasics(HaivenBaseApi):
                 if prompt_data.json is True:
                     stream_fn = self.stream_json_chat
 
+                stream_options = {}
+                if stream_fn == self.stream_text_chat:
+                    stream_options["debug_timings"] = wants_debug_timings(request)
+
                 selected_model_config = self.model_config
                 if prompt_data.promptid:
                     prompt_obj = prompts.get(prompt_data.promptid)
@@ -449,6 +571,12 @@ class ApiBasics(HaivenBaseApi):
                     contexts=contexts,
                     userContext=data.userContext,
                     origin_url=origin_url,
+                    cache_responses=(
+                        self.prompt_allows_response_cache(prompts, promptid)
+                        if promptid
+                        else True
+                    ),
+                    **stream_options,
                 )
 
             except Exception as error:
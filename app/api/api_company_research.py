@@ -11,8 +11,12 @@ CONFIG_TO_PROMPT_MAPPING = {
 
 
 class ApiCompanyResearch(HaivenBaseApi):
-    def __init__(self, app, chat_session_memory, model_key, prompt_list):
-        super().__init__(app, chat_session_memory, model_key, prompt_list)
+    def __init__(
+        self, app, chat_session_memory, model_key, prompt_list, stream_coalescing=None
+    ):
+        super().__init__(
+            app, chat_session_memory, model_key, prompt_list, stream_coalescing
+        )
 
         @app.post("/api/research")
         async def company_research(request: Request):
@@ -4,8 +4,12 @@ from api.api_basics import HaivenBaseApi
 
 
 class ApiCreativeMatrix(HaivenBaseApi):
-    def __init__(self, app, chat_session_memory, model_key, prompt_list):
-        super().__init__(app, chat_session_memory, model_key, prompt_list)
+    def __init__(
+        self, app, chat_session_memory, model_key, prompt_list, stream_coalescing=None
+    ):
+        super().__init__(
+            app, chat_session_memory, model_key, prompt_list, stream_coalescing
+        )
 
         @app.get("/api/creative-matrix")
         async def creative_matrix(request: Request):
@@ -30,4 +34,7 @@ class ApiCreativeMatrix(HaivenBaseApi):
                 "creative-matrix",
                 origin_url=origin_url,
                 prompt_id="creative-matrix",
+                cache_responses=self.prompt_allows_response_cache(
+                    prompt_list, "guided-creative-matrix"
+                ),
             )
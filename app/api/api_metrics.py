@@ -0,0 +1,20 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from typing import Callable, Dict
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+
+class ApiMetrics:
+    def __init__(
+        self, app: FastAPI, metrics_sources: Dict[str, Callable[[], dict]] = None
+    ):
+        self.app = app
+        self.metrics_sources = metrics_sources or {}
+        self.register_endpoints()
+
+    def register_endpoints(self):
+        @self.app.get("/api/metrics")
+        async def get_metrics():
+            metrics = {name: source() for name, source in self.metrics_sources.items()}
+
+            return JSONResponse(content=metrics)
@@ -36,8 +36,12 @@ class ApiMultiStep(HaivenBaseApi):
             for pair in promptinput.scenarios
         ]
 
-    def __init__(self, app, chat_session_memory, model_key, prompt_list):
-        super().__init__(app, chat_session_memory, model_key, prompt_list)
+    def __init__(
+        self, app, chat_session_memory, model_key, prompt_list, stream_coalescing=None
+    ):
+        super().__init__(
+            app, chat_session_memory, model_key, prompt_list, stream_coalescing
+        )
 
         # - Input for frontend: a list of promptIds - first step, multiple prompt options for next step?
         # - First step always returns cards, which are then editable in the UI
@@ -4,8 +4,12 @@ from api.api_basics import HaivenBaseApi
 
 
 class ApiScenarios(HaivenBaseApi):
-    def __init__(self, app, chat_session_memory, model_key, prompt_list):
-        super().__init__(app, chat_session_memory, model_key, prompt_list)
+    def __init__(
+        self, app, chat_session_memory, model_key, prompt_list, stream_coalescing=None
+    ):
+        super().__init__(
+            app, chat_session_memory, model_key, prompt_list, stream_coalescing
+        )
 
         @app.get("/api/make-scenario")
         def make_scenario(request: Request):
@@ -22,10 +26,11 @@ class ApiScenarios(HaivenBaseApi):
             }
             detailed = request.query_params.get("detail") == "true"
 
+            prompt_choice = (
+                "guided-scenarios-detailed" if detailed else "guided-scenarios"
+            )
             prompt, _ = prompt_list.render_prompt(
-                prompt_choice="guided-scenarios-detailed"
-                if detailed
-                else "guided-scenarios",
+                prompt_choice=prompt_choice,
                 user_input="",
                 additional_vars=variables,
             )
@@ -36,4 +41,7 @@ class ApiScenarios(HaivenBaseApi):
                 prompt_id="scenarios",
                 user_identifier=self.get_hashed_user_id(request),
                 origin_url=origin_url,
+                cache_responses=self.prompt_allows_response_cache(
+                    prompt_list, prompt_choice
+                ),
             )
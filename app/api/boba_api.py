@@ -6,6 +6,7 @@ from api.api_scenarios import ApiScenarios
 from api.api_creative_matrix import ApiCreativeMatrix
 from api.api_company_research import ApiCompanyResearch
 from api.api_features import ApiFeatures
+from api.api_metrics import ApiMetrics
 from api.api_key_management import ApiKeyManagementAPI
 from llms.chats import (
     ChatManager,
@@ -29,8 +30,10 @@ class BobaApi:
         image_service: ImageDescriptionService,
         disclaimer_and_guidelines: DisclaimerAndGuidelinesService,
         api_key_auth_service: ApiKeyAuthService = None,
+        metrics_sources: dict = None,
     ):
         self.knowledge_manager = knowledge_manager
+        self.metrics_sources = metrics_sources or {}
         self.chat_manager = chat_manager
         self.config_service = config_service
         self.inspirations_manager = InspirationsManager()
@@ -43,6 +46,7 @@ class BobaApi:
             self.knowledge_manager.knowledge_base_markdown, self.knowledge_manager
         )
         self.model_config = self.config_service.get_chat_model()
+        self.stream_coalescing = self.config_service.load_stream_coalescing_config()
         self.image_service = image_service
         self.disclaimer_and_guidelines = disclaimer_and_guidelines
         print(f"Model used for guided mode: {self.model_config.id}")
@@ -59,32 +63,38 @@ class BobaApi:
             self.config_service,
             self.disclaimer_and_guidelines,
             self.inspirations_manager,
+            self.stream_coalescing,
         )
         ApiMultiStep(
             app,
             self.chat_manager,
             self.model_config,
             self.prompts_chat,
+            self.stream_coalescing,
         )
         ApiScenarios(
             app,
             self.chat_manager,
             self.model_config,
             self.prompts_guided,
+            self.stream_coalescing,
         )
         ApiCreativeMatrix(
             app,
             self.chat_manager,
             self.model_config,
             self.prompts_guided,
+            self.stream_coalescing,
         )
         ApiCompanyResearch(
             app,
             self.chat_manager,
             self.model_config,
             self.prompts_chat,
+            self.stream_coalescing,
         )
         ApiFeatures(app)
+        ApiMetrics(app, self.metrics_sources)
         # Only register API key management endpoints if API key auth is enabled
         if self.api_key_auth_service and self.config_service.is_api_key_auth_enabled():
             ApiKeyManagementAPI(app, self.api_key_auth_service, self.config_service)
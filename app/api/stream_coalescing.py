@@ -0,0 +1,178 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+
+class CoalescingConfig:
+    """
+    Content events are buffered until max_bytes are collected or the oldest one has waited
+    max_delay_ms, then sent as one write. 0 disables the respective limit, both 0 disables
+    coalescing.
+    """
+
+    def __init__(self, max_bytes: int = 0, max_delay_ms: float = 0):
+        self.max_bytes = max_bytes
+        self.max_delay_ms = max_delay_ms
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self.max_delay_ms > 0
+
+    @classmethod
+    def from_dict(cls, data, default: "CoalescingConfig" = None):
+        default = default or cls()
+        data = data or {}
+        max_bytes = data.get("max_bytes")
+        max_delay_ms = data.get("max_delay_ms")
+        return cls(
+            max_bytes=default.max_bytes if max_bytes in [None, ""] else int(max_bytes),
+            max_delay_ms=default.max_delay_ms
+            if max_delay_ms in [None, ""]
+            else float(max_delay_ms),
+        )
+
+
+class StreamCoalescingConfig:
+    """Coalescing settings per endpoint, keyed by the chat category of the endpoint"""
+
+    def __init__(
+        self,
+        default: CoalescingConfig = None,
+        endpoints: Dict[str, CoalescingConfig] = None,
+    ):
+        self.default = default or CoalescingConfig()
+        self.endpoints = endpoints or {}
+
+    def for_endpoint(self, chat_category: str) -> CoalescingConfig:
+        return self.endpoints.get(chat_category, self.default)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        default = CoalescingConfig.from_dict(data)
+        return cls(
+            default=default,
+            endpoints={
+                chat_category: CoalescingConfig.from_dict(settings, default)
+                for chat_category, settings in (data.get("endpoints") or {}).items()
+            },
+        )
+
+
+def is_text_content(event: str) -> bool:
+    """Streaming chat sends content as plain text, everything else is a named SSE event"""
+    return not event.startswith(("event: ", "[ERROR]: "))
+
+
+def is_json_content(event: str) -> bool:
+    return event.startswith('{"data": ') and not event.startswith('{"data": "[ERROR]')
+
+
+class _Buffer:
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.size = 0
+        self.started_at: Optional[float] = None
+
+    def add(self, data: bytes, now: float):
+        if not self.parts:
+            self.started_at = now
+        self.parts.append(data)
+        self.size += len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        self.size = 0
+        self.started_at = None
+        return data
+
+
+def coalesce(
+    events: Iterator[str],
+    config: CoalescingConfig,
+    is_content: Callable[[str], bool],
+) -> Iterator[bytes]:
+    """
+    Merge runs of content events into fewer, larger writes. Any other event flushes the
+    buffered content and is sent right away.
+
+    The sync variant can only look at the clock when the next event arrives, so a stalled
+    provider holds back what is buffered until it sends again. acoalesce() flushes on time.
+    """
+    max_delay_seconds = config.max_delay_ms / 1000
+    buffer = _Buffer()
+    for event in events:
+        data = event.encode("utf-8")
+        if not is_content(event):
+            if buffer.parts:
+                yield buffer.take()
+            yield data
+            continue
+
+        now = time.monotonic()
+        buffer.add(data, now)
+        if (config.max_bytes and buffer.size >= config.max_bytes) or (
+            max_delay_seconds and now - buffer.started_at >= max_delay_seconds
+        ):
+            yield buffer.take()
+
+    if buffer.parts:
+        yield buffer.take()
+
+
+async def acoalesce(
+    events: AsyncIterator[str],
+    config: CoalescingConfig,
+    is_content: Callable[[str], bool],
+) -> AsyncIterator[bytes]:
+    """Async variant of coalesce(), flushes buffered content once max_delay_ms have passed"""
+    loop = asyncio.get_running_loop()
+    max_delay_seconds = config.max_delay_ms / 1000
+    iterator = events.__aiter__()
+    buffer = _Buffer()
+    next_event = None
+    try:
+        while True:
+            if next_event is None:
+                # A task, so that a flush on time does not cancel the pending read
+                next_event = asyncio.ensure_future(iterator.__anext__())
+
+            timeout = None
+            if max_delay_seconds and buffer.parts:
+                timeout = max(0, buffer.started_at + max_delay_seconds - loop.time())
+            done, _ = await asyncio.wait({next_event}, timeout=timeout)
+            if not done:
+                yield buffer.take()
+                continue
+
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                next_event = None
+                break
+            next_event = None
+
+            data = event.encode("utf-8")
+            if not is_content(event):
+                if buffer.parts:
+                    yield buffer.take()
+                yield data
+                continue
+
+            buffer.add(data, loop.time())
+            if config.max_bytes and buffer.size >= config.max_bytes:
+                yield buffer.take()
+
+        if buffer.parts:
+            yield buffer.take()
+    finally:
+        if next_event is not None:
+            next_event.cancel()
+            try:
+                await next_event
+            except (asyncio.CancelledError, Exception):
+                pass
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
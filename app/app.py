@@ -1,9 +1,15 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 from api.boba_api import BobaApi
+from embeddings.query_cache import QueryEmbeddingCache
+from knowledge.pack_watcher import KnowledgePackWatcher
 from knowledge_manager import KnowledgeManager
 from llms.chats import ChatManager, ServerChatSessionMemory
 from llms.image_description_service import ImageDescriptionService
 from llms.clients import ChatClientFactory
+from llms.failover import CircuitBreaker
+from llms.rate_limiter import AdmissionController
+from llms.response_cache import ResponseCache
+from llms.single_flight import SingleFlight
 from llms.model_config import ModelConfig
 from prompts.prompts_factory import PromptsFactory
 from server import Server
@@ -26,12 +32,50 @@ class App:
         config_service = ConfigService(config_path)
 
         knowledge_pack_path = config_service.load_knowledge_pack_path()
-        knowledge_manager = KnowledgeManager(config_service=config_service)
+        metrics_sources = {}
+        query_embedding_cache = QueryEmbeddingCache.from_config(
+            config_service.load_query_embedding_cache_config()
+        )
+        if query_embedding_cache is not None:
+            metrics_sources["query_embedding_cache"] = query_embedding_cache.stats
+        knowledge_manager = KnowledgeManager(
+            config_service=config_service,
+            query_embedding_cache=query_embedding_cache,
+        )
+        retriever_cache = knowledge_manager.knowledge_base_documents.retriever_cache
+        if retriever_cache is not None:
+            metrics_sources["knowledge_indexes"] = retriever_cache.stats
+        metrics_sources["knowledge_search"] = (
+            knowledge_manager.knowledge_base_documents.search_executor.stats
+        )
 
         prompts_factory = PromptsFactory(knowledge_pack_path)
         disclaimer_and_guidelines = DisclaimerAndGuidelinesService(knowledge_pack_path)
         chat_session_memory = ServerChatSessionMemory()
-        llm_chat_factory = ChatClientFactory(config_service)
+        response_cache = ResponseCache.from_config(
+            config_service.load_llm_response_cache_config()
+        )
+        if response_cache is not None:
+            metrics_sources["llm_response_cache"] = response_cache.stats
+        admission_controller = AdmissionController(
+            config_service.load_rate_limit_config()
+        )
+        failover_config = config_service.load_failover_config()
+        circuit_breaker = CircuitBreaker.from_config(failover_config)
+        metrics_sources["llm_circuit_breaker"] = circuit_breaker.stats
+        single_flight = None
+        if config_service.is_llm_single_flight_enabled():
+            single_flight = SingleFlight()
+            metrics_sources["llm_single_flight"] = single_flight.stats
+        llm_chat_factory = ChatClientFactory(
+            config_service,
+            response_cache,
+            admission_controller,
+            circuit_breaker,
+            failover_config.hedge_after_seconds,
+            single_flight,
+            config_service.load_mock_load_profile(),
+        )
         chat_manager = ChatManager(
             config_service, chat_session_memory, llm_chat_factory, knowledge_manager
         )
@@ -44,19 +88,32 @@ class App:
             api_key_repository = self._create_api_key_repository(config_service)
             api_key_auth_service = ApiKeyAuthService(config_service, api_key_repository)
 
-        self.server = Server(
+        boba_api = BobaApi(
+            prompts_factory,
+            knowledge_manager,
             chat_manager,
             config_service,
+            image_service,
+            disclaimer_and_guidelines,
             api_key_auth_service,
-            BobaApi(
-                prompts_factory,
+            metrics_sources,
+        )
+
+        reload_config = config_service.load_knowledge_pack_reload_config()
+        if reload_config.enabled:
+            knowledge_pack_watcher = KnowledgePackWatcher(
                 knowledge_manager,
-                chat_manager,
-                config_service,
-                image_service,
-                disclaimer_and_guidelines,
-                api_key_auth_service,
-            ),
+                [boba_api.prompts_chat],
+                reload_config.interval_seconds,
+            )
+            metrics_sources["knowledge_pack_reload"] = knowledge_pack_watcher.stats
+            knowledge_pack_watcher.start()
+
+        self.server = Server(
+            chat_manager,
+            config_service,
+            api_key_auth_service,
+            boba_api,
         ).create()
 
     def launch_via_fastapi_wrapper(self):
@@ -0,0 +1,481 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+"""
+Latency and throughput benchmark of the streaming chat endpoints.
+
+Boots the full app (sessions, prompts, contexts, SSE formatting) in process against the
+synthetic mock provider and a synthetic knowledge pack, drives each endpoint at stepped
+concurrency and writes a JSON baseline that can be diffed between versions:
+
+    cd app && poetry run python -m benchmarks.chat_endpoints --output baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import anyio.to_thread
+import httpx
+import uvicorn
+import yaml
+
+from benchmarks.synthetic_pack import (
+    CHAT_PROMPT_ID,
+    create_synthetic_knowledge_pack,
+    write_benchmark_config,
+)
+
+DEFAULT_MOCK_AI = {
+    "seed": 1,
+    "time_to_first_token_seconds": {
+        "distribution": "lognormal",
+        "mean": 0.5,
+        "stddev": 0.2,
+    },
+    "tokens_per_second": {
+        "distribution": "normal",
+        "mean": 80,
+        "stddev": 20,
+        "min": 10,
+    },
+    "response_tokens": {
+        "distribution": "normal",
+        "mean": 150,
+        "stddev": 50,
+        "min": 20,
+    },
+    "chunk_tokens": 3,
+}
+
+
+def _prompt_request(index: int) -> dict:
+    return {
+        "method": "POST",
+        "url": "/api/prompt",
+        "json": {
+            "userinput": f"Benchmark request {index}: summarise our architecture",
+            "promptid": CHAT_PROMPT_ID,
+            "contexts": ["context_0"],
+        },
+    }
+
+
+def _follow_up_request(index: int) -> dict:
+    return {
+        "method": "POST",
+        "url": "/api/prompt/follow-up",
+        "json": {
+            "userinput": f"Benchmark request {index}: what are the risks?",
+            "promptid": CHAT_PROMPT_ID,
+            "scenarios": [
+                {"title": "Scenario", "content": "A scenario to follow up on"}
+            ],
+        },
+    }
+
+
+def _explore_request(index: int) -> dict:
+    return {
+        "method": "POST",
+        "url": "/api/prompt/explore",
+        "json": {
+            "userinput": f"Benchmark request {index}: tell me more",
+            "previous_framing": "Scenarios for a benchmark",
+            "first_step_input": "Benchmarking the chat endpoints",
+            "item": "The first scenario",
+        },
+    }
+
+
+def _make_scenario_request(index: int) -> dict:
+    return {
+        "method": "GET",
+        "url": "/api/make-scenario",
+        "params": {"input": f"benchmark request {index}", "num_scenarios": 3},
+    }
+
+
+def _creative_matrix_request(index: int) -> dict:
+    return {
+        "method": "GET",
+        "url": "/api/creative-matrix",
+        "params": {
+            "rows": f"benchmark {index}, teams",
+            "columns": "cost, speed",
+            "prompt": "How might we go faster?",
+        },
+    }
+
+
+# Every request is unique, so neither the response cache nor coalescing can skip work
+ENDPOINTS: Dict[str, Callable[[int], dict]] = {
+    "prompt": _prompt_request,
+    "prompt_follow_up": _follow_up_request,
+    "prompt_explore": _explore_request,
+    "make_scenario": _make_scenario_request,
+    "creative_matrix": _creative_matrix_request,
+}
+
+
+def percentiles(values: List[float]) -> Optional[dict]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cut_points = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "p50": round(cut_points[49], 4),
+        "p95": round(cut_points[94], 4),
+        "p99": round(cut_points[98], 4),
+    }
+
+
+def current_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as file:
+            resident_pages = int(file.read().split()[1])
+        return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    divisor = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def completion_tokens_from_stream(body: str) -> int:
+    for block in body.split("\n\n"):
+        if block.startswith("event: token_usage"):
+            data = block.split("data:", 1)[1].strip()
+            try:
+                return int(json.loads(data).get("completion_tokens", 0))
+            except ValueError:
+                return 0
+    return 0
+
+
+class ThreadpoolSampler:
+    """Samples how many of the worker threads that run sync endpoints and streams are busy"""
+
+    def __init__(self, interval_seconds: float = 0.05):
+        self.interval_seconds = interval_seconds
+        self.samples: List[int] = []
+        self.size = 0
+        self._task = None
+
+    async def _sample(self):
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        self.size = int(limiter.total_tokens)
+        while True:
+            self.samples.append(limiter.borrowed_tokens)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.ensure_future(self._sample())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        samples = self.samples or [0]
+        return {
+            "size": self.size,
+            "max_busy": max(samples),
+            "mean_busy": round(statistics.mean(samples), 2),
+            "saturated_fraction": round(
+                sum(1 for busy in samples if busy >= self.size) / len(samples), 4
+            ),
+        }
+
+
+async def timed_request(client: httpx.AsyncClient, request: dict) -> dict:
+    started_at = time.perf_counter()
+    time_to_first_byte = None
+    body = []
+    try:
+        async with client.stream(
+            request["method"],
+            request["url"],
+            json=request.get("json"),
+            params=request.get("params"),
+        ) as response:
+            async for text in response.aiter_text():
+                if time_to_first_byte is None and text:
+                    time_to_first_byte = time.perf_counter() - started_at
+                body.append(text)
+            status_code = response.status_code
+    except httpx.HTTPError as error:
+        return {"ok": False, "error": type(error).__name__}
+
+    completion_seconds = time.perf_counter() - started_at
+    text = "".join(body)
+    error = None
+    if status_code != 200:
+        error = f"HTTP {status_code}"
+    elif "[ERROR]" in text:
+        error = "error event"
+    completion_tokens = completion_tokens_from_stream(text)
+    streaming_seconds = completion_seconds - (time_to_first_byte or 0)
+    return {
+        "ok": error is None,
+        "error": error,
+        "ttfb_seconds": time_to_first_byte,
+        "completion_seconds": completion_seconds,
+        "tokens_per_second": completion_tokens / streaming_seconds
+        if completion_tokens and streaming_seconds > 0
+        else None,
+    }
+
+
+async def run_step(
+    client: httpx.AsyncClient,
+    build_request: Callable[[int], dict],
+    concurrency: int,
+    requests_per_worker: int,
+) -> dict:
+    counter = iter(range(concurrency * requests_per_worker))
+    results = []
+
+    async def worker():
+        for index in counter:
+            results.append(await timed_request(client, build_request(index)))
+
+    sampler = ThreadpoolSampler()
+    sampler.start()
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started_at
+    threadpool = await sampler.stop()
+
+    successful = [result for result in results if result["ok"]]
+    errors: Dict[str, int] = {}
+    for result in results:
+        if not result["ok"]:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": round(1 - len(successful) / len(results), 4) if results else 0,
+        "throughput_rps": round(len(results) / duration, 2),
+        "ttfb_seconds": percentiles(
+            [
+                result["ttfb_seconds"]
+                for result in successful
+                if result["ttfb_seconds"] is not None
+            ]
+        ),
+        "completion_seconds": percentiles(
+            [result["completion_seconds"] for result in successful]
+        ),
+        "tokens_per_second": percentiles(
+            [
+                result["tokens_per_second"]
+                for result in successful
+                if result["tokens_per_second"] is not None
+            ]
+        ),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "threadpool": threadpool,
+    }
+
+
+def max_sustainable_concurrency(
+    steps: List[dict], ttfb_slo_seconds: float, max_error_rate: float
+) -> int:
+    """The highest concurrency before the first step that breaks the TTFB SLO or error budget"""
+    sustainable = 0
+    for step in steps:
+        ttfb = step["ttfb_seconds"]
+        if (
+            ttfb is None
+            or ttfb["p95"] > ttfb_slo_seconds
+            or step["error_rate"] > max_error_rate
+        ):
+            break
+        sustainable = step["concurrency"]
+    return sustainable
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_app(work_dir: str, mock_ai: dict):
+    os.environ["MOCK_AI"] = "true"
+    os.environ["AUTH_SWITCHED_OFF"] = "true"
+    knowledge_pack_path = create_synthetic_knowledge_pack(
+        os.path.join(work_dir, "knowledge-pack")
+    )
+    config_path = write_benchmark_config(
+        os.path.join(work_dir, "config.yaml"), knowledge_pack_path, mock_ai
+    )
+
+    # Imported late, so the environment is set up before the app modules are loaded
+    from app import App
+
+    return App(config_path).launch_via_fastapi_wrapper()
+
+
+async def run_benchmark(
+    endpoints: List[str],
+    concurrency_steps: List[int],
+    requests_per_worker: int,
+    ttfb_slo_seconds: float,
+    max_error_rate: float,
+    mock_ai: dict,
+) -> dict:
+    with tempfile.TemporaryDirectory() as work_dir:
+        app = create_app(work_dir, mock_ai)
+        server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+        )
+        # Server and load generator share one event loop, so the sampled threadpool is the server's
+        server_task = asyncio.ensure_future(server.serve())
+        while not server.started:
+            if server_task.done():
+                server_task.result()
+            await asyncio.sleep(0.05)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        results = {}
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        try:
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}", timeout=300, limits=limits
+            ) as client:
+                for endpoint in endpoints:
+                    print(f"Benchmarking {endpoint}...")
+                    steps = []
+                    for concurrency in concurrency_steps:
+                        step = await run_step(
+                            client,
+                            ENDPOINTS[endpoint],
+                            concurrency,
+                            requests_per_worker,
+                        )
+                        print(
+                            f"  concurrency {concurrency}: p95 TTFB {step['ttfb_seconds'] and step['ttfb_seconds']['p95']}s, "
+                            f"error rate {step['error_rate']}"
+                        )
+                        steps.append(step)
+                    results[endpoint] = {
+                        "steps": steps,
+                        "max_sustainable_concurrency": max_sustainable_concurrency(
+                            steps, ttfb_slo_seconds, max_error_rate
+                        ),
+                    }
+        finally:
+            server.should_exit = True
+            await server_task
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency_steps": concurrency_steps,
+            "requests_per_worker": requests_per_worker,
+            "ttfb_slo_seconds": ttfb_slo_seconds,
+            "max_error_rate": max_error_rate,
+            "mock_ai": mock_ai,
+        },
+        "endpoints": results,
+    }
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--output", default="benchmark-results.json", help="Path of the JSON baseline"
+    )
+    parser.add_argument(
+        "--endpoints",
+        default=",".join(ENDPOINTS),
+        help=f"Comma separated subset of {', '.join(ENDPOINTS)}",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,5,10,25,50",
+        help="Comma separated concurrency steps",
+    )
+    parser.add_argument(
+        "--requests-per-worker",
+        type=int,
+        default=3,
+        help="Sequential requests each concurrent client sends per step",
+    )
+    parser.add_argument(
+        "--ttfb-slo",
+        type=float,
+        default=3.0,
+        help="p95 time to first byte in seconds a step has to stay under to be sustainable",
+    )
+    parser.add_argument(
+        "--max-error-rate",
+        type=float,
+        default=0.01,
+        help="Error rate a step has to stay under to be sustainable",
+    )
+    parser.add_argument(
+        "--mock-profile",
+        help="YAML or JSON file with a `mock_ai` load profile to use instead of the default",
+    )
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",")]
+    unknown_endpoints = [
+        endpoint for endpoint in endpoints if endpoint not in ENDPOINTS
+    ]
+    if unknown_endpoints:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown_endpoints)}")
+
+    mock_ai = DEFAULT_MOCK_AI
+    if args.mock_profile:
+        with open(args.mock_profile) as file:
+            mock_ai = yaml.safe_load(file) or {}
+
+    report = asyncio.run(
+        run_benchmark(
+            endpoints=endpoints,
+            concurrency_steps=[int(step) for step in args.concurrency.split(",")],
+            requests_per_worker=args.requests_per_worker,
+            ttfb_slo_seconds=args.ttfb_slo,
+            max_error_rate=args.max_error_rate,
+            mock_ai=mock_ai,
+        )
+    )
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+"""
+Micro-benchmark of the per-token overhead of streaming a response.
+
+Measures the CPU time each streamed delta costs between the provider and the response body:
+decoding the litellm chunk, formatting it for streaming or JSON chat and recording it in the
+chat memory. It compares the previous per-chunk path (attribute probing, a pydantic event
+per chunk, string concatenation in memory) with the current fast path:
+
+    cd app && poetry run python -m benchmarks.chunk_formatting --tokens 2000
+"""
+
+import argparse
+import json
+import time
+from types import SimpleNamespace
+from typing import Callable, List
+
+from litellm.types.utils import Delta, ModelResponseStream, StreamingChoices, Usage
+
+from llms.chat_events import ChatEventFormatter, create_content_event
+from llms.chats import JSONChat, StreamingChat, _AssistantReply
+from llms.clients import ChatClient, HaivenAIMessage
+from llms.model_config import ModelConfig
+
+WORDS = ["Lorem", " ipsum", " dolor", " sit", " amet", ",", " consectetur", " elit"]
+
+
+def provider_chunks(number_of_tokens: int) -> List[ModelResponseStream]:
+    """Chunks as litellm streams them, one token each, with usage on the last one"""
+    chunks = [
+        ModelResponseStream(
+            choices=[StreamingChoices(delta=Delta(content=WORDS[i % len(WORDS)]))]
+        )
+        for i in range(number_of_tokens)
+    ]
+    chunks.append(
+        ModelResponseStream(
+            choices=[StreamingChoices(delta=Delta(content=None))],
+            usage=Usage(
+                prompt_tokens=10,
+                completion_tokens=number_of_tokens,
+                total_tokens=10 + number_of_tokens,
+            ),
+        )
+    )
+    return chunks
+
+
+def _stream_state() -> dict:
+    return {"citations": None, "usage": None, "served_by": "benchmark/model"}
+
+
+def previous_path(chat_client: ChatClient, chunks: list, json_chat: bool) -> str:
+    """The per-chunk path before the fast path, kept as the baseline to compare against"""
+    stream_state = _stream_state()
+    message = HaivenAIMessage(content="")
+    for result in chunks:
+        content = chat_client._process_other_result(result, stream_state)
+        if content is None:
+            continue
+        chunk = {"content": content}
+        if json_chat and not content.strip():
+            continue
+        event = create_content_event(chunk.get("content", ""))
+        if json_chat:
+            ChatEventFormatter.format_for_json(event)
+        else:
+            ChatEventFormatter.format_for_streaming(event)
+        message.content += event.content
+    return message.content
+
+
+def fast_path(chat, chunks: list) -> str:
+    stream_state = _stream_state()
+    reply = _AssistantReply([])
+    for result in chunks:
+        content = chat.chat_client._process_result(result, stream_state)
+        if content is not None:
+            chat._process_chunk({"content": content}, reply)
+    reply.close()
+    return reply.message.content
+
+
+def microseconds_per_token(
+    run: Callable[[], str], number_of_tokens: int, repeats: int
+) -> float:
+    """Best of `repeats` runs, the least disturbed by the rest of the machine"""
+    timings = []
+    for _ in range(repeats):
+        started_at = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started_at)
+    return round(min(timings) / number_of_tokens * 1_000_000, 3)
+
+
+def run_benchmark(number_of_tokens: int, repeats: int) -> dict:
+    chunks = provider_chunks(number_of_tokens)
+    chat_client = ChatClient(ModelConfig("benchmark/model", "benchmark", "Benchmark"))
+    knowledge_manager = SimpleNamespace(
+        get_system_message=lambda: "",
+        knowledge_base_markdown=SimpleNamespace(
+            aggregate_all_contexts=lambda contexts, user_context: ""
+        ),
+    )
+    chats = {
+        "streaming_chat": StreamingChat(chat_client, knowledge_manager),
+        "json_chat": JSONChat(chat_client, knowledge_manager),
+    }
+
+    results = {}
+    for name, chat in chats.items():
+        json_chat = isinstance(chat, JSONChat)
+        expected = previous_path(chat_client, chunks, json_chat)
+        if fast_path(chat, chunks) != expected:
+            raise AssertionError(f"{name}: fast path recorded a different response")
+
+        before = microseconds_per_token(
+            lambda: previous_path(chat_client, chunks, json_chat),
+            number_of_tokens,
+            repeats,
+        )
+        after = microseconds_per_token(
+            lambda: fast_path(chat, chunks), number_of_tokens, repeats
+        )
+        results[name] = {
+            "before_us_per_token": before,
+            "after_us_per_token": after,
+            "speedup": round(before / after, 2),
+        }
+    return {"tokens": number_of_tokens, "repeats": repeats, "results": results}
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--tokens", type=int, default=2000, help="Tokens in the streamed response"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=20, help="Runs per path, the fastest counts"
+    )
+    parser.add_argument("--output", help="Optional path of a JSON report")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    report = run_benchmark(args.tokens, args.repeats)
+    for name, result in report["results"].items():
+        print(
+            f"{name}: {result['before_us_per_token']} -> {result['after_us_per_token']} "
+            f"us/token ({result['speedup']}x)"
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+"""
+Benchmark of the memory each worker needs for a knowledge document index.
+
+Writes a synthetic FAISS index, then starts --workers processes per loading mode that all
+load it at the same time, like uvicorn workers on one host. Reports per worker how much the
+load grew the resident set (RSS), its anonymous, process-private part, the proportional set
+size (PSS, shared pages split between the workers that map them), the load time and the
+time of the first search, which loads a lazily loaded docstore:
+
+    cd app && poetry run python -m benchmarks.index_memory --vectors 100000 --workers 4
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from embeddings.memory_mapped import load_memory_mapped
+
+MODES = ["in_memory", "memory_mapped"]
+
+
+def create_index(
+    folder_path: str, number_of_vectors: int, dimension: int, seed: int = 1
+) -> str:
+    vectors = np.random.default_rng(seed).random(
+        (number_of_vectors, dimension), dtype=np.float32
+    )
+    store = FAISS.from_embeddings(
+        [(f"chunk {index}", vector) for index, vector in enumerate(vectors.tolist())],
+        FakeEmbeddings(size=dimension),
+    )
+    store.save_local(folder_path)
+    return folder_path
+
+
+def memory_kb() -> Optional[Dict[str, int]]:
+    """Rss, Pss and Anonymous of this process in kB, from /proc (Linux only)"""
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            lines = file.readlines()
+    except OSError:
+        return None
+
+    values = {}
+    for line in lines:
+        name, _, rest = line.partition(":")
+        if name in ["Rss", "Pss", "Anonymous"]:
+            values[name] = int(rest.split()[0])
+    return values
+
+
+def load_index(folder_path: str, mode: str, dimension: int) -> FAISS:
+    embeddings = FakeEmbeddings(size=dimension)
+    if mode == "memory_mapped":
+        return load_memory_mapped(folder_path, embeddings)
+    return FAISS.load_local(
+        folder_path=folder_path,
+        embeddings=embeddings,
+        allow_dangerous_deserialization=True,
+    )
+
+
+def _worker(folder_path, mode, dimension, barrier, results):
+    before = memory_kb()
+    started_at = time.perf_counter()
+    store = load_index(folder_path, mode, dimension)
+    load_seconds = time.perf_counter() - started_at
+
+    query = store.index.reconstruct(0).tolist()
+    started_at = time.perf_counter()
+    found = store.similarity_search_with_score_by_vector(query, k=5)
+    first_search_seconds = time.perf_counter() - started_at
+    # Measure once every worker has loaded and searched the index
+    barrier.wait()
+    after = memory_kb()
+    results.put(
+        {
+            "load_seconds": load_seconds,
+            "first_search_seconds": first_search_seconds,
+            "rss_mb": (after["Rss"] - before["Rss"]) / 1024,
+            "private_mb": (after["Anonymous"] - before["Anonymous"]) / 1024,
+            "pss_mb": (after["Pss"] - before["Pss"]) / 1024,
+            "found": [document.page_content for document, _ in found],
+        }
+    )
+    barrier.wait()
+
+
+def measure_mode(folder_path: str, mode: str, dimension: int, workers: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_worker, args=(folder_path, mode, dimension, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    measurements: List[dict] = [results.get(timeout=300) for _ in processes]
+    for process in processes:
+        process.join()
+
+    def mean(name):
+        return round(sum(item[name] for item in measurements) / workers, 3)
+
+    return {
+        "rss_mb_per_worker": mean("rss_mb"),
+        "private_mb_per_worker": mean("private_mb"),
+        "pss_mb_per_worker": mean("pss_mb"),
+        "load_seconds": mean("load_seconds"),
+        "first_search_seconds": mean("first_search_seconds"),
+        "found": measurements[0]["found"],
+    }
+
+
+def run_benchmark(number_of_vectors: int, dimension: int, workers: int) -> dict:
+    if memory_kb() is None:
+        raise RuntimeError(
+            "This benchmark reads /proc/self/smaps_rollup, run it on Linux"
+        )
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        folder_path = create_index(
+            os.path.join(work_dir, "index.kb"), number_of_vectors, dimension
+        )
+        results = {
+            mode: measure_mode(folder_path, mode, dimension, workers) for mode in MODES
+        }
+
+    if results["in_memory"].pop("found") != results["memory_mapped"].pop("found"):
+        raise AssertionError("The memory-mapped index found different chunks")
+    return {
+        "vectors": number_of_vectors,
+        "dimension": dimension,
+        "index_mb": round(number_of_vectors * dimension * 4 / 1024 / 1024, 3),
+        "workers": workers,
+        "results": results,
+    }
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--vectors", type=int, default=100_000, help="Vectors in the index"
+    )
+    parser.add_argument(
+        "--dimension", type=int, default=1536, help="Dimension of the vectors"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Worker processes per loading mode"
+    )
+    parser.add_argument("--output", help="Optional path of a JSON report")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    report = run_benchmark(args.vectors, args.dimension, args.workers)
+    print(
+        f"{report['vectors']} vectors x {report['dimension']} ({report['index_mb']} MB), "
+        f"{report['workers']} workers"
+    )
+    for mode, result in report["results"].items():
+        print(
+            f"{mode}: RSS {result['rss_mb_per_worker']} MB, private "
+            f"{result['private_mb_per_worker']} MB, PSS {result['pss_mb_per_worker']} MB "
+            f"per worker, loaded in {result['load_seconds']} s, first search in "
+            f"{result['first_search_seconds']} s"
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
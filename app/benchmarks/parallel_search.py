@@ -0,0 +1,194 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+"""
+Benchmark of searching knowledge documents one after another and in parallel.
+
+Writes 16 synthetic FAISS indexes of --vectors vectors to a temporary knowledge pack and loads
+it. Then searches --queries random queries in 1, 4 and 16 of the documents, serially and with
+the search executor on --threads threads, and reports the mean and p95 latency and the speedup
+of every fan-out. Run it on a host with several cores:
+
+    cd app && poetry run python -m benchmarks.parallel_search --vectors 20000 --threads 8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.chat_endpoints import percentiles
+from benchmarks.index_memory import create_index
+from embeddings.model import EmbeddingModel
+from knowledge.documents import KnowledgeBaseDocuments
+from knowledge.search_config import KnowledgeSearchConfig
+
+FAN_OUTS = [1, 4, 16]
+
+
+class _BenchmarkEmbeddingsClient:
+    """Loads the indexes like EmbeddingsClient, without an embeddings provider"""
+
+    embedding_model = EmbeddingModel(
+        id="benchmark-embeddings", name="Benchmark", provider="benchmark"
+    )
+
+    def __init__(self, dimension: int):
+        self._embeddings = FakeEmbeddings(size=dimension)
+
+    def generate_from_filesystem(self, kb_folder_path):
+        return FAISS.load_local(
+            folder_path=str(kb_folder_path),
+            embeddings=self._embeddings,
+            allow_dangerous_deserialization=True,
+        )
+
+
+def create_knowledge_pack(
+    folder_path: str, number_of_documents: int, number_of_vectors: int, dimension: int
+) -> str:
+    for number in range(number_of_documents):
+        key = f"document-{number}"
+        create_index(
+            os.path.join(folder_path, f"{key}.kb"),
+            number_of_vectors,
+            dimension,
+            seed=number,
+        )
+        with open(os.path.join(folder_path, f"{key}.md"), "w") as file:
+            file.write(
+                f"---\nkey: {key}\ntitle: {key}\npath: {key}.kb\nprovider: benchmark\n---\n"
+            )
+    return folder_path
+
+
+def load_documents(
+    folder_path: str, dimension: int, threads: int
+) -> KnowledgeBaseDocuments:
+    knowledge_base_documents = KnowledgeBaseDocuments(
+        None,
+        _BenchmarkEmbeddingsClient(dimension),
+        KnowledgeSearchConfig(search_threads=threads),
+    )
+    knowledge_base_documents.load_documents_for_base(folder_path)
+    return knowledge_base_documents
+
+
+def measure(
+    knowledge_base_documents: KnowledgeBaseDocuments,
+    queries: np.ndarray,
+    document_keys: List[str],
+    k: int,
+) -> dict:
+    latencies = []
+    found = []
+    for query in queries:
+        started_at = time.perf_counter()
+        results = (
+            knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+                query.tolist(), document_keys, k
+            )
+        )
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        found.append([document.page_content for document in results])
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p95_ms": round(percentiles(latencies)["p95"], 3),
+        "found": found,
+    }
+
+
+def run_benchmark(
+    number_of_vectors: int,
+    dimension: int,
+    threads: int,
+    number_of_queries: int = 50,
+    k: int = 5,
+    fan_outs: List[int] = None,
+) -> dict:
+    fan_outs = fan_outs or FAN_OUTS
+    queries = np.random.default_rng(0).random(
+        (number_of_queries, dimension), dtype=np.float32
+    )
+    with tempfile.TemporaryDirectory() as work_dir:
+        folder_path = create_knowledge_pack(
+            work_dir, max(fan_outs), number_of_vectors, dimension
+        )
+        modes = {
+            "serial": load_documents(folder_path, dimension, threads=1),
+            "parallel": load_documents(folder_path, dimension, threads=threads),
+        }
+
+    results = {}
+    for fan_out in fan_outs:
+        document_keys = [f"document-{number}" for number in range(fan_out)]
+        measurements = {
+            mode: measure(knowledge_base_documents, queries, document_keys, k)
+            for mode, knowledge_base_documents in modes.items()
+        }
+        if measurements["serial"].pop("found") != measurements["parallel"].pop("found"):
+            raise AssertionError("The parallel search found different chunks")
+        measurements["speedup"] = round(
+            measurements["serial"]["mean_ms"]
+            / max(measurements["parallel"]["mean_ms"], 1e-9),
+            2,
+        )
+        results[fan_out] = measurements
+
+    modes["parallel"].search_executor.shutdown()
+    return {
+        "vectors_per_document": number_of_vectors,
+        "dimension": dimension,
+        "threads": threads,
+        "cpus": os.cpu_count(),
+        "queries": number_of_queries,
+        "results": results,
+    }
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--vectors", type=int, default=20_000, help="Vectors in every document index"
+    )
+    parser.add_argument(
+        "--dimension", type=int, default=1536, help="Dimension of the vectors"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Threads of the parallel search",
+    )
+    parser.add_argument(
+        "--queries", type=int, default=50, help="Queries per fan-out and mode"
+    )
+    parser.add_argument("--output", help="Optional path of a JSON report")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    report = run_benchmark(args.vectors, args.dimension, args.threads, args.queries)
+    print(
+        f"{report['vectors_per_document']} vectors x {report['dimension']} per document, "
+        f"{report['threads']} threads on {report['cpus']} CPUs"
+    )
+    for fan_out, result in report["results"].items():
+        print(
+            f"{fan_out} documents: serial {result['serial']['mean_ms']} ms "
+            f"(p95 {result['serial']['p95_ms']} ms), parallel "
+            f"{result['parallel']['mean_ms']} ms (p95 {result['parallel']['p95_ms']} ms), "
+            f"speedup {result['speedup']}x"
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+
+import yaml
+
+CHAT_PROMPT_ID = "benchmark-chat"
+
+LOREM_IPSUM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt "
+    "ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco "
+    "laboris nisi ut aliquip ex ea commodo consequat."
+)
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+def create_synthetic_knowledge_pack(root_dir: str, number_of_contexts: int = 3) -> str:
+    """
+    Write a small knowledge pack with contexts, a system message and a chat prompt to root_dir.
+    It has no knowledge documents, as searching those needs a live embeddings provider.
+    """
+    _write(
+        os.path.join(root_dir, "prompts", "system.md"),
+        "You are a helpful assistant for a software delivery team.",
+    )
+    _write(
+        os.path.join(root_dir, "prompts", "chat", f"{CHAT_PROMPT_ID}.md"),
+        f"""---
+identifier: {CHAT_PROMPT_ID}
+title: Benchmark chat prompt
+categories: ["benchmark"]
+grounded: false
+---
+Help me with the following request. {{user_input}}
+
+{{context}}
+""",
+    )
+    for index in range(number_of_contexts):
+        _write(
+            os.path.join(root_dir, "contexts", f"context_{index}.md"),
+            f"""---
+title: Benchmark context {index}
+---
+
+{" ".join([LOREM_IPSUM] * 20)}
+""",
+        )
+    return root_dir
+
+
+def write_benchmark_config(
+    config_path: str, knowledge_pack_path: str, mock_ai: dict
+) -> str:
+    """Write a config.yaml that serves one mock model with the given `mock_ai` load profile"""
+    model = {
+        "id": "benchmark-model",
+        "name": "Synthetic benchmark model",
+        "provider": "benchmark",
+        "features": ["text-generation", "image-to-text"],
+    }
+    config = {
+        "application_name": "Haiven benchmark",
+        "knowledge_pack_path": knowledge_pack_path,
+        "enabled_providers": "benchmark",
+        "default_models": {
+            "chat": model["id"],
+            "vision": model["id"],
+            "embeddings": "benchmark-embeddings",
+        },
+        "models": [model],
+        "embeddings": [
+            {
+                "id": "benchmark-embeddings",
+                "name": "Unused embeddings, the pack has no documents",
+                "provider": "ollama",
+                "config": {"model": "benchmark"},
+            }
+        ],
+        # Every benchmark request is unique, coalescing could only hide load
+        "llm_single_flight": {"enabled": False},
+        "mock_ai": {"load_test": True, **mock_ai},
+    }
+    with open(config_path, "w") as file:
+        yaml.safe_dump(config, file)
+    return config_path
@@ -0,0 +1,96 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+import threading
+import time
+from typing import Optional
+
+
+class CacheDirectory:
+    """
+    The on-disk tier of a cache, one file per entry.
+
+    The directory holds at most max_files entries, the least recently modified files are deleted
+    first, and with max_age_seconds files older than that are deleted as well. Pruning scans the
+    directory, so it only runs once the writes since the last scan can exceed max_files (down to
+    90% of it, so it does not run again on the next write), or max_age_seconds after the last one.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        suffix: str,
+        max_files: int,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.path = path
+        self.suffix = suffix
+        self.max_files = max_files
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._pruning = False
+        os.makedirs(self.path, exist_ok=True)
+        self._files = 0
+        self._pruned_at = 0.0
+        self.prune()
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name + self.suffix)
+
+    def written(self):
+        """Counts a written entry, and prunes the directory if it is due"""
+        with self._lock:
+            self._files += 1
+            if self._pruning or not self._prune_due():
+                return
+            self._pruning = True
+        try:
+            self.prune()
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def prune(self):
+        now = time.time()
+        files = []
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(self.suffix):
+                        continue
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        # Deleted since the directory was listed
+                        continue
+        except OSError as error:
+            print(f"[WARNING]: Could not prune the cache in {self.path}: {error}")
+            return
+
+        keep = (
+            self.max_files if len(files) <= self.max_files else self.max_files * 9 // 10
+        )
+        kept = 0
+        for modified_at, file_path in sorted(files, reverse=True):
+            expired = (
+                self.max_age_seconds is not None
+                and now - modified_at > self.max_age_seconds
+            )
+            if kept < keep and not expired:
+                kept += 1
+                continue
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._files = kept
+            self._pruned_at = now
+
+    def _prune_due(self) -> bool:
+        if self._files > self.max_files:
+            return True
+        return (
+            self.max_age_seconds is not None
+            and time.time() - self._pruned_at > self.max_age_seconds
+        )
@@ -5,10 +5,24 @@ from typing import List
 
 import yaml
 from dotenv import load_dotenv
+from config_values import is_enabled_value
 from knowledge.pack import KnowledgePackError
 from llms.model_config import ModelConfig
 from llms.default_models import DefaultModels
+from api.stream_coalescing import StreamCoalescingConfig
+from llms.context_packing import ContextPackingConfig
+from llms.memory_budget import MemoryBudgetConfig
+from llms.query_rewrite import QueryRewriteConfig
+from llms.failover import FailoverConfig
+from llms.mock_load_profile import MockLoadProfile
+from llms.rate_limiter import RateLimitConfig
+from llms.response_cache import ResponseCacheConfig
 from embeddings.model import EmbeddingModel
+from embeddings.query_cache import QueryEmbeddingCacheConfig
+from embeddings.db_config import EmbeddingsDBConfig
+from knowledge.loading_config import KnowledgeLoadingConfig
+from knowledge.reload_config import KnowledgePackReloadConfig
+from knowledge.search_config import KnowledgeSearchConfig
 import re
 
 
@@ -156,6 +170,44 @@ class ConfigService:
 
         return knowledge_pack_path
 
+    def load_embeddings_db_config(self) -> EmbeddingsDBConfig:
+        """
+        Load where the vectors of the knowledge documents are stored and searched.
+
+        Returns:
+            EmbeddingsDBConfig: The embeddings DB settings, local FAISS indexes if the `embeddings_db` block is missing.
+        """
+        return EmbeddingsDBConfig.from_dict(self.data.get("embeddings_db"))
+
+    def load_knowledge_loading_config(self) -> KnowledgeLoadingConfig:
+        """
+        Load how the indexes of the knowledge documents are loaded.
+
+        Returns:
+            KnowledgeLoadingConfig: The loading settings, indexes are read into memory if the `knowledge_loading` block is missing.
+        """
+        return KnowledgeLoadingConfig.from_dict(self.data.get("knowledge_loading"))
+
+    def load_knowledge_search_config(self) -> KnowledgeSearchConfig:
+        """
+        Load how the knowledge documents are searched.
+
+        Returns:
+            KnowledgeSearchConfig: The search settings, one index per document if the `knowledge_search` block is missing.
+        """
+        return KnowledgeSearchConfig.from_dict(self.data.get("knowledge_search"))
+
+    def load_knowledge_pack_reload_config(self) -> KnowledgePackReloadConfig:
+        """
+        Load whether changes to the knowledge pack are reloaded without a restart.
+
+        Returns:
+            KnowledgePackReloadConfig: The reload settings, the knowledge pack is only loaded at startup if the `knowledge_pack_reload` block is missing.
+        """
+        return KnowledgePackReloadConfig.from_dict(
+            self.data.get("knowledge_pack_reload")
+        )
+
     def load_enabled_providers(self) -> List[str]:
         """
         Load the enabled providers from the specified YAML configuration file.
@@ -216,6 +268,111 @@ class ConfigService:
                     default_chat_model = "ollama-local-llama3"
         return default_chat_model
 
+    def load_llm_response_cache_config(self) -> ResponseCacheConfig:
+        """
+        Load the settings of the exact-match LLM response cache.
+
+        Returns:
+            ResponseCacheConfig: The cache settings, disabled if the `llm_response_cache` block is missing.
+        """
+        return ResponseCacheConfig.from_dict(self.data.get("llm_response_cache"))
+
+    def load_query_embedding_cache_config(self) -> QueryEmbeddingCacheConfig:
+        """
+        Load the settings of the cache for the embedding vectors of search queries.
+
+        Returns:
+            QueryEmbeddingCacheConfig: The cache settings, disabled if the `query_embedding_cache` block is missing.
+        """
+        return QueryEmbeddingCacheConfig.from_dict(
+            self.data.get("query_embedding_cache")
+        )
+
+    def is_llm_single_flight_enabled(self) -> bool:
+        """
+        Check if identical concurrent LLM requests should share one upstream generation.
+
+        Returns:
+            bool: True unless `llm_single_flight.enabled` is set to false.
+        """
+        single_flight = self.data.get("llm_single_flight") or {}
+        return is_enabled_value(single_flight.get("enabled", True))
+
+    def load_rate_limit_config(self) -> RateLimitConfig:
+        """
+        Load the rate limit budgets and admission settings for the model providers.
+
+        Returns:
+            RateLimitConfig: The admission settings, without any budgets if the `rate_limits` block is missing.
+        """
+        return RateLimitConfig.from_dict(self.data.get("rate_limits"))
+
+    def load_failover_config(self) -> FailoverConfig:
+        """
+        Load the circuit breaker and hedging settings used when failing over to fallback models.
+
+        Returns:
+            FailoverConfig: The failover settings, with hedging disabled if the `failover` block is missing.
+        """
+        return FailoverConfig.from_dict(self.data.get("failover"))
+
+    def load_mock_load_profile(self) -> MockLoadProfile:
+        """
+        Load the behaviour of the synthetic provider that is used when MOCK_AI is set.
+
+        Returns:
+            MockLoadProfile: The mock provider settings, an instant fixed response if the `mock_ai` block is missing.
+        """
+        return MockLoadProfile.from_dict(self.data.get("mock_ai"))
+
+    def load_memory_budget(self, model_config: ModelConfig) -> MemoryBudgetConfig:
+        """
+        Load the token budget for the conversation history sent to a model.
+
+        Args:
+            model_config (ModelConfig): The model, its `memory_budget` overrides the `conversation_memory` defaults.
+
+        Returns:
+            MemoryBudgetConfig: The budget, unlimited if neither sets max_tokens.
+        """
+        default = MemoryBudgetConfig.from_dict(self.data.get("conversation_memory"))
+        return MemoryBudgetConfig.from_dict(
+            getattr(model_config, "memory_budget", None), default
+        )
+
+    def load_context_packing(self, model_config: ModelConfig) -> ContextPackingConfig:
+        """
+        Load how the chunks found for a knowledge chat are packed into the prompt of a model.
+
+        Args:
+            model_config (ModelConfig): The model, its `context_packing` overrides the `context_packing` defaults.
+
+        Returns:
+            ContextPackingConfig: The packing settings, all chunks are added as they are if neither enables it.
+        """
+        default = ContextPackingConfig.from_dict(self.data.get("context_packing"))
+        return ContextPackingConfig.from_dict(
+            getattr(model_config, "context_packing", None), default
+        )
+
+    def load_query_rewrite_config(self) -> QueryRewriteConfig:
+        """
+        Load how knowledge chat rewrites user messages into search queries.
+
+        Returns:
+            QueryRewriteConfig: The rewrite settings, a full conversation rewrite if the `query_rewrite` block is missing.
+        """
+        return QueryRewriteConfig.from_dict(self.data.get("query_rewrite"))
+
+    def load_stream_coalescing_config(self) -> StreamCoalescingConfig:
+        """
+        Load how content events of streamed responses are buffered into fewer writes, per endpoint.
+
+        Returns:
+            StreamCoalescingConfig: The coalescing settings, disabled if the `stream_coalescing` block is missing.
+        """
+        return StreamCoalescingConfig.from_dict(self.data.get("stream_coalescing"))
+
     def load_api_key_repository_type(self) -> str:
         repo_config = self.data.get("api_key_repository", {})
         repo_type = repo_config.get("type")
@@ -350,7 +507,7 @@ def _resolve_config_list_values(config, key, value):
 
 
 def _replace_by_env_var(value):
-    if value is None:
+    if value is None or not isinstance(value, str):
         return value
 
     # Use regex to find all ${ENV_VAR} patterns and replace them with their values
@@ -0,0 +1,8 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+
+
+def is_enabled_value(value) -> bool:
+    """Whether a config value, e.g. an unset or substituted ${ENV_VAR}, switches something on"""
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ["true", "1", "yes", "on"]
@@ -0,0 +1,34 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class EmbeddingsBackend(ABC):
+    """Abstract interface for where the vectors of the knowledge documents are stored and searched."""
+
+    # Backends that can search several documents with one query implement search
+    searches_across_documents = False
+
+    @abstractmethod
+    def load_retriever(self, document_key: str, kb_path: str):
+        """
+        Makes the embeddings saved at kb_path searchable as the given document. Returns its
+        retriever, which is searched with similarity_search_with_score_by_vector like a FAISS store.
+        """
+        pass
+
+    def search(
+        self,
+        embedding: List[float],
+        document_keys: List[str],
+        k: int,
+        score_threshold: float = None,
+        with_vectors: bool = False,
+    ) -> list:
+        """
+        The k best chunks of all given documents, best first, as (Document, score) tuples, or
+        (Document, score, vector) with_vectors.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not search across documents"
+        )
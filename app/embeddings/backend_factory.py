@@ -0,0 +1,25 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from embeddings.backend import EmbeddingsBackend
+from embeddings.client import EmbeddingsClient
+from embeddings.db_config import EmbeddingsDBConfig
+
+
+def create_embeddings_backend(
+    config: EmbeddingsDBConfig, embeddings_client: EmbeddingsClient
+) -> EmbeddingsBackend:
+    """
+    Creates the backend of the configured embeddings_db type.
+
+    Raises:
+        NotImplementedError: If the type is not implemented.
+    """
+    if config.type == "faiss":
+        from embeddings.faiss_backend import FaissBackend
+
+        return FaissBackend(embeddings_client)
+    elif config.type == "qdrant":
+        from embeddings.qdrant_backend import QdrantBackend
+
+        return QdrantBackend.from_config(config, embeddings_client)
+
+    raise NotImplementedError(f"Embeddings DB type '{config.type}' is not implemented.")
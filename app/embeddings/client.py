@@ -1,17 +1,31 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 import os
+from typing import List
 
 from langchain_community.embeddings import BedrockEmbeddings, OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from embeddings.compact_docstore import load_compact
+from embeddings.memory_mapped import load_memory_mapped
 from embeddings.model import EmbeddingModel
+from embeddings.query_cache import QueryEmbeddingCache
+from knowledge.retrieval_trace import RetrievalTrace
 
 
 class EmbeddingsClient:
     CONST_INVALID_CONFIG_ERROR = "Invalid config for the given embedding model"
 
-    def __init__(self, embedding_model: EmbeddingModel):
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel,
+        query_cache: QueryEmbeddingCache = None,
+        memory_map_indexes: bool = False,
+        compact_docstore: bool = False,
+    ):
         self.embedding_model: EmbeddingModel = embedding_model
+        self.query_cache = query_cache
+        self.memory_map_indexes = memory_map_indexes
+        self.compact_docstore = compact_docstore
         self.__embeddings_provider = None
 
         if self.embedding_model.provider.lower() == "openai":
@@ -81,7 +95,28 @@ class EmbeddingsClient:
         if not self.embedding_model.config.get(key):
             raise ValueError(f"{key} config is not set for the given embedding model")
 
+    def embed_query(self, query: str, trace: RetrievalTrace = None) -> List[float]:
+        if self.query_cache is None:
+            return self.__embeddings_provider.embed_query(query)
+
+        embedding = self.query_cache.get(self.embedding_model.id, query)
+        if trace is not None:
+            trace.record(query_embedding_cached=embedding is not None)
+        if embedding is None:
+            embedding = self.__embeddings_provider.embed_query(query)
+            self.query_cache.put(self.embedding_model.id, query, embedding)
+        return embedding
+
     def generate_from_filesystem(self, kb_folder_path):
+        if self.compact_docstore:
+            return load_compact(
+                kb_folder_path,
+                self.__embeddings_provider,
+                memory_map=self.memory_map_indexes,
+            )
+        if self.memory_map_indexes:
+            return load_memory_mapped(kb_folder_path, self.__embeddings_provider)
+
         return FAISS.load_local(
             folder_path=kb_folder_path,
             embeddings=self.__embeddings_provider,
@@ -0,0 +1,218 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import json
+import os
+import pickle
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+
+from embeddings.memory_mapped import read_index_memory_mapped
+
+# Files written next to {index_name}.faiss, the metadata table is written last
+TEXT_SUFFIX = ".chunks"
+OFFSETS_SUFFIX = ".chunk_offsets.npy"
+METADATA_IDS_SUFFIX = ".chunk_metadata_ids.npy"
+METADATA_SUFFIX = ".chunk_metadata.json"
+
+
+class ChunkPositions(Mapping):
+    """The id mapping of a compact docstore, chunks are stored by their position in the index"""
+
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, vector_id):
+        vector_id = int(vector_id)
+        if not 0 <= vector_id < self._size:
+            raise KeyError(vector_id)
+        return vector_id
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def __len__(self):
+        return self._size
+
+
+class CompactDocstore(Docstore):
+    """
+    The chunks of one knowledge document in a few flat arrays instead of a Document per chunk.
+
+    The UTF-8 text of chunk i is text[offsets[i]:offsets[i + 1]], the text can be a memory-mapped
+    file. Chunks of the same page repeat the same metadata, so every distinct metadata dict is
+    stored once and chunks refer to it by metadata_ids[i]. A Document is only created when a
+    chunk is looked up by search.
+    """
+
+    def __init__(
+        self,
+        text,
+        offsets: np.ndarray,
+        metadata_ids: np.ndarray,
+        metadata_table: List[dict],
+    ):
+        self.text = text
+        self.offsets = offsets
+        self.metadata_ids = metadata_ids
+        self.metadata_table = metadata_table
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document]) -> "CompactDocstore":
+        texts = []
+        metadata_ids = []
+        metadata_table = []
+        interned: Dict[str, int] = {}
+        for document in documents:
+            texts.append(document.page_content.encode("utf-8"))
+            # Raises TypeError for metadata that cannot be written as JSON
+            metadata_key = json.dumps(document.metadata, sort_keys=True)
+            if metadata_key not in interned:
+                interned[metadata_key] = len(metadata_table)
+                metadata_table.append(json.loads(metadata_key))
+            metadata_ids.append(interned[metadata_key])
+
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in texts])
+        return cls(
+            b"".join(texts),
+            offsets,
+            np.array(metadata_ids, dtype=np.int32),
+            metadata_table,
+        )
+
+    @classmethod
+    def from_store(cls, store: FAISS) -> "CompactDocstore":
+        """The chunks of a FAISS store, in the order of its index"""
+        return cls.from_documents(
+            store.docstore.search(store.index_to_docstore_id[position])
+            for position in range(store.index.ntotal)
+        )
+
+    @classmethod
+    def load(
+        cls, folder_path, index_name: str = "index", memory_map: bool = False
+    ) -> "CompactDocstore":
+        path = Path(folder_path)
+        text_path = path / f"{index_name}{TEXT_SUFFIX}"
+        mmap_mode = "r" if memory_map else None
+        offsets = np.load(path / f"{index_name}{OFFSETS_SUFFIX}", mmap_mode=mmap_mode)
+        metadata_ids = np.load(
+            path / f"{index_name}{METADATA_IDS_SUFFIX}", mmap_mode=mmap_mode
+        )
+        with open(path / f"{index_name}{METADATA_SUFFIX}", encoding="utf-8") as file:
+            metadata_table = json.load(file)
+        # An empty file cannot be mapped
+        if memory_map and os.path.getsize(text_path) > 0:
+            text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            text = text_path.read_bytes()
+        return cls(text, offsets, metadata_ids, metadata_table)
+
+    @staticmethod
+    def is_up_to_date(folder_path, index_name: str = "index") -> bool:
+        """Whether the compact files exist and are not older than the pickled docstore"""
+        path = Path(folder_path)
+        metadata_path = path / f"{index_name}{METADATA_SUFFIX}"
+        pickle_path = path / f"{index_name}.pkl"
+        if not metadata_path.exists():
+            return False
+        return (
+            not pickle_path.exists()
+            or metadata_path.stat().st_mtime >= pickle_path.stat().st_mtime
+        )
+
+    def save(self, folder_path, index_name: str = "index") -> None:
+        """Writes every file to a temporary file first, so a concurrent load never sees half a file"""
+        path = Path(folder_path)
+        _write_atomically(
+            path / f"{index_name}{TEXT_SUFFIX}",
+            lambda file: file.write(bytes(self.text)),
+        )
+        _write_atomically(
+            path / f"{index_name}{OFFSETS_SUFFIX}",
+            lambda file: np.save(file, np.asarray(self.offsets)),
+        )
+        _write_atomically(
+            path / f"{index_name}{METADATA_IDS_SUFFIX}",
+            lambda file: np.save(file, np.asarray(self.metadata_ids)),
+        )
+        _write_atomically(
+            path / f"{index_name}{METADATA_SUFFIX}",
+            lambda file: file.write(json.dumps(self.metadata_table).encode("utf-8")),
+        )
+
+    def __len__(self):
+        return len(self.metadata_ids)
+
+    def page_content(self, position: int) -> str:
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return bytes(self.text[start:end]).decode("utf-8")
+
+    def page_contents(self) -> List[str]:
+        return [self.page_content(position) for position in range(len(self))]
+
+    def search(self, search):
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        return Document(
+            page_content=self.page_content(position),
+            # A copy, so callers cannot change the metadata of other chunks
+            metadata=dict(self.metadata_table[self.metadata_ids[position]]),
+        )
+
+
+def _write_atomically(path: Path, write: Callable) -> None:
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as file:
+        write(file)
+    os.replace(temporary_path, path)
+
+
+def load_compact(
+    folder_path, embeddings, index_name: str = "index", memory_map: bool = False
+) -> FAISS:
+    """
+    Like FAISS.load_local, with a compact docstore. A store that only has the pickled docstore is
+    converted once and the compact files are written next to the index for the next load.
+    """
+    path = Path(folder_path)
+    index_path = str(path / f"{index_name}.faiss")
+    index = (
+        read_index_memory_mapped(index_path)
+        if memory_map
+        else faiss.read_index(index_path)
+    )
+
+    if CompactDocstore.is_up_to_date(path, index_name):
+        docstore = CompactDocstore.load(path, index_name, memory_map)
+    else:
+        with open(path / f"{index_name}.pkl", "rb") as file:
+            pickled_docstore, index_to_docstore_id = pickle.load(file)
+        try:
+            docstore = CompactDocstore.from_store(
+                FAISS(embeddings, index, pickled_docstore, index_to_docstore_id)
+            )
+        except TypeError as error:
+            print(
+                f"[WARNING]: Keeping the pickled docstore of {folder_path}, its metadata cannot be stored compactly: {error}"
+            )
+            return FAISS(embeddings, index, pickled_docstore, index_to_docstore_id)
+        del pickled_docstore, index_to_docstore_id
+        try:
+            docstore.save(path, index_name)
+        except OSError as error:
+            print(
+                f"[WARNING]: Could not write the compact docstore of {folder_path}, it is converted on every load: {error}"
+            )
+
+    return FAISS(embeddings, index, docstore, ChunkPositions(len(docstore)))
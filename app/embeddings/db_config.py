@@ -0,0 +1,44 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from config_values import is_enabled_value
+
+
+class EmbeddingsDBConfig:
+    """
+    Where the vectors of the knowledge documents are stored and searched.
+
+    type "faiss" (the default) loads the FAISS index of every document into the app process.
+    type "qdrant" imports them into a Qdrant collection at url, or into a local Qdrant at path,
+    or in memory if neither is set. With skip_import, documents that are already in the
+    collection are not imported again.
+    """
+
+    TYPES = ["faiss", "qdrant"]
+
+    def __init__(
+        self,
+        type: str = "faiss",
+        skip_import: bool = False,
+        url: str = None,
+        api_key: str = None,
+        collection_name: str = "haiven",
+        path: str = None,
+    ):
+        self.type = type
+        self.skip_import = skip_import
+        self.url = url
+        self.api_key = api_key
+        self.collection_name = collection_name
+        self.path = path
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        config = data.get("config") or {}
+        return cls(
+            type=(data.get("type") or "faiss").lower(),
+            skip_import=is_enabled_value(data.get("skip_import")),
+            url=config.get("url") or None,
+            api_key=config.get("api_key") or None,
+            collection_name=config.get("collection_name") or "haiven",
+            path=config.get("path") or None,
+        )
@@ -1,6 +1,6 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 from langchain_community.vectorstores import FAISS
-from typing import List
+from typing import Callable, List
 from langchain.docstore.document import Document
 
 
@@ -14,14 +14,29 @@ class KnowledgeDocument:
         sample_question: str,
         description: str,
         provider: str,
+        retriever_loader: Callable[[], FAISS] = None,
+        hybrid_search: bool = False,
     ):
         self.key = key
-        self.retriever = retriever
+        self._retriever = retriever
+        # Without a retriever, the loader returns it when the document is searched
+        self._retriever_loader = retriever_loader
         self.title = title
         self.source = source
         self.sample_question = sample_question
         self.description = description
         self.provider = provider
+        self.hybrid_search = hybrid_search
+
+    @property
+    def retriever(self) -> FAISS:
+        if self._retriever is None and self._retriever_loader is not None:
+            return self._retriever_loader()
+        return self._retriever
+
+    @retriever.setter
+    def retriever(self, retriever: FAISS):
+        self._retriever = retriever
 
     def get_source_title_link(self) -> str:
         document_metadata = vars(self)
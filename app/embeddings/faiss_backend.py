@@ -0,0 +1,17 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+
+from embeddings.backend import EmbeddingsBackend
+from embeddings.client import EmbeddingsClient
+
+
+class FaissBackend(EmbeddingsBackend):
+    """Loads the FAISS index of every document into the app process."""
+
+    def __init__(self, embeddings_client: EmbeddingsClient):
+        self._embeddings_client = embeddings_client
+
+    def load_retriever(self, document_key: str, kb_path: str) -> FAISS:
+        return self._embeddings_client.generate_from_filesystem(Path(kb_path))
@@ -0,0 +1,79 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import pickle
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+
+
+class _PickledDocstore:
+    """The docstore and id mapping FAISS.save_local pickles, unpickled on first use"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    with open(self.path, "rb") as file:
+                        self._data = pickle.load(file)
+        return self._data
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+
+class LazyDocstore(Docstore):
+    def __init__(self, pickled: _PickledDocstore):
+        self._pickled = pickled
+
+    def search(self, search: str):
+        return self._pickled.load()[0].search(search)
+
+
+class LazyIndexToDocstoreId(Mapping):
+    def __init__(self, pickled: _PickledDocstore):
+        self._pickled = pickled
+
+    def __getitem__(self, vector_id):
+        return self._pickled.load()[1][vector_id]
+
+    def __iter__(self):
+        return iter(self._pickled.load()[1])
+
+    def __len__(self):
+        return len(self._pickled.load()[1])
+
+
+def read_index_memory_mapped(index_path: str):
+    """
+    Maps the index file read-only instead of reading it into the heap. The vector pages are then
+    shared with every other process that maps the same file, through the OS page cache.
+    Index types that cannot be used in place are mapped while loading, or read as usual.
+    """
+    for flags in [faiss.IO_FLAG_MMAP_IFC, faiss.IO_FLAG_MMAP]:
+        try:
+            return faiss.read_index(index_path, flags | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(index_path)
+
+
+def load_memory_mapped(folder_path, embeddings, index_name: str = "index") -> FAISS:
+    """Like FAISS.load_local, with a memory-mapped index and a docstore that is loaded lazily"""
+    path = Path(folder_path)
+    index = read_index_memory_mapped(str(path / f"{index_name}.faiss"))
+    pickled = _PickledDocstore(path / f"{index_name}.pkl")
+    return FAISS(
+        embeddings,
+        index,
+        LazyDocstore(pickled),
+        LazyIndexToDocstoreId(pickled),
+    )
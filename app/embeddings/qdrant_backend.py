@@ -0,0 +1,233 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import uuid
+from pathlib import Path
+from typing import List
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from qdrant_client import QdrantClient, models
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+from embeddings.backend import EmbeddingsBackend
+from embeddings.client import EmbeddingsClient
+from embeddings.db_config import EmbeddingsDBConfig
+
+DOCUMENT_KEY = "document_key"
+
+
+class QdrantRetriever:
+    """The chunks of one document in a Qdrant collection, searched like a FAISS store"""
+
+    def __init__(self, backend: "QdrantBackend", document_key: str):
+        self.backend = backend
+        self.document_key = document_key
+
+    @property
+    def distance_strategy(self) -> DistanceStrategy:
+        return self.backend.distance_strategy
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, score_threshold: float = None
+    ):
+        return self.backend.search(
+            embedding, [self.document_key], k, score_threshold=score_threshold
+        )
+
+
+class QdrantBackend(EmbeddingsBackend):
+    """
+    Keeps the vectors of all documents in one Qdrant collection, outside of the app process.
+    The FAISS index of a document is imported in batches when it is loaded, its points carry
+    the document key, so one query searches any set of documents.
+    """
+
+    searches_across_documents = True
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection_name: str,
+        embeddings_client: EmbeddingsClient,
+        skip_import: bool = False,
+        batch_size: int = 256,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.skip_import = skip_import
+        self.batch_size = batch_size
+        self._embeddings_client = embeddings_client
+        # The distance of the collection, only set once the collection is known to exist
+        self._distance: models.Distance = None
+
+    @classmethod
+    def from_config(
+        cls, config: EmbeddingsDBConfig, embeddings_client: EmbeddingsClient
+    ) -> "QdrantBackend":
+        if config.url:
+            client = QdrantClient(url=config.url, api_key=config.api_key)
+        elif config.path:
+            client = QdrantClient(path=config.path)
+        else:
+            client = QdrantClient(location=":memory:")
+        return cls(
+            client, config.collection_name, embeddings_client, config.skip_import
+        )
+
+    @property
+    def distance_strategy(self) -> DistanceStrategy:
+        # Read once when the collection is created or loaded, Euclidean until there is one
+        if self._distance == models.Distance.DOT:
+            return DistanceStrategy.MAX_INNER_PRODUCT
+        return DistanceStrategy.EUCLIDEAN_DISTANCE
+
+    def load_retriever(self, document_key: str, kb_path: str) -> QdrantRetriever:
+        if self.skip_import and self.has_document(document_key):
+            print(f"Skipping import of {document_key}, it is already in Qdrant")
+            if self._distance is None:
+                self._distance = self._read_distance()
+        else:
+            store = self._embeddings_client.generate_from_filesystem(Path(kb_path))
+            self.import_document(document_key, store)
+        return QdrantRetriever(self, document_key)
+
+    def has_document(self, document_key: str) -> bool:
+        if not self.client.collection_exists(self.collection_name):
+            return False
+        return (
+            self.client.count(
+                self.collection_name,
+                count_filter=self._filter([document_key]),
+                exact=False,
+            ).count
+            > 0
+        )
+
+    def import_document(self, document_key: str, store: FAISS) -> None:
+        """Replaces the points of a document with the vectors and chunks of its FAISS store"""
+        number_of_vectors = store.index.ntotal
+        distance = (
+            models.Distance.DOT
+            if store.index.metric_type == faiss.METRIC_INNER_PRODUCT
+            else models.Distance.EUCLID
+        )
+        self._create_collection(store.index.d, distance)
+        self.client.delete(
+            self.collection_name,
+            points_selector=models.FilterSelector(filter=self._filter([document_key])),
+        )
+
+        for start in range(0, number_of_vectors, self.batch_size):
+            end = min(start + self.batch_size, number_of_vectors)
+            vectors = store.index.reconstruct_n(start, end - start)
+            points = []
+            for position, vector in zip(range(start, end), vectors):
+                document = store.docstore.search(store.index_to_docstore_id[position])
+                points.append(
+                    models.PointStruct(
+                        id=str(
+                            uuid.uuid5(uuid.NAMESPACE_URL, f"{document_key}/{position}")
+                        ),
+                        vector=vector.tolist(),
+                        payload={
+                            DOCUMENT_KEY: document_key,
+                            "page_content": document.page_content,
+                            "metadata": document.metadata,
+                        },
+                    )
+                )
+            self.upsert(points)
+
+    def upsert(self, points: List[models.PointStruct]) -> None:
+        self.client.upsert(self.collection_name, points=points, wait=True)
+
+    def search(
+        self,
+        embedding: List[float],
+        document_keys: List[str],
+        k: int,
+        score_threshold: float = None,
+        with_vectors: bool = False,
+    ) -> list:
+        if k <= 0:
+            return []
+        # Checked once, not with a round trip to Qdrant per query
+        if self._distance is None:
+            if not self.client.collection_exists(self.collection_name):
+                return []
+            self._distance = self._read_distance()
+
+        euclidean = self._distance == models.Distance.EUCLID
+        try:
+            points = self.client.query_points(
+                self.collection_name,
+                query=list(embedding),
+                query_filter=self._filter(document_keys),
+                limit=k,
+                with_payload=True,
+                with_vectors=with_vectors,
+            ).points
+        except (UnexpectedResponse, ValueError) as error:
+            if not self._is_not_found(error):
+                raise
+            # The collection was deleted outside of the app
+            self._distance = None
+            return []
+
+        results = []
+        for point in points:
+            # FAISS L2 indexes score with the squared distance, thresholds are set for those
+            score = point.score**2 if euclidean else point.score
+            if score_threshold is not None and (
+                score > score_threshold if euclidean else score < score_threshold
+            ):
+                continue
+            document = Document(
+                page_content=point.payload["page_content"],
+                metadata=point.payload.get("metadata") or {},
+            )
+            if with_vectors:
+                results.append(
+                    (document, score, np.array(point.vector, dtype=np.float32))
+                )
+            else:
+                results.append((document, score))
+        return results
+
+    def _create_collection(self, dimension: int, distance: models.Distance) -> None:
+        if self.client.collection_exists(self.collection_name):
+            if self._distance is None:
+                self._distance = self._read_distance()
+            return
+        self.client.create_collection(
+            self.collection_name,
+            vectors_config=models.VectorParams(size=dimension, distance=distance),
+        )
+        self.client.create_payload_index(
+            self.collection_name, DOCUMENT_KEY, models.PayloadSchemaType.KEYWORD
+        )
+        self._distance = distance
+
+    def _read_distance(self) -> models.Distance:
+        return self.client.get_collection(
+            self.collection_name
+        ).config.params.vectors.distance
+
+    @staticmethod
+    def _is_not_found(error: Exception) -> bool:
+        # The Qdrant server answers 404, the local client raises a ValueError
+        if isinstance(error, UnexpectedResponse):
+            return error.status_code == 404
+        return "not found" in str(error).lower()
+
+    @staticmethod
+    def _filter(document_keys: List[str]) -> models.Filter:
+        return models.Filter(
+            must=[
+                models.FieldCondition(
+                    key=DOCUMENT_KEY, match=models.MatchAny(any=list(document_keys))
+                )
+            ]
+        )
@@ -0,0 +1,185 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import hashlib
+import os
+import sys
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from cache_directory import CacheDirectory
+from config_values import is_enabled_value
+
+
+def normalize_query(query: str) -> str:
+    """Queries that only differ in unicode form or whitespace share one cache entry"""
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+class QueryEmbeddingCacheConfig:
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_entries: int = 2048,
+        max_memory_mb: float = 32,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 20000,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_memory_mb = max_memory_mb
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(
+            enabled=is_enabled_value(data.get("enabled")),
+            max_entries=int(data.get("max_entries") or 2048),
+            max_memory_mb=float(data.get("max_memory_mb") or 32),
+            disk_path=data.get("disk_path") or None,
+            max_disk_entries=int(data.get("max_disk_entries") or 20000),
+        )
+
+
+class QueryEmbeddingCache:
+    """
+    Cache for the embedding vectors of search queries, keyed by embedding model id and
+    normalized query text.
+
+    Vectors are kept as float32 arrays in an LRU bounded by max_entries and max_memory_bytes.
+    If disk_path is set, vectors are also written there as raw float32 files, which survive
+    restarts and are read back into memory on a miss. The disk tier keeps the max_disk_entries
+    most recently used vectors. Files are read and written outside of the lock, so a slow disk
+    does not hold up lookups that are answered from memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 20000,
+    ):
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_path = disk_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_bytes = 0
+        self._entries: OrderedDict[Tuple[str, str], Tuple[array, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = (
+            CacheDirectory(self.disk_path, ".f32", max_disk_entries)
+            if self.disk_path
+            else None
+        )
+
+    @classmethod
+    def from_config(cls, config: QueryEmbeddingCacheConfig):
+        if not config.enabled:
+            return None
+        return cls(
+            max_entries=config.max_entries,
+            max_memory_bytes=int(config.max_memory_mb * 1024 * 1024),
+            disk_path=config.disk_path,
+            max_disk_entries=config.max_disk_entries,
+        )
+
+    def get(self, model_id: str, query: str) -> Optional[List[float]]:
+        key = (model_id, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0].tolist()
+
+        vector = self._read_from_disk(key)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self._store_in_memory(key, vector)
+            self.hits += 1
+            self.disk_hits += 1
+            return vector.tolist()
+
+    def put(self, model_id: str, query: str, embedding: List[float]):
+        key = (model_id, normalize_query(query))
+        vector = array("f", embedding)
+        with self._lock:
+            self._store_in_memory(key, vector)
+        self._write_to_disk(key, vector)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "memory_bytes": self.memory_bytes,
+            }
+
+    def _store_in_memory(self, key: Tuple[str, str], vector: array):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= previous[1]
+
+        size = sys.getsizeof(vector) + sys.getsizeof(key[1])
+        self._entries[key] = (vector, size)
+        self.memory_bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or self.memory_bytes > self.max_memory_bytes
+        ):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.memory_bytes -= evicted_size
+
+    def _disk_file(self, key: Tuple[str, str]) -> str:
+        digest = hashlib.sha256("\0".join(key).encode("utf-8")).hexdigest()
+        return self._disk.file(digest)
+
+    def _read_from_disk(self, key: Tuple[str, str]) -> Optional[array]:
+        if self._disk is None:
+            return None
+
+        file_path = self._disk_file(key)
+        vector = array("f")
+        try:
+            with open(file_path, "rb") as file:
+                vector.frombytes(file.read())
+        except (OSError, ValueError):
+            return None
+        try:
+            # The disk tier is pruned by modification time, a read keeps the vector around
+            os.utime(file_path)
+        except OSError:
+            pass
+        return vector
+
+    def _write_to_disk(self, key: Tuple[str, str], vector: array):
+        if self._disk is None:
+            return
+
+        file_path = self._disk_file(key)
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                vector.tofile(file)
+            os.replace(temp_path, file_path)
+        except OSError as error:
+            print(f"[WARNING]: Could not write query embedding cache entry: {error}")
+            return
+        self._disk.written()
@@ -0,0 +1,241 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import operator
+from bisect import bisect_right
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+
+class UnifiedIndex:
+    """
+    One flat FAISS index over the vectors of all knowledge documents.
+
+    The vectors of each document are stored in one contiguous id range, so the id -> document
+    key mapping is just the list of keys and their start offsets. Searches in a subset of the
+    documents are a single search with an ID selector over the ranges of those documents.
+    The chunks stay in the docstores of the documents and are only looked up for the results.
+    Once merged, the documents are searched through retriever(), their own indexes can be let go.
+    """
+
+    def __init__(
+        self,
+        index,
+        docstores: List[Docstore],
+        index_to_docstore_ids: List[Mapping],
+        document_keys: List[str],
+        offsets: List[int],
+        distance_strategy: DistanceStrategy,
+        normalize_L2: bool,
+    ):
+        self.index = index
+        # The docstore and id mapping of document_keys[i], by the position in its own index
+        self.docstores = docstores
+        self.index_to_docstore_ids = index_to_docstore_ids
+        self.document_keys = document_keys
+        # offsets[i] is the first id of document_keys[i], offsets[-1] the number of vectors
+        self.offsets = offsets
+        self.distance_strategy = distance_strategy
+        self.normalize_L2 = normalize_L2
+        self._ranges = {
+            key: (offsets[position], offsets[position + 1])
+            for position, key in enumerate(document_keys)
+        }
+
+    @classmethod
+    def from_stores(cls, stores: Dict[str, FAISS]) -> "UnifiedIndex":
+        """
+        Merges the FAISS stores of several documents into one index. The stores need to have the
+        same dimension, metric and normalization, and a flat index: vectors of compressed indexes
+        can only be reconstructed approximately, and would be stored uncompressed again.
+        Retrievers of another unified index can be merged again, e.g. after a reload.
+        """
+        stores = {key: store for key, store in stores.items() if store is not None}
+        if not stores:
+            raise ValueError("There are no indexes to merge")
+
+        first = next(iter(stores.values()))
+        index = faiss.IndexFlat(first.index.d, first.index.metric_type)
+        docstores, index_to_docstore_ids, document_keys, offsets = [], [], [], [0]
+        for key, store in stores.items():
+            if (
+                store.index.d != first.index.d
+                or store.index.metric_type != first.index.metric_type
+                or store.distance_strategy != first.distance_strategy
+                or store._normalize_L2 != first._normalize_L2
+            ):
+                raise ValueError(
+                    f"The index of {key} is not compatible with the index of the other documents"
+                )
+            if not isinstance(store, UnifiedIndexRetriever) and not isinstance(
+                faiss.downcast_index(store.index), faiss.IndexFlat
+            ):
+                raise ValueError(f"The index of {key} is not a flat index")
+
+            number_of_vectors = store.index.ntotal
+            if number_of_vectors:
+                index.add(store.index.reconstruct_n(0, number_of_vectors))
+            docstores.append(store.docstore)
+            index_to_docstore_ids.append(store.index_to_docstore_id)
+            document_keys.append(key)
+            offsets.append(offsets[-1] + number_of_vectors)
+
+        return cls(
+            index,
+            docstores,
+            index_to_docstore_ids,
+            document_keys,
+            offsets,
+            first.distance_strategy,
+            first._normalize_L2,
+        )
+
+    def document_key(self, vector_id: int) -> str:
+        return self.document_keys[bisect_right(self.offsets, vector_id) - 1]
+
+    def document(self, vector_id: int) -> Document:
+        position = bisect_right(self.offsets, vector_id) - 1
+        return self.docstores[position].search(
+            self.index_to_docstore_ids[position][
+                int(vector_id) - self.offsets[position]
+            ]
+        )
+
+    def retriever(self, document_key: str) -> "UnifiedIndexRetriever":
+        return UnifiedIndexRetriever(self, document_key)
+
+    def search(
+        self,
+        embedding: List[float],
+        k: int = 5,
+        document_keys: Optional[List[str]] = None,
+        score_threshold: float = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Searches the vectors of the given documents, or of all documents if document_keys is None.
+        Scores and score_threshold behave like FAISS.similarity_search_with_score_by_vector.
+        """
+        scores, ids = self._search(embedding, k, document_keys)
+        results = zip(ids, scores)
+
+        if score_threshold is not None:
+            compare = (
+                operator.ge
+                if self.distance_strategy
+                in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            results = [
+                (vector_id, score)
+                for vector_id, score in results
+                if compare(score, score_threshold)
+            ]
+        return [(self.document(vector_id), score) for vector_id, score in results]
+
+    def search_with_vectors(
+        self,
+        embedding: List[float],
+        k: int = 5,
+        document_keys: Optional[List[str]] = None,
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        """Same as search(), with the vector of every result"""
+        scores, ids = self._search(embedding, k, document_keys)
+        if not len(ids):
+            return []
+
+        vectors = self.index.reconstruct_batch(ids)
+        return [
+            (self.document(vector_id), score, vector)
+            for vector_id, score, vector in zip(ids, scores, vectors)
+        ]
+
+    def _search(
+        self, embedding: List[float], k: int, document_keys: Optional[List[str]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        vector = np.array([embedding], dtype=np.float32)
+        if self.normalize_L2:
+            faiss.normalize_L2(vector)
+
+        selector = None
+        if document_keys is not None:
+            ranges = [
+                self._ranges[key]
+                for key in dict.fromkeys(document_keys)
+                if key in self._ranges
+            ]
+            if not ranges:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+            if len(ranges) < len(self._ranges):
+                selector = self._selector(ranges)
+
+        if selector is None:
+            scores, ids = self.index.search(vector, k)
+        else:
+            scores, ids = self.index.search(
+                vector, k, params=faiss.SearchParameters(sel=selector)
+            )
+
+        found = ids[0] != -1
+        return scores[0][found], ids[0][found]
+
+    @staticmethod
+    def _selector(ranges: List[Tuple[int, int]]):
+        selector = faiss.IDSelectorRange(*ranges[0])
+        # The combined selectors only reference their parts, keep them alive with it
+        parts = [selector]
+        for start, end in ranges[1:]:
+            part = faiss.IDSelectorRange(start, end)
+            selector = faiss.IDSelectorOr(selector, part)
+            parts.extend([part, selector])
+        selector.parts = parts
+        return selector
+
+
+class _DocumentVectors:
+    """The id range of one document in a unified index, read like the document's own index"""
+
+    def __init__(self, index, start: int, end: int):
+        self._index = index
+        self._start = start
+        self.d = index.d
+        self.metric_type = index.metric_type
+        self.ntotal = end - start
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        return self._index.reconstruct(self._start + int(position))
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return self._index.reconstruct_n(self._start + start, count)
+
+
+class UnifiedIndexRetriever:
+    """The chunks of one document in a unified index, searched like its FAISS store"""
+
+    def __init__(self, unified_index: UnifiedIndex, document_key: str):
+        self.unified_index = unified_index
+        self.document_key = document_key
+        position = unified_index.document_keys.index(document_key)
+        self.docstore = unified_index.docstores[position]
+        self.index_to_docstore_id = unified_index.index_to_docstore_ids[position]
+        self.index = _DocumentVectors(
+            unified_index.index, *unified_index._ranges[document_key]
+        )
+
+    @property
+    def distance_strategy(self) -> DistanceStrategy:
+        return self.unified_index.distance_strategy
+
+    @property
+    def _normalize_L2(self) -> bool:
+        return self.unified_index.normalize_L2
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, score_threshold: float = None
+    ) -> List[Tuple[Document, float]]:
+        return self.unified_index.search(
+            embedding, k, [self.document_key], score_threshold
+        )
@@ -0,0 +1,122 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Words, and identifiers like PROJ-1234, snake_case or v1.2 as one token
+_TOKEN = re.compile(r"\w+(?:[-.]\w+)*")
+_PART = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased tokens, compound identifiers also split into their parts"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one knowledge document.
+
+    The postings are stored like a sparse matrix in CSR layout: the chunk positions and term
+    frequencies of term t are chunk_ids[offsets[t]:offsets[t + 1]] and term_frequencies[...].
+    A query is scored with a few array operations per query term.
+    """
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        chunk_ids: np.ndarray,
+        term_frequencies: np.ndarray,
+        chunk_lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.chunk_ids = chunk_ids
+        self.term_frequencies = term_frequencies
+        self.chunk_lengths = chunk_lengths
+        self.k1 = k1
+        self.b = b
+
+        number_of_chunks = len(chunk_lengths)
+        document_frequencies = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(
+            1
+            + (number_of_chunks - document_frequencies + 0.5)
+            / (document_frequencies + 0.5)
+        ).astype(np.float32)
+        average_length = chunk_lengths.mean() if number_of_chunks else 1.0
+        # The part of the BM25 denominator that only depends on the chunk
+        self._length_norm = (
+            k1 * (1 - b + b * chunk_lengths / max(average_length, 1e-9))
+        ).astype(np.float32)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        vocabulary: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        chunk_lengths = np.zeros(len(texts), dtype=np.float32)
+        for chunk_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            chunk_lengths[chunk_id] = len(tokens)
+            for token, count in Counter(tokens).items():
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((chunk_id, count))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_postings) for term_postings in postings])
+        chunk_ids = np.empty(offsets[-1], dtype=np.int32)
+        term_frequencies = np.empty(offsets[-1], dtype=np.float32)
+        for term_id, term_postings in enumerate(postings):
+            start = offsets[term_id]
+            for position, (chunk_id, count) in enumerate(term_postings):
+                chunk_ids[start + position] = chunk_id
+                term_frequencies[start + position] = count
+        return cls(
+            vocabulary, offsets, chunk_ids, term_frequencies, chunk_lengths, k1, b
+        )
+
+    def __len__(self):
+        return len(self.chunk_lengths)
+
+    def scores(self, query: str) -> np.ndarray:
+        """The BM25 score of every chunk for the query"""
+        scores = np.zeros(len(self.chunk_lengths), dtype=np.float32)
+        for token in tokenize(query):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            chunk_ids = self.chunk_ids[start:end]
+            frequencies = self.term_frequencies[start:end]
+            # A term has at most one posting per chunk, so the chunk ids are unique
+            scores[chunk_ids] += (
+                self.idf[term_id]
+                * frequencies
+                * (self.k1 + 1)
+                / (frequencies + self._length_norm[chunk_ids])
+            )
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Positions and scores of the k best chunks that match any query term, best first"""
+        scores = self.scores(query)
+        matching = np.flatnonzero(scores)
+        if k <= 0 or not len(matching):
+            return []
+        if len(matching) > k:
+            matching = matching[np.argpartition(-scores[matching], k - 1)[:k]]
+        best = matching[np.argsort(-scores[matching], kind="stable")]
+        return [(int(position), float(scores[position])) for position in best]
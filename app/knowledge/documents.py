@@ -1,15 +1,43 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import copy
+import operator
 import os
+import threading
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import AbstractSet, Dict, List, Tuple
 
 import frontmatter
+import numpy as np
 from langchain.docstore.document import Document
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from embeddings.backend import EmbeddingsBackend
 from embeddings.client import EmbeddingsClient
+from embeddings.compact_docstore import CompactDocstore
 from embeddings.documents import KnowledgeDocument
 from config_service import ConfigService
+from embeddings.faiss_backend import FaissBackend
 from embeddings.in_memory import InMemoryEmbeddingsDB
+from embeddings.unified_index import UnifiedIndex
+from knowledge.bm25 import BM25Index
+from knowledge.loading_config import KnowledgeLoadingConfig
+from knowledge.ranking import (
+    higher_is_better,
+    materialize,
+    maximal_marginal_relevance,
+    merge_top_k,
+    reciprocal_rank_fusion,
+    relevance,
+    search_store_references,
+    search_store_with_vectors,
+    vector_score,
+)
+from knowledge.retrieval_trace import RetrievalTrace, timed
+from knowledge.retriever_cache import RetrieverCache
+from knowledge.search_config import KnowledgeSearchConfig
+from knowledge.search_executor import SearchExecutor
+from config_values import is_enabled_value
 
 
 class KnowledgeBaseDocuments:
@@ -29,12 +57,40 @@ class KnowledgeBaseDocuments:
         self,
         config_service: ConfigService,
         embeddings_provider: EmbeddingsClient = None,
+        search_config: KnowledgeSearchConfig = None,
+        loading_config: KnowledgeLoadingConfig = None,
+        embeddings_backend: EmbeddingsBackend = None,
     ):
+        self._search_config = search_config or KnowledgeSearchConfig()
+        self._unified_index: UnifiedIndex = None
+        self._keyword_indexes: Dict[str, BM25Index] = {}
+        self._keyword_index_locks: Dict[str, threading.Lock] = {}
+        self._keyword_indexes_lock = threading.Lock()
+        # The markdown file and the index folder of every loaded document, for reloads
+        self._document_paths: Dict[str, Tuple[str, str]] = {}
+        self.search_executor = SearchExecutor(
+            self._search_config.search_threads,
+            self._search_config.min_parallel_documents,
+        )
+        loading_config = loading_config or KnowledgeLoadingConfig()
+        self._warm_up = loading_config.warm_up
+        self.retriever_cache: RetrieverCache = None
+        # The unified index is built from all indexes at startup, documents cannot be lazy then
+        if loading_config.lazy_documents and not self._search_config.unified_index:
+            self.retriever_cache = RetrieverCache(
+                self._load_retriever,
+                loading_config.max_resident_indexes,
+                loading_config.popularity_path,
+            )
+
         if embeddings_provider is None:
             embedding_model = config_service.load_embedding_model()
             self._embeddings_provider = EmbeddingsClient(embedding_model)
         else:
             self._embeddings_provider = embeddings_provider
+        self._embeddings_backend = embeddings_backend or FaissBackend(
+            self._embeddings_provider
+        )
 
         if self._document_stores is None:
             self._document_stores = InMemoryEmbeddingsDB()
@@ -47,6 +103,44 @@ class KnowledgeBaseDocuments:
             knowledge_pack_path (str): The file system path to the directory containing the knowledge pack documents.
         """
         self._load_documents(path=knowledge_pack_path)
+        self._index_loaded_documents()
+
+    def reloaded(
+        self, knowledge_pack_path: str, changed_paths: AbstractSet[str]
+    ) -> "KnowledgeBaseDocuments":
+        """
+        Loads the documents of a knowledge pack again, into a copy of this instance that shares its embeddings provider, backend, retriever cache and search executor. Lazily loaded documents of this instance keep loading from their own paths when the reload registers others. Documents whose markdown file and index are not among the changed paths are taken over with their loaded index, so only changed and new documents are loaded. This instance is left as it is, searches that already use it are not affected.
+
+        Parameters:
+            knowledge_pack_path (str): The file system path to the directory containing the knowledge pack documents.
+            changed_paths (AbstractSet[str]): The absolute paths of the files that changed since this instance was loaded.
+
+        Returns:
+            KnowledgeBaseDocuments: The reloaded documents.
+        """
+        reloaded = copy.copy(self)
+        reloaded._document_stores = InMemoryEmbeddingsDB()
+        reloaded._keyword_indexes = {}
+        reloaded._keyword_index_locks = {}
+        reloaded._keyword_indexes_lock = threading.Lock()
+        reloaded._document_paths = {}
+        reloaded._unified_index = None
+        reloaded._load_documents(knowledge_pack_path, self, changed_paths)
+        if self.retriever_cache is not None:
+            for key in self._document_paths.keys() - reloaded._document_paths.keys():
+                self.retriever_cache.unregister(key)
+        reloaded._index_loaded_documents()
+        return reloaded
+
+    def _index_loaded_documents(self) -> None:
+        # A backend that searches across documents does not need a unified index
+        if (
+            self._search_config.unified_index
+            and not self._embeddings_backend.searches_across_documents
+        ):
+            self._build_unified_index()
+        elif self.retriever_cache is not None and self._warm_up:
+            self.retriever_cache.warm_up()
 
     def get_documents(self) -> List[KnowledgeDocument]:
         """
@@ -58,14 +152,33 @@ class KnowledgeBaseDocuments:
 
         return self._document_stores.get_documents()
 
-    def _get_retriever_from_file(self, kb_path: str) -> FAISS:
-        path = Path(kb_path)
+    def _build_unified_index(self) -> None:
+        stores = {
+            document.key: document.retriever
+            for document in self._document_stores.get_documents()
+        }
+        try:
+            self._unified_index = UnifiedIndex.from_stores(stores)
+        except Exception as error:
+            self._unified_index = None
+            print(
+                f"[WARNING]: Could not build a unified index, searching documents one by one: {error}"
+            )
+            return
 
-        faiss = self._embeddings_provider.generate_from_filesystem(path)
+        # The vectors are in the unified index now, the indexes of the documents can be let go
+        for document in self._document_stores.get_documents():
+            document.retriever = self._unified_index.retriever(document.key)
 
-        return faiss
+    def _load_retriever(self, document_key: str, kb_path: str) -> FAISS:
+        return self._embeddings_backend.load_retriever(document_key, kb_path)
 
-    def _load_documents(self, path: str) -> None:
+    def _load_documents(
+        self,
+        path: str,
+        previous: "KnowledgeBaseDocuments" = None,
+        changed_paths: AbstractSet[str] = frozenset(),
+    ) -> None:
         if not os.path.exists(path):
             raise FileNotFoundError(
                 f"The specified path does not exist, no embeddings will be loaded: {path}"
@@ -80,10 +193,15 @@ class KnowledgeBaseDocuments:
 
         for knowledge_document_file in knowledge_document_files:
             self._load_document_into_store(
-                document_path=os.path.join(path, knowledge_document_file)
+                os.path.join(path, knowledge_document_file), previous, changed_paths
             )
 
-    def _load_document_into_store(self, document_path: str) -> None:
+    def _load_document_into_store(
+        self,
+        document_path: str,
+        previous: "KnowledgeBaseDocuments" = None,
+        changed_paths: AbstractSet[str] = frozenset(),
+    ) -> None:
         document = frontmatter.load(document_path)
         if (
             document.metadata.get("provider").lower()
@@ -92,22 +210,121 @@ class KnowledgeBaseDocuments:
             folder_path = Path(document_path).parent
             kb_path = document.metadata["path"]
             kb_full_path = os.path.join(folder_path, kb_path)
+            key = document.metadata["key"]
+            paths = (os.path.abspath(document_path), os.path.abspath(kb_full_path))
+            if previous is not None and previous._is_unchanged(
+                key, paths, changed_paths
+            ):
+                self._document_stores.add_embedding(
+                    key, previous._document_stores.get_document(key)
+                )
+                if key in previous._keyword_indexes:
+                    self._keyword_indexes[key] = previous._keyword_indexes[key]
+                self._document_paths[key] = paths
+                return
+
+            retriever, retriever_loader = None, None
+            if self.retriever_cache is None:
+                retriever = self._load_retriever(key, kb_full_path)
+            else:
+                self.retriever_cache.register(key, kb_full_path)
+                retriever_loader = partial(self.retriever_cache.get, key, kb_full_path)
             knowledge_document = KnowledgeDocument(
-                key=document.metadata["key"],
+                key=key,
                 title=document.metadata.get("title", ""),
                 source=document.metadata.get("source", ""),
                 sample_question=document.metadata.get("sample_question", ""),
                 description=document.metadata.get("description", ""),
                 provider=document.metadata.get("provider", ""),
-                retriever=self._get_retriever_from_file(kb_full_path),
+                retriever=retriever,
+                retriever_loader=retriever_loader,
+                hybrid_search=is_enabled_value(document.metadata.get("hybrid_search")),
             )
 
             self._document_stores.add_embedding(
                 knowledge_document.key, knowledge_document
             )
+            self._document_paths[key] = paths
+            self._keyword_indexes.pop(key, None)
+            # Lazily loaded documents are indexed when they are first searched
+            if knowledge_document.hybrid_search and retriever is not None:
+                self._keyword_index(key)
+
+    def _is_unchanged(
+        self,
+        document_key: str,
+        paths: Tuple[str, str],
+        changed_paths: AbstractSet[str],
+    ) -> bool:
+        if self._document_paths.get(document_key) != paths:
+            return False
+        document_path, kb_path = paths
+        return document_path not in changed_paths and not any(
+            path.startswith(kb_path + os.sep) for path in changed_paths
+        )
+
+    def _keyword_index(self, document_key: str) -> BM25Index:
+        document = self._document_stores.get_document(document_key)
+        if document is None or not document.hybrid_search:
+            return None
+
+        if document_key in self._keyword_indexes:
+            return self._keyword_indexes[document_key]
+
+        with self._keyword_indexes_lock:
+            building_lock = self._keyword_index_locks.setdefault(
+                document_key, threading.Lock()
+            )
+        # Indexes of different documents build in parallel, concurrent builds of one wait for the first
+        with building_lock:
+            if document_key not in self._keyword_indexes:
+                self._keyword_indexes[document_key] = self._build_keyword_index(
+                    document_key, document.retriever
+                )
+        return self._keyword_indexes[document_key]
+
+    @staticmethod
+    def _build_keyword_index(document_key: str, retriever) -> BM25Index:
+        if not hasattr(retriever, "docstore"):
+            print(
+                f"[WARNING]: Hybrid search needs the chunks of {document_key} in the app, searching it by vector only"
+            )
+            return None
+        if isinstance(retriever.docstore, CompactDocstore):
+            return BM25Index.from_texts(retriever.docstore.page_contents())
+        return BM25Index.from_texts(
+            [
+                retriever.docstore.search(
+                    retriever.index_to_docstore_id[position]
+                ).page_content
+                for position in range(retriever.index.ntotal)
+            ]
+        )
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embeds a search query with the embeddings provider of the knowledge pack. The resulting vector can be passed to the *_by_vector search methods, so that a query searched in several documents is only embedded once.
+
+        Parameters:
+            query (str): The search query.
+
+        Returns:
+            List[float]: The embedding vector of the query.
+        """
+        return self._embeddings_provider.embed_query(query)
+
+    def _embed_query(self, query: str, trace: RetrievalTrace = None) -> List[float]:
+        if trace is None:
+            return self.embed_query(query)
+        with trace.stage("query_embedding"):
+            return self._embeddings_provider.embed_query(query, trace)
 
     def similarity_search_with_scores(
-        self, query: str, k: int = 5, score_threshold: float = None
+        self,
+        query: str,
+        k: int = 5,
+        score_threshold: float = None,
+        trace: RetrievalTrace = None,
     ) -> List[Tuple[Document, float]]:
         """
         Performs a similarity search across all stored document embeddings, returning a list of documents and their similarity scores relative to the query. This method supports specifying the number of results (k) and an optional score threshold.
@@ -115,39 +332,68 @@ class KnowledgeBaseDocuments:
         Parameters:
             query (str): The search query.
             k (int, optional): The number of results to return. Defaults to 5.
-            score_threshold (float, optional): The minimum similarity score for a document to be included in the results. Defaults to None.
+            score_threshold (float, optional): The minimum similarity score for a document to be included in the results. A maximum distance for raw distance scores. Defaults to the score_threshold of the search config.
+            trace (RetrievalTrace, optional): Records the time of each stage of the search and what it found.
 
         Returns:
             List[Tuple[Document, float]]: A list of tuples, each containing a Document and its similarity score.
         """
-        similar_documents = []
+        if not self._document_stores.get_keys():
+            return []
 
-        for embedding_key in self._document_stores.get_keys():
-            partial_results = self._similarity_search_on_single_document_with_scores(
-                query, embedding_key, k, score_threshold
-            )
-            similar_documents.extend(partial_results)
+        return self.similarity_search_with_scores_by_vector(
+            self._embed_query(query, trace), k, score_threshold, query, trace
+        )
 
-        similar_documents.sort(key=lambda x: x[1], reverse=False)
+    def similarity_search_with_scores_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 5,
+        score_threshold: float = None,
+        query: str = None,
+        trace: RetrievalTrace = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Same as similarity_search_with_scores, for a query that is already embedded (see embed_query).
 
-        similar_documents = similar_documents[:k]
+        Parameters:
+            embedding (List[float]): The embedding vector of the search query.
+            k (int, optional): The number of results to return. Defaults to 5.
+            score_threshold (float, optional): The minimum similarity score for a document to be included in the results. A maximum distance for raw distance scores. Defaults to the score_threshold of the search config.
+            query (str, optional): The text of the search query, documents with hybrid search are only also searched by keywords if it is given.
+            trace (RetrievalTrace, optional): Records the time of each stage of the search and what it found.
 
-        return similar_documents
+        Returns:
+            List[Tuple[Document, float]]: A list of tuples, each containing a Document and its similarity score.
+        """
+        return self._top_k_by_vector(
+            embedding,
+            self._document_stores.get_keys(),
+            k,
+            score_threshold,
+            query,
+            trace,
+        )
 
-    def _similarity_search_on_single_document_with_scores(
+    def _similarity_search_on_single_document_with_scores_by_vector(
         self,
-        query: str,
+        embedding: List[float],
         document_key: str,
         k: int = 5,
         score_threshold: float = None,
     ) -> List[Tuple[Document, float]]:
-        embedding = self._document_stores.get_document(document_key)
+        document = self._document_stores.get_document(document_key)
 
-        if embedding is None:
+        if document is None:
             return []
 
-        similar_documents = embedding.retriever.similarity_search_with_score(
-            query=query, k=k, score_threshold=score_threshold
+        if self._unified_index is not None:
+            return self._unified_index.search(
+                embedding, k, [document_key], score_threshold
+            )
+
+        similar_documents = document.retriever.similarity_search_with_score_by_vector(
+            embedding, k=k, score_threshold=score_threshold
         )
         return similar_documents
 
@@ -157,27 +403,242 @@ class KnowledgeBaseDocuments:
         document_keys: List[str],
         k: int = 5,
         score_threshold: float = None,
+        trace: RetrievalTrace = None,
     ) -> List[Document]:
         """
-        Similar to the method above but returns only the documents without their similarity scores. This provides a simpler interface when only the documents are needed.
+        Similar to the method above but returns only the documents without their similarity scores, and only searches the given documents. The results are the k best chunks of all given documents together, best first, no matter how many documents are searched.
 
         Parameters:
             query (str): The search query.
             document_keys List(str): The list of document keys to search within.
             k (int, optional): The number of results to return. Defaults to 5.
-            score_threshold (float, optional): The minimum similarity score for a document to be included in the results. Defaults to None.
+            score_threshold (float, optional): The minimum similarity score for a document to be included in the results. A maximum distance for raw distance scores. Defaults to the score_threshold of the search config.
+            trace (RetrievalTrace, optional): Records the time of each stage of the search and what it found.
 
         Returns:
             List[Document]: A list of documents that are similar to the query.
         """
+        if not document_keys:
+            return []
 
-        documents_with_scores = []
-        for document_key in document_keys:
-            documents_with_scores.extend(
-                self._similarity_search_on_single_document_with_scores(
-                    query, document_key, k, score_threshold
-                )
-            )
+        return self.similarity_search_on_multiple_documents_by_vector(
+            self._embed_query(query, trace),
+            document_keys,
+            k,
+            score_threshold,
+            query,
+            trace,
+        )
+
+    def similarity_search_on_multiple_documents_by_vector(
+        self,
+        embedding: List[float],
+        document_keys: List[str],
+        k: int = 5,
+        score_threshold: float = None,
+        query: str = None,
+        trace: RetrievalTrace = None,
+    ) -> List[Document]:
+        """
+        Same as similarity_search_on_multiple_documents, for a query that is already embedded (see embed_query).
+
+        Parameters:
+            embedding (List[float]): The embedding vector of the search query.
+            document_keys List(str): The list of document keys to search within.
+            k (int, optional): The number of results to return. Defaults to 5.
+            score_threshold (float, optional): The minimum similarity score for a document to be included in the results. A maximum distance for raw distance scores. Defaults to the score_threshold of the search config.
+            query (str, optional): The text of the search query, documents with hybrid search are only also searched by keywords if it is given.
+            trace (RetrievalTrace, optional): Records the time of each stage of the search and what it found.
+
+        Returns:
+            List[Document]: A list of documents that are similar to the query.
+        """
+        documents_with_scores = self._top_k_by_vector(
+            embedding, document_keys, k, score_threshold, query, trace
+        )
 
         documents = [doc for doc, _ in documents_with_scores]
         return documents
+
+    def _top_k_by_vector(
+        self,
+        embedding: List[float],
+        document_keys: List[str],
+        k: int,
+        score_threshold: float = None,
+        query: str = None,
+        trace: RetrievalTrace = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        The k best chunks of all given documents, best first. The documents are searched by the
+        search executor and their best chunks merged with a heap, or found with one search if
+        there is a unified index. Scores are normalized to relevances and candidates re-ranked
+        with MMR if the search config says so.
+        With a query, the BM25 matches of documents with hybrid search are fused in by RRF.
+        The stages are timed into trace if it is given.
+        """
+        config = self._search_config
+        if score_threshold is None:
+            score_threshold = config.score_threshold
+        document_keys = [
+            key
+            for key in dict.fromkeys(document_keys)
+            if self._document_stores.get_document(key) is not None
+        ]
+        if not document_keys or k <= 0:
+            return []
+        if self.retriever_cache is not None:
+            self.retriever_cache.record_search(document_keys)
+            if trace is not None:
+                trace.record(
+                    resident_indexes=sum(
+                        self.retriever_cache.is_loaded(key) for key in document_keys
+                    )
+                )
+        if trace is not None:
+            trace.record(documents_searched=len(document_keys))
+
+        use_mmr = config.mmr_lambda is not None
+        fetch_k = max(k, config.mmr_fetch_k) if use_mmr else k
+        # Raw scores are filtered by the index, relevances only once they are normalized
+        index_threshold = None if config.normalize_scores else score_threshold
+        distance_strategy = self._distance_strategy(document_keys[0])
+
+        with timed(trace, "vector_search"):
+            if self._unified_index is not None and use_mmr:
+                candidates = self._unified_index.search_with_vectors(
+                    embedding, fetch_k, document_keys
+                )
+            elif self._unified_index is not None:
+                candidates = self._unified_index.search(
+                    embedding, fetch_k, document_keys, index_threshold
+                )
+            elif self._embeddings_backend.searches_across_documents:
+                candidates = self._embeddings_backend.search(
+                    embedding, document_keys, fetch_k, index_threshold, use_mmr
+                )
+            else:
+                candidates = merge_top_k(
+                    self.search_executor.map(
+                        lambda key: self._candidates_of_document(
+                            embedding, key, fetch_k, index_threshold, use_mmr
+                        ),
+                        document_keys,
+                    ),
+                    fetch_k,
+                    higher_is_better(distance_strategy),
+                )
+        # Chunks of compact docstores are only looked up for the best candidates overall,
+        # other stores look their chunks up while they are searched
+        with timed(trace, "docstore_lookup"):
+            candidates = materialize(candidates)
+        if trace is not None:
+            trace.record(candidates=len(candidates))
+
+        if config.normalize_scores:
+            candidates = [
+                (candidate[0], relevance(candidate[1], distance_strategy))
+                + candidate[2:]
+                for candidate in candidates
+            ]
+            if score_threshold is not None:
+                candidates = [
+                    candidate
+                    for candidate in candidates
+                    if candidate[1] >= score_threshold
+                ]
+        elif use_mmr and score_threshold is not None:
+            compare = (
+                operator.ge if higher_is_better(distance_strategy) else operator.le
+            )
+            candidates = [
+                candidate
+                for candidate in candidates
+                if compare(candidate[1], score_threshold)
+            ]
+
+        if use_mmr and candidates:
+            with timed(trace, "mmr"):
+                picked = maximal_marginal_relevance(
+                    np.array(embedding, dtype=np.float32),
+                    np.array([candidate[2] for candidate in candidates]),
+                    k,
+                    config.mmr_lambda,
+                )
+                candidates = [candidates[position] for position in picked]
+
+        keyword_keys = [
+            key
+            for key in document_keys
+            if query and self._keyword_index(key) is not None
+        ]
+        if keyword_keys:
+            with timed(trace, "keyword_search"):
+                candidates = self._fuse_keyword_matches(
+                    query, embedding, candidates[:k], keyword_keys, k, distance_strategy
+                )
+
+        return [(candidate[0], candidate[1]) for candidate in candidates[:k]]
+
+    def _fuse_keyword_matches(
+        self,
+        query: str,
+        embedding: List[float],
+        candidates: list,
+        document_keys: List[str],
+        k: int,
+        distance_strategy: DistanceStrategy,
+    ) -> list:
+        # Keyword matches get the score the vector index would give them
+        query_vector = np.array(embedding, dtype=np.float32)
+        rankings = [candidates]
+        for key in document_keys:
+            retriever = self._document_stores.get_document(key).retriever
+            matches = []
+            for position, _ in self._keyword_index(key).search(query, k):
+                score = vector_score(
+                    query_vector,
+                    retriever.index.reconstruct(position),
+                    distance_strategy,
+                )
+                if self._search_config.normalize_scores:
+                    score = relevance(score, distance_strategy)
+                document = retriever.docstore.search(
+                    retriever.index_to_docstore_id[position]
+                )
+                matches.append((document, score))
+            rankings.append(matches)
+
+        return reciprocal_rank_fusion(
+            rankings,
+            key=lambda result: result[0].page_content,
+            k=self._search_config.rrf_k,
+        )
+
+    def _candidates_of_document(
+        self,
+        embedding: List[float],
+        document_key: str,
+        k: int,
+        score_threshold: float,
+        with_vectors: bool,
+    ) -> list:
+        document = self._document_stores.get_document(document_key)
+        if with_vectors:
+            return search_store_with_vectors(document.retriever, embedding, k)
+
+        if isinstance(getattr(document.retriever, "docstore", None), CompactDocstore):
+            return search_store_references(
+                document.retriever, embedding, k, score_threshold
+            )
+        return self._similarity_search_on_single_document_with_scores_by_vector(
+            embedding, document_key, k, score_threshold
+        )
+
+    def _distance_strategy(self, document_key: str) -> DistanceStrategy:
+        if self._unified_index is not None:
+            return self._unified_index.distance_strategy
+        retriever = self._document_stores.get_document(document_key).retriever
+        return getattr(
+            retriever, "distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE
+        )
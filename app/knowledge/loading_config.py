@@ -0,0 +1,45 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from config_values import is_enabled_value
+
+
+class KnowledgeLoadingConfig:
+    """
+    How the indexes of the knowledge documents are loaded.
+
+    With memory_map_indexes, index files are memory-mapped read-only instead of read into the
+    heap, and the pickled docstore of a document is only loaded when it is first searched.
+    With lazy_documents, only the metadata of the documents is read at startup and an index is
+    loaded when its document is first searched. At most max_resident_indexes indexes stay loaded
+    (0 for no limit). With warm_up, the most searched documents are loaded in the background at
+    startup, the search counts are kept in popularity_path across restarts if it is set.
+    With compact_docstore, the chunks of a document are kept in flat arrays instead of a
+    Document object per chunk (see CompactDocstore).
+    """
+
+    def __init__(
+        self,
+        memory_map_indexes: bool = False,
+        lazy_documents: bool = False,
+        max_resident_indexes: int = 0,
+        warm_up: bool = False,
+        popularity_path: str = None,
+        compact_docstore: bool = False,
+    ):
+        self.memory_map_indexes = memory_map_indexes
+        self.lazy_documents = lazy_documents
+        self.max_resident_indexes = max_resident_indexes
+        self.warm_up = warm_up
+        self.popularity_path = popularity_path
+        self.compact_docstore = compact_docstore
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(
+            memory_map_indexes=is_enabled_value(data.get("memory_map_indexes")),
+            lazy_documents=is_enabled_value(data.get("lazy_documents")),
+            max_resident_indexes=int(data.get("max_resident_indexes") or 0),
+            warm_up=is_enabled_value(data.get("warm_up")),
+            popularity_path=data.get("popularity_path") or None,
+            compact_docstore=is_enabled_value(data.get("compact_docstore")),
+        )
@@ -0,0 +1,91 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import hashlib
+import os
+from typing import Dict, NamedTuple, Set
+
+from embeddings.compact_docstore import (
+    METADATA_IDS_SUFFIX,
+    METADATA_SUFFIX,
+    OFFSETS_SUFFIX,
+    TEXT_SUFFIX,
+)
+
+# Files the app writes into the knowledge pack itself, they do not change its content
+_GENERATED_SUFFIXES = (
+    TEXT_SUFFIX,
+    OFFSETS_SUFFIX,
+    METADATA_IDS_SUFFIX,
+    METADATA_SUFFIX,
+    ".tmp",
+)
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    modified_ns: int
+    sha256: str
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PackManifest:
+    """
+    The content hashes of the files of a knowledge pack, by path relative to the pack.
+
+    A file whose size and modification time are the same as in the previous manifest is not
+    hashed again, so scanning a large pack that did not change only costs a stat per file.
+    Hidden files and the files the app generates next to the indexes are left out.
+    """
+
+    def __init__(self, root: str, entries: Dict[str, ManifestEntry] = None):
+        self.root = root
+        self.entries = entries or {}
+
+    @classmethod
+    def build(cls, root: str, previous: "PackManifest" = None) -> "PackManifest":
+        previous_entries = previous.entries if previous is not None else {}
+        entries = {}
+        for folder, folder_names, file_names in os.walk(root):
+            folder_names[:] = sorted(
+                name for name in folder_names if not name.startswith(".")
+            )
+            for file_name in sorted(file_names):
+                if file_name.startswith(".") or file_name.endswith(_GENERATED_SUFFIXES):
+                    continue
+                path = os.path.join(folder, file_name)
+                relative_path = os.path.relpath(path, root)
+                try:
+                    stat = os.stat(path)
+                    known = previous_entries.get(relative_path)
+                    if (
+                        known is not None
+                        and known.size == stat.st_size
+                        and known.modified_ns == stat.st_mtime_ns
+                    ):
+                        entries[relative_path] = known
+                    else:
+                        entries[relative_path] = ManifestEntry(
+                            stat.st_size, stat.st_mtime_ns, file_sha256(path)
+                        )
+                except OSError:
+                    # Deleted while the pack was scanned
+                    continue
+        return cls(root, entries)
+
+    def changed_paths(self, other: "PackManifest") -> Set[str]:
+        """The relative paths of the files that were added, removed or changed in other"""
+        return {
+            path
+            for path in self.entries.keys() | other.entries.keys()
+            if _sha256(self.entries.get(path)) != _sha256(other.entries.get(path))
+        }
+
+
+def _sha256(entry: ManifestEntry):
+    return entry.sha256 if entry is not None else None
@@ -53,6 +53,9 @@ class KnowledgeBaseMarkdown:
         context_content = self._load_context(path)
         self._knowledge[context] = context_content
 
+    def add_context(self, context: str, knowledge: KnowledgeMarkdown):
+        self._knowledge[context] = knowledge
+
     def get_all_contexts(self) -> dict[str, KnowledgeMarkdown]:
         """
         Returns a dictionary containing all available contexts
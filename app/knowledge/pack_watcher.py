@@ -0,0 +1,127 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+import threading
+import time
+from typing import AbstractSet, List
+
+from knowledge.manifest import PackManifest
+from knowledge_manager import KnowledgeManager
+from logger import HaivenLogger
+from prompts.prompts import PromptList
+
+
+class KnowledgePackWatcher:
+    """
+    Polls the knowledge pack for changes and reloads what they affect, without a restart.
+
+    Every interval_seconds the pack is scanned into a manifest of content hashes (see
+    PackManifest). A change is only reloaded once the next scan finds the pack the same again,
+    so that files that are still being copied are not loaded half way. The knowledge manager
+    and the prompt lists swap in what they reloaded at once, a failed reload leaves the loaded
+    knowledge as it is and is tried again with the next change.
+    """
+
+    def __init__(
+        self,
+        knowledge_manager: KnowledgeManager,
+        prompt_lists: List[PromptList] = None,
+        interval_seconds: float = 10.0,
+    ):
+        self.knowledge_manager = knowledge_manager
+        self.prompt_lists = prompt_lists or []
+        self.interval_seconds = interval_seconds
+        self.root = knowledge_manager.knowledge_pack_definition.path
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_reload_seconds = None
+        self.total_reload_seconds = 0.0
+        self._manifest: PackManifest = None
+        self._pending: PackManifest = None
+        self._failed: PackManifest = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self) -> threading.Thread:
+        """Scans the pack in a background thread until stop is called. Returns the thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="knowledge-pack-watcher", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def check(self) -> bool:
+        """Scans the pack once and reloads a change that is complete. Returns whether it did."""
+        if self._manifest is None:
+            self._manifest = PackManifest.build(self.root)
+            return False
+
+        manifest = PackManifest.build(self.root, self._pending or self._manifest)
+        changed_paths = self._manifest.changed_paths(manifest)
+        if not changed_paths:
+            self._pending = None
+            return False
+        if self._pending is None or self._pending.changed_paths(manifest):
+            # Still changing, wait for the next scan
+            self._pending = manifest
+            return False
+
+        self._pending = None
+        if self._failed is not None and not self._failed.changed_paths(manifest):
+            return False
+        started_at = time.perf_counter()
+        try:
+            self.reload(changed_paths)
+        except Exception as error:
+            self.failed_reloads += 1
+            self._failed = manifest
+            HaivenLogger.get().error(
+                f"Could not reload the knowledge pack: {error}",
+                extra={"ERROR": "KnowledgePackReloadFailed"},
+            )
+            return False
+
+        self.last_reload_seconds = time.perf_counter() - started_at
+        self.total_reload_seconds += self.last_reload_seconds
+        self.reloads += 1
+        self._manifest = manifest
+        self._failed = None
+        HaivenLogger.get().info(
+            f"Reloaded {len(changed_paths)} changed files of the knowledge pack in {self.last_reload_seconds:.2f}s",
+            extra={"INFO": "KnowledgePackReloaded"},
+        )
+        return True
+
+    def reload(self, changed_paths: AbstractSet[str]):
+        """Reloads the knowledge and prompts the changed files (relative to the pack) affect"""
+        self.knowledge_manager.reload(changed_paths)
+        absolute_paths = {
+            os.path.abspath(os.path.join(self.root, path)) for path in changed_paths
+        }
+        for prompt_list in self.prompt_lists:
+            prompt_list.reload(absolute_paths)
+
+    def stats(self) -> dict:
+        return {
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_reload_seconds": None
+            if self.last_reload_seconds is None
+            else round(self.last_reload_seconds, 3),
+            "total_reload_seconds": round(self.total_reload_seconds, 3),
+        }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.check()
+            except Exception as error:
+                HaivenLogger.get().error(
+                    f"Could not scan the knowledge pack: {error}",
+                    extra={"ERROR": "KnowledgePackScanFailed"},
+                )
+            self._stopped.wait(self.interval_seconds)
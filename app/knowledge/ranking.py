@@ -0,0 +1,150 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import heapq
+import operator
+from itertools import islice
+from typing import Iterable, List, NamedTuple, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+
+def higher_is_better(distance_strategy) -> bool:
+    """Same convention as the score_threshold of the langchain FAISS store"""
+    return distance_strategy in (
+        DistanceStrategy.MAX_INNER_PRODUCT,
+        DistanceStrategy.JACCARD,
+    )
+
+
+def relevance(score: float, distance_strategy) -> float:
+    """Maps a raw score to a relevance between 0 and 1, higher is better"""
+    if higher_is_better(distance_strategy):
+        return min(1.0, max(0.0, (1.0 + float(score)) / 2.0))
+    return 1.0 / (1.0 + max(0.0, float(score)))
+
+
+def merge_top_k(result_lists: Iterable[list], k: int, higher_is_better: bool) -> list:
+    """
+    Merges result lists that are each sorted best first into the k best results overall.
+    Results are tuples with the score at index 1.
+    """
+    if higher_is_better:
+        merged = heapq.merge(*result_lists, key=lambda result: -result[1])
+    else:
+        merged = heapq.merge(*result_lists, key=lambda result: result[1])
+    return list(islice(merged, k))
+
+
+def search_store_with_vectors(
+    store: FAISS, embedding: List[float], k: int
+) -> List[Tuple[Document, float, np.ndarray]]:
+    """Like FAISS.similarity_search_with_score_by_vector, with the vector of every result"""
+    vector = np.array([embedding], dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(vector)
+    scores, ids = store.index.search(vector, k)
+    found = ids[0] != -1
+    ids, scores = ids[0][found], scores[0][found]
+    if not len(ids):
+        return []
+
+    vectors = store.index.reconstruct_batch(ids)
+    return [
+        (store.docstore.search(store.index_to_docstore_id[vector_id]), score, vector)
+        for vector_id, score, vector in zip(ids, scores, vectors)
+    ]
+
+
+class ChunkReference(NamedTuple):
+    """A search result of a store, its chunk is only looked up in the docstore when needed"""
+
+    store: FAISS
+    vector_id: int
+
+    def document(self) -> Document:
+        return self.store.docstore.search(
+            self.store.index_to_docstore_id[self.vector_id]
+        )
+
+
+def search_store_references(
+    store: FAISS, embedding: List[float], k: int, score_threshold: float = None
+) -> List[Tuple[ChunkReference, float]]:
+    """Like FAISS.similarity_search_with_score_by_vector, with references to the chunks"""
+    vector = np.array([embedding], dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(vector)
+    scores, ids = store.index.search(vector, k)
+    compare = operator.ge if higher_is_better(store.distance_strategy) else operator.le
+    return [
+        (ChunkReference(store, int(vector_id)), score)
+        for vector_id, score in zip(ids[0], scores[0])
+        if vector_id != -1
+        and (score_threshold is None or compare(score, score_threshold))
+    ]
+
+
+def materialize(candidates: list) -> list:
+    """Replaces the chunk references in search results by the chunks"""
+    return [
+        (candidate[0].document(),) + candidate[1:]
+        if isinstance(candidate[0], ChunkReference)
+        else candidate
+        for candidate in candidates
+    ]
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float
+) -> List[int]:
+    """
+    Greedily picks k of the candidate vectors that are similar to the query and dissimilar to
+    the ones already picked. lambda_mult is the weight of similarity to the query, 1 ranks by
+    relevance only. Returns the picked row indexes in order.
+    """
+    if not len(vectors) or k <= 0:
+        return []
+
+    vectors = vectors / np.maximum(
+        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+    )
+    query = query / max(np.linalg.norm(query), 1e-12)
+    query_similarity = vectors @ query
+    # Highest similarity of every candidate to any picked candidate so far
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+
+    picked = [int(np.argmax(query_similarity))]
+    while len(picked) < min(k, len(vectors)):
+        available[picked[-1]] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[picked[-1]])
+        scores = lambda_mult * query_similarity - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        picked.append(int(np.argmax(scores)))
+    return picked
+
+
+def vector_score(query: np.ndarray, vector: np.ndarray, distance_strategy) -> float:
+    """The raw score a FAISS index gives a vector for the query"""
+    if higher_is_better(distance_strategy):
+        return float(np.dot(query, vector))
+    return float(np.sum((query - vector) ** 2))
+
+
+def reciprocal_rank_fusion(rankings: List[list], key, k: int = 60) -> list:
+    """
+    Fuses result lists that are each sorted best first. A result scores 1 / (k + rank) in every
+    list it is in, results are returned by their summed score, best first. key identifies the
+    same result in different lists, the result of the first list it is in is returned.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            result_key = key(result)
+            if result_key not in fused:
+                fused[result_key] = [0.0, result]
+            fused[result_key][0] += 1.0 / (k + rank)
+    return [result for _, result in sorted(fused.values(), key=lambda item: -item[0])]
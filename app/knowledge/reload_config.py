@@ -0,0 +1,27 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from config_values import is_enabled_value
+
+
+class KnowledgePackReloadConfig:
+    """
+    Whether changes to the knowledge pack are picked up without a restart.
+
+    When enabled, the knowledge pack is scanned every interval_seconds. Changed documents,
+    contexts and prompts are reloaded in the background once the pack was the same in two scans
+    in a row, so that a pack that is still being copied is not loaded half way.
+    """
+
+    def __init__(self, enabled: bool = False, interval_seconds: float = 10.0):
+        self.enabled = enabled
+        self.interval_seconds = interval_seconds
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        interval_seconds = data.get("interval_seconds")
+        return cls(
+            enabled=is_enabled_value(data.get("enabled")),
+            interval_seconds=10.0
+            if interval_seconds in [None, ""]
+            else float(interval_seconds),
+        )
@@ -0,0 +1,51 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+
+class RetrievalTrace:
+    """
+    How long the stages of one knowledge chat turn took, and what they found.
+
+    Stages are timed in milliseconds, a stage that runs several times adds up. Counts and cache
+    hit flags are recorded next to them. A trace is passed along explicitly, so that it also
+    works for searches that run on other threads.
+    """
+
+    def __init__(self):
+        self.stages_ms: Dict[str, float] = {}
+        self.values: dict = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, (time.perf_counter() - started_at) * 1000)
+
+    def add_time(self, name: str, milliseconds: float):
+        self.stages_ms[name] = self.stages_ms.get(name, 0.0) + milliseconds
+
+    def record(self, **values):
+        self.values.update(values)
+
+    def merge(self, other: "RetrievalTrace"):
+        for name, milliseconds in other.stages_ms.items():
+            self.add_time(name, milliseconds)
+        self.values.update(other.values)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages_ms": {
+                name: round(milliseconds, 3)
+                for name, milliseconds in self.stages_ms.items()
+            },
+            **self.values,
+        }
+
+
+def timed(trace: Optional[RetrievalTrace], name: str):
+    """Times a stage into trace, if there is one"""
+    return trace.stage(name) if trace is not None else nullcontext()
@@ -0,0 +1,177 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from langchain_community.vectorstores import FAISS
+
+
+class RetrieverCache:
+    """
+    Loads the FAISS retrievers of knowledge documents when they are first searched.
+
+    At most max_resident retrievers stay loaded (0 for no limit), the least recently searched
+    one is released when another one has to be loaded. Searches are counted per document, if
+    popularity_path is set the counts are saved there and order the warm-up after a restart.
+
+    Snapshots of the knowledge pack from before a reload share the cache. Their documents pass
+    the path they were loaded from, so they can still be searched after the reload registered
+    other paths or unregistered them.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str, str], FAISS],
+        max_resident: int = 0,
+        popularity_path: Optional[str] = None,
+        save_popularity_every: int = 20,
+    ):
+        self._load = load
+        self.max_resident = max_resident
+        self.popularity_path = popularity_path
+        self.save_popularity_every = save_popularity_every
+        self.popularity = Counter(self._read_popularity())
+        self.loads = 0
+        self.evictions = 0
+        self._paths: Dict[str, str] = {}
+        # Bumped whenever a document is (un)registered, loads that started before are not kept
+        self._generations: Dict[str, int] = {}
+        self._resident: OrderedDict[str, FAISS] = OrderedDict()
+        self._loading_locks: Dict[str, threading.Lock] = {}
+        self._searches_since_save = 0
+        self._lock = threading.Lock()
+
+    def register(self, key: str, path: str):
+        with self._lock:
+            self._paths[key] = path
+            self._resident.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def unregister(self, key: str):
+        """Forgets a document that is no longer in the knowledge pack"""
+        with self._lock:
+            self._paths.pop(key, None)
+            self._resident.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def get(self, key: str, path: Optional[str] = None) -> Optional[FAISS]:
+        """
+        The retriever of a document, loaded if it is not yet. A document that is no longer
+        registered is loaded from path, without keeping it. None if there is no path to load from.
+        """
+        return self._ensure_loaded(key, path)
+
+    def record_search(self, keys: List[str]):
+        """Counts a search in the given documents, for the order of the warm-up"""
+        with self._lock:
+            self.popularity.update(keys)
+            self._searches_since_save += 1
+            save = (
+                self.popularity_path
+                and self._searches_since_save >= self.save_popularity_every
+            )
+            if save:
+                self._searches_since_save = 0
+        if save:
+            self.save_popularity()
+
+    def is_loaded(self, key: str) -> bool:
+        with self._lock:
+            return key in self._resident
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Loads the most searched documents in a background thread, as many as may stay loaded.
+        Returns the thread.
+        """
+        with self._lock:
+            keys = sorted(self._paths, key=lambda key: -self.popularity[key])
+        if self.max_resident:
+            keys = keys[: self.max_resident]
+
+        def load_all():
+            for key in keys:
+                try:
+                    # Documents unregistered meanwhile are skipped
+                    self._ensure_loaded(key)
+                except Exception as error:
+                    print(
+                        f"[WARNING]: Could not warm up knowledge document {key}: {error}"
+                    )
+
+        thread = threading.Thread(
+            target=load_all, name="knowledge-warm-up", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def resident_keys(self) -> List[str]:
+        with self._lock:
+            return list(self._resident)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._paths),
+                "resident": len(self._resident),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def save_popularity(self):
+        if not self.popularity_path:
+            return
+
+        with self._lock:
+            popularity = dict(self.popularity)
+        temp_path = f"{self.popularity_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(popularity, file)
+            os.replace(temp_path, self.popularity_path)
+        except OSError as error:
+            print(f"[WARNING]: Could not save knowledge document popularity: {error}")
+
+    def _ensure_loaded(self, key: str, path: Optional[str] = None) -> Optional[FAISS]:
+        with self._lock:
+            retriever = self._resident.get(key)
+            if retriever is not None:
+                self._resident.move_to_end(key)
+                return retriever
+            path = self._paths.get(key, path)
+            if path is None:
+                return None
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        # Loads of different documents run in parallel, concurrent loads of one wait for the first
+        with loading_lock:
+            with self._lock:
+                retriever = self._resident.get(key)
+                if retriever is not None:
+                    self._resident.move_to_end(key)
+                    return retriever
+
+            with self._lock:
+                generation = self._generations.get(key)
+            retriever = self._load(key, path)
+
+            with self._lock:
+                if self._generations.get(key) != generation or key not in self._paths:
+                    return retriever
+                self._resident[key] = retriever
+                self.loads += 1
+                while self.max_resident and len(self._resident) > self.max_resident:
+                    self._resident.popitem(last=False)
+                    self.evictions += 1
+            return retriever
+
+    def _read_popularity(self) -> Dict[str, int]:
+        if not self.popularity_path:
+            return {}
+        try:
+            with open(self.popularity_path) as file:
+                return {key: int(count) for key, count in json.load(file).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
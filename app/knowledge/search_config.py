@@ -0,0 +1,61 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from typing import Optional
+
+from config_values import is_enabled_value
+
+
+class KnowledgeSearchConfig:
+    """
+    How the knowledge documents are searched.
+
+    A search in several documents returns the k best chunks of all of them together. With
+    unified_index, the indexes of all documents are merged into one index after loading and
+    such a search is a single vector search.
+
+    normalize_scores turns the raw scores of the index into relevances between 0 and 1, higher is
+    better, score_threshold then is a minimum relevance, otherwise a limit on the raw score.
+    With mmr_lambda set, the mmr_fetch_k best chunks are re-ranked with maximal marginal
+    relevance, 1 ranks by relevance only, lower values prefer chunks that differ from each other.
+    Documents with hybrid_search in their frontmatter are also searched with BM25, the keyword
+    matches are fused with the vector results by reciprocal rank fusion with constant rrf_k.
+    The documents of a search are searched on up to search_threads threads at the same time, if
+    there are at least min_parallel_documents of them (see SearchExecutor).
+    """
+
+    def __init__(
+        self,
+        unified_index: bool = False,
+        normalize_scores: bool = False,
+        score_threshold: Optional[float] = None,
+        mmr_lambda: Optional[float] = None,
+        mmr_fetch_k: int = 20,
+        rrf_k: int = 60,
+        search_threads: int = 1,
+        min_parallel_documents: int = 4,
+    ):
+        self.unified_index = unified_index
+        self.normalize_scores = normalize_scores
+        self.score_threshold = score_threshold
+        self.mmr_lambda = mmr_lambda
+        self.mmr_fetch_k = mmr_fetch_k
+        self.rrf_k = rrf_k
+        self.search_threads = search_threads
+        self.min_parallel_documents = min_parallel_documents
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(
+            unified_index=is_enabled_value(data.get("unified_index")),
+            normalize_scores=is_enabled_value(data.get("normalize_scores")),
+            score_threshold=_optional_float(data.get("score_threshold")),
+            mmr_lambda=_optional_float(data.get("mmr_lambda")),
+            mmr_fetch_k=int(data.get("mmr_fetch_k") or 20),
+            rrf_k=int(data.get("rrf_k") or 60),
+            search_threads=int(data.get("search_threads") or 1),
+            min_parallel_documents=int(data.get("min_parallel_documents") or 4),
+        )
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value in [None, ""] else float(value)
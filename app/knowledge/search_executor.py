@@ -0,0 +1,59 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class SearchExecutor:
+    """
+    Runs the searches of one query in several knowledge documents on a shared thread pool.
+
+    FAISS releases the GIL while it searches, so the documents are searched on several cores.
+    The pool has max_workers threads for all requests together. A search in fewer than
+    min_parallel_searches documents runs on the calling thread, where handing the searches to
+    the pool would cost more than it saves. With max_workers 1 every search is serial.
+    """
+
+    def __init__(self, max_workers: int = 1, min_parallel_searches: int = 4):
+        self.max_workers = max(1, max_workers)
+        self.min_parallel_searches = max(2, min_parallel_searches)
+        self.parallel_searches = 0
+        self.serial_searches = 0
+        self._pool: ThreadPoolExecutor = None
+        self._lock = threading.Lock()
+
+    def map(self, search: Callable[[T], R], items: Iterable[T]) -> List[R]:
+        """The results of search for every item, in the order of the items"""
+        items = list(items)
+        if self.max_workers == 1 or len(items) < self.min_parallel_searches:
+            self.serial_searches += 1
+            return [search(item) for item in items]
+
+        self.parallel_searches += 1
+        return list(self._get_pool().map(search, items))
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "parallel_searches": self.parallel_searches,
+            "serial_searches": self.serial_searches,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="knowledge-search",
+                    )
+        return self._pool
@@ -1,11 +1,14 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 import os
+from typing import AbstractSet
 
 from config_service import ConfigService
 from logger import HaivenLogger
 from config.constants import SYSTEM_MESSAGE
 
+from embeddings.backend_factory import create_embeddings_backend
 from embeddings.client import EmbeddingsClient
+from embeddings.query_cache import QueryEmbeddingCache
 from knowledge.markdown import KnowledgeBaseMarkdown
 from knowledge.pack import (
     KnowledgeContext,
@@ -14,26 +17,129 @@ from knowledge.pack import (
 from knowledge.documents import KnowledgeBaseDocuments
 
 
+class KnowledgeSnapshot:
+    """The knowledge loaded from one state of the knowledge pack, a reload replaces it as a whole"""
+
+    def __init__(
+        self,
+        knowledge_pack_definition: KnowledgePack,
+        knowledge_base_markdown: KnowledgeBaseMarkdown,
+        knowledge_base_documents: KnowledgeBaseDocuments,
+        system_message: str,
+    ):
+        self.knowledge_pack_definition = knowledge_pack_definition
+        self.knowledge_base_markdown = knowledge_base_markdown
+        self.knowledge_base_documents = knowledge_base_documents
+        self.system_message = system_message
+
+
 class KnowledgeManager:
-    def __init__(self, config_service: ConfigService):
+    def __init__(
+        self,
+        config_service: ConfigService,
+        query_embedding_cache: QueryEmbeddingCache = None,
+    ):
         self._config_service = config_service
+        self._query_embedding_cache = query_embedding_cache
 
-        self.knowledge_pack_definition = KnowledgePack(
+        knowledge_pack_definition = KnowledgePack(
             config_service.load_knowledge_pack_path()
         )
 
-        self._load_context_markdown_knowledge()
+        self.snapshot = KnowledgeSnapshot(
+            knowledge_pack_definition,
+            self._load_context_markdown_knowledge(knowledge_pack_definition),
+            self._load_base_documents_knowledge(knowledge_pack_definition),
+            self._load_system_message(knowledge_pack_definition),
+        )
 
-        self.knowledge_base_documents = self._load_base_documents_knowledge()
+    @property
+    def knowledge_pack_definition(self) -> KnowledgePack:
+        return self.snapshot.knowledge_pack_definition
+
+    @property
+    def knowledge_base_markdown(self) -> KnowledgeBaseMarkdown:
+        return self.snapshot.knowledge_base_markdown
+
+    @property
+    def knowledge_base_documents(self) -> KnowledgeBaseDocuments:
+        return self.snapshot.knowledge_base_documents
+
+    @property
+    def system_message(self) -> str:
+        return self.snapshot.system_message
+
+    def reload(self, changed_paths: AbstractSet[str]) -> None:
+        """
+        Reloads what the changed files of the knowledge pack affect and swaps the new knowledge in
+        at once. Documents and contexts whose files did not change are taken over as they are.
+        Requests that already got the knowledge before the swap keep using it.
+
+        Parameters:
+            changed_paths (AbstractSet[str]): The paths of the changed files, relative to the knowledge pack.
+        """
+        snapshot = self.snapshot
+        root = snapshot.knowledge_pack_definition.path
+        changed_paths = {
+            os.path.abspath(os.path.join(root, path)) for path in changed_paths
+        }
+
+        def changed_in(folder: str) -> bool:
+            prefix = os.path.abspath(os.path.join(root, folder)) + os.sep
+            return any(path.startswith(prefix) for path in changed_paths)
+
+        knowledge_pack_definition = snapshot.knowledge_pack_definition
+        knowledge_base_markdown = snapshot.knowledge_base_markdown
+        if changed_in("contexts"):
+            knowledge_pack_definition = KnowledgePack(root)
+            knowledge_base_markdown = self._load_context_markdown_knowledge(
+                knowledge_pack_definition,
+                snapshot.knowledge_base_markdown,
+                changed_paths,
+            )
 
-        self.system_message = self._load_system_message()
+        knowledge_base_documents = snapshot.knowledge_base_documents
+        if changed_in("embeddings"):
+            try:
+                knowledge_base_documents = knowledge_base_documents.reloaded(
+                    os.path.join(root, "embeddings"), changed_paths
+                )
+            except FileNotFoundError as error:
+                HaivenLogger.get().error(
+                    str(error), extra={"ERROR": "KnowledgePackEmbeddingsNotFound"}
+                )
+
+        system_message = snapshot.system_message
+        if os.path.abspath(os.path.join(root, "prompts", "system.md")) in changed_paths:
+            system_message = self._load_system_message(knowledge_pack_definition)
+
+        self.snapshot = KnowledgeSnapshot(
+            knowledge_pack_definition,
+            knowledge_base_markdown,
+            knowledge_base_documents,
+            system_message,
+        )
 
-    def _load_base_documents_knowledge(self):
+    def _load_base_documents_knowledge(self, knowledge_pack_definition: KnowledgePack):
         embedding_model = self._config_service.load_embedding_model()
-        base_embeddings_path = self.knowledge_pack_definition.path + "/embeddings"
+        base_embeddings_path = knowledge_pack_definition.path + "/embeddings"
+        loading_config = self._config_service.load_knowledge_loading_config()
+
+        embeddings_client = EmbeddingsClient(
+            embedding_model,
+            self._query_embedding_cache,
+            loading_config.memory_map_indexes,
+            loading_config.compact_docstore,
+        )
 
         knowledge_base_documents = KnowledgeBaseDocuments(
-            self._config_service, EmbeddingsClient(embedding_model)
+            self._config_service,
+            embeddings_client,
+            self._config_service.load_knowledge_search_config(),
+            loading_config,
+            create_embeddings_backend(
+                self._config_service.load_embeddings_db_config(), embeddings_client
+            ),
         )
 
         try:
@@ -45,21 +151,50 @@ class KnowledgeManager:
 
         return knowledge_base_documents
 
-    def _load_context_markdown_knowledge(self):
-        self.knowledge_base_markdown = KnowledgeBaseMarkdown()
-        for context in self.knowledge_pack_definition.contexts:
-            self._load_context_knowledge(context)
-
-    def _load_context_knowledge(self, knowledge_context: KnowledgeContext):
+    def _load_context_markdown_knowledge(
+        self,
+        knowledge_pack_definition: KnowledgePack,
+        previous: KnowledgeBaseMarkdown = None,
+        changed_paths: AbstractSet[str] = frozenset(),
+    ) -> KnowledgeBaseMarkdown:
+        knowledge_base_markdown = KnowledgeBaseMarkdown()
+        for context in knowledge_pack_definition.contexts:
+            self._load_context_knowledge(
+                knowledge_base_markdown,
+                knowledge_pack_definition,
+                context,
+                previous,
+                changed_paths,
+            )
+        return knowledge_base_markdown
+
+    def _load_context_knowledge(
+        self,
+        knowledge_base_markdown: KnowledgeBaseMarkdown,
+        knowledge_pack_definition: KnowledgePack,
+        knowledge_context: KnowledgeContext,
+        previous: KnowledgeBaseMarkdown = None,
+        changed_paths: AbstractSet[str] = frozenset(),
+    ):
         if knowledge_context is None:
             return
 
         context_path = (
-            self.knowledge_pack_definition.path + "/contexts/" + knowledge_context.path
+            knowledge_pack_definition.path + "/contexts/" + knowledge_context.path
         )
 
+        contexts = previous.get_all_contexts() if previous is not None else {}
+        if (
+            knowledge_context.name in contexts
+            and os.path.abspath(context_path) not in changed_paths
+        ):
+            knowledge_base_markdown.add_context(
+                knowledge_context.name, contexts[knowledge_context.name]
+            )
+            return
+
         try:
-            self.knowledge_base_markdown.load_for_context(
+            knowledge_base_markdown.load_for_context(
                 knowledge_context.name, path=context_path
             )
         except FileNotFoundError as error:
@@ -67,9 +202,9 @@ class KnowledgeManager:
                 str(error), extra={"ERROR": "KnowledgePackContextNotFound"}
             )
 
-    def _load_system_message(self):
+    def _load_system_message(self, knowledge_pack_definition: KnowledgePack):
         system_message_path = os.path.join(
-            self.knowledge_pack_definition.path, "prompts", "system.md"
+            knowledge_pack_definition.path, "prompts", "system.md"
         )
 
         try:
@@ -51,8 +51,8 @@ class MetadataEvent(ChatEvent):
     )
 
     def to_sse_format(self) -> str:
-        """Convert to SSE format for streaming"""
-        return f"data: {self.model_dump_json()}\n\n"
+        """Convert to SSE format for streaming, as a named event so it never shows up as text"""
+        return f"event: metadata\ndata: {self.model_dump_json()}\n\n"
 
 
 class TokenUsageEvent(ChatEvent):
@@ -102,19 +102,21 @@ class ChatEventFormatter:
         else:
             raise ValueError(f"Unknown event type: {type(event)}")
 
+    @staticmethod
+    def format_content_for_json(content: str) -> str:
+        """Format a content chunk for JSON chat without building a ContentEvent first"""
+        # Check if content is already formatted as JSON
+        if content.startswith('{"data":') and content.endswith("}"):
+            # Content is already formatted, return as-is (preserve original formatting)
+            return content + "\n\n"
+        # Content is plain text, wrap in data format with proper JSON escaping
+        return '{"data": ' + json.dumps(content) + "}\n\n"
+
     @staticmethod
     def format_for_json(event: ChatEvent) -> str:
         """Format event for JSON chat (structured data)"""
         if isinstance(event, ContentEvent):
-            # Check if content is already formatted as JSON
-            content = event.content
-            if content.startswith('{"data":') and content.endswith("}"):
-                # Content is already formatted, return as-is (preserve original formatting)
-                return content + "\n\n"
-            else:
-                # Content is plain text, wrap in data format with proper JSON escaping
-                data_dict = {"data": content}
-                return json.dumps(data_dict) + "\n\n"
+            return ChatEventFormatter.format_content_for_json(event.content)
         elif isinstance(event, MetadataEvent):
             # Metadata as JSON string for JSON chat (matching test expectations)
             metadata_dict = {"metadata": {"citations": event.citations or []}}
@@ -1,21 +1,30 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
-import json
+import asyncio
+import hashlib
 import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from pydantic import BaseModel
 from config_service import ConfigService
 from knowledge_manager import KnowledgeManager
 from embeddings.documents import DocumentsUtils
+from knowledge.retrieval_trace import RetrievalTrace, timed
 from llms.clients import (
     ChatClient,
     ChatClientFactory,
     HaivenAIMessage,
     HaivenHumanMessage,
+    HaivenMessage,
     HaivenSystemMessage,
     ModelConfig,
 )
+from llms.context_packing import CONTEXT_SEPARATOR, ContextPacker, ContextPackingConfig
+from llms.conversation_memory import ConversationMemory
+from llms.memory_budget import MemoryBudgetConfig, count_tokens
+from llms.query_rewrite import QueryRewriteConfig, adds_nothing_new
 from logger import HaivenLogger
 from llms.chat_events import (
     ChatEvent,
@@ -28,6 +37,44 @@ from llms.chat_events import (
 )
 
 
+# Searches on the raw user message that run while the model rewrites the search query
+_speculative_searches = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="speculative-search"
+)
+
+# Rewritten search queries kept per chat, by conversation and message
+_MAX_CACHED_REWRITES = 8
+
+
+class _AssistantReply:
+    """
+    The assistant message of the response being streamed. Chunks are collected in a list and
+    joined into the message once the stream ends, instead of concatenating per chunk.
+    """
+
+    __slots__ = ("memory", "message", "parts")
+
+    def __init__(self, memory: list):
+        self.memory = memory
+        self.message = None
+        self.parts = []
+
+    def start(self):
+        if self.message is None:
+            self.message = HaivenAIMessage(content="")
+            self.memory.append(self.message)
+
+    def append(self, content: str):
+        if self.message is None:
+            self.start()
+        self.parts.append(content)
+
+    def close(self):
+        if self.parts:
+            self.message.content += "".join(self.parts)
+            self.parts = []
+
+
 class HaivenBaseChat:
     def __init__(
         self,
@@ -35,8 +82,15 @@ class HaivenBaseChat:
         knowledge_manager: KnowledgeManager,
         contexts: List[str] = None,
         user_context: str = None,
+        cache_responses: bool = True,
+        memory_budget: MemoryBudgetConfig = None,
+        query_rewrite: QueryRewriteConfig = None,
+        context_packing: ContextPackingConfig = None,
     ):
         self.knowledge_manager = knowledge_manager
+        self.cache_responses = cache_responses
+        self.query_rewrite = query_rewrite or QueryRewriteConfig()
+        self._rewritten_queries = OrderedDict()
         self.system = knowledge_manager.get_system_message()
         aggregatedContext = (
             knowledge_manager.knowledge_base_markdown.aggregate_all_contexts(
@@ -52,6 +106,16 @@ class HaivenBaseChat:
 
         self.memory = [HaivenSystemMessage(content=self.system)]
         self.chat_client = chat_client
+        self.conversation_memory = None
+        if memory_budget is not None and memory_budget.enabled:
+            self.conversation_memory = ConversationMemory(
+                memory_budget, chat_client.model_config.lite_id, self._summarise
+            )
+        self.context_packer = None
+        if context_packing is not None and context_packing.enabled:
+            self.context_packer = ContextPacker(
+                context_packing, chat_client.model_config.lite_id
+            )
 
     def log_run(self, extra={}):
         class_name = self.__class__.__name__
@@ -63,14 +127,28 @@ class HaivenBaseChat:
 
         HaivenLogger.get().analytics("Sending message", extra_info)
 
+    def _messages_for_request(self):
+        """The memory, cut down to the memory budget of the model if there is one"""
+        if self.conversation_memory is None:
+            return self.memory
+        return self.conversation_memory.messages_for_request(self.memory)
+
+    def _finish_reply(self, reply: _AssistantReply):
+        reply.close()
+        if self.conversation_memory is not None and reply.message is not None:
+            self.conversation_memory.after_reply(self.memory)
+
+    def _summarise(self, prompt: List[HaivenMessage]) -> str:
+        stream = self.chat_client.stream(prompt, use_cache=False)
+        return "".join(chunk.get("content", "") for chunk in stream)
+
     def memory_as_text(self):
         return "\n".join([str(message) for message in self.memory])
 
-    def _similarity_query(self, message):
-        if len(self.memory) == 1:
-            return message
-
-        if len(self.memory) > 5:
+    def _similarity_query_prompt(self, message):
+        if self.query_rewrite.mode == "compact":
+            conversation = self._compact_conversation()
+        elif len(self.memory) > 5:
             conversation = "\n".join(
                 [message.content for message in (self.memory[:2] + self.memory[-4:])]
             )
@@ -92,12 +170,18 @@ class HaivenBaseChat:
         prompt.append(
             HaivenHumanMessage(content=f"Current user message: {message} \n Query:")
         )
+        return prompt
+
+    def _compact_conversation(self):
+        """The most recent messages without the system message, each cut to a maximum length"""
+        recent_messages = self.memory[1:][-self.query_rewrite.recent_messages :]
+        max_chars = self.query_rewrite.max_message_chars
+        return "\n".join(
+            f"{'Assistant' if isinstance(message, HaivenAIMessage) else 'User'}: {message.content[:max_chars]}"
+            for message in recent_messages
+        )
 
-        stream = self.chat_client.stream(prompt)
-        query = ""
-        for chunk in stream:
-            query += chunk.get("content", "")
-
+    def _parse_similarity_query(self, query: str):
         if "none" in query.lower():
             return None
         elif "query:" in query.lower():
@@ -105,8 +189,178 @@ class HaivenBaseChat:
         else:
             return query
 
-    def _similarity_search_based_on_history(self, message, knowledge_document_keys):
-        similarity_query = self._similarity_query(message)
+    def _skips_query_rewrite(self):
+        return len(self.memory) == 1 and self.query_rewrite.skip_first_turn
+
+    def _rewrite_key(self, message):
+        """
+        The conversation before this turn and the message. A regenerated or retried turn sends
+        the same message again after the exchange of its earlier attempt, which is left out.
+        """
+        end = len(self.memory)
+        while end > 1:
+            previous = end - 1
+            if isinstance(self.memory[previous], HaivenAIMessage):
+                previous -= 1
+            earlier_attempt = self.memory[previous]
+            if not (
+                previous > 0
+                and isinstance(earlier_attempt, HaivenHumanMessage)
+                and earlier_attempt.content == message
+            ):
+                break
+            end = previous
+
+        digest = hashlib.sha256()
+        for item in self.memory[:end]:
+            digest.update(item.content.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest(), message
+
+    def _remember_rewrite(self, key, query):
+        self._rewritten_queries[key] = query
+        while len(self._rewritten_queries) > _MAX_CACHED_REWRITES:
+            self._rewritten_queries.popitem(last=False)
+
+    def _similarity_query(self, message, trace: RetrievalTrace = None):
+        if self._skips_query_rewrite():
+            return message
+
+        key = self._rewrite_key(message)
+        if trace is not None:
+            trace.record(query_rewrite_cached=key in self._rewritten_queries)
+        if key in self._rewritten_queries:
+            return self._rewritten_queries[key]
+
+        with timed(trace, "query_rewrite"):
+            stream = self.chat_client.stream(self._similarity_query_prompt(message))
+            query = ""
+            for chunk in stream:
+                query += chunk.get("content", "")
+
+        query = self._parse_similarity_query(query)
+        self._remember_rewrite(key, query)
+        return query
+
+    async def _asimilarity_query(self, message, trace: RetrievalTrace = None):
+        if self._skips_query_rewrite():
+            return message
+
+        key = self._rewrite_key(message)
+        if trace is not None:
+            trace.record(query_rewrite_cached=key in self._rewritten_queries)
+        if key in self._rewritten_queries:
+            return self._rewritten_queries[key]
+
+        with timed(trace, "query_rewrite"):
+            stream = self.chat_client.astream(self._similarity_query_prompt(message))
+            query = ""
+            async for chunk in stream:
+                query += chunk.get("content", "")
+
+        query = self._parse_similarity_query(query)
+        self._remember_rewrite(key, query)
+        return query
+
+    def _searches_speculatively(self, message, knowledge_document_keys):
+        """Only worth it if the search would otherwise wait for a rewrite by the model"""
+        return (
+            self.query_rewrite.speculative
+            and bool(message)
+            and bool(knowledge_document_keys)
+            and not self._skips_query_rewrite()
+            and self._rewrite_key(message) not in self._rewritten_queries
+        )
+
+    def _similarity_search_based_on_history(
+        self, message, knowledge_document_keys, trace: RetrievalTrace = None
+    ):
+        if not self._searches_speculatively(message, knowledge_document_keys):
+            similarity_query = self._similarity_query(message, trace)
+            return self._search_knowledge_documents(
+                similarity_query, knowledge_document_keys, trace
+            )
+
+        # The speculative search runs at the same time as the rewrite, its stages are only
+        # added to the trace if its result is used
+        speculative_trace = RetrievalTrace() if trace is not None else None
+        speculative_search = _speculative_searches.submit(
+            self._search_knowledge_documents,
+            message,
+            knowledge_document_keys,
+            speculative_trace,
+        )
+        try:
+            similarity_query = self._similarity_query(message, trace)
+        except Exception:
+            speculative_search.cancel()
+            raise
+
+        if similarity_query is not None and adds_nothing_new(message, similarity_query):
+            result = speculative_search.result()
+            self._use_speculative_trace(trace, speculative_trace)
+            return result
+
+        speculative_search.cancel()
+        self._use_speculative_trace(trace, None)
+        return self._search_knowledge_documents(
+            similarity_query, knowledge_document_keys, trace
+        )
+
+    async def _asimilarity_search_based_on_history(
+        self, message, knowledge_document_keys, trace: RetrievalTrace = None
+    ):
+        if not self._searches_speculatively(message, knowledge_document_keys):
+            similarity_query = await self._asimilarity_query(message, trace)
+            # Vector search is CPU-bound and synchronous, keep it off the event loop
+            return await asyncio.to_thread(
+                self._search_knowledge_documents,
+                similarity_query,
+                knowledge_document_keys,
+                trace,
+            )
+
+        speculative_trace = RetrievalTrace() if trace is not None else None
+        speculative_search = asyncio.ensure_future(
+            asyncio.to_thread(
+                self._search_knowledge_documents,
+                message,
+                knowledge_document_keys,
+                speculative_trace,
+            )
+        )
+        try:
+            similarity_query = await self._asimilarity_query(message, trace)
+        except BaseException:
+            speculative_search.cancel()
+            raise
+
+        if similarity_query is not None and adds_nothing_new(message, similarity_query):
+            result = await speculative_search
+            self._use_speculative_trace(trace, speculative_trace)
+            return result
+
+        speculative_search.cancel()
+        self._use_speculative_trace(trace, None)
+        return await asyncio.to_thread(
+            self._search_knowledge_documents,
+            similarity_query,
+            knowledge_document_keys,
+            trace,
+        )
+
+    def _use_speculative_trace(
+        self, trace: RetrievalTrace, speculative_trace: RetrievalTrace
+    ):
+        if trace is None:
+            return
+        trace.record(speculative_search_used=speculative_trace is not None)
+        if speculative_trace is not None:
+            trace.merge(speculative_trace)
+
+    def _search_knowledge_documents(
+        self, similarity_query, knowledge_document_keys, trace: RetrievalTrace = None
+    ):
         print("Similarity Query:", similarity_query)
         if similarity_query is None:
             return None, None
@@ -115,11 +369,18 @@ class HaivenBaseChat:
             context_documents = self.knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents(
                 query=similarity_query,
                 document_keys=knowledge_document_keys,
+                trace=trace,
             )
         else:
             return None, None
 
-        context_for_prompt = "\n---".join(
+        if self.context_packer is not None:
+            with timed(trace, "context_packing"):
+                context_documents = self.context_packer.pack(context_documents)
+        if trace is not None:
+            trace.record(context_chunks=len(context_documents))
+
+        context_for_prompt = CONTEXT_SEPARATOR.join(
             [f"{document.page_content}" for document in context_documents]
         )
         de_duplicated_sources = DocumentsUtils.get_unique_sources(context_documents)
@@ -145,38 +406,90 @@ class StreamingChat(HaivenBaseChat):
         stream_in_chunks: bool = False,
         contexts: List[str] = None,
         user_context: str = None,
+        cache_responses: bool = True,
+        memory_budget: MemoryBudgetConfig = None,
+        query_rewrite: QueryRewriteConfig = None,
+        context_packing: ContextPackingConfig = None,
     ):
-        super().__init__(chat_client, knowledge_manager, contexts, user_context)
+        super().__init__(
+            chat_client,
+            knowledge_manager,
+            contexts,
+            user_context,
+            cache_responses,
+            memory_budget,
+            query_rewrite,
+            context_packing,
+        )
         self.stream_in_chunks = stream_in_chunks
 
     def run(self, message: str, user_query: str = None):
         """Run streaming chat with unified event system"""
         self.memory.append(HaivenHumanMessage(content=message))
+        reply = _AssistantReply(self.memory)
 
         try:
-            for i, chunk in enumerate(self.chat_client.stream(self.memory)):
-                if i == 0:
-                    if user_query:
-                        self.memory[-1].content = user_query
-                    self.memory.append(HaivenAIMessage(content=""))
+            for chunk in self.chat_client.stream(
+                self._messages_for_request(), use_cache=self.cache_responses
+            ):
+                if reply.message is None:
+                    self._start_reply(reply, user_query)
+                formatted_event = self._process_chunk(chunk, reply)
+                if formatted_event is not None:
+                    yield formatted_event
 
-                # Convert raw chunks to standardized events
-                event = self._convert_chunk_to_event(chunk)
-                if event:
-                    # Format event for streaming chat
-                    yield ChatEventFormatter.format_for_streaming(event)
+        except Exception as error:
+            yield self._format_error(error)
+        finally:
+            self._finish_reply(reply)
 
-                    # Update memory for content events
-                    if isinstance(event, ContentEvent):
-                        self.memory[-1].content += event.content
+    async def arun(self, message: str, user_query: str = None):
+        """Async variant of run(), streams from the chat client without holding a worker thread"""
+        self.memory.append(HaivenHumanMessage(content=message))
+        reply = _AssistantReply(self.memory)
+
+        try:
+            async for chunk in self.chat_client.astream(
+                self._messages_for_request(), use_cache=self.cache_responses
+            ):
+                if reply.message is None:
+                    self._start_reply(reply, user_query)
+                formatted_event = self._process_chunk(chunk, reply)
+                if formatted_event is not None:
+                    yield formatted_event
 
         except Exception as error:
-            error_msg = (
-                str(error).strip() or "Error while the model was processing the input"
-            )
-            print(f"[ERROR]: {error_msg}")
-            error_event = create_error_event(error_msg)
-            yield ChatEventFormatter.format_for_streaming(error_event)
+            yield self._format_error(error)
+        finally:
+            self._finish_reply(reply)
+
+    def _start_reply(self, reply: _AssistantReply, user_query: str = None):
+        if user_query:
+            self.memory[-1].content = user_query
+        reply.start()
+
+    def _process_chunk(self, chunk: dict, reply: _AssistantReply):
+        # Fast path for content, the bulk of a stream: streaming chat sends it as plain text
+        content = chunk.get("content")
+        if content is not None:
+            reply.append(content)
+            return content
+
+        # Convert other raw chunks to standardized events
+        event = self._convert_chunk_to_event(chunk)
+        if not event:
+            return None
+
+        # Format event for streaming chat
+        return ChatEventFormatter.format_for_streaming(event)
+
+    def _format_error(self, error: Exception) -> str:
+        error_msg = (
+            str(error).strip() or "Error while the model was processing the input"
+        )
+        print(f"[ERROR]: {error_msg}")
+        error_event = create_error_event(error_msg)
+        return ChatEventFormatter.format_for_streaming(error_event)
 
     def _convert_chunk_to_event(self, chunk) -> ChatEvent:
         """Convert raw chunk from chat client to standardized event"""
@@ -203,50 +516,135 @@ class StreamingChat(HaivenBaseChat):
         self,
         knowledge_document_keys: List[str],
         message: str = None,
+        debug_timings: bool = False,
     ):
-        """Run streaming chat with document context"""
+        """
+        Run streaming chat with document context. The time of each stage is logged as analytics
+        at the end, and also sent as a metadata event with debug_timings.
+        """
+        trace = RetrievalTrace()
+        started_at = time.perf_counter()
         try:
             context_for_prompt, sources_markdown = (
                 self._similarity_search_based_on_history(
-                    message, knowledge_document_keys
+                    message, knowledge_document_keys, trace
                 )
             )
+            prompt, user_request = self._prompt_with_context(
+                message, context_for_prompt
+            )
+            context_tokens = self._count_context_tokens(context_for_prompt, trace)
+            if self.context_packer is not None and context_for_prompt:
+                yield self._context_event(context_tokens), sources_markdown
+
+            # Stream content events
+            with trace.stage("generation"):
+                for event_str in self.run(prompt, user_request):
+                    yield event_str, sources_markdown
+
+            # Add sources at the end if available
+            if sources_markdown:
+                yield self._sources_event(sources_markdown), sources_markdown
 
-            user_request = (
-                message
-                or "Based on our conversation so far, what do you think is relevant to me with the CONTEXT information I gathered?"
+            trace.add_time("total", (time.perf_counter() - started_at) * 1000)
+            if debug_timings:
+                yield self._timings_event(trace), sources_markdown
+
+        except Exception as error:
+            yield self._format_error(error), ""
+        finally:
+            self._log_timings(trace)
+
+    async def arun_with_document(
+        self,
+        knowledge_document_keys: List[str],
+        message: str = None,
+        debug_timings: bool = False,
+    ):
+        """Async variant of run_with_document()"""
+        trace = RetrievalTrace()
+        started_at = time.perf_counter()
+        try:
+            (
+                context_for_prompt,
+                sources_markdown,
+            ) = await self._asimilarity_search_based_on_history(
+                message, knowledge_document_keys, trace
             )
+            prompt, user_request = self._prompt_with_context(
+                message, context_for_prompt
+            )
+            context_tokens = self._count_context_tokens(context_for_prompt, trace)
+            if self.context_packer is not None and context_for_prompt:
+                yield self._context_event(context_tokens), sources_markdown
+
+            with trace.stage("generation"):
+                async for event_str in self.arun(prompt, user_request):
+                    yield event_str, sources_markdown
+
+            if sources_markdown:
+                yield self._sources_event(sources_markdown), sources_markdown
+
+            trace.add_time("total", (time.perf_counter() - started_at) * 1000)
+            if debug_timings:
+                yield self._timings_event(trace), sources_markdown
+
+        except Exception as error:
+            yield self._format_error(error), ""
+        finally:
+            self._log_timings(trace)
+
+    def _prompt_with_context(self, message: str, context_for_prompt: str):
+        user_request = (
+            message
+            or "Based on our conversation so far, what do you think is relevant to me with the CONTEXT information I gathered?"
+        )
 
-            if context_for_prompt:
-                prompt = f"""
+        if context_for_prompt:
+            prompt = f"""
                 {user_request}
                 ---- Here is some additional CONTEXT that might be relevant to this:
                 {context_for_prompt} 
                 -------
                 Do not provide any advice that is outside of the CONTEXT I provided.
                 """
-            else:
-                prompt = user_request
+        else:
+            prompt = user_request
 
-            # Stream content events
-            for event_str in self.run(prompt, user_request):
-                yield event_str, sources_markdown
+        return prompt, user_request
 
-            # Add sources at the end if available
-            if sources_markdown:
-                sources_event = create_content_event("\n\n" + sources_markdown)
-                yield (
-                    ChatEventFormatter.format_for_streaming(sources_event),
-                    sources_markdown,
-                )
+    def _count_context_tokens(self, context_for_prompt: str, trace: RetrievalTrace):
+        if not context_for_prompt:
+            return 0
+        context_tokens = count_tokens(
+            self.chat_client.model_config.lite_id, context_for_prompt
+        )
+        trace.record(context_tokens=context_tokens)
+        return context_tokens
 
-        except Exception as error:
-            error_msg = (
-                str(error).strip() or "Error while the model was processing the input"
-            )
-            print(f"[ERROR]: {error_msg}")
-            error_event = create_error_event(error_msg)
-            yield ChatEventFormatter.format_for_streaming(error_event), ""
+    def _context_event(self, context_tokens: int) -> str:
+        """Metadata event with the number of tokens of the packed context"""
+        context_event = create_metadata_event(
+            metadata={"context_tokens": context_tokens}
+        )
+        return ChatEventFormatter.format_for_streaming(context_event)
+
+    def _timings_event(self, trace: RetrievalTrace) -> str:
+        """Metadata event with the time of each stage of the turn, for debugging"""
+        timings_event = create_metadata_event(
+            metadata={"retrieval_timings": trace.as_dict()}
+        )
+        return ChatEventFormatter.format_for_streaming(timings_event)
+
+    def _log_timings(self, trace: RetrievalTrace):
+        HaivenLogger.get().analytics(
+            "Knowledge chat timings",
+            {"chat_type": self.__class__.__name__, **trace.as_dict()},
+        )
+
+    def _sources_event(self, sources_markdown: str) -> str:
+        sources_event = create_content_event("\n\n" + sources_markdown)
+        return ChatEventFormatter.format_for_streaming(sources_event)
 
 
 class JSONChat(HaivenBaseChat):
@@ -256,14 +654,29 @@ class JSONChat(HaivenBaseChat):
         knowledge_manager: KnowledgeManager,
         contexts: List[str] = None,
         user_context: str = None,
+        cache_responses: bool = True,
+        memory_budget: MemoryBudgetConfig = None,
+        query_rewrite: QueryRewriteConfig = None,
+        context_packing: ContextPackingConfig = None,
     ):
-        super().__init__(chat_client, knowledge_manager, contexts, user_context)
+        super().__init__(
+            chat_client,
+            knowledge_manager,
+            contexts,
+            user_context,
+            cache_responses,
+            memory_budget,
+            query_rewrite,
+            context_packing,
+        )
 
     def stream_from_model(self, new_message):
         """Stream raw events from the model"""
         try:
             self.memory.append(HaivenHumanMessage(content=new_message))
-            stream = self.chat_client.stream(self.memory)
+            stream = self.chat_client.stream(
+                self._messages_for_request(), use_cache=self.cache_responses
+            )
 
             for chunk in stream:
                 event = self._convert_chunk_to_event(chunk)
@@ -271,39 +684,86 @@ class JSONChat(HaivenBaseChat):
                     yield event
 
         except Exception as error:
-            error_msg = (
-                str(error).strip() or "Error while the model was processing the input"
-            )
-            print(f"[ERROR]: {error_msg}")
-            yield create_error_event(error_msg)
+            yield self._error_event(error)
+
+    async def astream_from_model(self, new_message):
+        """Async variant of stream_from_model()"""
+        try:
+            self.memory.append(HaivenHumanMessage(content=new_message))
+
+            async for chunk in self.chat_client.astream(
+                self._messages_for_request(), use_cache=self.cache_responses
+            ):
+                event = self._convert_chunk_to_event(chunk)
+                if event:
+                    yield event
+
+        except Exception as error:
+            yield self._error_event(error)
 
     def run(self, message: str):
         """Run JSON chat with unified event system"""
+        reply = _AssistantReply(self.memory)
+        try:
+            self.memory.append(HaivenHumanMessage(content=message))
+            for chunk in self.chat_client.stream(
+                self._messages_for_request(), use_cache=self.cache_responses
+            ):
+                formatted_event = self._process_chunk(chunk, reply)
+                if formatted_event is not None:
+                    yield formatted_event
 
-        def create_data_chunk(chunk):
-            message = json.dumps({"data": chunk})
-            return f"{message}\n\n"
+        except Exception as error:
+            yield ChatEventFormatter.format_for_json(self._error_event(error))
+        finally:
+            self._finish_reply(reply)
 
+    async def arun(self, message: str):
+        """Async variant of run(), streams from the chat client without holding a worker thread"""
+        reply = _AssistantReply(self.memory)
         try:
-            for event in self.stream_from_model(message):
-                if isinstance(event, ContentEvent):
-                    # Update memory for content events
-                    if not hasattr(self, "_first_chunk"):
-                        self.memory.append(HaivenAIMessage(content=""))
-                        self._first_chunk = True
-                    self.memory[-1].content += event.content
-
-                # Format event for JSON chat - all formatting handled by ChatEventFormatter
-                formatted_event = ChatEventFormatter.format_for_json(event)
-                yield formatted_event
+            self.memory.append(HaivenHumanMessage(content=message))
+            async for chunk in self.chat_client.astream(
+                self._messages_for_request(), use_cache=self.cache_responses
+            ):
+                formatted_event = self._process_chunk(chunk, reply)
+                if formatted_event is not None:
+                    yield formatted_event
 
         except Exception as error:
-            error_msg = (
-                str(error).strip() or "Error while the model was processing the input"
-            )
-            print(f"[ERROR]: {error_msg}")
-            error_event = create_error_event(error_msg)
-            yield ChatEventFormatter.format_for_json(error_event) + "\n\n"
+            yield ChatEventFormatter.format_for_json(self._error_event(error))
+        finally:
+            self._finish_reply(reply)
+
+    def _process_chunk(self, chunk, reply: _AssistantReply):
+        # Fast path for content, formatted straight to JSON without an intermediate event
+        content = chunk.get("content") if isinstance(chunk, dict) else None
+        if content is not None:
+            # Skip empty content chunks to avoid invalid JSON
+            if not content.strip():
+                return None
+            reply.append(content)
+            return ChatEventFormatter.format_content_for_json(content)
+
+        event = self._convert_chunk_to_event(chunk)
+        if not event:
+            return None
+        return self._process_event(event, reply)
+
+    def _process_event(self, event: ChatEvent, reply: _AssistantReply) -> str:
+        if isinstance(event, ContentEvent):
+            # Update memory for content events
+            reply.append(event.content)
+
+        # Format event for JSON chat - all formatting handled by ChatEventFormatter
+        return ChatEventFormatter.format_for_json(event)
+
+    def _error_event(self, error: Exception):
+        error_msg = (
+            str(error).strip() or "Error while the model was processing the input"
+        )
+        print(f"[ERROR]: {error_msg}")
+        return create_error_event(error_msg)
 
     def _convert_chunk_to_event(self, chunk) -> ChatEvent:
         """Convert raw chunk from chat client to standardized event"""
@@ -429,6 +889,7 @@ class ChatOptions(BaseModel):
     category: str = None
     in_chunks: bool = False
     user_identifier: str = None
+    cache_responses: bool = True
 
 
 class ChatManager:
@@ -465,6 +926,10 @@ class ChatManager:
                 stream_in_chunks=options.in_chunks if options else False,
                 contexts=contexts,
                 user_context=user_context,
+                cache_responses=options.cache_responses if options else True,
+                memory_budget=self.config_service.load_memory_budget(model_config),
+                query_rewrite=self.config_service.load_query_rewrite_config(),
+                context_packing=self.config_service.load_context_packing(model_config),
             )
 
         return self.chat_session_memory.get_or_create_chat(
@@ -488,6 +953,10 @@ class ChatManager:
                 self.knowledge_manager,
                 contexts=contexts,
                 user_context=user_context,
+                cache_responses=options.cache_responses if options else True,
+                memory_budget=self.config_service.load_memory_budget(model_config),
+                query_rewrite=self.config_service.load_query_rewrite_config(),
+                context_packing=self.config_service.load_context_packing(model_config),
             )
 
         return self.chat_session_memory.get_or_create_chat(
@@ -1,13 +1,31 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
 import json
 import os
-from typing import List, Dict, Any, Optional
+import queue
+import threading
+import time
+from typing import List, Optional
 from config_service import ConfigService
 from llms.model_config import ModelConfig
+import httpx
+from litellm import APIConnectionError, RateLimitError, Timeout
+from litellm.types.utils import ModelResponseStream
 from pydantic import BaseModel
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from langchain_core.messages.base import BaseMessage
-from llms.litellm_wrapper import llmCompletion
+from llms.failover import (
+    CircuitBreaker,
+    ProviderUnavailableError,
+    is_provider_failure,
+    is_transient_provider_error,
+)
+from llms.litellm_wrapper import llmAcompletion, llmCompletion
+from llms.mock_load_profile import MockLoadProfile
+from llms.rate_limiter import AdmissionController
+from llms.response_cache import ResponseCache
+from llms.single_flight import SingleFlight
+from logger import HaivenLogger
 
 
 class HaivenMessage(BaseModel):
@@ -51,13 +69,62 @@ class MockChoice(BaseModel):
     delta: MockDelta
 
 
+class MockUsage(BaseModel):
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
 class MockResult(BaseModel):
     choices: List[MockChoice]
-    usage: Optional[Dict[str, Any]] = None
+    usage: Optional[MockUsage] = None
+
+
+LOREM_IPSUM_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt "
+    "ut labore et dolore magna aliqua ut enim ad minim veniam quis nostrud exercitation ullamco "
+    "laboris nisi ut aliquip ex ea commodo consequat duis aute irure dolor in reprehenderit"
+).split()
 
 
 class MockModelClient:
+    """
+    Synthetic provider used instead of litellm when MOCK_AI is set.
+    Its behaviour, from a fixed instant response to load-test latencies and failures, is
+    configured with a MockLoadProfile (`mock_ai` in config.yaml).
+    """
+
+    def __init__(self, profile: MockLoadProfile = None):
+        self.profile = profile or MockLoadProfile()
+
     def completion(self, messages, model=None, **kwargs):
+        # Like litellm.completion(stream=True), errors before the first chunk are raised by the call itself
+        if not self.profile.load_test:
+            return self._fixed_results(messages)
+
+        plan = self._plan(messages, model)
+        if plan["failure"] == "timeout":
+            time.sleep(self.profile.timeout_seconds)
+        self._raise_injected_failure(plan, model)
+        return self._timed_results(plan, model)
+
+    async def acompletion(self, messages, model=None, **kwargs):
+        # Mirrors litellm.acompletion(stream=True): awaiting returns an async iterator
+        if not self.profile.load_test:
+
+            async def stream_results():
+                for result in self._fixed_results(messages):
+                    yield result
+
+            return stream_results()
+
+        plan = self._plan(messages, model)
+        if plan["failure"] == "timeout":
+            await asyncio.sleep(self.profile.timeout_seconds)
+        self._raise_injected_failure(plan, model)
+        return self._atimed_results(plan, model)
+
+    def _fixed_results(self, messages):
         message = messages[0]["content"]
         test_data = [
             "[Mock response]",
@@ -90,7 +157,7 @@ class MockModelClient:
             ]
 
         # Mock token usage for testing
-        mock_usage = {"prompt_tokens": 25, "completion_tokens": 15, "total_tokens": 40}
+        mock_usage = MockUsage(prompt_tokens=25, completion_tokens=15, total_tokens=40)
 
         for i, chunk in enumerate(test_data):
             result = MockResult(choices=[MockChoice(delta=MockDelta(content=chunk))])
@@ -99,64 +166,657 @@ class MockModelClient:
                 result.usage = mock_usage
             yield result
 
+    def _plan(self, messages, model) -> dict:
+        """Draw everything random about one response up front"""
+        profile = self.profile
+        rng = profile.rng
+
+        failure = None
+        roll = rng.random()
+        if roll < profile.rate_limit_probability:
+            failure = "rate_limit"
+        elif roll < profile.rate_limit_probability + profile.timeout_probability:
+            failure = "timeout"
+
+        response_tokens = max(1, int(profile.response_tokens.sample(rng)))
+        words = [
+            LOREM_IPSUM_WORDS[rng.randrange(len(LOREM_IPSUM_WORDS))]
+            for _ in range(response_tokens)
+        ]
+        # Roughly one token per word, so chunk_tokens words make up one chunk
+        chunks = [
+            " ".join(words[i : i + profile.chunk_tokens]) + " "
+            for i in range(0, len(words), profile.chunk_tokens)
+        ]
+        if "json" in messages[0]["content"].lower():
+            chunks = self._as_json_chunks(" ".join(words), len(chunks))
+
+        disconnect_after = None
+        if rng.random() < profile.disconnect_probability:
+            disconnect_after = rng.randrange(len(chunks))
+
+        prompt_characters = sum(
+            len(message.get("content") or "")
+            for message in messages
+            if isinstance(message.get("content"), str)
+        )
+        prompt_tokens = max(1, prompt_characters // 4)
+        return {
+            "failure": failure,
+            "time_to_first_token": max(
+                0.0, profile.time_to_first_token_seconds.sample(rng)
+            ),
+            "seconds_per_chunk": profile.chunk_tokens
+            / max(0.1, profile.tokens_per_second.sample(rng)),
+            "chunks": chunks,
+            "disconnect_after": disconnect_after,
+            "usage": MockUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=response_tokens,
+                total_tokens=prompt_tokens + response_tokens,
+            ),
+        }
+
+    @staticmethod
+    def _as_json_chunks(text: str, chunk_count: int) -> List[str]:
+        # JSON prompts expect an array of objects, e.g. scenarios with a title and a summary
+        response = json.dumps(
+            [
+                {"title": f"Mock scenario {i + 1}", "summary": summary}
+                for i, summary in enumerate(text.split(" dolor ")[:10])
+            ]
+        )
+        chunk_size = max(1, len(response) // max(1, chunk_count))
+        return [
+            response[i : i + chunk_size] for i in range(0, len(response), chunk_size)
+        ]
+
+    def _raise_injected_failure(self, plan: dict, model: str):
+        provider = (model or "mock").split("/")[0]
+        if plan["failure"] == "rate_limit":
+            headers = {}
+            if self.profile.retry_after_seconds is not None:
+                headers["retry-after"] = str(self.profile.retry_after_seconds)
+            raise RateLimitError(
+                message="Mock provider rate limit",
+                llm_provider=provider,
+                model=model,
+                response=httpx.Response(
+                    429,
+                    headers=headers,
+                    request=httpx.Request("POST", "https://mock-ai.local"),
+                ),
+            )
+        if plan["failure"] == "timeout":
+            raise Timeout(
+                message="Mock provider timed out", model=model, llm_provider=provider
+            )
+
+    def _results(self, plan: dict):
+        """The results of a plan as (delay before the result, result) pairs"""
+        chunks = plan["chunks"]
+        for i, chunk in enumerate(chunks):
+            delay = plan["time_to_first_token"] if i == 0 else plan["seconds_per_chunk"]
+            if plan["disconnect_after"] == i:
+                yield delay, None
+                return
+            result = MockResult(choices=[MockChoice(delta=MockDelta(content=chunk))])
+            if i == len(chunks) - 1:
+                result.usage = plan["usage"]
+            yield delay, result
+
+    def _disconnect_error(self, model: str):
+        return APIConnectionError(
+            message="Mock provider closed the connection mid-stream",
+            llm_provider=(model or "mock").split("/")[0],
+            model=model,
+        )
+
+    def _timed_results(self, plan: dict, model: str):
+        for delay, result in self._results(plan):
+            time.sleep(delay)
+            if result is None:
+                raise self._disconnect_error(model)
+            yield result
+
+    async def _atimed_results(self, plan: dict, model: str):
+        for delay, result in self._results(plan):
+            await asyncio.sleep(delay)
+            if result is None:
+                raise self._disconnect_error(model)
+            yield result
+
+
+def _close_provider_response(response):
+    close = getattr(getattr(response, "completion_stream", response), "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        # Closing from another thread may fail (e.g. a generator that is running), the attempt
+        # then ends with its first chunk instead
+        pass
+
+
+class _HedgedAttempt:
+    """
+    One of the models racing for the first chunk. When the race is decided without it, its
+    provider response is closed right away, instead of streaming on until its first chunk.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.abandoned = False
+        self._response = None
+
+    def track(self, response) -> bool:
+        """Remember the provider response, returns False (and closes it) if already abandoned"""
+        with self.lock:
+            self._response = response
+            abandoned = self.abandoned
+        if abandoned:
+            _close_provider_response(response)
+        return not abandoned
+
+    def abandon(self):
+        with self.lock:
+            self.abandoned = True
+            response = self._response
+        if response is not None:
+            _close_provider_response(response)
+
 
 class ChatClient:
-    def __init__(self, model_config: ModelConfig):
+    def __init__(
+        self,
+        model_config: ModelConfig,
+        response_cache: ResponseCache = None,
+        admission_controller: AdmissionController = None,
+        fallback_models: List[ModelConfig] = None,
+        circuit_breaker: CircuitBreaker = None,
+        hedge_after_seconds: Optional[float] = None,
+        single_flight: SingleFlight = None,
+        mock_profile: MockLoadProfile = None,
+    ):
         self.model_config = model_config
-
-    def _get_kwargs(self) -> dict:
-        if self.model_config.provider == "ollama":
+        self.response_cache = response_cache
+        self.admission_controller = admission_controller
+        self.fallback_models = fallback_models or []
+        self.circuit_breaker = circuit_breaker
+        self.hedge_after_seconds = hedge_after_seconds
+        self.single_flight = single_flight
+        self.mock_profile = mock_profile
+
+    def _get_kwargs(self, model_config: ModelConfig = None) -> dict:
+        model_config = model_config or self.model_config
+        if model_config.provider == "ollama":
             return {"api_base": os.environ.get("OLLAMA_HOST", "")}
         else:
             return {}
 
-    def stream(self, messages: List[HaivenMessage], mock: bool = False):
+    def _completion_params(self, model_config: ModelConfig = None) -> dict:
+        return {
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            **self._get_kwargs(model_config),
+        }
+
+    def _request_key(self, json_messages: List[dict]) -> str:
+        return ResponseCache.make_key(
+            self.model_config.lite_id,
+            json_messages,
+            {"temperature": self.model_config.temperature, **self._completion_params()},
+        )
+
+    def stream(
+        self, messages: List[HaivenMessage], mock: bool = False, use_cache: bool = True
+    ):
         json_messages = [message.to_json() for message in messages]
-        if os.environ.get("MOCK_AI", False):
-            completion_fn = MockModelClient().completion
+        request_key = self._request_key(json_messages) if use_cache else None
+
+        if request_key is not None and self.response_cache is not None:
+            cached_chunks = self.response_cache.get(request_key)
+            if cached_chunks is not None:
+                yield from cached_chunks
+                return
+
+        if request_key is not None and self.single_flight is not None:
+            yield from self.single_flight.stream(
+                request_key, lambda: self._stream_and_cache(json_messages, request_key)
+            )
         else:
-            completion_fn = llmCompletion
+            yield from self._stream_and_cache(json_messages, request_key)
 
-        citations = None
-        usage_data = None
-        for result in completion_fn(
-            model=self.model_config.lite_id,
-            messages=json_messages,
-            stream=True,
-            stream_options={"include_usage": True},
-            **self._get_kwargs(),
-        ):
-            # Handle different response types safely
+    async def astream(
+        self, messages: List[HaivenMessage], mock: bool = False, use_cache: bool = True
+    ):
+        """Async counterpart of stream(), yields the same chunk dicts without blocking a worker thread"""
+        json_messages = [message.to_json() for message in messages]
+        request_key = self._request_key(json_messages) if use_cache else None
+
+        if request_key is not None and self.response_cache is not None:
+            cached_chunks = self.response_cache.get(request_key)
+            if cached_chunks is not None:
+                for chunk in cached_chunks:
+                    yield chunk
+                return
+
+        if request_key is not None and self.single_flight is not None:
+            stream = self.single_flight.astream(
+                request_key, lambda: self._astream_and_cache(json_messages, request_key)
+            )
+        else:
+            stream = self._astream_and_cache(json_messages, request_key)
+        async for chunk in stream:
+            yield chunk
+
+    def _stream_and_cache(self, json_messages: List[dict], request_key: Optional[str]):
+        recorded_chunks = []
+        for chunk in self._stream_from_provider(json_messages):
+            recorded_chunks.append(chunk)
+            yield chunk
+
+        # Only reached when the stream completed, errors and disconnects are never cached
+        if request_key is not None and self.response_cache is not None:
+            self.response_cache.put(request_key, recorded_chunks)
+
+    async def _astream_and_cache(
+        self, json_messages: List[dict], request_key: Optional[str]
+    ):
+        recorded_chunks = []
+        async for chunk in self._astream_from_provider(json_messages):
+            recorded_chunks.append(chunk)
+            yield chunk
+
+        if request_key is not None and self.response_cache is not None:
+            self.response_cache.put(request_key, recorded_chunks)
+
+    def _available_models(self):
+        """The model and then its fallbacks, in order, skipping providers with an open circuit"""
+        for model_config in [self.model_config] + self.fallback_models:
+            if self.circuit_breaker is None or self.circuit_breaker.allow(
+                model_config.provider
+            ):
+                yield model_config
+
+    def _stream_from_provider(self, json_messages: List[dict]):
+        """
+        Stream from the first available model that yields its first chunk. Models only fail over
+        on transient provider errors before that first chunk, any other error and a failure after
+        the first chunk are raised to the caller.
+        """
+        available_models = self._available_models()
+        last_error = None
+        for model_config in available_models:
             try:
-                if isinstance(result, dict):
-                    citations = citations or result.get("citations", None)
-                    if self._is_token_usage_result(result):
-                        usage_data = result.get("usage")
+                if self.hedge_after_seconds:
+                    model_config, stream, first_chunk = self._race_first_chunk(
+                        model_config, available_models, json_messages
+                    )
                 else:
-                    # Handle object-like responses
-                    if hasattr(result, "usage") and getattr(result, "usage", None):
-                        usage_data = getattr(result, "usage")
-                    if hasattr(result, "get"):
-                        citations = citations or getattr(result, "get")(
-                            "citations", None
-                        )
+                    model_config, stream, first_chunk = self._start_stream(
+                        model_config, json_messages
+                    )
+            except Exception as error:
+                if not is_transient_provider_error(error):
+                    raise
+                last_error = error
+                continue
 
-                # Extract content from streaming response
-                if hasattr(result, "choices") and getattr(result, "choices", None):
-                    choices = getattr(result, "choices")
-                    if choices and len(choices) > 0 and hasattr(choices[0], "delta"):
-                        delta = getattr(choices[0], "delta")
-                        if (
-                            hasattr(delta, "content")
-                            and getattr(delta, "content") is not None
-                        ):
-                            yield {"content": getattr(delta, "content")}
-            except (AttributeError, TypeError, IndexError):
-                # Skip malformed responses
+            self._log_served_by(model_config)
+            yield first_chunk
+            try:
+                yield from stream
+            except Exception as error:
+                if is_provider_failure(error):
+                    self._record_failure(model_config)
+                raise
+            return
+
+        raise last_error or self._unavailable_error()
+
+    async def _astream_from_provider(self, json_messages: List[dict]):
+        available_models = self._available_models()
+        last_error = None
+        for model_config in available_models:
+            try:
+                if self.hedge_after_seconds:
+                    model_config, stream, first_chunk = await self._arace_first_chunk(
+                        model_config, available_models, json_messages
+                    )
+                else:
+                    model_config, stream, first_chunk = await self._astart_stream(
+                        model_config, json_messages
+                    )
+            except Exception as error:
+                if not is_transient_provider_error(error):
+                    raise
+                last_error = error
                 continue
 
+            self._log_served_by(model_config)
+            yield first_chunk
+            try:
+                async for chunk in stream:
+                    yield chunk
+            except Exception as error:
+                if is_provider_failure(error):
+                    self._record_failure(model_config)
+                raise
+            return
+
+        raise last_error or self._unavailable_error()
+
+    def _start_stream(
+        self,
+        model_config: ModelConfig,
+        json_messages: List[dict],
+        hedged_attempt: _HedgedAttempt = None,
+    ):
+        stream = self._stream_from_model(model_config, json_messages, hedged_attempt)
+        try:
+            first_chunk = next(stream)
+        except Exception as error:
+            abandoned = hedged_attempt is not None and hedged_attempt.abandoned
+            if is_provider_failure(error) and not abandoned:
+                self._record_failure(model_config, error)
+            else:
+                self._record_cancelled(model_config)
+            raise
+        self._record_success(model_config)
+        return model_config, stream, first_chunk
+
+    async def _astart_stream(
+        self, model_config: ModelConfig, json_messages: List[dict]
+    ):
+        stream = self._astream_from_model(model_config, json_messages)
+        try:
+            first_chunk = await stream.__anext__()
+        except asyncio.CancelledError:
+            self._record_cancelled(model_config)
+            raise
+        except Exception as error:
+            if is_provider_failure(error):
+                self._record_failure(model_config, error)
+            else:
+                self._record_cancelled(model_config)
+            raise
+        self._record_success(model_config)
+        return model_config, stream, first_chunk
+
+    def _race_first_chunk(
+        self, model_config: ModelConfig, available_models, json_messages: List[dict]
+    ):
+        """
+        Start model_config, and if it has neither yielded its first chunk nor failed after
+        hedge_after_seconds, start the next available model as well. Whichever yields first wins,
+        the provider response of the loser is closed as soon as the race is decided.
+        """
+        outcomes = queue.Queue()
+        attempts = []
+
+        def start(candidate: ModelConfig, attempt: _HedgedAttempt):
+            try:
+                started = self._start_stream(candidate, json_messages, attempt)
+            except Exception as error:
+                outcomes.put((attempt, None, error))
+                return
+            with attempt.lock:
+                if not attempt.abandoned:
+                    outcomes.put((attempt, started, None))
+                    return
+            started[1].close()
+
+        def race(candidate: ModelConfig):
+            attempt = _HedgedAttempt()
+            attempts.append(attempt)
+            threading.Thread(
+                target=start, args=(candidate, attempt), daemon=True
+            ).start()
+
+        race(model_config)
+        running = 1
+        hedged = False
+        last_error = None
+        winner = None
+        try:
+            while running:
+                try:
+                    attempt, started, error = outcomes.get(
+                        timeout=None if hedged else self.hedge_after_seconds
+                    )
+                    running -= 1
+                    if error is None:
+                        winner = attempt
+                        return started
+                    if not is_transient_provider_error(error):
+                        raise error
+                    last_error = error
+                except queue.Empty:
+                    pass
+
+                if not hedged:
+                    hedged = True
+                    hedge_model = next(available_models, None)
+                    if hedge_model is not None:
+                        race(hedge_model)
+                        running += 1
+
+            raise last_error
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.abandon()
+            # Streams that started before they were abandoned
+            while not outcomes.empty():
+                attempt, started, _ = outcomes.get_nowait()
+                if started is not None and attempt is not winner:
+                    started[1].close()
+
+    async def _arace_first_chunk(
+        self, model_config: ModelConfig, available_models, json_messages: List[dict]
+    ):
+        tasks = {
+            asyncio.ensure_future(self._astart_stream(model_config, json_messages))
+        }
+        hedged = False
+        last_error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks,
+                    timeout=None if hedged else self.hedge_after_seconds,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                started = [task.result() for task in done if task.exception() is None]
+                if started:
+                    for _, stream, _ in started[1:]:
+                        await stream.aclose()
+                    return started[0]
+                for task in done:
+                    last_error = task.exception()
+                    if not is_transient_provider_error(last_error):
+                        raise last_error
+
+                if not hedged:
+                    hedged = True
+                    hedge_model = next(available_models, None)
+                    if hedge_model is not None:
+                        tasks.add(
+                            asyncio.ensure_future(
+                                self._astart_stream(hedge_model, json_messages)
+                            )
+                        )
+
+            raise last_error
+        finally:
+            # Also when the caller is cancelled while waiting for the first chunk
+            for loser in tasks:
+                loser.cancel()
+
+    def _record_success(self, model_config: ModelConfig):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success(model_config.provider)
+
+    def _record_failure(self, model_config: ModelConfig, error: Exception = None):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure(model_config.provider)
+        if error is not None and (self.fallback_models or self.hedge_after_seconds):
+            print(f"[WARNING]: {model_config.lite_id} failed, failing over: {error}")
+
+    def _record_cancelled(self, model_config: ModelConfig):
+        # Neither a success nor a failure of the provider, but a half open circuit needs its trial back
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_cancelled(model_config.provider)
+
+    def _unavailable_error(self) -> ProviderUnavailableError:
+        return ProviderUnavailableError(
+            f"{self.model_config.name} and its fallbacks are currently unavailable, please try again in a moment."
+        )
+
+    def _log_served_by(self, model_config: ModelConfig):
+        HaivenLogger.get().analytics(
+            "Model response served",
+            {
+                "requested_model": self.model_config.lite_id,
+                "served_by": model_config.lite_id,
+                "failover": model_config is not self.model_config,
+            },
+        )
+
+    def _stream_from_model(
+        self,
+        model_config: ModelConfig,
+        json_messages: List[dict],
+        hedged_attempt: _HedgedAttempt = None,
+    ):
+        # The mock goes through the same admission control, so its injected 429s exercise the retries
+        if os.environ.get("MOCK_AI", False):
+            completion_fn = MockModelClient(self.mock_profile).completion
+        else:
+            completion_fn = None
+
+        stream_state = {
+            "citations": None,
+            "usage": None,
+            "served_by": model_config.lite_id,
+        }
+        response = llmCompletion(
+            completion_fn=completion_fn,
+            model=model_config.lite_id,
+            messages=json_messages,
+            admission_controller=self.admission_controller,
+            **self._completion_params(model_config),
+        )
+        if hedged_attempt is not None and not hedged_attempt.track(response):
+            return
+        for result in response:
+            content = self._process_result(result, stream_state)
+            if content is not None:
+                yield {"content": content}
+
+        yield from self._final_chunks(stream_state)
+
+    async def _astream_from_model(
+        self, model_config: ModelConfig, json_messages: List[dict]
+    ):
+        if os.environ.get("MOCK_AI", False):
+            acompletion_fn = MockModelClient(self.mock_profile).acompletion
+        else:
+            acompletion_fn = None
+
+        stream_state = {
+            "citations": None,
+            "usage": None,
+            "served_by": model_config.lite_id,
+        }
+        response = await llmAcompletion(
+            acompletion_fn=acompletion_fn,
+            model=model_config.lite_id,
+            messages=json_messages,
+            admission_controller=self.admission_controller,
+            **self._completion_params(model_config),
+        )
+        async for result in response:
+            content = self._process_result(result, stream_state)
+            if content is not None:
+                yield {"content": content}
+
+        for chunk in self._final_chunks(stream_state):
+            yield chunk
+
+    def _process_result(self, result, stream_state: dict) -> Optional[str]:
+        """Collect citations and usage from a streamed result into stream_state, return its content delta if any"""
+        if isinstance(result, ModelResponseStream):
+            return self._process_stream_chunk(result, stream_state)
+        return self._process_other_result(result, stream_state)
+
+    def _process_stream_chunk(
+        self, result: ModelResponseStream, stream_state: dict
+    ) -> Optional[str]:
+        """
+        Fast path for the chunks litellm streams for every provider: usage and provider specific
+        fields like Perplexity's citations are pydantic extras, only present on a few chunks.
+        Probing for them with hasattr costs an AttributeError per token.
+        """
+        extra = result.__pydantic_extra__
+        if extra:
+            if extra.get("usage"):
+                stream_state["usage"] = extra["usage"]
+            stream_state["citations"] = stream_state["citations"] or extra.get(
+                "citations"
+            )
+
+        choices = result.choices
+        if choices:
+            delta = getattr(choices[0], "delta", None)
+            if delta is not None:
+                return delta.content
+        return None
+
+    def _process_other_result(self, result, stream_state: dict) -> Optional[str]:
+        # Handle different response types safely
+        try:
+            if isinstance(result, dict):
+                stream_state["citations"] = stream_state["citations"] or result.get(
+                    "citations", None
+                )
+                if self._is_token_usage_result(result):
+                    stream_state["usage"] = result.get("usage")
+            else:
+                # Handle object-like responses
+                if hasattr(result, "usage") and getattr(result, "usage", None):
+                    stream_state["usage"] = getattr(result, "usage")
+                if hasattr(result, "get"):
+                    stream_state["citations"] = stream_state["citations"] or getattr(
+                        result, "get"
+                    )("citations", None)
+
+            # Extract content from streaming response
+            if hasattr(result, "choices") and getattr(result, "choices", None):
+                choices = getattr(result, "choices")
+                if choices and len(choices) > 0 and hasattr(choices[0], "delta"):
+                    delta = getattr(choices[0], "delta")
+                    if (
+                        hasattr(delta, "content")
+                        and getattr(delta, "content") is not None
+                    ):
+                        return getattr(delta, "content")
+        except (AttributeError, TypeError, IndexError):
+            # Skip malformed responses
+            pass
+        return None
+
+    def _final_chunks(self, stream_state: dict):
+        citations = stream_state["citations"]
+        usage_data = stream_state["usage"]
+
+        # One metadata chunk per response, the UI replaces its citations on every metadata event
+        metadata = {"served_by": stream_state["served_by"]}
         if citations is not None:
-            yield {"metadata": {"citations": citations}}
+            metadata["citations"] = citations
+        yield {"metadata": metadata}
 
         # Yield usage data if available - simplified
         if usage_data is not None:
@@ -206,9 +866,43 @@ class ChatClient:
 
 
 class ChatClientFactory:
-    def __init__(self, config_service: ConfigService):
+    def __init__(
+        self,
+        config_service: ConfigService,
+        response_cache: ResponseCache = None,
+        admission_controller: AdmissionController = None,
+        circuit_breaker: CircuitBreaker = None,
+        hedge_after_seconds: Optional[float] = None,
+        single_flight: SingleFlight = None,
+        mock_profile: MockLoadProfile = None,
+    ):
         self.config_service = config_service
+        self.response_cache = response_cache
+        self.admission_controller = admission_controller
+        self.circuit_breaker = circuit_breaker
+        self.hedge_after_seconds = hedge_after_seconds
+        self.single_flight = single_flight
+        self.mock_profile = mock_profile
 
     # Factory method gives us some extra control over how the ChatClients are created
     def new_chat_client(self, model: ModelConfig) -> ChatClient:
-        return ChatClient(model_config=model)
+        return ChatClient(
+            model_config=model,
+            response_cache=self.response_cache,
+            admission_controller=self.admission_controller,
+            fallback_models=self._fallback_models(model),
+            circuit_breaker=self.circuit_breaker,
+            hedge_after_seconds=self.hedge_after_seconds,
+            single_flight=self.single_flight,
+            mock_profile=self.mock_profile,
+        )
+
+    def _fallback_models(self, model: ModelConfig) -> List[ModelConfig]:
+        fallback_models = []
+        for fallback_id in model.fallbacks:
+            try:
+                fallback_models.append(self.config_service.get_model(fallback_id))
+            except ValueError:
+                # Fallbacks of providers that are not enabled in this deployment are skipped
+                continue
+        return fallback_models
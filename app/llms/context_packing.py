@@ -0,0 +1,179 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import re
+from typing import List, Optional
+
+from langchain.docstore.document import Document
+
+from config_values import is_enabled_value
+from llms.memory_budget import count_tokens
+
+CONTEXT_SEPARATOR = "\n---"
+
+_WORD = re.compile(r"\w+")
+
+
+class ContextPackingConfig:
+    """
+    How the chunks found for a knowledge chat are packed into the prompt.
+
+    Chunks of the same source and page that overlap are merged into one, the splitter of the
+    knowledge pack repeats the end of a chunk at the start of the next one. Chunks that are
+    contained in another or whose words are duplicate_threshold similar (Jaccard) to a better
+    chunk are dropped. The remaining chunks are then added best first while they fit into
+    max_tokens, without max_tokens all of them are added.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_tokens: Optional[int] = None,
+        duplicate_threshold: float = 0.9,
+        min_overlap_chars: int = 20,
+    ):
+        self.enabled = enabled
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap_chars = min_overlap_chars
+
+    @classmethod
+    def from_dict(cls, data, default: "ContextPackingConfig" = None):
+        default = default or cls()
+        data = data or {}
+        enabled = data.get("enabled")
+        max_tokens = data.get("max_tokens")
+        duplicate_threshold = data.get("duplicate_threshold")
+        min_overlap_chars = data.get("min_overlap_chars")
+        return cls(
+            enabled=default.enabled
+            if enabled in [None, ""]
+            else is_enabled_value(enabled),
+            max_tokens=default.max_tokens
+            if max_tokens in [None, ""]
+            else int(max_tokens),
+            duplicate_threshold=default.duplicate_threshold
+            if duplicate_threshold in [None, ""]
+            else float(duplicate_threshold),
+            min_overlap_chars=default.min_overlap_chars
+            if min_overlap_chars in [None, ""]
+            else int(min_overlap_chars),
+        )
+
+
+def overlap_length(first: str, second: str, min_overlap: int) -> int:
+    """Length of the longest end of first that second starts with, 0 if below min_overlap"""
+    if min(len(first), len(second)) < min_overlap:
+        return 0
+    start = first.find(second[:min_overlap], max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(second[:min_overlap], start + 1)
+    return 0
+
+
+def jaccard_similarity(first: set, second: set) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class _Packed:
+    __slots__ = ("document", "rank", "words")
+
+    def __init__(self, document: Document, rank: int):
+        self.document = document
+        self.rank = rank
+        self.words = set(_WORD.findall(document.page_content.lower()))
+
+
+class ContextPacker:
+    """Packs the chunks found for a knowledge chat, see ContextPackingConfig"""
+
+    def __init__(self, config: ContextPackingConfig, model: str):
+        self.config = config
+        self.model = model
+
+    def pack(self, documents: List[Document]) -> List[Document]:
+        """The chunks to put into the prompt, best first. documents must be sorted best first."""
+        packed = self._remove_duplicates(self._merge_overlaps(documents))
+        if self.config.max_tokens is None:
+            return [item.document for item in packed]
+
+        separator_tokens = count_tokens(self.model, CONTEXT_SEPARATOR)
+        budget = self.config.max_tokens
+        selected = []
+        for item in packed:
+            tokens = count_tokens(self.model, item.document.page_content)
+            if selected:
+                tokens += separator_tokens
+            # A smaller chunk further down may still fit
+            if tokens <= budget:
+                selected.append(item.document)
+                budget -= tokens
+        return selected
+
+    def _merge_overlaps(self, documents: List[Document]) -> List[_Packed]:
+        packed: List[_Packed] = []
+        for rank, document in enumerate(documents):
+            item = _Packed(document, rank)
+            page = _page_of(document)
+            # Merging two chunks can make them overlap a third one
+            merged = page is not None
+            while merged:
+                merged = False
+                for other in packed:
+                    if _page_of(other.document) != page:
+                        continue
+                    combined = self._combine(other.document, item.document)
+                    if combined is not None:
+                        packed.remove(other)
+                        item = _Packed(combined, min(other.rank, item.rank))
+                        merged = True
+                        break
+            packed.append(item)
+        return sorted(packed, key=lambda item: item.rank)
+
+    def _combine(self, first: Document, second: Document) -> Optional[Document]:
+        first_text, second_text = first.page_content, second.page_content
+        if second_text in first_text:
+            return first
+        if first_text in second_text:
+            return Document(page_content=second_text, metadata=first.metadata)
+
+        min_overlap = self.config.min_overlap_chars
+        overlap = overlap_length(first_text, second_text, min_overlap)
+        if overlap:
+            return Document(
+                page_content=first_text + second_text[overlap:],
+                metadata=first.metadata,
+            )
+        overlap = overlap_length(second_text, first_text, min_overlap)
+        if overlap:
+            return Document(
+                page_content=second_text + first_text[overlap:],
+                metadata=first.metadata,
+            )
+        return None
+
+    def _remove_duplicates(self, packed: List[_Packed]) -> List[_Packed]:
+        kept: List[_Packed] = []
+        for item in packed:
+            text = item.document.page_content
+            if any(
+                text in other.document.page_content
+                or jaccard_similarity(item.words, other.words)
+                >= self.config.duplicate_threshold
+                for other in kept
+            ):
+                continue
+            kept.append(item)
+        return kept
+
+
+def _page_of(document: Document):
+    """The source and page of a chunk, None if its source is not known"""
+    metadata = document.metadata or {}
+    source = metadata.get("source") or metadata.get("file")
+    if not source:
+        return None
+    return source, metadata.get("page")
@@ -0,0 +1,135 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import threading
+from typing import Callable, List, Optional
+
+from llms.clients import (
+    HaivenAIMessage,
+    HaivenHumanMessage,
+    HaivenMessage,
+    HaivenSystemMessage,
+)
+from llms.memory_budget import MemoryBudgetConfig, count_tokens
+
+SUMMARY_HEADER = "\n\nSummary of the earlier conversation:\n"
+
+
+def summary_prompt(
+    previous_summary: str, messages: List[HaivenMessage], max_tokens: int
+) -> List[HaivenMessage]:
+    transcript = "\n\n".join(
+        f"{'Assistant' if isinstance(message, HaivenAIMessage) else 'User'}: {message.content}"
+        for message in messages
+    )
+    return [
+        HaivenSystemMessage(
+            content=f"""You maintain a running summary of a conversation between a user and an assistant.
+        Update the summary with the new messages. Keep facts, decisions, requirements, names and open questions,
+        drop small talk. Answer with the updated summary only, in at most {max_tokens} tokens."""
+        ),
+        HaivenHumanMessage(
+            content=f"Summary so far:\n{previous_summary or 'None'}\n\nNew messages:\n{transcript}"
+        ),
+    ]
+
+
+class ConversationMemory:
+    """
+    Decides which part of a chat's memory is sent to the model.
+
+    The system message and the most recent messages that fit into max_tokens are sent verbatim,
+    always at least keep_recent_messages of them. Older messages are folded into a rolling
+    summary, which is appended to the system message. Folding runs in a background thread
+    after a reply is complete, with the chat's own model, so it does not delay any response.
+    Until a fold is done, older messages that do not fit are left out.
+    """
+
+    def __init__(
+        self,
+        budget: MemoryBudgetConfig,
+        model: str,
+        summarise: Callable[[List[HaivenMessage]], str],
+    ):
+        self.budget = budget
+        self.model = model
+        self.summarise = summarise
+        self.summary = ""
+        # Index of the first message in memory that is not part of the summary
+        self.summarised_until = 1
+        self._folding: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def messages_for_request(self, memory: List[HaivenMessage]) -> List[HaivenMessage]:
+        with self._lock:
+            summary = self.summary
+            summarised_until = self.summarised_until
+
+        system_message = memory[0]
+        if summary:
+            system_message = HaivenSystemMessage(
+                content=system_message.content + SUMMARY_HEADER + summary
+            )
+        start = self._window_start(
+            memory, summarised_until, self._count(system_message.content)
+        )
+        return [system_message] + memory[start:]
+
+    def after_reply(self, memory: List[HaivenMessage]):
+        """Start folding the messages that will no longer fit into the next request"""
+        with self._lock:
+            if self._folding is not None:
+                return
+            summarised_until = self.summarised_until
+            reserved = self._count(memory[0].content) + self.budget.summary_max_tokens
+            end = self._window_start(memory, summarised_until, reserved)
+            if end <= summarised_until:
+                return
+            self._folding = threading.Thread(
+                target=self._fold,
+                args=(self.summary, list(memory[summarised_until:end]), end),
+                daemon=True,
+            )
+            self._folding.start()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait for a running fold to complete"""
+        folding = self._folding
+        if folding is not None:
+            folding.join(timeout)
+
+    def _fold(self, previous_summary: str, messages: List[HaivenMessage], end: int):
+        try:
+            summary = self.summarise(
+                summary_prompt(
+                    previous_summary, messages, self.budget.summary_max_tokens
+                )
+            )
+            with self._lock:
+                self.summary = summary.strip()
+                self.summarised_until = end
+        except Exception as error:
+            print(f"[WARNING]: Could not summarise the conversation: {error}")
+        finally:
+            with self._lock:
+                self._folding = None
+
+    def _window_start(
+        self, memory: List[HaivenMessage], lower_bound: int, used_tokens: int
+    ) -> int:
+        remaining = self.budget.max_tokens - used_tokens
+        start = len(memory)
+        kept = 0
+        while start > max(1, lower_bound):
+            tokens = self._count(memory[start - 1].content)
+            if kept >= self.budget.keep_recent_messages and tokens > remaining:
+                break
+            remaining -= tokens
+            kept += 1
+            start -= 1
+
+        # The history sent has to start with a user message, not with an orphaned reply
+        while start < len(memory) - 1 and isinstance(memory[start], HaivenAIMessage):
+            start += 1
+        return start
+
+    def _count(self, text: str) -> int:
+        return count_tokens(self.model, text)
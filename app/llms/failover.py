@@ -0,0 +1,174 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import threading
+import time
+from typing import Dict, Optional
+
+from litellm import (
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout,
+)
+
+from llms.rate_limiter import AdmissionRejectedError
+
+# Errors of the provider that another attempt, or another provider, may not run into. Anything
+# else (a bad request, a context window that is too small, ...) fails the same way everywhere.
+TRANSIENT_PROVIDER_ERRORS = (
+    RateLimitError,
+    Timeout,
+    APIConnectionError,
+    ServiceUnavailableError,
+    InternalServerError,
+)
+
+
+def is_transient_provider_error(error: BaseException) -> bool:
+    """
+    Whether another model may still serve the request. This includes requests the admission
+    control rejected, for the local rate limit budget or after the provider kept answering 429.
+    """
+    return isinstance(error, TRANSIENT_PROVIDER_ERRORS + (AdmissionRejectedError,))
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Whether the error counts against the circuit breaker, a used up local budget does not"""
+    if isinstance(error, AdmissionRejectedError):
+        return isinstance(error.__cause__, RateLimitError)
+    return isinstance(error, TRANSIENT_PROVIDER_ERRORS)
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when the circuit breakers of the model and all of its fallbacks are open"""
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+def _optional_float(value) -> Optional[float]:
+    if value is None or str(value).strip() == "":
+        return None
+    return float(value)
+
+
+class FailoverConfig:
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout_seconds: float = 30,
+        hedge_after_seconds: Optional[float] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        hedge_after_seconds = _optional_float(data.get("hedge_after_seconds"))
+        return cls(
+            failure_threshold=int(data.get("failure_threshold") or 3),
+            reset_timeout_seconds=float(data.get("reset_timeout_seconds") or 30),
+            hedge_after_seconds=hedge_after_seconds
+            if hedge_after_seconds and hedge_after_seconds > 0
+            else None,
+        )
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per model provider.
+
+    After failure_threshold consecutive failures the circuit of a provider opens and its
+    models are skipped in favour of their fallbacks. Once reset_timeout_seconds have passed,
+    a single trial request is let through (half open): success closes the circuit again,
+    failure keeps it open for another reset_timeout_seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout_seconds: float = 30,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self._clock = clock
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._trial_running: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: FailoverConfig):
+        return cls(
+            failure_threshold=config.failure_threshold,
+            reset_timeout_seconds=config.reset_timeout_seconds,
+        )
+
+    def state(self, provider: str) -> str:
+        with self._lock:
+            return self._state(provider.lower())
+
+    def allow(self, provider: str) -> bool:
+        provider = provider.lower()
+        with self._lock:
+            state = self._state(provider)
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running.get(provider):
+                self._trial_running[provider] = True
+                return True
+            return False
+
+    def record_success(self, provider: str):
+        provider = provider.lower()
+        with self._lock:
+            self._failures[provider] = 0
+            self._opened_at.pop(provider, None)
+            self._trial_running.pop(provider, None)
+
+    def record_failure(self, provider: str):
+        provider = provider.lower()
+        with self._lock:
+            self._trial_running.pop(provider, None)
+            if provider in self._opened_at:
+                # A failed trial request keeps the circuit open for another reset timeout
+                self._opened_at[provider] = self._clock()
+                return
+
+            self._failures[provider] = self._failures.get(provider, 0) + 1
+            if self._failures[provider] >= self.failure_threshold:
+                self._opened_at[provider] = self._clock()
+
+    def record_cancelled(self, provider: str):
+        # A request that was cancelled (e.g. the losing side of a hedge) says nothing about the provider
+        with self._lock:
+            self._trial_running.pop(provider.lower(), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = set(self._failures) | set(self._opened_at)
+            return {
+                provider: {
+                    "state": self._state(provider),
+                    "consecutive_failures": self._failures.get(provider, 0),
+                }
+                for provider in sorted(providers)
+            }
+
+    def _state(self, provider: str) -> str:
+        opened_at = self._opened_at.get(provider)
+        if opened_at is None:
+            return self.CLOSED
+        if self._clock() - opened_at >= self.reset_timeout_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
@@ -1,13 +1,20 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
-from litellm import completion
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
-from litellm import RateLimitError
-
-
-@retry(
-    stop=stop_after_attempt(2),
-    wait=wait_fixed(60),
-    retry=retry_if_exception_type(RateLimitError),
-)
-def llmCompletion(**kwargs):
-    return completion(**kwargs)
+from litellm import acompletion, completion
+from llms.rate_limiter import AdmissionController
+
+# Without configured budgets this only adds backoff retries on provider 429s
+_default_admission_controller = AdmissionController()
+
+
+def llmCompletion(
+    admission_controller: AdmissionController = None, completion_fn=None, **kwargs
+):
+    controller = admission_controller or _default_admission_controller
+    return controller.call(completion_fn or completion, **kwargs)
+
+
+async def llmAcompletion(
+    admission_controller: AdmissionController = None, acompletion_fn=None, **kwargs
+):
+    controller = admission_controller or _default_admission_controller
+    return await controller.acall(acompletion_fn or acompletion, **kwargs)
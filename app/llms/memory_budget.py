@@ -0,0 +1,78 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import litellm
+
+TOKEN_COUNT_CACHE_SIZE = 4096
+
+# Keyed on a hash of the text, so that the cache does not keep whole conversations alive
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def count_tokens(model: str, text: str) -> int:
+    """Tokens of text for the model, cached as every request recounts the same history"""
+    key = (model, len(text), hashlib.sha256(text.encode("utf-8")).digest())
+    with _token_counts_lock:
+        tokens = _token_counts.get(key)
+        if tokens is not None:
+            _token_counts.move_to_end(key)
+            return tokens
+
+    tokens = _count_tokens(model, text)
+    with _token_counts_lock:
+        _token_counts[key] = tokens
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return tokens
+
+
+def _count_tokens(model: str, text: str) -> int:
+    try:
+        return litellm.token_counter(model=model, text=text)
+    except Exception:
+        # Rough 4 characters per token estimate for models litellm has no tokenizer for
+        return len(text) // 4
+
+
+class MemoryBudgetConfig:
+    """
+    Token budget for the conversation history sent to the model with every request.
+    Without max_tokens the full history is sent.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        keep_recent_messages: int = 4,
+        summary_max_tokens: int = 400,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.summary_max_tokens = summary_max_tokens
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tokens is not None
+
+    @classmethod
+    def from_dict(cls, data, default: "MemoryBudgetConfig" = None):
+        default = default or cls()
+        data = data or {}
+        max_tokens = data.get("max_tokens")
+        keep_recent_messages = data.get("keep_recent_messages")
+        summary_max_tokens = data.get("summary_max_tokens")
+        return cls(
+            max_tokens=default.max_tokens
+            if max_tokens in [None, ""]
+            else int(max_tokens),
+            keep_recent_messages=default.keep_recent_messages
+            if keep_recent_messages in [None, ""]
+            else int(keep_recent_messages),
+            summary_max_tokens=default.summary_max_tokens
+            if summary_max_tokens in [None, ""]
+            else int(summary_max_tokens),
+        )
@@ -0,0 +1,140 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import math
+import random
+from typing import Optional
+
+from config_values import is_enabled_value
+
+
+class Distribution:
+    """
+    A value drawn per request, configured either as a plain number (always that value) or as
+    {distribution: fixed|uniform|normal|lognormal, mean, stddev, min, max}.
+    For uniform, min and max are the range; for the others they only clamp the drawn value.
+    """
+
+    KINDS = ["fixed", "uniform", "normal", "lognormal"]
+
+    def __init__(
+        self,
+        kind: str = "fixed",
+        mean: float = 0.0,
+        stddev: float = 0.0,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+    ):
+        if kind not in self.KINDS:
+            raise ValueError(
+                f"Unknown distribution '{kind}', expected one of {', '.join(self.KINDS)}"
+            )
+        self.kind = kind
+        self.mean = mean
+        self.stddev = stddev
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_dict(cls, data, default: float = 0.0):
+        if data is None or data == "":
+            return cls(mean=default)
+        if not isinstance(data, dict):
+            return cls(mean=float(data))
+        return cls(
+            kind=data.get("distribution") or "fixed",
+            mean=float(data.get("mean") or default),
+            stddev=float(data.get("stddev") or 0.0),
+            minimum=None if data.get("min") is None else float(data.get("min")),
+            maximum=None if data.get("max") is None else float(data.get("max")),
+        )
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            low = self.minimum if self.minimum is not None else 0.0
+            high = self.maximum if self.maximum is not None else 2 * self.mean
+            return rng.uniform(low, high)
+
+        if self.kind == "normal":
+            value = rng.gauss(self.mean, self.stddev)
+        elif self.kind == "lognormal" and self.mean > 0:
+            # Parameters of the underlying normal, so that the samples have the configured mean and stddev
+            sigma = math.sqrt(math.log(1 + (self.stddev / self.mean) ** 2))
+            mu = math.log(self.mean) - sigma**2 / 2
+            value = rng.lognormvariate(mu, sigma)
+        else:
+            value = self.mean
+
+        if self.minimum is not None:
+            value = max(self.minimum, value)
+        if self.maximum is not None:
+            value = min(self.maximum, value)
+        return value
+
+
+def _probability(value) -> float:
+    return min(1.0, max(0.0, float(value or 0.0)))
+
+
+class MockLoadProfile:
+    """
+    Behaviour of the synthetic provider that MockModelClient simulates when MOCK_AI is set.
+
+    Without load_test it streams the fixed mock response instantly. With load_test it generates
+    responses of response_tokens length at tokens_per_second after time_to_first_token_seconds,
+    in chunks of chunk_tokens, and injects provider 429s, timeouts and mid-stream disconnects
+    with the configured probabilities.
+    """
+
+    def __init__(
+        self,
+        load_test: bool = False,
+        time_to_first_token_seconds: Distribution = None,
+        tokens_per_second: Distribution = None,
+        response_tokens: Distribution = None,
+        chunk_tokens: int = 1,
+        rate_limit_probability: float = 0.0,
+        retry_after_seconds: Optional[float] = None,
+        timeout_probability: float = 0.0,
+        timeout_seconds: float = 30.0,
+        disconnect_probability: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.load_test = load_test
+        self.time_to_first_token_seconds = time_to_first_token_seconds or Distribution(
+            mean=0.5
+        )
+        self.tokens_per_second = tokens_per_second or Distribution(mean=50)
+        self.response_tokens = response_tokens or Distribution(mean=300)
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after_seconds = retry_after_seconds
+        self.timeout_probability = timeout_probability
+        self.timeout_seconds = timeout_seconds
+        self.disconnect_probability = disconnect_probability
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        retry_after_seconds = data.get("retry_after_seconds")
+        seed = data.get("seed")
+        return cls(
+            load_test=is_enabled_value(data.get("load_test")),
+            time_to_first_token_seconds=Distribution.from_dict(
+                data.get("time_to_first_token_seconds"), default=0.5
+            ),
+            tokens_per_second=Distribution.from_dict(
+                data.get("tokens_per_second"), default=50
+            ),
+            response_tokens=Distribution.from_dict(
+                data.get("response_tokens"), default=300
+            ),
+            chunk_tokens=int(data.get("chunk_tokens") or 1),
+            rate_limit_probability=_probability(data.get("rate_limit_probability")),
+            retry_after_seconds=None
+            if retry_after_seconds in [None, ""]
+            else float(retry_after_seconds),
+            timeout_probability=_probability(data.get("timeout_probability")),
+            timeout_seconds=float(data.get("timeout_seconds") or 30),
+            disconnect_probability=_probability(data.get("disconnect_probability")),
+            seed=None if seed in [None, ""] else int(seed),
+        )
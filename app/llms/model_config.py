@@ -10,6 +10,9 @@ class ModelConfig:
         name: str,
         features: Optional[List[str]] = None,
         config: Optional[Dict[str, str]] = None,
+        fallbacks: Optional[List[str]] = None,
+        memory_budget: Optional[Dict] = None,
+        context_packing: Optional[Dict] = None,
     ):
         """
         Initialize a Model object.
@@ -20,12 +23,18 @@ class ModelConfig:
             name (str): The name of the model.
             features (List[str], optional): The list of features of the model. Defaults to None.
             config (Dict[str, str], optional): The configuration of the model. Defaults to None.
+            fallbacks (List[str], optional): Ordered IDs of the models to fail over to. Defaults to None.
+            memory_budget (Dict, optional): Overrides of the conversation memory budget for this model. Defaults to None.
+            context_packing (Dict, optional): Overrides of the knowledge context packing for this model. Defaults to None.
         """
         self.id = id
         self.provider = provider
         self.name = name
         self.features = features if features else []
         self.config = config if config else {}
+        self.fallbacks = fallbacks if fallbacks else []
+        self.memory_budget = memory_budget if memory_budget else {}
+        self.context_packing = context_packing if context_packing else {}
         self.temperature = 0.5
 
         self.lite_id = provider.lower() + "/" + self.id
@@ -64,4 +73,7 @@ class ModelConfig:
             name=data.get("name"),
             features=data.get("features"),
             config=data.get("config"),
+            fallbacks=data.get("fallbacks"),
+            memory_budget=data.get("memory_budget"),
+            context_packing=data.get("context_packing"),
         )
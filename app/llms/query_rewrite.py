@@ -0,0 +1,55 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import re
+
+from config_values import is_enabled_value
+
+_WORD = re.compile(r"\w+")
+
+
+class QueryRewriteConfig:
+    """
+    How knowledge chat rewrites the user message into a search query with the model.
+
+    mode "full" sends the start and the end of the conversation, including the system message
+    with all contexts. "compact" only sends the last recent_messages messages, each cut to
+    max_message_chars. With skip_first_turn, the first message of a chat is searched as it is.
+    With speculative, the user message is searched while the rewrite runs, and that result is
+    kept if the rewritten query does not add any new words.
+    """
+
+    MODES = ["full", "compact"]
+
+    def __init__(
+        self,
+        mode: str = "full",
+        recent_messages: int = 4,
+        max_message_chars: int = 1000,
+        skip_first_turn: bool = True,
+        speculative: bool = False,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(
+                f"Query rewrite mode {mode} not supported, use one of {', '.join(self.MODES)}"
+            )
+        self.mode = mode
+        self.recent_messages = recent_messages
+        self.max_message_chars = max_message_chars
+        self.skip_first_turn = skip_first_turn
+        self.speculative = speculative
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(
+            mode=data.get("mode") or "full",
+            recent_messages=int(data.get("recent_messages") or 4),
+            max_message_chars=int(data.get("max_message_chars") or 1000),
+            skip_first_turn=is_enabled_value(data.get("skip_first_turn", True)),
+            speculative=is_enabled_value(data.get("speculative")),
+        )
+
+
+def adds_nothing_new(message: str, query: str) -> bool:
+    """True if every word of the rewritten query already is in the user message"""
+    message_words = set(_WORD.findall(message.lower()))
+    return set(_WORD.findall(query.lower())) <= message_words
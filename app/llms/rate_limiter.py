@@ -0,0 +1,287 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from litellm import RateLimitError
+
+
+class AdmissionRejectedError(Exception):
+    """Raised instead of waiting when a request cannot be admitted within the configured budget"""
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+def _optional_int(value) -> Optional[int]:
+    if value is None or str(value).strip() == "":
+        return None
+    return int(value)
+
+
+class RateLimitBudget:
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(
+            rpm=_optional_int(data.get("rpm")), tpm=_optional_int(data.get("tpm"))
+        )
+
+
+class RateLimitConfig:
+    def __init__(
+        self,
+        max_queue_size: int = 50,
+        max_wait_seconds: float = 20,
+        max_sync_wait_seconds: float = 5,
+        max_retries: int = 3,
+        base_backoff_seconds: float = 1,
+        providers: Dict[str, RateLimitBudget] = None,
+        models: Dict[str, RateLimitBudget] = None,
+    ):
+        self.max_queue_size = max_queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_sync_wait_seconds = max_sync_wait_seconds
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.providers = providers or {}
+        self.models = models or {}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        max_retries = _optional_int(data.get("max_retries"))
+        return cls(
+            max_queue_size=int(data.get("max_queue_size") or 50),
+            max_wait_seconds=float(data.get("max_wait_seconds") or 20),
+            max_sync_wait_seconds=float(data.get("max_sync_wait_seconds") or 5),
+            max_retries=3 if max_retries is None else max_retries,
+            base_backoff_seconds=float(data.get("base_backoff_seconds") or 1),
+            providers={
+                key.lower(): RateLimitBudget.from_dict(budget)
+                for key, budget in (data.get("providers") or {}).items()
+            },
+            models={
+                key: RateLimitBudget.from_dict(budget)
+                for key, budget in (data.get("models") or {}).items()
+            },
+        )
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at per_minute / 60 tokens per second.
+    Consuming more than is available drives the balance negative, which is how
+    waiting requests reserve their place in line.
+    """
+
+    def __init__(self, per_minute: int, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class AdmissionController:
+    """
+    Admission control in front of the LLM provider calls.
+
+    Requests per minute and tokens per minute are budgeted with token buckets per provider
+    (the litellm prefix, e.g. "azure") and per model (the full litellm model id).
+    A request that has to wait for budget reserves it and waits, as long as the wait stays
+    under max_wait_seconds and fewer than max_queue_size requests are already waiting.
+    Otherwise, and when the provider keeps answering with 429 after max_retries jittered
+    exponential backoffs (honouring Retry-After), it fails fast with AdmissionRejectedError.
+    Sync callers block a worker thread while they wait, so they wait at most
+    max_sync_wait_seconds instead. The budget of an attempt the provider rejected with a 429
+    is given back before the retry reserves it again.
+    """
+
+    def __init__(self, config: RateLimitConfig = None, clock=time.monotonic):
+        self.config = config or RateLimitConfig()
+        self._clock = clock
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._waiting = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, completion_fn, **kwargs):
+        model = kwargs.get("model") or ""
+        estimated_tokens = self._estimate_tokens(kwargs)
+        max_wait_seconds = min(
+            self.config.max_wait_seconds, self.config.max_sync_wait_seconds
+        )
+        for attempt in range(self.config.max_retries + 1):
+            wait_seconds = self._reserve(model, estimated_tokens, max_wait_seconds)
+            if wait_seconds > 0:
+                try:
+                    time.sleep(wait_seconds)
+                finally:
+                    self._release(model)
+            try:
+                return completion_fn(**kwargs)
+            except RateLimitError as error:
+                self._refund(model, estimated_tokens)
+                time.sleep(self._retry_delay(model, attempt, error, max_wait_seconds))
+
+    async def acall(self, acompletion_fn, **kwargs):
+        model = kwargs.get("model") or ""
+        estimated_tokens = self._estimate_tokens(kwargs)
+        for attempt in range(self.config.max_retries + 1):
+            wait_seconds = self._reserve(model, estimated_tokens)
+            if wait_seconds > 0:
+                try:
+                    await asyncio.sleep(wait_seconds)
+                finally:
+                    self._release(model)
+            try:
+                return await acompletion_fn(**kwargs)
+            except RateLimitError as error:
+                self._refund(model, estimated_tokens)
+                await asyncio.sleep(self._retry_delay(model, attempt, error))
+
+    def _reserve(
+        self,
+        model: str,
+        estimated_tokens: int,
+        max_wait_seconds: Optional[float] = None,
+    ) -> float:
+        if max_wait_seconds is None:
+            max_wait_seconds = self.config.max_wait_seconds
+        with self._lock:
+            reservations = self._reservations_for(model, estimated_tokens)
+            if not reservations:
+                return 0.0
+
+            wait_seconds = max(
+                bucket.wait_time(amount) for bucket, amount in reservations
+            )
+            if wait_seconds > 0:
+                if self._waiting[model] >= self.config.max_queue_size:
+                    raise AdmissionRejectedError(
+                        f"Too many requests are waiting for {model}, please try again in a moment."
+                    )
+                if wait_seconds > max_wait_seconds:
+                    raise AdmissionRejectedError(
+                        f"The rate limit budget for {model} is used up, please try again in {round(wait_seconds)} seconds."
+                    )
+                self._waiting[model] += 1
+
+            for bucket, amount in reservations:
+                bucket.consume(amount)
+
+            return wait_seconds
+
+    def _release(self, model: str):
+        with self._lock:
+            self._waiting[model] -= 1
+
+    def _refund(self, model: str, estimated_tokens: int):
+        with self._lock:
+            for bucket, amount in self._reservations_for(model, estimated_tokens):
+                bucket.refund(amount)
+
+    def _reservations_for(
+        self, model: str, estimated_tokens: int
+    ) -> List[Tuple[TokenBucket, float]]:
+        provider = model.split("/")[0].lower()
+        budgets = [
+            ("provider:" + provider, self.config.providers.get(provider)),
+            ("model:" + model, self.config.models.get(model)),
+        ]
+
+        reservations = []
+        for budget_key, budget in budgets:
+            if budget is None:
+                continue
+            if budget.rpm:
+                reservations.append((self._bucket(budget_key, "rpm", budget.rpm), 1))
+            if budget.tpm:
+                reservations.append(
+                    (self._bucket(budget_key, "tpm", budget.tpm), estimated_tokens)
+                )
+        return reservations
+
+    def _bucket(self, budget_key: str, kind: str, per_minute: int) -> TokenBucket:
+        key = (budget_key, kind)
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(per_minute, clock=self._clock)
+        return self._buckets[key]
+
+    def _retry_delay(
+        self,
+        model: str,
+        attempt: int,
+        error: RateLimitError,
+        max_wait_seconds: Optional[float] = None,
+    ) -> float:
+        if max_wait_seconds is None:
+            max_wait_seconds = self.config.max_wait_seconds
+        retry_after = self._retry_after_seconds(error)
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.config.base_backoff_seconds)
+        else:
+            backoff = self.config.base_backoff_seconds * (2**attempt)
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+        if attempt >= self.config.max_retries or delay > max_wait_seconds:
+            raise AdmissionRejectedError(
+                f"{model} is rate limited by the provider, please try again in {max(1, round(delay))} seconds."
+            ) from error
+        return delay
+
+    @staticmethod
+    def _retry_after_seconds(error: RateLimitError) -> Optional[float]:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms") is not None:
+                return float(headers.get("retry-after-ms")) / 1000
+            if headers.get("retry-after") is not None:
+                return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            # Retry-After can also be an HTTP date, fall back to exponential backoff
+            return None
+        return None
+
+    @staticmethod
+    def _estimate_tokens(kwargs: dict) -> int:
+        # Rough 4 characters per token estimate, good enough for budgeting before the call
+        characters = 0
+        for message in kwargs.get("messages") or []:
+            content = message.get("content", "") if isinstance(message, dict) else ""
+            if isinstance(content, str):
+                characters += len(content)
+        return characters // 4 + int(kwargs.get("max_tokens") or 0)
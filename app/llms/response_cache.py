@@ -0,0 +1,180 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from cache_directory import CacheDirectory
+from config_values import is_enabled_value
+
+
+class ResponseCacheConfig:
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_entries: int = 256,
+        ttl_seconds: int = 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 2048,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(
+            enabled=is_enabled_value(data.get("enabled")),
+            max_entries=int(data.get("max_entries") or 256),
+            ttl_seconds=int(data.get("ttl_seconds") or 3600),
+            disk_path=data.get("disk_path") or None,
+            max_disk_entries=int(data.get("max_disk_entries") or 2048),
+        )
+
+
+class ResponseCache:
+    """
+    Exact-match cache for streamed LLM responses.
+
+    Entries are the full list of chunk dicts a ChatClient yielded for one request
+    (content, metadata with citations, usage), so a hit can be replayed chunk by chunk.
+    The in-memory tier is an LRU bounded by max_entries, every entry expires after ttl_seconds.
+    If disk_path is set, entries are also written there as JSON files and survive restarts.
+    Expired files and the oldest files beyond max_disk_entries are deleted as entries are
+    written. Files are read and written outside of the lock of the in-memory tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: int = 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 2048,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = (
+            CacheDirectory(self.disk_path, ".json", max_disk_entries, ttl_seconds)
+            if self.disk_path
+            else None
+        )
+
+    @classmethod
+    def from_config(cls, config: ResponseCacheConfig):
+        if not config.enabled:
+            return None
+        return cls(
+            max_entries=config.max_entries,
+            ttl_seconds=config.ttl_seconds,
+            disk_path=config.disk_path,
+            max_disk_entries=config.max_disk_entries,
+        )
+
+    @staticmethod
+    def make_key(model: str, messages: List[dict], params: dict) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, chunks = entry
+                if not self._is_expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(chunks)
+                del self._entries[key]
+
+        disk_entry = self._read_from_disk(key)
+        with self._lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            created_at, chunks = disk_entry
+            self._store_in_memory(key, created_at, chunks)
+            self.hits += 1
+            return list(chunks)
+
+    def put(self, key: str, chunks: List[dict]):
+        created_at = time.time()
+        with self._lock:
+            self._store_in_memory(key, created_at, tuple(chunks))
+        self._write_to_disk(key, created_at, chunks)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def _store_in_memory(self, key: str, created_at: float, chunks: tuple):
+        self._entries[key] = (created_at, chunks)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_file(self, key: str) -> str:
+        return self._disk.file(key)
+
+    def _read_from_disk(self, key: str):
+        if self._disk is None:
+            return None
+
+        file_path = self._disk_file(key)
+        try:
+            with open(file_path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if self._is_expired(data["created_at"]):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            return None
+
+        return data["created_at"], tuple(data["chunks"])
+
+    def _write_to_disk(self, key: str, created_at: float, chunks: List[dict]):
+        if self._disk is None:
+            return
+
+        file_path = self._disk_file(key)
+        # Concurrent writes of the same key, now that they are not serialized by the lock
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump({"created_at": created_at, "chunks": list(chunks)}, file)
+            os.replace(temp_path, file_path)
+        except (OSError, TypeError) as error:
+            print(f"[WARNING]: Could not write LLM response cache entry: {error}")
+            return
+        self._disk.written()
@@ -0,0 +1,182 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import threading
+from typing import Callable, Dict, List
+
+
+class SingleFlightError(Exception):
+    """Raised to every subscriber of a flight whose upstream failed, caused by the upstream error"""
+
+
+class _Flight:
+    def __init__(self, condition):
+        self.chunks: List[dict] = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.condition = condition
+        self.task = None
+        self.upstream = None
+        self.pulling = False
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight LLM generations.
+
+    The first request for a key starts the upstream stream, concurrent requests with the same key
+    attach to it instead of starting their own. Every subscriber gets all chunks from the start,
+    late joiners first get the buffered prefix replayed. The upstream keeps running while anybody
+    is subscribed and is cancelled when the last subscriber disconnects.
+    Sync and async flights are coalesced separately, as they are driven differently: a sync
+    upstream is pulled on the thread of whichever subscriber needs the next chunk first, an async
+    upstream runs in its own task. A failed upstream raises a SingleFlightError to each subscriber.
+    """
+
+    def __init__(self):
+        self.flights_started = 0
+        self.coalesced = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key: str, start_upstream: Callable):
+        flight, _ = self._subscribe(self._flights, key, threading.Condition)
+
+        try:
+            index = 0
+            while True:
+                with flight.condition:
+                    while (
+                        index >= len(flight.chunks)
+                        and not flight.done
+                        and flight.pulling
+                    ):
+                        flight.condition.wait()
+                    new_chunks = flight.chunks[index:]
+                    done = flight.done
+                    # Nobody is pulling the upstream, so this subscriber pulls the next chunk
+                    pull = not new_chunks and not done
+                    if pull:
+                        flight.pulling = True
+                index += len(new_chunks)
+
+                if pull:
+                    self._pull(key, flight, start_upstream)
+                    continue
+                yield from new_chunks
+                if done and not new_chunks:
+                    if flight.error is not None:
+                        raise SingleFlightError(str(flight.error)) from flight.error
+                    return
+        finally:
+            unfinished = self._unsubscribe(self._flights, key, flight)
+            if unfinished and flight.upstream is not None:
+                # Closing the upstream generator also closes the provider stream
+                flight.upstream.close()
+
+    async def astream(self, key: str, start_upstream: Callable):
+        flight, is_leader = self._subscribe(self._async_flights, key, asyncio.Condition)
+        if is_leader:
+            flight.task = asyncio.ensure_future(
+                self._aproduce(key, flight, start_upstream)
+            )
+
+        try:
+            index = 0
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(
+                        lambda: index < len(flight.chunks) or flight.done
+                    )
+                    new_chunks = flight.chunks[index:]
+                    done = flight.done
+                index += len(new_chunks)
+
+                for chunk in new_chunks:
+                    yield chunk
+                if done and not new_chunks:
+                    if flight.error is not None:
+                        raise SingleFlightError(str(flight.error)) from flight.error
+                    return
+        finally:
+            if self._unsubscribe(self._async_flights, key, flight):
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights) + len(self._async_flights),
+                "flights_started": self.flights_started,
+                "coalesced": self.coalesced,
+            }
+
+    def _subscribe(
+        self, flights: Dict[str, _Flight], key: str, condition_factory: Callable
+    ):
+        with self._lock:
+            flight = flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight(condition_factory())
+                flights[key] = flight
+                self.flights_started += 1
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+            return flight, is_leader
+
+    def _unsubscribe(self, flights: Dict[str, _Flight], key: str, flight: _Flight):
+        """Returns True if this was the last subscriber of an unfinished flight, which is then cancelled"""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.done:
+                return False
+            # New requests for the key start a fresh flight instead of joining the cancelled one
+            if flights.get(key) is flight:
+                del flights[key]
+            return True
+
+    def _finish(self, flights: Dict[str, _Flight], key: str, flight: _Flight):
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def _pull(self, key: str, flight: _Flight, start_upstream: Callable):
+        """Pulls the next chunk of a sync flight, only one subscriber pulls at a time"""
+        chunks, done = [], False
+        try:
+            if flight.upstream is None:
+                flight.upstream = start_upstream()
+            chunks.append(next(flight.upstream))
+        except StopIteration:
+            done = True
+        except Exception as error:
+            flight.error = error
+            done = True
+        finally:
+            if done:
+                if flight.upstream is not None:
+                    flight.upstream.close()
+                self._finish(self._flights, key, flight)
+            with flight.condition:
+                flight.chunks.extend(chunks)
+                flight.done = flight.done or done
+                flight.pulling = False
+                flight.condition.notify_all()
+
+    async def _aproduce(self, key: str, flight: _Flight, start_upstream: Callable):
+        upstream = start_upstream()
+        try:
+            async for chunk in upstream:
+                async with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except Exception as error:
+            flight.error = error
+        finally:
+            await upstream.aclose()
+            self._finish(self._async_flights, key, flight)
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
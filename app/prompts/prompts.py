@@ -1,7 +1,7 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 import os
 import yaml
-from typing import List
+from typing import AbstractSet, List
 
 import frontmatter
 from langchain.prompts import PromptTemplate
@@ -43,41 +43,70 @@ class PromptList:
 
         self.interaction_pattern_name = data_sources[interaction_type]["title"]
 
-        directory = data_sources[interaction_type]["dir"]
-        prompt_files = sorted(
-            [f for f in os.listdir(directory) if f.endswith(".md") and f != "README.md"]
-        )
+        self.directory = data_sources[interaction_type]["dir"]
         self.prompts = [
-            self.add_filename_to_metadata(
-                frontmatter.load(os.path.join(directory, filename)), filename
-            )
-            for filename in prompt_files
+            self._load_prompt(filename) for filename in self._prompt_files()
         ]
 
         self.knowledge_base = knowledge_base
         self.knowledge_manager = knowledge_manager
         self.extra_variables = variables
 
-        for prompt in self.prompts:
-            if "title" not in prompt.metadata:
-                prompt.metadata["title"] = "Unnamed use case"
-            if "categories" not in prompt.metadata:
-                prompt.metadata["categories"] = []
-            if "type" not in prompt.metadata:
-                prompt.metadata["type"] = "chat"
-            if "editable" not in prompt.metadata:
-                prompt.metadata["editable"] = False
-            if "show" not in prompt.metadata:
-                prompt.metadata["show"] = True
-            if "grounded" not in prompt.metadata:
-                prompt.metadata["grounded"] = False
-            if "download_restricted" not in prompt.metadata:
-                prompt.metadata["download_restricted"] = False
-
         self.prompt_flows = self.load_prompt_flows(
-            os.path.join(directory, "prompt_flows.yaml")
+            os.path.join(self.directory, "prompt_flows.yaml")
+        )
+
+    def reload(self, changed_paths: AbstractSet[str]):
+        """
+        Loads the prompts of the directory again, only the files among changed_paths (absolute
+        paths) are parsed again. The prompts are replaced at once, a request that already got
+        the previous prompts keeps them.
+        """
+        directory = os.path.abspath(self.directory)
+        loaded = {prompt.metadata["filename"]: prompt for prompt in self.prompts}
+        prompts = [
+            loaded[os.path.splitext(filename)[0]]
+            if os.path.splitext(filename)[0] in loaded
+            and os.path.join(directory, filename) not in changed_paths
+            else self._load_prompt(filename)
+            for filename in self._prompt_files()
+        ]
+        prompt_flows = self.prompt_flows
+        if os.path.join(directory, "prompt_flows.yaml") in changed_paths:
+            prompt_flows = self.load_prompt_flows(
+                os.path.join(self.directory, "prompt_flows.yaml")
+            )
+        self.prompts, self.prompt_flows = prompts, prompt_flows
+
+    def _prompt_files(self) -> List[str]:
+        return sorted(
+            [
+                f
+                for f in os.listdir(self.directory)
+                if f.endswith(".md") and f != "README.md"
+            ]
         )
 
+    def _load_prompt(self, filename: str):
+        prompt = self.add_filename_to_metadata(
+            frontmatter.load(os.path.join(self.directory, filename)), filename
+        )
+        if "title" not in prompt.metadata:
+            prompt.metadata["title"] = "Unnamed use case"
+        if "categories" not in prompt.metadata:
+            prompt.metadata["categories"] = []
+        if "type" not in prompt.metadata:
+            prompt.metadata["type"] = "chat"
+        if "editable" not in prompt.metadata:
+            prompt.metadata["editable"] = False
+        if "show" not in prompt.metadata:
+            prompt.metadata["show"] = True
+        if "grounded" not in prompt.metadata:
+            prompt.metadata["grounded"] = False
+        if "download_restricted" not in prompt.metadata:
+            prompt.metadata["download_restricted"] = False
+        return prompt
+
     def load_prompt_flows(self, prompt_flows_path):
         if prompt_flows_path and os.path.exists(prompt_flows_path):
             try:
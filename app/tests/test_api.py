@@ -21,7 +21,7 @@ from api.api_basics import ApiBasics
 from knowledge.markdown import KnowledgeMarkdown
 from knowledge_manager import KnowledgeManager
 from config_service import ConfigService
-from llms.chats import ChatManager
+from llms.chats import ChatManager, StreamingChat
 from llms.model_config import ModelConfig
 from prompts.prompts import PromptList
 from llms.image_description_service import ImageDescriptionService
@@ -379,6 +379,64 @@ class TestApi(unittest.TestCase):
             user_input="some user input",
         )
 
+    @patch("llms.chats.HaivenLogger")
+    @patch("llms.chats.ChatManager")
+    def test_prompting_with_documents_streams_timings_with_the_debug_header(
+        self,
+        mock_chat_manager,
+        mock_haiven_logger,
+    ):
+        knowledge_manager = MagicMock()
+        knowledge_manager.get_system_message.return_value = "system"
+        knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+        knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents.return_value = []
+        chat_client = MagicMock()
+        chat_client.model_config.lite_id = "openai/gpt-4o"
+
+        async def astream(messages, **kwargs):
+            yield {"content": "some response from the model"}
+
+        chat_client.astream = astream
+        mock_chat_manager.streaming_chat.side_effect = lambda **kwargs: (
+            "some_key",
+            StreamingChat(chat_client, knowledge_manager),
+        )
+        ApiBasics(
+            self.app,
+            chat_manager=mock_chat_manager,
+            model_config=MagicMock(),
+            prompts_guided=MagicMock(),
+            knowledge_manager=MagicMock(),
+            prompts_chat=MagicMock(),
+            image_service=MagicMock(),
+            config_service=MagicMock(),
+            disclaimer_and_guidelines=MagicMock(),
+            inspirations_manager=MagicMock(),
+        )
+        request = {"userinput": "some user input", "document": ["some-document"]}
+
+        response = self.client.post("/api/prompt", json=request)
+        debug_response = self.client.post(
+            "/api/prompt",
+            json=request,
+            headers={"X-Haiven-Debug-Timings": "true"},
+        )
+
+        assert response.status_code == 200
+        assert debug_response.status_code == 200
+        streamed_content = response.content.decode("utf-8")
+        debug_content = debug_response.content.decode("utf-8")
+        assert "some response from the model" in streamed_content
+        assert "some response from the model" in debug_content
+        assert "retrieval_timings" not in streamed_content
+        timings_events = [
+            json.loads(line.split("data: ", 1)[1])["metadata"]["retrieval_timings"]
+            for line in debug_content.splitlines()
+            if "retrieval_timings" in line
+        ]
+        assert len(timings_events) == 1
+        assert {"generation", "total"} <= set(timings_events[0]["stages_ms"])
+
     @patch("llms.chats.JSONChat")
     @patch("llms.chats.ChatManager")
     @patch("prompts.prompts.PromptList")
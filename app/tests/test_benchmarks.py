@@ -0,0 +1,103 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.chat_endpoints import (
+    completion_tokens_from_stream,
+    max_sustainable_concurrency,
+    percentiles,
+)
+from benchmarks.chunk_formatting import run_benchmark as run_chunk_benchmark
+from benchmarks.index_memory import memory_kb
+from benchmarks.index_memory import run_benchmark as run_index_memory_benchmark
+from benchmarks.parallel_search import run_benchmark as run_parallel_search_benchmark
+from benchmarks.synthetic_pack import (
+    CHAT_PROMPT_ID,
+    create_synthetic_knowledge_pack,
+    write_benchmark_config,
+)
+from config_service import ConfigService
+from knowledge.pack import KnowledgePack
+
+
+def step(concurrency, p95, error_rate=0.0):
+    return {
+        "concurrency": concurrency,
+        "ttfb_seconds": {"p50": p95, "p95": p95, "p99": p95},
+        "error_rate": error_rate,
+    }
+
+
+class TestChatEndpointsBenchmark:
+    def test_percentiles(self):
+        result = percentiles([float(value) for value in range(1, 101)])
+
+        assert result == {"p50": 50.5, "p95": 95.05, "p99": 99.01}
+        assert percentiles([]) is None
+
+    def test_max_sustainable_concurrency_stops_at_first_failing_step(self):
+        steps = [step(1, 0.5), step(10, 1.0), step(25, 4.0), step(50, 1.0)]
+
+        assert max_sustainable_concurrency(steps, 3.0, 0.01) == 10
+        assert (
+            max_sustainable_concurrency([step(1, 0.5, error_rate=0.5)], 3.0, 0.01) == 0
+        )
+
+    def test_completion_tokens_are_read_from_token_usage_event(self):
+        body = (
+            "Hello world\n\n"
+            'event: token_usage\ndata: {"prompt_tokens": 3, "completion_tokens": 42}\n\n'
+        )
+
+        assert completion_tokens_from_stream(body) == 42
+        assert completion_tokens_from_stream("Hello world") == 0
+
+    def test_synthetic_knowledge_pack_and_config_load(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            pack_path = create_synthetic_knowledge_pack(
+                os.path.join(work_dir, "pack"), number_of_contexts=2
+            )
+            config_path = write_benchmark_config(
+                os.path.join(work_dir, "config.yaml"), pack_path, {"seed": 1}
+            )
+
+            config_service = ConfigService(config_path)
+
+            assert config_service.get_chat_model().id == "benchmark-model"
+            assert config_service.load_mock_load_profile().load_test is True
+            assert not config_service.is_llm_single_flight_enabled()
+            assert len(KnowledgePack(pack_path).contexts) == 2
+            assert os.path.exists(
+                os.path.join(pack_path, "prompts", "chat", f"{CHAT_PROMPT_ID}.md")
+            )
+
+    def test_chunk_formatting_fast_path_records_the_same_response(self):
+        # run_benchmark fails if the fast path records a different response than before
+        report = run_chunk_benchmark(number_of_tokens=50, repeats=1)
+
+        assert set(report["results"]) == {"streaming_chat", "json_chat"}
+        assert all(
+            result["after_us_per_token"] > 0 for result in report["results"].values()
+        )
+
+    @pytest.mark.skipif(
+        memory_kb() is None, reason="Reads /proc/self/smaps_rollup, Linux only"
+    )
+    def test_index_memory_benchmark_finds_the_same_chunks_in_both_modes(self):
+        # run_benchmark fails if the memory-mapped index finds different chunks
+        report = run_index_memory_benchmark(
+            number_of_vectors=500, dimension=32, workers=1
+        )
+
+        assert set(report["results"]) == {"in_memory", "memory_mapped"}
+
+    def test_parallel_search_benchmark_finds_the_same_chunks_in_both_modes(self):
+        # run_benchmark fails if the parallel search finds different chunks
+        report = run_parallel_search_benchmark(
+            number_of_vectors=200, dimension=16, threads=2, number_of_queries=3
+        )
+
+        assert set(report["results"]) == {1, 4, 16}
+        assert all(result["speedup"] > 0 for result in report["results"].values())
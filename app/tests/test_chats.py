@@ -1,11 +1,19 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
 import os
 import unittest
 
+from litellm.types.utils import Delta, ModelResponseStream, StreamingChoices, Usage
+
 from llms.chats import ServerChatSessionMemory, StreamingChat, JSONChat, HaivenBaseChat
 from unittest.mock import MagicMock, patch
 
-from llms.clients import HaivenAIMessage, HaivenHumanMessage, HaivenSystemMessage
+from llms.clients import (
+    ChatClient,
+    HaivenAIMessage,
+    HaivenHumanMessage,
+    HaivenSystemMessage,
+)
 from config.constants import SYSTEM_MESSAGE
 
 
@@ -62,6 +70,119 @@ class TestChats(unittest.TestCase):
         assert isinstance(streaming_chat.memory[1], HaivenHumanMessage)
         assert isinstance(streaming_chat.memory[2], HaivenAIMessage)
 
+    @patch("knowledge_manager.KnowledgeManager")
+    def test_streaming_chat_arun(self, mock_knowledge_manager):
+        mock_knowledge_manager.get_system_message.return_value = "system"
+        mock_knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+
+        async def astream(messages, **kwargs):
+            for part in ["Pa", "ris"]:
+                yield {"content": part}
+            yield {"usage": {"prompt_tokens": 3, "completion_tokens": 2}}
+
+        mock_chat_client = MagicMock()
+        mock_chat_client.astream = astream
+
+        streaming_chat = StreamingChat(
+            chat_client=mock_chat_client, knowledge_manager=mock_knowledge_manager
+        )
+
+        async def collect():
+            return [event async for event in streaming_chat.arun("Capital?")]
+
+        events = asyncio.run(collect())
+
+        assert events[:2] == ["Pa", "ris"]
+        assert events[2].startswith("event: token_usage")
+        assert len(streaming_chat.memory) == 3
+        assert streaming_chat.memory[2].content == "Paris"
+
+    @patch("knowledge_manager.KnowledgeManager")
+    def test_json_chat_arun(self, mock_knowledge_manager):
+        mock_knowledge_manager.get_system_message.return_value = "system"
+        mock_knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+
+        async def astream(messages, **kwargs):
+            for part in ['{"key":"v', 'alue"}']:
+                yield {"content": part}
+
+        mock_chat_client = MagicMock()
+        mock_chat_client.astream = astream
+
+        json_chat = JSONChat(
+            chat_client=mock_chat_client, knowledge_manager=mock_knowledge_manager
+        )
+
+        async def collect():
+            return [event async for event in json_chat.arun("Give me JSON")]
+
+        events = asyncio.run(collect())
+
+        assert events == ['{"data": "{\\"key\\":\\"v"}\n\n', '{"data": "alue\\"}"}\n\n']
+        assert json_chat.memory[2].content == '{"key":"value"}'
+
+    @patch.dict(os.environ, {"MOCK_AI": "true"})
+    def test_chat_client_astream_matches_stream(self):
+        model_config = MagicMock()
+        model_config.lite_id = "mock/model"
+        model_config.provider = "mock"
+        chat_client = ChatClient(model_config)
+        messages = [HaivenHumanMessage(content="hello")]
+
+        async def collect():
+            return [chunk async for chunk in chat_client.astream(messages)]
+
+        assert asyncio.run(collect()) == list(chat_client.stream(messages))
+
+    def test_chat_client_decodes_litellm_stream_chunks(self):
+        chat_client = ChatClient(MagicMock())
+        stream_state = {"citations": None, "usage": None}
+        usage = Usage(prompt_tokens=3, completion_tokens=2, total_tokens=5)
+        chunks = [
+            ModelResponseStream(
+                choices=[StreamingChoices(delta=Delta(content="Pa"))],
+                citations=["test.url"],
+            ),
+            ModelResponseStream(choices=[StreamingChoices(delta=Delta(content="ris"))]),
+            ModelResponseStream(
+                choices=[StreamingChoices(delta=Delta(content=None))], usage=usage
+            ),
+        ]
+
+        contents = [
+            chat_client._process_result(chunk, stream_state) for chunk in chunks
+        ]
+
+        assert contents == ["Pa", "ris", None]
+        assert stream_state["citations"] == ["test.url"]
+        assert stream_state["usage"] == usage
+
+    @patch("knowledge_manager.KnowledgeManager")
+    def test_json_chat_records_every_reply_in_memory(self, mock_knowledge_manager):
+        mock_knowledge_manager.get_system_message.return_value = "system"
+        mock_knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+
+        mock_chat_client = MagicMock()
+        mock_chat_client.stream.side_effect = [
+            iter([{"content": '{"a":'}, {"content": " "}, {"content": "1}"}]),
+            iter([{"content": '{"b":2}'}]),
+        ]
+
+        json_chat = JSONChat(
+            chat_client=mock_chat_client, knowledge_manager=mock_knowledge_manager
+        )
+        first_events = list(json_chat.run("First"))
+        list(json_chat.run("Second"))
+
+        assert first_events == ['{"data": "{\\"a\\":"}\n\n', '{"data": "1}"}\n\n']
+        assert [message.content for message in json_chat.memory[1:]] == [
+            "First",
+            '{"a":1}',
+            "Second",
+            '{"b":2}',
+        ]
+        assert isinstance(json_chat.memory[4], HaivenAIMessage)
+
     def test_dump_as_text(self):
         # Arrange
         category = "category"
@@ -175,9 +296,7 @@ class TestChats(unittest.TestCase):
         # Verify metadata chunks are passed through as JSON strings
         metadata_chunks = [chunk for chunk in string_chunks if "metadata" in chunk]
         assert len(metadata_chunks) == 1
-        assert metadata_chunks[0] == (
-            '{"metadata": {"citations": [' '"test.url"]}}\n\n'
-        )
+        assert metadata_chunks[0] == ('{"metadata": {"citations": ["test.url"]}}\n\n')
 
         # Verify the memory was updated correctly
         assert len(json_chat.memory) == 3
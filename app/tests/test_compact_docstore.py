@@ -0,0 +1,110 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+import shutil
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+from embeddings.compact_docstore import CompactDocstore, load_compact
+from tests.utils import (
+    create_embeddings_client,
+    create_knowledge_base_documents,
+    get_test_data_path,
+    load_store,
+)
+
+EMBEDDINGS_PATH = os.path.join(get_test_data_path(), "test_knowledge_pack/embeddings")
+DOCUMENT_KEYS = ["ingenuity-wikipedia", "tw-guide-agile-sd"]
+
+
+class TestCompactDocstore:
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        self.knowledge_pack_path = tmp_path / "embeddings"
+        shutil.copytree(EMBEDDINGS_PATH, self.knowledge_pack_path)
+        self.kb_path = self.knowledge_pack_path / "tw-guide-agile-sd.kb"
+        self.pickled = load_store(self.kb_path)
+        self.embedding = self.pickled.index.reconstruct(3).tolist()
+
+    def test_stores_every_chunk_and_each_metadata_once(self):
+        docstore = CompactDocstore.from_documents(
+            [
+                Document(page_content="Ünïcode chunk", metadata={"page": 1}),
+                Document(page_content="", metadata={"page": 1}),
+                Document(page_content="Next page", metadata={"page": 2}),
+            ]
+        )
+
+        assert [docstore.search(position) for position in range(3)] == [
+            Document(page_content="Ünïcode chunk", metadata={"page": 1}),
+            Document(page_content="", metadata={"page": 1}),
+            Document(page_content="Next page", metadata={"page": 2}),
+        ]
+        assert docstore.metadata_table == [{"page": 1}, {"page": 2}]
+        assert docstore.search(3) == "ID 3 not found."
+
+    def test_converted_store_finds_the_same_chunks(self):
+        compact = load_compact(self.kb_path, FakeEmbeddings(size=1536))
+
+        expected = self.pickled.similarity_search_with_score_by_vector(
+            self.embedding, k=4
+        )
+        results = compact.similarity_search_with_score_by_vector(self.embedding, k=4)
+
+        assert [(document.page_content, score) for document, score in results] == [
+            (document.page_content, score) for document, score in expected
+        ]
+        assert results[0][0].metadata == expected[0][0].metadata
+        assert len(compact.docstore.metadata_table) < len(compact.docstore) == 640
+
+    def test_compact_files_are_written_once_and_memory_mapped(self):
+        load_compact(self.kb_path, FakeEmbeddings(size=1536))
+
+        with patch("embeddings.compact_docstore.pickle.load") as pickle_load:
+            compact = load_compact(
+                self.kb_path, FakeEmbeddings(size=1536), memory_map=True
+            )
+
+        pickle_load.assert_not_called()
+        assert isinstance(compact.docstore.text, np.memmap)
+        expected = self.pickled.docstore.search(self.pickled.index_to_docstore_id[5])
+        assert compact.docstore.search(5).page_content == expected.page_content
+
+    def test_compact_files_older_than_the_pickle_are_converted_again(self):
+        load_compact(self.kb_path, FakeEmbeddings(size=1536))
+        metadata_path = self.kb_path / "index.chunk_metadata.json"
+        modified = os.path.getmtime(self.kb_path / "index.pkl") - 10
+        os.utime(metadata_path, (modified, modified))
+
+        assert not CompactDocstore.is_up_to_date(self.kb_path)
+        load_compact(self.kb_path, FakeEmbeddings(size=1536))
+        assert CompactDocstore.is_up_to_date(self.kb_path)
+
+    def test_only_the_top_k_chunks_are_materialised(self):
+        expected = create_knowledge_base_documents(
+            self.knowledge_pack_path, create_embeddings_client()
+        ).similarity_search_with_scores_by_vector(self.embedding, k=5)
+        documents = create_knowledge_base_documents(
+            self.knowledge_pack_path,
+            create_embeddings_client(
+                lambda path: load_compact(path, FakeEmbeddings(size=1536))
+            ),
+        )
+        searches = []
+        for document in documents.get_documents():
+            document.retriever.docstore.search = MagicMock(
+                wraps=document.retriever.docstore.search
+            )
+            searches.append(document.retriever.docstore.search)
+
+        results = documents.similarity_search_on_multiple_documents_by_vector(
+            self.embedding, DOCUMENT_KEYS, k=5
+        )
+
+        assert [document.page_content for document in results] == [
+            document.page_content for document, _ in expected
+        ]
+        assert sum(search.call_count for search in searches) == 5
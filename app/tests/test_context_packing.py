@@ -0,0 +1,132 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import json
+from unittest.mock import MagicMock
+
+from langchain.docstore.document import Document
+
+from llms.chats import StreamingChat
+from llms.context_packing import (
+    ContextPacker,
+    ContextPackingConfig,
+    overlap_length,
+)
+from llms.memory_budget import count_tokens
+
+MODEL = "openai/gpt-4o"
+PAGE = {"source": "guide.pdf", "page": 3}
+
+FIRST = "Pair programming spreads knowledge in the team and catches defects early."
+# Starts with the end of FIRST, like chunks of a splitter with chunk_overlap
+SECOND = "catches defects early. It also helps new joiners to get started quickly."
+
+
+def chunk(text, metadata=PAGE):
+    return Document(page_content=text, metadata=dict(metadata))
+
+
+def texts(documents):
+    return [document.page_content for document in documents]
+
+
+class TestContextPackingConfig:
+    def test_model_settings_override_the_defaults(self):
+        default = ContextPackingConfig.from_dict(
+            {"enabled": "true", "max_tokens": 4000, "duplicate_threshold": 0.8}
+        )
+
+        config = ContextPackingConfig.from_dict({"max_tokens": 1000}, default)
+
+        assert (config.enabled, config.max_tokens, config.duplicate_threshold) == (
+            True,
+            1000,
+            0.8,
+        )
+        assert not ContextPackingConfig.from_dict(None).enabled
+
+
+class TestContextPacker:
+    def test_overlap_length(self):
+        assert overlap_length(FIRST, SECOND, 10) == len("catches defects early.")
+        assert overlap_length(SECOND, FIRST, 10) == 0
+        assert overlap_length("abc", "bcd", 10) == 0
+
+    def test_overlapping_chunks_of_a_page_are_merged_at_the_best_rank(self):
+        packer = ContextPacker(ContextPackingConfig(enabled=True), MODEL)
+        other = chunk("Continuous delivery keeps the software releasable.")
+
+        packed = packer.pack([chunk(SECOND), other, chunk(FIRST)])
+
+        assert texts(packed) == [
+            FIRST + SECOND[len("catches defects early.") :],
+            other.page_content,
+        ]
+
+    def test_chunks_of_other_pages_are_not_merged(self):
+        packer = ContextPacker(ContextPackingConfig(enabled=True), MODEL)
+
+        packed = packer.pack(
+            [chunk(FIRST), chunk(SECOND, {"source": "guide.pdf", "page": 4})]
+        )
+
+        assert texts(packed) == [FIRST, SECOND]
+
+    def test_contained_and_near_duplicate_chunks_are_dropped(self):
+        packer = ContextPacker(ContextPackingConfig(enabled=True), MODEL)
+
+        packed = packer.pack(
+            [
+                chunk(FIRST, {}),
+                chunk("spreads knowledge in the team", {"source": "other.pdf"}),
+                chunk(FIRST.replace("early.", "early!"), {"source": "copy.pdf"}),
+            ]
+        )
+
+        assert texts(packed) == [FIRST]
+
+    def test_best_chunks_are_added_while_they_fit_into_the_budget(self):
+        long_chunk = chunk("word " * 200, {})
+        short_chunk = chunk("Small chunk that still fits.", {})
+        budget = count_tokens(MODEL, FIRST) + 20
+        packer = ContextPacker(
+            ContextPackingConfig(enabled=True, max_tokens=budget), MODEL
+        )
+
+        packed = packer.pack([chunk(FIRST, {}), long_chunk, short_chunk])
+
+        assert texts(packed) == [FIRST, short_chunk.page_content]
+
+
+class TestStreamingChatContextPacking:
+    def test_packed_context_is_sent_and_its_tokens_are_reported(self):
+        knowledge_manager = MagicMock()
+        knowledge_manager.get_system_message.return_value = "system"
+        knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+        knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents.return_value = [
+            chunk(FIRST),
+            chunk(SECOND),
+        ]
+        chat_client = MagicMock()
+        chat_client.model_config.lite_id = MODEL
+        sent = []
+
+        def stream(messages, **kwargs):
+            sent.append(messages[-1].content)
+            yield {"content": "answer"}
+
+        chat_client.stream.side_effect = stream
+        chat = StreamingChat(
+            chat_client,
+            knowledge_manager,
+            context_packing=ContextPackingConfig(enabled=True),
+        )
+
+        events = [
+            event for event, _ in chat.run_with_document(["guide"], "What helps?")
+        ]
+
+        packed = FIRST + SECOND[len("catches defects early.") :]
+        assert packed in sent[-1]
+        assert FIRST + "\n---" not in sent[-1]
+        metadata = json.loads(events[0].split("data: ", 1)[1])["metadata"]
+        assert events[0].startswith("event: metadata")
+        assert metadata == {"context_tokens": count_tokens(MODEL, packed)}
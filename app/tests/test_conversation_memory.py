@@ -0,0 +1,198 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import threading
+from unittest.mock import MagicMock, patch
+
+from llms.chats import StreamingChat
+from llms.clients import HaivenAIMessage, HaivenHumanMessage, HaivenSystemMessage
+from llms.conversation_memory import SUMMARY_HEADER, ConversationMemory
+from llms import memory_budget
+from llms.memory_budget import MemoryBudgetConfig, count_tokens
+from llms.model_config import ModelConfig
+
+MODEL = "openai/gpt-4o"
+
+
+def conversation(number_of_turns, words_per_message=50):
+    memory = [HaivenSystemMessage(content="You are a helpful assistant.")]
+    for turn in range(number_of_turns):
+        memory.append(
+            HaivenHumanMessage(
+                content=f"question {turn} " + "word " * words_per_message
+            )
+        )
+        memory.append(
+            HaivenAIMessage(content=f"answer {turn} " + "word " * words_per_message)
+        )
+    return memory
+
+
+def tokens(messages):
+    return sum(count_tokens(MODEL, message.content) for message in messages)
+
+
+class FakeSummariser:
+    def __init__(self):
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, prompt):
+        self.release.wait(5)
+        self.prompts.append(prompt)
+        return f"summary {len(self.prompts)}"
+
+
+class TestCountTokens:
+    def test_counts_are_cached_by_hash_without_keeping_the_text(self):
+        text = "an uncached message " * 100
+        with patch(
+            "llms.memory_budget.litellm.token_counter", return_value=400
+        ) as token_counter:
+            assert count_tokens(MODEL, text) == 400
+            assert count_tokens(MODEL, text) == 400
+
+        token_counter.assert_called_once()
+        assert not any(text in key for key in memory_budget._token_counts)
+
+
+class TestMemoryBudgetConfig:
+    def test_model_settings_override_the_defaults(self):
+        default = MemoryBudgetConfig.from_dict(
+            {"max_tokens": 16000, "keep_recent_messages": 6}
+        )
+
+        budget = MemoryBudgetConfig.from_dict({"max_tokens": 3000}, default)
+
+        assert budget.enabled
+        assert budget.max_tokens == 3000
+        assert budget.keep_recent_messages == 6
+        assert not MemoryBudgetConfig.from_dict(None).enabled
+
+    def test_model_config_reads_memory_budget(self):
+        model_config = ModelConfig.from_dict(
+            {
+                "id": "llama",
+                "provider": "ollama",
+                "name": "Llama",
+                "config": {"model": "llama2"},
+                "memory_budget": {"max_tokens": 3000},
+            }
+        )
+
+        assert model_config.memory_budget == {"max_tokens": 3000}
+        assert "memory_budget" not in model_config.config
+
+
+class TestConversationMemory:
+    def test_small_conversations_are_sent_in_full(self):
+        memory = conversation(2)
+        conversation_memory = ConversationMemory(
+            MemoryBudgetConfig(max_tokens=10000), MODEL, FakeSummariser()
+        )
+
+        assert conversation_memory.messages_for_request(memory) == memory
+
+    def test_recent_messages_within_budget_are_sent(self):
+        memory = conversation(10)
+        memory.append(HaivenHumanMessage(content="new question"))
+        budget = MemoryBudgetConfig(max_tokens=300, keep_recent_messages=2)
+        conversation_memory = ConversationMemory(budget, MODEL, FakeSummariser())
+
+        messages = conversation_memory.messages_for_request(memory)
+
+        assert messages[0] is memory[0]
+        assert messages[-1].content == "new question"
+        assert isinstance(messages[1], HaivenHumanMessage)
+        assert tokens(messages) <= 300
+        assert len(messages) < len(memory)
+
+    def test_keeps_recent_messages_even_over_budget(self):
+        memory = conversation(3, words_per_message=500)
+        budget = MemoryBudgetConfig(max_tokens=100, keep_recent_messages=2)
+        conversation_memory = ConversationMemory(budget, MODEL, FakeSummariser())
+
+        messages = conversation_memory.messages_for_request(memory)
+
+        assert messages[1:] == memory[-2:]
+
+    def test_older_messages_are_folded_into_the_summary(self):
+        memory = conversation(10)
+        summariser = FakeSummariser()
+        budget = MemoryBudgetConfig(
+            max_tokens=400, keep_recent_messages=2, summary_max_tokens=50
+        )
+        conversation_memory = ConversationMemory(budget, MODEL, summariser)
+
+        conversation_memory.after_reply(memory)
+        conversation_memory.wait(5)
+        memory.append(HaivenHumanMessage(content="new question"))
+        messages = conversation_memory.messages_for_request(memory)
+
+        assert len(summariser.prompts) == 1
+        transcript = summariser.prompts[0][-1].content
+        assert "question 0" in transcript
+        assert "answer 9" not in transcript
+        assert messages[0].content.endswith(SUMMARY_HEADER + "summary 1")
+        assert memory[0].content == "You are a helpful assistant."
+        assert messages[-1].content == "new question"
+
+        # The next fold only summarises the messages since the last one
+        memory.extend(conversation(14)[21:])
+        conversation_memory.after_reply(memory)
+        conversation_memory.wait(5)
+
+        second_prompt = summariser.prompts[1][-1].content
+        assert "Summary so far:\nsummary 1" in second_prompt
+        assert "question 0" not in second_prompt
+
+    def test_only_one_fold_runs_at_a_time(self):
+        memory = conversation(10)
+        summariser = FakeSummariser()
+        summariser.release.clear()
+        conversation_memory = ConversationMemory(
+            MemoryBudgetConfig(max_tokens=400, keep_recent_messages=2),
+            MODEL,
+            summariser,
+        )
+
+        conversation_memory.after_reply(memory)
+        conversation_memory.after_reply(memory)
+        # Requests while the summary is pending leave out what does not fit
+        assert conversation_memory.messages_for_request(memory)[0] is memory[0]
+        summariser.release.set()
+        conversation_memory.wait(5)
+
+        assert len(summariser.prompts) == 1
+
+    def test_streaming_chat_sends_the_budgeted_history(self):
+        knowledge_manager = MagicMock()
+        knowledge_manager.get_system_message.return_value = "system"
+        knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+        chat_client = MagicMock()
+        chat_client.model_config.lite_id = MODEL
+        sent, summary_prompts = [], []
+
+        def stream(messages, use_cache=True):
+            if use_cache:
+                sent.append(list(messages))
+                yield {"content": "answer " + "word " * 100}
+            else:
+                summary_prompts.append(messages)
+                yield {"content": "the summary"}
+
+        chat_client.stream.side_effect = stream
+        chat = StreamingChat(
+            chat_client,
+            knowledge_manager,
+            memory_budget=MemoryBudgetConfig(max_tokens=250, keep_recent_messages=2),
+        )
+
+        for turn in range(4):
+            list(chat.run(f"question {turn}"))
+            chat.conversation_memory.wait(5)
+
+        assert len(chat.memory) == 9
+        assert len(sent[-1]) < len(chat.memory)
+        assert sent[-1][-1].content == "question 3"
+        assert summary_prompts
+        assert sent[-1][0].content.endswith(SUMMARY_HEADER + "the summary")
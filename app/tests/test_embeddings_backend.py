@@ -0,0 +1,146 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_community.vectorstores.utils import DistanceStrategy
+from qdrant_client import QdrantClient
+
+from embeddings.backend_factory import create_embeddings_backend
+from embeddings.db_config import EmbeddingsDBConfig
+from embeddings.faiss_backend import FaissBackend
+from embeddings.qdrant_backend import QdrantBackend
+from tests.utils import (
+    create_embeddings_client,
+    create_knowledge_base_documents,
+    get_test_data_path,
+)
+
+EMBEDDINGS_PATH = os.path.join(get_test_data_path(), "test_knowledge_pack/embeddings")
+DOCUMENT_KEYS = ["ingenuity-wikipedia", "tw-guide-agile-sd"]
+
+
+class TestEmbeddingsDBConfig:
+    def test_defaults_to_faiss(self):
+        config = EmbeddingsDBConfig.from_dict(
+            {"type": "", "skip_import": "", "config": {"url": ""}}
+        )
+
+        assert (config.type, config.skip_import, config.url) == ("faiss", False, None)
+        assert isinstance(create_embeddings_backend(config, MagicMock()), FaissBackend)
+
+    def test_unknown_type_is_not_implemented(self):
+        with pytest.raises(NotImplementedError):
+            create_embeddings_backend(
+                EmbeddingsDBConfig.from_dict({"type": "chroma"}), MagicMock()
+            )
+
+
+class TestQdrantBackend:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.client = QdrantClient(location=":memory:")
+        self.embeddings_client = create_embeddings_client()
+        self.backend = QdrantBackend(
+            self.client, "knowledge", self.embeddings_client, batch_size=100
+        )
+        self.faiss_documents = create_knowledge_base_documents(EMBEDDINGS_PATH)
+        self.qdrant_documents = create_knowledge_base_documents(
+            EMBEDDINGS_PATH, self.embeddings_client, embeddings_backend=self.backend
+        )
+        self.embedding = (
+            self.faiss_documents.get_documents()[0]
+            .retriever.index.reconstruct(3)
+            .tolist()
+        )
+
+    def test_imports_every_chunk_of_every_document(self):
+        assert self.client.count("knowledge").count == 44 + 640
+        assert self.backend.has_document("tw-guide-agile-sd")
+        assert not self.backend.has_document("unknown")
+
+    def test_single_document_search_matches_faiss(self):
+        expected = self.faiss_documents._similarity_search_on_single_document_with_scores_by_vector(
+            self.embedding, "tw-guide-agile-sd", k=4
+        )
+
+        results = self.qdrant_documents._similarity_search_on_single_document_with_scores_by_vector(
+            self.embedding, "tw-guide-agile-sd", k=4
+        )
+
+        assert [document.page_content for document, _ in results] == [
+            document.page_content for document, _ in expected
+        ]
+        assert [score for _, score in results] == pytest.approx(
+            [score for _, score in expected], rel=1e-3
+        )
+
+    def test_multiple_documents_are_searched_with_one_query(self):
+        expected = (
+            self.faiss_documents.similarity_search_on_multiple_documents_by_vector(
+                self.embedding, DOCUMENT_KEYS, k=5
+            )
+        )
+        self.client.query_points = MagicMock(wraps=self.client.query_points)
+
+        results = (
+            self.qdrant_documents.similarity_search_on_multiple_documents_by_vector(
+                self.embedding, DOCUMENT_KEYS, k=5
+            )
+        )
+
+        assert [document.page_content for document in results] == [
+            document.page_content for document in expected
+        ]
+        assert self.client.query_points.call_count == 1
+
+    def test_skip_import_keeps_documents_that_are_already_imported(self):
+        embeddings_client = create_embeddings_client()
+        backend = QdrantBackend(
+            self.client, "knowledge", embeddings_client, skip_import=True
+        )
+
+        documents = create_knowledge_base_documents(
+            EMBEDDINGS_PATH, embeddings_client, embeddings_backend=backend
+        )
+
+        embeddings_client.generate_from_filesystem.assert_not_called()
+        assert self.client.count("knowledge").count == 44 + 640
+        assert (
+            len(documents.similarity_search_with_scores_by_vector(self.embedding)) == 5
+        )
+
+    def test_distance_is_read_once_and_euclidean_without_a_collection(self):
+        backend = QdrantBackend(
+            QdrantClient(location=":memory:"), "missing", create_embeddings_client()
+        )
+        assert backend.distance_strategy == DistanceStrategy.EUCLIDEAN_DISTANCE
+
+        skipping = QdrantBackend(
+            self.client, "knowledge", create_embeddings_client(), skip_import=True
+        )
+        self.client.get_collection = MagicMock(wraps=self.client.get_collection)
+        create_knowledge_base_documents(EMBEDDINGS_PATH, embeddings_backend=skipping)
+        assert skipping.distance_strategy == DistanceStrategy.EUCLIDEAN_DISTANCE
+        skipping.search(self.embedding, DOCUMENT_KEYS, k=2)
+
+        assert self.client.get_collection.call_count == 1
+
+    def test_collection_is_only_looked_up_until_it_is_known(self):
+        self.client.collection_exists = MagicMock(wraps=self.client.collection_exists)
+
+        for _ in range(3):
+            assert len(self.backend.search(self.embedding, DOCUMENT_KEYS, k=2)) == 2
+        self.client.collection_exists.assert_not_called()
+
+        self.client.delete_collection("knowledge")
+        assert self.backend.search(self.embedding, DOCUMENT_KEYS, k=2) == []
+        assert self.backend.search(self.embedding, DOCUMENT_KEYS, k=2) == []
+        assert self.client.collection_exists.call_count == 1
+
+    def test_reimport_replaces_the_points_of_a_document(self):
+        create_knowledge_base_documents(
+            EMBEDDINGS_PATH, embeddings_backend=self.backend
+        )
+
+        assert self.client.count("knowledge").count == 44 + 640
@@ -0,0 +1,361 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from litellm import APIConnectionError, BadRequestError
+from litellm.types.utils import Delta, ModelResponseStream, StreamingChoices
+
+from llms.clients import ChatClient, HaivenHumanMessage, _HedgedAttempt
+from llms.failover import CircuitBreaker, FailoverConfig, ProviderUnavailableError
+from llms.model_config import ModelConfig
+from llms.rate_limiter import AdmissionController, RateLimitBudget, RateLimitConfig
+from tests.utils import FakeClock, rate_limit_error
+
+
+def model(model_id, provider="openai"):
+    return ModelConfig(
+        model_id, provider, model_id, config={"model_name": model_id, "model": model_id}
+    )
+
+
+PRIMARY = model("gpt-4o")
+FALLBACK = model("llama3", provider="ollama")
+MESSAGES = [HaivenHumanMessage(content="hi")]
+
+
+def answer(lite_id):
+    return [
+        {"content": f"from {lite_id}"},
+        {"metadata": {"served_by": lite_id}},
+    ]
+
+
+class FakeProvider:
+    """Stands in for ChatClient._stream_from_model, failing or stalling per model"""
+
+    def __init__(self, failing=(), first_chunk_delay=None, error=APIConnectionError):
+        self.failing = set(failing)
+        self.first_chunk_delay = first_chunk_delay or {}
+        self.error = error
+        self.closed = []
+
+    def fail(self, model_config):
+        raise self.error(
+            message=f"{model_config.lite_id} is down",
+            llm_provider=model_config.provider,
+            model=model_config.lite_id,
+        )
+
+    def stream(self, model_config, json_messages, hedged_attempt=None):
+        response = FakeResponse()
+        if hedged_attempt is not None and not hedged_attempt.track(response):
+            return
+        try:
+            if response.closed.wait(
+                self.first_chunk_delay.get(model_config.lite_id, 0)
+            ):
+                self.closed.append(model_config.lite_id)
+                return
+            if model_config.lite_id in self.failing:
+                self.fail(model_config)
+            yield from answer(model_config.lite_id)
+        except GeneratorExit:
+            self.closed.append(model_config.lite_id)
+            raise
+
+    async def astream(self, model_config, json_messages):
+        try:
+            await asyncio.sleep(self.first_chunk_delay.get(model_config.lite_id, 0))
+        except asyncio.CancelledError:
+            self.closed.append(model_config.lite_id)
+            raise
+        if model_config.lite_id in self.failing:
+            self.fail(model_config)
+        for chunk in answer(model_config.lite_id):
+            yield chunk
+
+
+class FakeResponse:
+    """A provider response whose first chunk stops waiting when it is closed"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def chat_client(provider, circuit_breaker=None, hedge_after_seconds=None):
+    client = ChatClient(
+        PRIMARY,
+        fallback_models=[FALLBACK],
+        circuit_breaker=circuit_breaker,
+        hedge_after_seconds=hedge_after_seconds,
+    )
+    client._stream_from_model = provider.stream
+    client._astream_from_model = provider.astream
+    return client
+
+
+@pytest.fixture(autouse=True)
+def haiven_logger():
+    with patch("llms.clients.HaivenLogger") as logger:
+        yield logger
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+        breaker.record_failure("openai")
+        assert breaker.allow("openai")
+
+        breaker.record_failure("openai")
+        assert breaker.state("openai") == CircuitBreaker.OPEN
+        assert not breaker.allow("openai")
+        assert breaker.allow("ollama")
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+        breaker.record_failure("openai")
+        breaker.record_success("openai")
+        breaker.record_failure("openai")
+
+        assert breaker.state("openai") == CircuitBreaker.CLOSED
+
+    def test_half_open_lets_one_trial_request_through(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            failure_threshold=1, reset_timeout_seconds=30, clock=clock
+        )
+        breaker.record_failure("openai")
+        clock.now = 31
+
+        assert breaker.allow("openai")
+        assert not breaker.allow("openai")
+
+        breaker.record_failure("openai")
+        assert breaker.state("openai") == CircuitBreaker.OPEN
+
+        clock.now = 62
+        assert breaker.allow("openai")
+        breaker.record_success("openai")
+        assert breaker.state("openai") == CircuitBreaker.CLOSED
+
+    def test_trial_is_released_when_it_fails_with_a_bad_request(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+        breaker.record_failure("openai")
+        clock.now = 31
+        provider = FakeProvider(failing=["openai/gpt-4o"], error=BadRequestError)
+        client = chat_client(provider, circuit_breaker=breaker)
+
+        with pytest.raises(BadRequestError):
+            list(client.stream(MESSAGES))
+
+        assert breaker.state("openai") == CircuitBreaker.HALF_OPEN
+        assert breaker.allow("openai")
+
+    def test_trial_is_released_when_an_abandoned_hedge_fails(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+        breaker.record_failure("openai")
+        clock.now = 31
+        client = chat_client(FakeProvider(), circuit_breaker=breaker)
+        attempt = _HedgedAttempt()
+        attempt.abandon()
+
+        assert breaker.allow("openai")
+        with pytest.raises(StopIteration):
+            client._start_stream(PRIMARY, [], attempt)
+
+        assert breaker.allow("openai")
+
+    def test_config_from_dict_disables_hedging_when_empty(self):
+        assert (
+            FailoverConfig.from_dict({"hedge_after_seconds": ""}).hedge_after_seconds
+            is None
+        )
+        assert (
+            FailoverConfig.from_dict({"hedge_after_seconds": "2.5"}).hedge_after_seconds
+            == 2.5
+        )
+
+
+class TestChatClientFailover:
+    def test_fails_over_to_fallback_before_first_chunk(self, haiven_logger):
+        client = chat_client(FakeProvider(failing=["openai/gpt-4o"]))
+
+        chunks = list(client.stream(MESSAGES))
+
+        assert chunks == answer("ollama/llama3")
+        haiven_logger.get().analytics.assert_called_with(
+            "Model response served",
+            {
+                "requested_model": "openai/gpt-4o",
+                "served_by": "ollama/llama3",
+                "failover": True,
+            },
+        )
+
+    def test_raises_last_error_when_all_models_fail(self):
+        client = chat_client(FakeProvider(failing=["openai/gpt-4o", "ollama/llama3"]))
+
+        with pytest.raises(APIConnectionError, match="ollama/llama3 is down"):
+            list(client.stream(MESSAGES))
+
+    def test_does_not_fail_over_or_open_the_circuit_on_a_bad_request(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+        provider = FakeProvider(failing=["openai/gpt-4o"], error=BadRequestError)
+        provider.stream = MagicMock(side_effect=provider.stream)
+        client = chat_client(provider, circuit_breaker=breaker)
+
+        with pytest.raises(BadRequestError, match="openai/gpt-4o is down"):
+            list(client.stream(MESSAGES))
+
+        provider.stream.assert_called_once()
+        assert breaker.state("openai") == CircuitBreaker.CLOSED
+
+    def test_async_does_not_fail_over_on_a_bad_request(self):
+        provider = FakeProvider(failing=["openai/gpt-4o"], error=BadRequestError)
+        client = chat_client(provider, hedge_after_seconds=1)
+
+        async def collect():
+            return [chunk async for chunk in client.astream(MESSAGES)]
+
+        with pytest.raises(BadRequestError, match="openai/gpt-4o is down"):
+            asyncio.run(collect())
+
+    def test_skips_provider_with_open_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+        provider = FakeProvider(failing=["openai/gpt-4o"])
+        client = chat_client(provider, circuit_breaker=breaker)
+
+        list(client.stream(MESSAGES))
+        assert breaker.state("openai") == CircuitBreaker.OPEN
+
+        provider.failing.clear()
+        assert list(client.stream(MESSAGES)) == answer("ollama/llama3")
+
+    def test_raises_unavailable_when_all_circuits_are_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+        breaker.record_failure("openai")
+        breaker.record_failure("ollama")
+        client = chat_client(FakeProvider(), circuit_breaker=breaker)
+
+        with pytest.raises(ProviderUnavailableError):
+            list(client.stream(MESSAGES))
+
+    def test_hedge_serves_faster_fallback_and_closes_primary(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+        provider = FakeProvider(first_chunk_delay={"openai/gpt-4o": 30})
+        client = chat_client(provider, breaker, hedge_after_seconds=0.05)
+
+        assert list(client.stream(MESSAGES)) == answer("ollama/llama3")
+
+        time.sleep(0.1)
+        assert provider.closed == ["openai/gpt-4o"]
+        assert breaker.state("openai") == CircuitBreaker.CLOSED
+
+    def test_no_hedge_when_first_chunk_arrives_in_time(self):
+        provider = FakeProvider()
+        provider.stream = MagicMock(side_effect=provider.stream)
+        client = chat_client(provider, hedge_after_seconds=1)
+        client._stream_from_model = provider.stream
+
+        assert list(client.stream(MESSAGES)) == answer("openai/gpt-4o")
+        provider.stream.assert_called_once()
+
+    def test_async_hedge_serves_faster_fallback(self):
+        provider = FakeProvider(first_chunk_delay={"openai/gpt-4o": 1})
+        client = chat_client(provider, hedge_after_seconds=0.05)
+
+        async def collect():
+            return [chunk async for chunk in client.astream(MESSAGES)]
+
+        assert asyncio.run(collect()) == answer("ollama/llama3")
+
+    def test_async_hedge_cancels_both_models_when_the_caller_is_cancelled(self):
+        provider = FakeProvider(
+            first_chunk_delay={"openai/gpt-4o": 30, "ollama/llama3": 30}
+        )
+        client = chat_client(provider, hedge_after_seconds=0.05)
+
+        async def cancel_while_waiting():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.astream(MESSAGES).__anext__(), 0.2)
+            await asyncio.sleep(0.01)
+            return sorted(provider.closed)
+
+        assert asyncio.run(cancel_while_waiting()) == [
+            "ollama/llama3",
+            "openai/gpt-4o",
+        ]
+
+    def test_async_fails_over_to_fallback(self):
+        client = chat_client(FakeProvider(failing=["openai/gpt-4o"]))
+
+        async def collect():
+            return [chunk async for chunk in client.astream(MESSAGES)]
+
+        assert asyncio.run(collect()) == answer("ollama/llama3")
+
+
+def streamed(content):
+    return [
+        ModelResponseStream(choices=[StreamingChoices(delta=Delta(content=content))])
+    ]
+
+
+class TestFailoverWithAdmissionControl:
+    def client(self, rate_limits: RateLimitConfig, circuit_breaker=None):
+        return ChatClient(
+            PRIMARY,
+            fallback_models=[FALLBACK],
+            admission_controller=AdmissionController(rate_limits, clock=FakeClock()),
+            circuit_breaker=circuit_breaker,
+        )
+
+    def completion(self, calls, rate_limited=(PRIMARY.lite_id,)):
+        def completion(model, **kwargs):
+            calls.append(model)
+            if model in rate_limited:
+                raise rate_limit_error()
+            return streamed(f"from {model}")
+
+        return completion
+
+    def test_fails_over_when_the_provider_keeps_answering_429(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+        client = self.client(
+            RateLimitConfig(max_retries=1, base_backoff_seconds=0.001), breaker
+        )
+        calls = []
+
+        with patch("llms.litellm_wrapper.completion", self.completion(calls)):
+            chunks = list(client.stream(MESSAGES))
+
+        assert chunks[0] == {"content": "from ollama/llama3"}
+        assert calls == ["openai/gpt-4o", "openai/gpt-4o", "ollama/llama3"]
+        assert breaker.state("openai") == CircuitBreaker.OPEN
+
+    def test_fails_over_when_the_local_budget_is_used_up(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+        client = self.client(
+            RateLimitConfig(models={"openai/gpt-4o": RateLimitBudget(rpm=1)}),
+            breaker,
+        )
+        calls = []
+
+        with patch(
+            "llms.litellm_wrapper.completion", self.completion(calls, rate_limited=())
+        ):
+            list(client.stream(MESSAGES, use_cache=False))
+            chunks = list(client.stream(MESSAGES, use_cache=False))
+
+        assert chunks[0] == {"content": "from ollama/llama3"}
+        assert calls == ["openai/gpt-4o", "ollama/llama3"]
+        # The used up local budget says nothing about the health of the provider
+        assert breaker.state("openai") == CircuitBreaker.CLOSED
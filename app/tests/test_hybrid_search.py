@@ -0,0 +1,136 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from knowledge.bm25 import BM25Index, tokenize
+from knowledge.ranking import reciprocal_rank_fusion
+from tests.utils import (
+    create_embeddings_client,
+    create_knowledge_base_documents,
+    load_store,
+)
+
+CHUNKS = [
+    "The deployment pipeline runs on every commit.",
+    "Ticket PROJ-4711 tracks the flaky login test.",
+    "Pair programming spreads knowledge in the team.",
+    "The login page uses the auth_service API.",
+]
+
+
+def write_document(folder, key, hybrid_search):
+    vectors = np.eye(len(CHUNKS), 8, dtype=np.float32)
+    store = FAISS.from_embeddings(
+        list(zip(CHUNKS, vectors.tolist())), FakeEmbeddings(size=8)
+    )
+    store.save_local(str(folder / f"{key}.kb"))
+    (folder / f"{key}.md").write_text(
+        f"---\nkey: {key}\ntitle: {key}\npath: {key}.kb\nprovider: ollama\n"
+        f"hybrid_search: {'true' if hybrid_search else 'false'}\n---\n"
+    )
+
+
+class TestBM25Index:
+    def test_tokenize_keeps_identifiers_and_their_parts(self):
+        assert tokenize("See PROJ-4711 and auth_service.") == [
+            "see",
+            "proj-4711",
+            "proj",
+            "4711",
+            "and",
+            "auth_service",
+            "auth",
+            "service",
+        ]
+
+    def test_ranks_chunks_with_rare_query_terms_first(self):
+        index = BM25Index.from_texts(CHUNKS)
+
+        results = index.search("login PROJ-4711", k=3)
+
+        assert [position for position, _ in results] == [1, 3]
+        assert results[0][1] > results[1][1] > 0
+        assert index.search("kubernetes", k=3) == []
+
+    def test_postings_are_compact_arrays(self):
+        index = BM25Index.from_texts(CHUNKS)
+
+        assert index.chunk_ids.dtype == np.int32
+        assert len(index.offsets) == len(index.vocabulary) + 1
+        assert index.offsets[-1] == len(index.chunk_ids) == len(index.term_frequencies)
+
+    def test_reciprocal_rank_fusion_prefers_results_in_both_lists(self):
+        fused = reciprocal_rank_fusion(
+            [["a", "b", "c"], ["c", "d"]], key=lambda result: result
+        )
+
+        assert fused == ["c", "a", "b", "d"]
+
+
+class TestHybridSearch:
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        write_document(tmp_path, "hybrid", hybrid_search=True)
+        write_document(tmp_path, "vector", hybrid_search=False)
+        self.knowledge_base_documents = create_knowledge_base_documents(
+            tmp_path, create_embeddings_client(lambda path: load_store(path, size=8))
+        )
+        # Closest to the pipeline chunk, farthest from the ticket chunk
+        self.embedding = [1.0, 0.0, 0.3, 0.3, 0.0, 0.0, 0.0, 0.0]
+
+    def test_keyword_matches_are_fused_into_the_results(self):
+        results = self.knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+            self.embedding, ["hybrid"], k=2, query="status of PROJ-4711"
+        )
+
+        assert [document.page_content for document in results] == [
+            CHUNKS[0],
+            CHUNKS[1],
+        ]
+
+    def test_documents_without_hybrid_search_are_searched_by_vector_only(self):
+        vector_only = self.knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+            self.embedding, ["vector"], k=2, query="status of PROJ-4711"
+        )
+        without_query = self.knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+            self.embedding, ["hybrid"], k=2
+        )
+
+        assert CHUNKS[1] not in [document.page_content for document in vector_only]
+        assert self.knowledge_base_documents._keyword_index("vector") is None
+        assert [document.page_content for document in without_query] == [
+            document.page_content for document in vector_only
+        ]
+
+    def test_keyword_matches_get_their_vector_score(self):
+        results = self.knowledge_base_documents.similarity_search_with_scores_by_vector(
+            self.embedding, k=3, query="PROJ-4711"
+        )
+
+        scores = {document.page_content: score for document, score in results}
+        assert scores[CHUNKS[1]] == pytest.approx(2.18)
+
+    def test_concurrent_searches_build_the_keyword_index_once(self):
+        self.knowledge_base_documents._keyword_indexes.clear()
+
+        with (
+            patch(
+                "knowledge.documents.BM25Index.from_texts",
+                side_effect=BM25Index.from_texts,
+            ) as from_texts,
+            ThreadPoolExecutor(8) as executor,
+        ):
+            indexes = list(
+                executor.map(
+                    lambda _: self.knowledge_base_documents._keyword_index("hybrid"),
+                    range(8),
+                )
+            )
+
+        assert from_texts.call_count == 1
+        assert all(index is indexes[0] for index in indexes)
@@ -27,10 +27,12 @@ class TestsKnowledgeBaseDocuments:
         ]
 
         retriever_mock = MagicMock()
-        retriever_mock.similarity_search_with_score.return_value = (
+        retriever_mock.similarity_search_with_score_by_vector.return_value = (
             fake_similarity_results
         )
+        self.retriever_mock = retriever_mock
         embeddings_provider_mock = MagicMock()
+        embeddings_provider_mock.embed_query.return_value = [0.1, 0.2, 0.3]
         embeddings_provider_mock.generate_from_filesystem.return_value = retriever_mock
         embeddings_provider_mock.generate_from_documents.return_value = retriever_mock
         embeddings_provider_mock.embedding_model = embedding_model
@@ -81,8 +83,8 @@ class TestsKnowledgeBaseDocuments:
         self.service.load_documents_for_base(self.knowledge_pack_path + "/embeddings")
 
         similarity_results = (
-            self.service._similarity_search_on_single_document_with_scores(
-                query="When Ingenuity was launched?",
+            self.service._similarity_search_on_single_document_with_scores_by_vector(
+                embedding=self.service.embed_query("When Ingenuity was launched?"),
                 document_key="ingenuity-wikipedia",
             )
         )
@@ -101,17 +103,46 @@ class TestsKnowledgeBaseDocuments:
             document_keys=["ingenuity-wikipedia", "tw-guide-agile-sd"],
         )
 
-        assert len(similarity_results) == 10
+        assert len(similarity_results) == 5
 
-        # Since both stores retrievers will return the same results, results will be duplicated as there are 2 documents in total
+        # Both stores retrievers return the same results, the best 5 of both together are merged by score
         assert similarity_results[0].page_content == "document content A"
-        assert similarity_results[1].page_content == "document content B"
-        assert similarity_results[2].page_content == "document content C"
-        assert similarity_results[3].page_content == "document content D"
-        assert similarity_results[4].page_content == "document content E"
+        assert similarity_results[1].page_content == "document content A"
+        assert similarity_results[2].page_content == "document content B"
+        assert similarity_results[3].page_content == "document content B"
+        assert similarity_results[4].page_content == "document content C"
 
-        assert similarity_results[0].page_content == "document content A"
-        assert similarity_results[1].page_content == "document content B"
-        assert similarity_results[2].page_content == "document content C"
-        assert similarity_results[3].page_content == "document content D"
-        assert similarity_results[4].page_content == "document content E"
+    def test_multiple_documents_search_embeds_the_query_once(
+        self,
+    ):
+        self.service.load_documents_for_base(self.knowledge_pack_path + "/embeddings")
+
+        self.service.similarity_search_on_multiple_documents(
+            query="When Ingenuity was launched?",
+            document_keys=["ingenuity-wikipedia", "tw-guide-agile-sd"],
+            k=3,
+            score_threshold=0.3,
+        )
+
+        self.service._embeddings_provider.embed_query.assert_called_once_with(
+            "When Ingenuity was launched?"
+        )
+        assert (
+            self.retriever_mock.similarity_search_with_score_by_vector.call_count == 2
+        )
+        self.retriever_mock.similarity_search_with_score_by_vector.assert_called_with(
+            [0.1, 0.2, 0.3], k=3, score_threshold=0.3
+        )
+        self.retriever_mock.similarity_search_with_score.assert_not_called()
+
+    def test_similarity_search_with_scores_by_vector_returns_the_top_k_of_all_documents(
+        self,
+    ):
+        self.service.load_documents_for_base(self.knowledge_pack_path + "/embeddings")
+
+        similarity_results = self.service.similarity_search_with_scores_by_vector(
+            [0.1, 0.2, 0.3], k=3
+        )
+
+        assert [score for _, score in similarity_results] == [0.2, 0.2, 0.23]
+        self.service._embeddings_provider.embed_query.assert_not_called()
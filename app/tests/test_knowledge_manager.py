@@ -4,7 +4,10 @@ from unittest.mock import patch
 from knowledge.documents import KnowledgeBaseDocuments
 from tests.utils import get_test_data_path
 from knowledge_manager import KnowledgeManager
+from embeddings.db_config import EmbeddingsDBConfig
 from embeddings.model import EmbeddingModel
+from knowledge.loading_config import KnowledgeLoadingConfig
+from knowledge.search_config import KnowledgeSearchConfig
 from config.constants import SYSTEM_MESSAGE
 
 
@@ -24,6 +27,9 @@ class TestKnowledgeManager:
         mock_embeddings,
     ):
         mock_config_service.load_embedding_model.return_value = {}
+        mock_config_service.load_embeddings_db_config.return_value = (
+            EmbeddingsDBConfig()
+        )
         mock_config_service.load_knowledge_pack_path.return_value = (
             self.knowledge_pack_path
         )
@@ -65,6 +71,15 @@ class TestKnowledgeManager:
         )
 
         mock_config_service.load_embedding_model.return_value = embedding_model
+        mock_config_service.load_embeddings_db_config.return_value = (
+            EmbeddingsDBConfig()
+        )
+        mock_config_service.load_knowledge_loading_config.return_value = (
+            KnowledgeLoadingConfig()
+        )
+        mock_config_service.load_knowledge_search_config.return_value = (
+            KnowledgeSearchConfig()
+        )
         mock_config_service.load_knowledge_pack_path.return_value = (
             self.knowledge_pack_path
         )
@@ -93,6 +108,9 @@ class TestKnowledgeManager:
         mock_embeddings_client,
     ):
         # Setup mocks
+        mock_config_service.load_embeddings_db_config.return_value = (
+            EmbeddingsDBConfig()
+        )
         mock_config_service.load_knowledge_pack_path.return_value = (
             self.knowledge_pack_path
         )
@@ -0,0 +1,129 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import numpy as np
+import pytest
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from knowledge.ranking import maximal_marginal_relevance, merge_top_k, relevance
+from knowledge.search_config import KnowledgeSearchConfig
+from tests.utils import create_documents_from_stores, store_from_vectors
+
+QUERY = [1.0, 0.0, 0.0]
+
+
+def create_knowledge_base_documents(search_config):
+    return create_documents_from_stores(
+        {
+            "first": store_from_vectors(
+                {
+                    "first close": [1.0, 0.1, 0.0],
+                    "first close copy": [1.0, 0.11, 0.0],
+                    "first far": [0.0, 1.0, 0.0],
+                }
+            ),
+            "second": store_from_vectors(
+                {
+                    "second closest": [1.0, 0.05, 0.0],
+                    "second other angle": [1.0, 0.0, 0.4],
+                }
+            ),
+        },
+        search_config=search_config,
+    )
+
+
+def texts(documents):
+    return [document.page_content for document in documents]
+
+
+class TestRanking:
+    def test_merge_top_k_keeps_the_best_results_of_all_lists(self):
+        first = [("a", 0.1), ("b", 0.4), ("c", 0.9)]
+        second = [("d", 0.2), ("e", 0.3)]
+
+        assert merge_top_k([first, second], 3, higher_is_better=False) == [
+            ("a", 0.1),
+            ("d", 0.2),
+            ("e", 0.3),
+        ]
+        assert merge_top_k(
+            [list(reversed(second)), list(reversed(first))], 2, higher_is_better=True
+        ) == [("c", 0.9), ("b", 0.4)]
+
+    def test_relevance_is_between_zero_and_one_and_higher_is_better(self):
+        euclidean = DistanceStrategy.EUCLIDEAN_DISTANCE
+        inner_product = DistanceStrategy.MAX_INNER_PRODUCT
+
+        assert relevance(0.0, euclidean) == 1.0
+        assert relevance(0.5, euclidean) > relevance(2.0, euclidean) > 0
+        assert relevance(1.0, inner_product) == 1.0
+        assert relevance(-1.0, inner_product) == 0.0
+
+    def test_maximal_marginal_relevance_skips_near_duplicates(self):
+        vectors = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [1.0, 0.0, 0.5]])
+
+        assert maximal_marginal_relevance(np.array(QUERY), vectors, 2, 1.0) == [0, 1]
+        assert maximal_marginal_relevance(np.array(QUERY), vectors, 2, 0.5) == [0, 2]
+
+
+class TestKnowledgeBaseDocumentsRanking:
+    def test_multiple_documents_return_the_global_top_k(self):
+        knowledge_base_documents = create_knowledge_base_documents(
+            KnowledgeSearchConfig()
+        )
+
+        results = (
+            knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+                QUERY, ["first", "second"], k=3
+            )
+        )
+
+        assert texts(results) == ["second closest", "first close", "first close copy"]
+
+    def test_documents_searched_in_parallel_return_the_same_top_k(self):
+        knowledge_base_documents = create_knowledge_base_documents(
+            KnowledgeSearchConfig(search_threads=2, min_parallel_documents=2)
+        )
+
+        results = (
+            knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+                QUERY, ["first", "second"], k=3
+            )
+        )
+
+        assert texts(results) == ["second closest", "first close", "first close copy"]
+        assert knowledge_base_documents.search_executor.parallel_searches == 1
+
+    def test_normalized_scores_are_filtered_by_relevance(self):
+        knowledge_base_documents = create_knowledge_base_documents(
+            KnowledgeSearchConfig(normalize_scores=True, score_threshold=0.9)
+        )
+
+        results = knowledge_base_documents.similarity_search_with_scores_by_vector(
+            QUERY, k=5
+        )
+
+        assert texts(document for document, _ in results) == [
+            "second closest",
+            "first close",
+            "first close copy",
+        ]
+        assert all(0.9 <= score <= 1.0 for _, score in results)
+        assert results[0][1] == pytest.approx(1 / (1 + 0.05**2))
+
+    @pytest.mark.parametrize("unified_index", [False, True])
+    def test_mmr_prefers_diverse_chunks(self, unified_index):
+        knowledge_base_documents = create_knowledge_base_documents(
+            KnowledgeSearchConfig(
+                unified_index=unified_index, mmr_lambda=0.5, mmr_fetch_k=10
+            )
+        )
+        if unified_index:
+            knowledge_base_documents._build_unified_index()
+
+        results = (
+            knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+                QUERY, ["first", "second"], k=2
+            )
+        )
+
+        assert texts(results) == ["second closest", "second other angle"]
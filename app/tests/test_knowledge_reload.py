@@ -0,0 +1,190 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+import shutil
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from embeddings.db_config import EmbeddingsDBConfig
+from embeddings.model import EmbeddingModel
+from knowledge.loading_config import KnowledgeLoadingConfig
+from knowledge.manifest import PackManifest
+from knowledge.pack_watcher import KnowledgePackWatcher
+from knowledge.search_config import KnowledgeSearchConfig
+from knowledge_manager import KnowledgeManager
+from prompts.prompts import PromptList
+from tests.utils import get_test_data_path
+
+KNOWLEDGE_PACK_PATH = os.path.join(get_test_data_path(), "test_knowledge_pack")
+
+
+def create_knowledge_manager(knowledge_pack_path, loading_config=None):
+    config_service = MagicMock()
+    config_service.load_knowledge_pack_path.return_value = str(knowledge_pack_path)
+    config_service.load_embedding_model.return_value = EmbeddingModel(
+        id="ollama-embeddings",
+        name="Ollama Embeddings",
+        provider="ollama",
+        config={"model": "ollama-embeddings", "api_key": "api_key"},
+    )
+    config_service.load_embeddings_db_config.return_value = EmbeddingsDBConfig()
+    config_service.load_knowledge_loading_config.return_value = (
+        loading_config or KnowledgeLoadingConfig()
+    )
+    config_service.load_knowledge_search_config.return_value = KnowledgeSearchConfig()
+    return KnowledgeManager(config_service=config_service)
+
+
+def append(path, text):
+    with open(path, "a") as file:
+        file.write(text)
+
+
+class TestPackManifest:
+    def test_only_files_whose_stat_changed_are_hashed_again(self, tmp_path):
+        (tmp_path / "a.md").write_text("a")
+        (tmp_path / "b.md").write_text("b")
+        manifest = PackManifest.build(str(tmp_path))
+
+        append(tmp_path / "b.md", " changed")
+        (tmp_path / "c.md").write_text("c")
+        (tmp_path / "index.chunks").write_text("generated")
+        with patch(
+            "knowledge.manifest.file_sha256", return_value="hash"
+        ) as file_sha256:
+            rebuilt = PackManifest.build(str(tmp_path), manifest)
+
+        assert sorted(call.args[0] for call in file_sha256.call_args_list) == [
+            str(tmp_path / "b.md"),
+            str(tmp_path / "c.md"),
+        ]
+        assert manifest.changed_paths(rebuilt) == {"b.md", "c.md"}
+
+    def test_removed_files_are_changed(self, tmp_path):
+        (tmp_path / "a.md").write_text("a")
+        manifest = PackManifest.build(str(tmp_path))
+        os.remove(tmp_path / "a.md")
+
+        assert manifest.changed_paths(PackManifest.build(str(tmp_path))) == {"a.md"}
+
+
+class TestKnowledgePackWatcher:
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        self.path = tmp_path / "pack"
+        shutil.copytree(KNOWLEDGE_PACK_PATH, self.path)
+        self.knowledge_manager = create_knowledge_manager(self.path)
+        self.prompt_list = PromptList(
+            "chat",
+            self.knowledge_manager.knowledge_base_markdown,
+            self.knowledge_manager,
+            root_dir=str(self.path),
+        )
+        self.watcher = KnowledgePackWatcher(self.knowledge_manager, [self.prompt_list])
+        self.watcher.check()
+
+    def reload(self):
+        assert not self.watcher.check()
+        assert self.watcher.check()
+
+    def test_changed_context_is_reloaded_once_the_pack_is_stable(self):
+        snapshot = self.knowledge_manager.snapshot
+        append(self.path / "contexts" / "context_a.md", "\nMore knowledge")
+
+        self.reload()
+
+        contexts = self.knowledge_manager.knowledge_base_markdown.get_all_contexts()
+        assert contexts["context_a"].content.endswith("More knowledge")
+        assert (
+            contexts["context_b"]
+            is snapshot.knowledge_base_markdown.get_all_contexts()["context_b"]
+        )
+        assert not snapshot.knowledge_base_markdown.get_all_contexts()[
+            "context_a"
+        ].content.endswith("More knowledge")
+        assert (
+            self.knowledge_manager.knowledge_base_documents
+            is snapshot.knowledge_base_documents
+        )
+        assert not self.watcher.check()
+        assert self.watcher.stats()["reloads"] == 1
+
+    def test_only_the_changed_document_is_loaded_again(self):
+        old_documents = self.knowledge_manager.knowledge_base_documents
+        embeddings_path = self.path / "embeddings"
+        markdown = (embeddings_path / "ingenuity_wikipedia.md").read_text()
+        (embeddings_path / "ingenuity_wikipedia.md").write_text(
+            markdown.replace("title: Wikipedia entry", "title: Updated entry")
+        )
+        shutil.copytree(
+            embeddings_path / "tw-guide-agile-sd.kb", embeddings_path / "copy.kb"
+        )
+        (embeddings_path / "copy.md").write_text(
+            "---\nkey: copy\ntitle: Copy\npath: copy.kb\nprovider: ollama\n---\n"
+        )
+
+        self.reload()
+
+        documents = self.knowledge_manager.knowledge_base_documents
+        assert documents is not old_documents
+        assert documents.search_executor is old_documents.search_executor
+        assert sorted(document.key for document in documents.get_documents()) == [
+            "copy",
+            "ingenuity-wikipedia",
+            "tw-guide-agile-sd",
+        ]
+        assert documents._document_stores.get_document(
+            "tw-guide-agile-sd"
+        ) is old_documents._document_stores.get_document("tw-guide-agile-sd")
+        assert (
+            documents._document_stores.get_document("ingenuity-wikipedia").title
+            == "Updated entry about Ingenuity"
+        )
+        assert (
+            old_documents._document_stores.get_document("ingenuity-wikipedia").title
+            == "Wikipedia entry about Ingenuity"
+        )
+
+    def test_changed_prompts_and_system_message_are_reloaded(self):
+        unchanged = self.prompt_list.get("uuid-1")
+        append(self.path / "prompts" / "chat" / "uuid-2-coding.md", " {user_input}")
+        (self.path / "prompts" / "system.md").write_text("Reloaded system message")
+
+        self.reload()
+
+        assert self.prompt_list.get("uuid-1") is unchanged
+        assert self.prompt_list.get("uuid-2").content.endswith(" {user_input}")
+        assert self.knowledge_manager.get_system_message() == "Reloaded system message"
+
+    def test_failed_reload_keeps_the_knowledge_until_the_next_change(self):
+        snapshot = self.knowledge_manager.snapshot
+        append(self.path / "contexts" / "context_a.md", "\nMore knowledge")
+
+        with patch.object(
+            self.knowledge_manager, "reload", side_effect=ValueError("broken")
+        ) as reload:
+            assert not self.watcher.check()
+            assert not self.watcher.check()
+            assert not self.watcher.check()
+            assert not self.watcher.check()
+
+        assert reload.call_count == 1
+        assert self.knowledge_manager.snapshot is snapshot
+        assert self.watcher.stats()["failed_reloads"] == 1
+
+        append(self.path / "contexts" / "context_a.md", "\nEven more")
+        self.reload()
+        assert self.watcher.stats()["reloads"] == 1
+
+    def test_documents_of_the_old_snapshot_stay_searchable_after_a_reload(self):
+        knowledge_manager = create_knowledge_manager(
+            self.path, KnowledgeLoadingConfig(lazy_documents=True)
+        )
+        old_documents = knowledge_manager.knowledge_base_documents
+        os.remove(self.path / "embeddings" / "ingenuity_wikipedia.md")
+
+        knowledge_manager.reload({"embeddings/ingenuity_wikipedia.md"})
+
+        removed = old_documents._document_stores.get_document("ingenuity-wikipedia")
+        assert removed.retriever is not None
+        assert not old_documents.retriever_cache.is_loaded("ingenuity-wikipedia")
@@ -0,0 +1,63 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+from unittest import mock
+
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from embeddings.client import EmbeddingsClient
+from embeddings.memory_mapped import load_memory_mapped
+from embeddings.model import EmbeddingModel
+from tests.utils import get_test_data_path
+
+INDEX_PATH = os.path.join(
+    get_test_data_path(), "test_knowledge_pack/embeddings/ingenuity_wikipedia.kb"
+)
+
+
+class TestMemoryMappedIndex:
+    def test_finds_the_same_chunks_as_an_index_in_memory(self):
+        embeddings = FakeEmbeddings(size=1536)
+        in_memory = FAISS.load_local(
+            INDEX_PATH, embeddings, allow_dangerous_deserialization=True
+        )
+        memory_mapped = load_memory_mapped(INDEX_PATH, embeddings)
+        query = in_memory.index.reconstruct(7).tolist()
+
+        expected = in_memory.similarity_search_with_score_by_vector(query, k=4)
+        results = memory_mapped.similarity_search_with_score_by_vector(query, k=4)
+
+        assert [document.page_content for document, _ in results] == [
+            document.page_content for document, _ in expected
+        ]
+        assert memory_mapped.index.ntotal == in_memory.index.ntotal
+
+    def test_docstore_is_loaded_on_first_search(self):
+        memory_mapped = load_memory_mapped(INDEX_PATH, FakeEmbeddings(size=1536))
+        pickled = memory_mapped.docstore._pickled
+
+        assert not pickled.loaded
+        memory_mapped.similarity_search_with_score_by_vector([0.0] * 1536, k=1)
+        assert pickled.loaded
+
+    @mock.patch("embeddings.client.load_memory_mapped")
+    @mock.patch("embeddings.client.FAISS.load_local")
+    @mock.patch("embeddings.client.OllamaEmbeddings")
+    def test_embeddings_client_memory_maps_if_configured(
+        self, ollama_embeddings_mock, load_local_mock, load_memory_mapped_mock
+    ):
+        embedding_model = EmbeddingModel(
+            id="ollama-embeddings",
+            name="Ollama Embeddings",
+            provider="ollama",
+            config={"model": "nomic-embed-text"},
+        )
+
+        EmbeddingsClient(
+            embedding_model, memory_map_indexes=True
+        ).generate_from_filesystem(INDEX_PATH)
+
+        load_memory_mapped_mock.assert_called_once_with(
+            INDEX_PATH, ollama_embeddings_mock()
+        )
+        load_local_mock.assert_not_called()
@@ -0,0 +1,151 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import random
+import statistics
+
+import pytest
+from litellm import APIConnectionError, RateLimitError, Timeout
+
+from llms.clients import MockModelClient
+from llms.mock_load_profile import Distribution, MockLoadProfile
+from llms.rate_limiter import (
+    AdmissionController,
+    AdmissionRejectedError,
+    RateLimitConfig,
+)
+
+MESSAGES = [{"role": "user", "content": "Tell me about load testing"}]
+
+
+def load_test_profile(**overrides):
+    settings = {
+        "load_test": "true",
+        "seed": 42,
+        "time_to_first_token_seconds": 0,
+        "tokens_per_second": 100000,
+        "response_tokens": 10,
+        "chunk_tokens": 3,
+    }
+    settings.update(overrides)
+    return MockLoadProfile.from_dict(settings)
+
+
+def contents(results):
+    return [result.choices[0].delta.content for result in results]
+
+
+class TestDistribution:
+    def test_plain_number_is_fixed(self):
+        assert Distribution.from_dict(3).sample(random.Random()) == 3
+
+    def test_samples_are_clamped_to_min_and_max(self):
+        distribution = Distribution.from_dict(
+            {"distribution": "normal", "mean": 10, "stddev": 100, "min": 5, "max": 15}
+        )
+        rng = random.Random(1)
+        samples = [distribution.sample(rng) for _ in range(200)]
+
+        assert min(samples) == 5
+        assert max(samples) == 15
+
+    def test_lognormal_has_configured_mean(self):
+        distribution = Distribution.from_dict(
+            {"distribution": "lognormal", "mean": 0.8, "stddev": 0.4}
+        )
+        rng = random.Random(1)
+        samples = [distribution.sample(rng) for _ in range(5000)]
+
+        assert min(samples) > 0
+        assert statistics.mean(samples) == pytest.approx(0.8, rel=0.05)
+
+    def test_unknown_distribution_is_rejected(self):
+        with pytest.raises(ValueError):
+            Distribution.from_dict({"distribution": "poisson", "mean": 1})
+
+
+class TestMockModelClient:
+    def test_without_load_test_streams_fixed_response_with_usage(self):
+        results = list(MockModelClient().completion(MESSAGES))
+
+        assert contents(results)[0] == "[Mock response]"
+        assert results[-1].usage.total_tokens == 40
+
+    def test_load_test_streams_configured_length_in_chunks(self):
+        results = list(MockModelClient(load_test_profile()).completion(MESSAGES))
+
+        assert len(results) == 4
+        assert [len(content.split()) for content in contents(results)] == [3, 3, 3, 1]
+        assert results[-1].usage.completion_tokens == 10
+        assert results[-1].usage.prompt_tokens == len(MESSAGES[0]["content"]) // 4
+
+    def test_load_test_waits_for_first_token_and_paces_tokens(self):
+        profile = load_test_profile(
+            time_to_first_token_seconds=0.05, tokens_per_second=300, response_tokens=30
+        )
+
+        async def collect():
+            loop = asyncio.get_running_loop()
+            started_at = loop.time()
+            stream = await MockModelClient(profile).acompletion(MESSAGES)
+            first = await stream.__anext__()
+            time_to_first_token = loop.time() - started_at
+            rest = [result async for result in stream]
+            return time_to_first_token, [first] + rest, loop.time() - started_at
+
+        time_to_first_token, results, duration = asyncio.run(collect())
+
+        assert time_to_first_token >= 0.05
+        # 9 more chunks of 3 tokens at 300 tokens/sec
+        assert duration >= 0.05 + 0.09
+        assert len(results) == 10
+
+    def test_injected_rate_limit_is_raised_by_the_call(self):
+        client = MockModelClient(load_test_profile(rate_limit_probability=1))
+
+        with pytest.raises(RateLimitError) as error:
+            client.completion(MESSAGES, model="mock/model")
+
+        assert error.value.response.headers.get("retry-after") is None
+
+    def test_injected_rate_limits_go_through_admission_retries(self):
+        client = MockModelClient(
+            load_test_profile(rate_limit_probability=1, retry_after_seconds=0)
+        )
+        controller = AdmissionController(
+            RateLimitConfig(max_retries=2, base_backoff_seconds=0.001)
+        )
+
+        with pytest.raises(AdmissionRejectedError):
+            controller.call(client.completion, model="mock/model", messages=MESSAGES)
+
+    def test_injected_timeout_is_raised_after_timeout_seconds(self):
+        client = MockModelClient(
+            load_test_profile(timeout_probability=1, timeout_seconds=0.01)
+        )
+
+        with pytest.raises(Timeout):
+            client.completion(MESSAGES, model="mock/model")
+
+    def test_injected_disconnect_breaks_the_stream(self):
+        client = MockModelClient(
+            load_test_profile(response_tokens=30, disconnect_probability=1)
+        )
+        results = []
+
+        with pytest.raises(APIConnectionError):
+            for result in client.completion(MESSAGES, model="mock/model"):
+                results.append(result)
+
+        assert len(results) < 10
+        assert all(result.usage is None for result in results)
+
+    def test_json_prompts_get_a_json_array(self):
+        messages = [{"role": "user", "content": "Respond in JSON"}]
+        results = MockModelClient(load_test_profile(response_tokens=50)).completion(
+            messages
+        )
+
+        response = "".join(contents(results))
+
+        assert response.startswith('[{"title": "Mock scenario 1"')
+        assert response.endswith("}]")
@@ -0,0 +1,151 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from embeddings.client import EmbeddingsClient
+from embeddings.model import EmbeddingModel
+from embeddings.query_cache import QueryEmbeddingCache, QueryEmbeddingCacheConfig
+
+EMBEDDING = [0.5, 0.25, 0.125]
+
+
+def create_embeddings_client(query_cache):
+    embedding_model = EmbeddingModel(
+        id="ollama-embeddings",
+        name="Ollama Embeddings",
+        provider="ollama",
+        config={"model": "nomic-embed-text"},
+    )
+    return EmbeddingsClient(embedding_model, query_cache)
+
+
+class TestQueryEmbeddingCache:
+    def test_lru_evicts_least_recently_used_entry(self):
+        cache = QueryEmbeddingCache(max_entries=2)
+        cache.put("model", "a", EMBEDDING)
+        cache.put("model", "b", EMBEDDING)
+        cache.get("model", "a")
+        cache.put("model", "c", EMBEDDING)
+
+        assert cache.get("model", "b") is None
+        assert cache.get("model", "a") == EMBEDDING
+        assert cache.get("model", "c") == EMBEDDING
+
+    def test_memory_cap_evicts_oldest_entries(self):
+        cache = QueryEmbeddingCache(max_memory_bytes=10_000)
+        for index in range(10):
+            cache.put("model", f"query {index}", [0.1] * 512)
+
+        assert cache.memory_bytes <= 10_000
+        assert cache.stats()["entries"] < 10
+        assert cache.get("model", "query 9") is not None
+        assert cache.get("model", "query 0") is None
+
+    def test_keys_are_normalized_and_scoped_to_the_embedding_model(self):
+        cache = QueryEmbeddingCache()
+        cache.put("model", "  When was  Ingenuity\tlaunched? ", EMBEDDING)
+
+        assert cache.get("model", "When was Ingenuity launched?") == EMBEDDING
+        assert cache.get("other-model", "When was Ingenuity launched?") is None
+
+    def test_counts_hits_and_misses(self):
+        cache = QueryEmbeddingCache()
+        cache.get("model", "a")
+        cache.put("model", "a", EMBEDDING)
+        cache.get("model", "a")
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+        assert stats["entries"] == 1
+
+    def test_disk_tier_survives_new_instance(self):
+        with tempfile.TemporaryDirectory() as disk_path:
+            QueryEmbeddingCache(disk_path=disk_path).put("model", "a", EMBEDDING)
+
+            cache = QueryEmbeddingCache(disk_path=disk_path)
+
+            assert cache.get("model", "a") == EMBEDDING
+            assert cache.stats()["disk_hits"] == 1
+
+    def test_disk_tier_keeps_the_most_recently_used_vectors(self):
+        with tempfile.TemporaryDirectory() as disk_path:
+            cache = QueryEmbeddingCache(
+                max_entries=1, disk_path=disk_path, max_disk_entries=10
+            )
+            for index in range(11):
+                cache.put("model", f"query {index}", EMBEDDING)
+                # Modification times of files written at once can be equal
+                os.utime(cache._disk_file(("model", f"query {index}")), (index, index))
+
+            assert len(os.listdir(disk_path)) == 9
+            assert cache.get("model", "query 10") == EMBEDDING
+            assert cache.get("model", "query 0") is None
+
+    def test_memory_hits_do_not_wait_for_a_slow_disk(self):
+        with tempfile.TemporaryDirectory() as disk_path:
+            cache = QueryEmbeddingCache(disk_path=disk_path)
+            cache.put("model", "a", EMBEDDING)
+            reading, release = threading.Event(), threading.Event()
+            read_from_disk = cache._read_from_disk
+
+            def slow_read_from_disk(key):
+                reading.set()
+                release.wait(5)
+                return read_from_disk(key)
+
+            cache._read_from_disk = slow_read_from_disk
+            miss = threading.Thread(target=cache.get, args=("model", "b"))
+            miss.start()
+            assert reading.wait(5)
+
+            assert cache.get("model", "a") == EMBEDDING
+            release.set()
+            miss.join(5)
+            assert cache.stats()["misses"] == 1
+
+    def test_from_config_is_disabled_by_default(self):
+        assert (
+            QueryEmbeddingCache.from_config(QueryEmbeddingCacheConfig.from_dict({}))
+            is None
+        )
+        cache = QueryEmbeddingCache.from_config(
+            QueryEmbeddingCacheConfig.from_dict({"enabled": "true", "max_memory_mb": 1})
+        )
+        assert cache.max_memory_bytes == 1024 * 1024
+
+
+class TestEmbeddingsClientWithQueryCache:
+    @mock.patch("embeddings.client.OllamaEmbeddings")
+    def test_repeated_queries_are_embedded_once(self, ollama_embeddings_mock):
+        ollama_embeddings_mock.return_value.embed_query.return_value = EMBEDDING
+        embeddings = create_embeddings_client(QueryEmbeddingCache())
+
+        assert embeddings.embed_query("When was Ingenuity launched?") == EMBEDDING
+        assert embeddings.embed_query("When was Ingenuity  launched?") == EMBEDDING
+
+        ollama_embeddings_mock.return_value.embed_query.assert_called_once_with(
+            "When was Ingenuity launched?"
+        )
+
+    @mock.patch("embeddings.client.OllamaEmbeddings")
+    def test_cached_path_is_an_order_of_magnitude_faster(self, ollama_embeddings_mock):
+        def embed_query(query):
+            # A fast embeddings API still needs a network round trip
+            time.sleep(0.005)
+            return [0.1] * 1536
+
+        ollama_embeddings_mock.return_value.embed_query.side_effect = embed_query
+        uncached = create_embeddings_client(None)
+        cached = create_embeddings_client(QueryEmbeddingCache())
+        cached.embed_query("sample question")
+
+        def timed(embeddings):
+            started_at = time.perf_counter()
+            for _ in range(20):
+                embeddings.embed_query("sample question")
+            return time.perf_counter() - started_at
+
+        assert timed(uncached) > 10 * timed(cached)
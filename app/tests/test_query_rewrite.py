@@ -0,0 +1,185 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from langchain.docstore.document import Document
+
+from llms.chats import StreamingChat
+from llms.clients import HaivenAIMessage, HaivenHumanMessage
+from llms.query_rewrite import QueryRewriteConfig, adds_nothing_new
+
+SYSTEM_MESSAGE = "You are a helpful assistant. CONTEXT: " + "aggregated context " * 50
+
+
+def create_chat(query_rewrite, rewrite="launch date of Ingenuity"):
+    knowledge_manager = MagicMock()
+    knowledge_manager.get_system_message.return_value = SYSTEM_MESSAGE
+    knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+    chat_client = MagicMock()
+    rewrite_prompts = []
+
+    def stream(messages, **kwargs):
+        rewrite_prompts.append(messages)
+        yield {"content": rewrite}
+
+    async def astream(messages, **kwargs):
+        rewrite_prompts.append(messages)
+        yield {"content": rewrite}
+
+    chat_client.stream.side_effect = stream
+    chat_client.astream = astream
+    chat = StreamingChat(chat_client, knowledge_manager, query_rewrite=query_rewrite)
+    chat.memory.extend(
+        [
+            HaivenHumanMessage(content="Tell me about Ingenuity"),
+            HaivenAIMessage(content="Ingenuity is a helicopter. " * 200),
+        ]
+    )
+    return chat, rewrite_prompts
+
+
+def searched_queries(chat):
+    search = chat.knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents
+    search.return_value = []
+    return [call.kwargs["query"] for call in search.call_args_list]
+
+
+class TestQueryRewriteConfig:
+    def test_defaults_keep_the_full_rewrite(self):
+        config = QueryRewriteConfig.from_dict(None)
+
+        assert (config.mode, config.skip_first_turn, config.speculative) == (
+            "full",
+            True,
+            False,
+        )
+        with pytest.raises(ValueError):
+            QueryRewriteConfig.from_dict({"mode": "short"})
+
+    def test_adds_nothing_new(self):
+        assert adds_nothing_new("When was Ingenuity launched?", "ingenuity launched")
+        assert not adds_nothing_new("When was it launched?", "Ingenuity launched")
+
+
+class TestQueryRewrite:
+    def test_compact_mode_leaves_out_the_system_message(self):
+        chat, rewrite_prompts = create_chat(
+            QueryRewriteConfig(mode="compact", max_message_chars=100)
+        )
+
+        assert chat._similarity_query("When was it launched?") == (
+            "launch date of Ingenuity"
+        )
+
+        conversation = rewrite_prompts[0][0].content
+        assert "aggregated context" not in conversation
+        assert "User: Tell me about Ingenuity" in conversation
+        assert "Assistant: " + ("Ingenuity is a helicopter. " * 4)[:100] in conversation
+        assert "helicopter. " * 5 not in conversation
+
+    def test_full_mode_sends_the_system_message(self):
+        chat, rewrite_prompts = create_chat(QueryRewriteConfig(mode="full"))
+
+        chat._similarity_query("When was it launched?")
+
+        assert "aggregated context" in rewrite_prompts[0][0].content
+
+    def test_rewrites_are_cached_per_conversation(self):
+        chat, rewrite_prompts = create_chat(QueryRewriteConfig())
+
+        chat._similarity_query("When was it launched?")
+        chat._similarity_query("When was it launched?")
+        chat.memory.extend(
+            [
+                HaivenHumanMessage(content="Who built it?"),
+                HaivenAIMessage(content="NASA JPL"),
+            ]
+        )
+        chat._similarity_query("When was it launched?")
+
+        assert len(rewrite_prompts) == 2
+
+    def test_regenerated_and_retried_turns_reuse_the_rewrite(self):
+        chat, rewrite_prompts = create_chat(QueryRewriteConfig())
+
+        chat._similarity_query("When was it launched?")
+        # A retry after the request failed before the reply started
+        chat.memory.append(HaivenHumanMessage(content="When was it launched?"))
+        chat._similarity_query("When was it launched?")
+        # Regenerating the reply
+        chat.memory.append(HaivenAIMessage(content="In 2020"))
+        assert chat._similarity_query("When was it launched?") == (
+            "launch date of Ingenuity"
+        )
+
+        assert len(rewrite_prompts) == 1
+
+    def test_first_turn_is_only_rewritten_if_configured(self):
+        chat, rewrite_prompts = create_chat(QueryRewriteConfig())
+        chat.memory = chat.memory[:1]
+
+        assert chat._similarity_query("Hello Ingenuity") == "Hello Ingenuity"
+        assert rewrite_prompts == []
+
+        chat.query_rewrite = QueryRewriteConfig(skip_first_turn=False)
+        assert chat._similarity_query("Hello Ingenuity") == "launch date of Ingenuity"
+
+
+class TestSpeculativeSearch:
+    def test_speculative_result_is_kept_if_the_rewrite_adds_nothing(self):
+        chat, _ = create_chat(
+            QueryRewriteConfig(speculative=True), rewrite="Ingenuity launch date"
+        )
+        search_started = threading.Event()
+        search = chat.knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents
+
+        def similarity_search(query, document_keys, trace=None):
+            search_started.set()
+            return []
+
+        search.side_effect = similarity_search
+        original_stream = chat.chat_client.stream.side_effect
+
+        def stream_after_search_started(messages, **kwargs):
+            # The search on the raw message runs while the model rewrites the query
+            assert search_started.wait(5)
+            yield from original_stream(messages, **kwargs)
+
+        chat.chat_client.stream.side_effect = stream_after_search_started
+
+        chat._similarity_search_based_on_history(
+            "What is the Ingenuity launch date?", ["ingenuity"]
+        )
+
+        assert [call.kwargs["query"] for call in search.call_args_list] == [
+            "What is the Ingenuity launch date?"
+        ]
+
+    def test_rewrite_with_new_words_is_searched_again(self):
+        chat, _ = create_chat(QueryRewriteConfig(speculative=True))
+        search = chat.knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents
+        search.side_effect = lambda query, document_keys, trace=None: [
+            Document(page_content=f"found with {query}")
+        ]
+
+        context, _ = chat._similarity_search_based_on_history(
+            "When was it launched?", ["ingenuity"]
+        )
+
+        assert context == "found with launch date of Ingenuity"
+
+    def test_async_speculative_search(self):
+        chat, _ = create_chat(
+            QueryRewriteConfig(speculative=True), rewrite="Ingenuity launch date"
+        )
+        searched_queries(chat)
+
+        asyncio.run(
+            chat._asimilarity_search_based_on_history(
+                "What is the Ingenuity launch date?", ["ingenuity"]
+            )
+        )
+
+        assert searched_queries(chat) == ["What is the Ingenuity launch date?"]
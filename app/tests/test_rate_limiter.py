@@ -0,0 +1,172 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from llms.rate_limiter import (
+    AdmissionController,
+    AdmissionRejectedError,
+    RateLimitBudget,
+    RateLimitConfig,
+    TokenBucket,
+)
+from tests.utils import FakeClock, rate_limit_error
+
+
+class TestTokenBucket:
+    def test_wait_time_grows_with_reservations(self):
+        clock = FakeClock()
+        bucket = TokenBucket(per_minute=60, clock=clock)
+
+        bucket.consume(60)
+        assert bucket.wait_time(1) == pytest.approx(1.0)
+
+        bucket.consume(1)
+        assert bucket.wait_time(1) == pytest.approx(2.0)
+
+        clock.now = 2.0
+        assert bucket.wait_time(1) == 0.0
+
+
+class TestAdmissionController:
+    def test_fails_fast_when_wait_exceeds_budget(self):
+        clock = FakeClock()
+        controller = AdmissionController(
+            RateLimitConfig(
+                max_wait_seconds=5, providers={"openai": RateLimitBudget(rpm=1)}
+            ),
+            clock=clock,
+        )
+        completion_fn = MagicMock(return_value="response")
+
+        assert controller.call(completion_fn, model="openai/gpt-4o") == "response"
+        with pytest.raises(AdmissionRejectedError, match="openai/gpt-4o"):
+            controller.call(completion_fn, model="openai/gpt-4o")
+        assert completion_fn.call_count == 1
+
+    def test_waits_for_budget_within_limit(self):
+        controller = AdmissionController(
+            RateLimitConfig(
+                max_wait_seconds=90,
+                max_sync_wait_seconds=90,
+                models={"openai/gpt-4o": RateLimitBudget(rpm=1)},
+            ),
+            clock=FakeClock(),
+        )
+        controller.call(MagicMock(), model="openai/gpt-4o")
+
+        with patch("llms.rate_limiter.time.sleep") as sleep:
+            controller.call(MagicMock(), model="openai/gpt-4o")
+
+        sleep.assert_called_once_with(pytest.approx(60.0))
+
+    def test_sync_calls_only_wait_for_max_sync_wait_seconds(self):
+        controller = AdmissionController(
+            RateLimitConfig(
+                max_wait_seconds=90,
+                max_sync_wait_seconds=5,
+                models={"openai/gpt-4o": RateLimitBudget(rpm=1)},
+            ),
+            clock=FakeClock(),
+        )
+        controller.call(MagicMock(), model="openai/gpt-4o")
+
+        with patch("llms.rate_limiter.time.sleep") as sleep:
+            with pytest.raises(AdmissionRejectedError, match="openai/gpt-4o"):
+                controller.call(MagicMock(), model="openai/gpt-4o")
+        sleep.assert_not_called()
+
+        async def acompletion_fn(**kwargs):
+            return "response"
+
+        with patch("llms.rate_limiter.asyncio.sleep") as sleep:
+            assert (
+                asyncio.run(controller.acall(acompletion_fn, model="openai/gpt-4o"))
+                == "response"
+            )
+        sleep.assert_called_once_with(pytest.approx(60.0))
+
+    def test_retry_reuses_the_budget_of_the_rejected_attempt(self):
+        controller = AdmissionController(
+            RateLimitConfig(
+                base_backoff_seconds=0.1,
+                models={"openai/gpt-4o": RateLimitBudget(rpm=1)},
+            ),
+            clock=FakeClock(),
+        )
+        completion_fn = MagicMock(side_effect=[rate_limit_error(), "response"])
+
+        with patch("llms.rate_limiter.time.sleep") as sleep:
+            assert controller.call(completion_fn, model="openai/gpt-4o") == "response"
+
+        assert completion_fn.call_count == 2
+        assert sleep.call_count == 1
+
+    def test_fails_fast_when_wait_queue_is_full(self):
+        controller = AdmissionController(
+            RateLimitConfig(
+                max_queue_size=1,
+                max_wait_seconds=600,
+                providers={"openai": RateLimitBudget(rpm=1)},
+            ),
+            clock=FakeClock(),
+        )
+        controller._reserve("openai/gpt-4o", 0)
+        controller._reserve("openai/gpt-4o", 0)
+
+        with pytest.raises(AdmissionRejectedError, match="Too many requests"):
+            controller._reserve("openai/gpt-4o", 0)
+
+    def test_models_without_budget_are_admitted_immediately(self):
+        controller = AdmissionController(
+            RateLimitConfig(providers={"azure": RateLimitBudget(rpm=1)})
+        )
+
+        for _ in range(5):
+            assert controller._reserve("openai/gpt-4o", 100) == 0.0
+
+    def test_retries_rate_limit_errors_honouring_retry_after(self):
+        controller = AdmissionController(RateLimitConfig(base_backoff_seconds=0.1))
+        completion_fn = MagicMock(
+            side_effect=[rate_limit_error({"retry-after": "2"}), "response"]
+        )
+
+        with patch("llms.rate_limiter.time.sleep") as sleep:
+            assert controller.call(completion_fn, model="openai/gpt-4o") == "response"
+
+        delay = sleep.call_args[0][0]
+        assert 2.0 <= delay <= 2.1
+
+    def test_rejects_when_retry_after_exceeds_max_wait(self):
+        controller = AdmissionController(RateLimitConfig(max_wait_seconds=10))
+        completion_fn = MagicMock(side_effect=rate_limit_error({"retry-after": "60"}))
+
+        with pytest.raises(
+            AdmissionRejectedError, match="rate limited by the provider"
+        ):
+            controller.call(completion_fn, model="openai/gpt-4o")
+        assert completion_fn.call_count == 1
+
+    def test_async_call_gives_up_after_max_retries(self):
+        controller = AdmissionController(
+            RateLimitConfig(max_retries=2, base_backoff_seconds=0.001)
+        )
+        attempts = []
+
+        async def acompletion_fn(**kwargs):
+            attempts.append(kwargs)
+            raise rate_limit_error()
+
+        with pytest.raises(AdmissionRejectedError):
+            asyncio.run(controller.acall(acompletion_fn, model="openai/gpt-4o"))
+        assert len(attempts) == 3
+
+    def test_config_from_dict_treats_empty_budgets_as_unlimited(self):
+        config = RateLimitConfig.from_dict(
+            {"max_retries": 0, "providers": {"Azure": {"rpm": "", "tpm": "1000"}}}
+        )
+
+        assert config.max_retries == 0
+        assert config.providers["azure"].rpm is None
+        assert config.providers["azure"].tpm == 1000
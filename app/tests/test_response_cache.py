@@ -0,0 +1,182 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import os
+import tempfile
+import threading
+from unittest.mock import MagicMock, patch
+
+from llms.clients import ChatClient, HaivenHumanMessage
+from llms.response_cache import ResponseCache, ResponseCacheConfig
+
+
+def create_chat_client(response_cache):
+    model_config = MagicMock()
+    model_config.lite_id = "openai/gpt-4o"
+    model_config.provider = "openai"
+    model_config.temperature = 0.5
+    return ChatClient(model_config, response_cache=response_cache)
+
+
+RECORDED_CHUNKS = [
+    {"content": "Hello"},
+    {"content": " world"},
+    {"metadata": {"citations": ["https://example.com"]}},
+    {"usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}},
+]
+
+
+class TestResponseCache:
+    def test_lru_evicts_least_recently_used_entry(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", [{"content": "a"}])
+        cache.put("b", [{"content": "b"}])
+        cache.get("a")
+        cache.put("c", [{"content": "c"}])
+
+        assert cache.get("b") is None
+        assert cache.get("a") == [{"content": "a"}]
+        assert cache.get("c") == [{"content": "c"}]
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResponseCache(ttl_seconds=10)
+        with patch("llms.response_cache.time.time", return_value=1000):
+            cache.put("a", [{"content": "a"}])
+        with patch("llms.response_cache.time.time", return_value=1011):
+            assert cache.get("a") is None
+
+    def test_counts_hits_and_misses(self):
+        cache = ResponseCache()
+        cache.get("a")
+        cache.put("a", [{"content": "a"}])
+        cache.get("a")
+
+        assert cache.stats() == {
+            "hits": 1,
+            "misses": 1,
+            "hit_rate": 0.5,
+            "entries": 1,
+        }
+
+    def test_disk_tier_survives_new_instance(self):
+        with tempfile.TemporaryDirectory() as disk_path:
+            ResponseCache(disk_path=disk_path).put("a", RECORDED_CHUNKS)
+
+            assert ResponseCache(disk_path=disk_path).get("a") == RECORDED_CHUNKS
+
+    def test_disk_tier_deletes_expired_files_as_entries_are_written(self):
+        with tempfile.TemporaryDirectory() as disk_path:
+            with patch("cache_directory.time.time", return_value=1000):
+                cache = ResponseCache(ttl_seconds=10, disk_path=disk_path)
+                cache.put("a", [{"content": "a"}])
+                os.utime(cache._disk_file("a"), (1000, 1000))
+            with patch("cache_directory.time.time", return_value=1005):
+                cache.put("b", [{"content": "b"}])
+                os.utime(cache._disk_file("b"), (1005, 1005))
+            assert os.path.exists(cache._disk_file("a"))
+
+            with patch("cache_directory.time.time", return_value=1012):
+                cache.put("c", [{"content": "c"}])
+
+            assert sorted(os.listdir(disk_path)) == ["b.json", "c.json"]
+
+    def test_memory_hits_do_not_wait_for_a_slow_disk(self):
+        with tempfile.TemporaryDirectory() as disk_path:
+            cache = ResponseCache(disk_path=disk_path)
+            cache.put("a", [{"content": "a"}])
+            reading, release = threading.Event(), threading.Event()
+            read_from_disk = cache._read_from_disk
+
+            def slow_read_from_disk(key):
+                reading.set()
+                release.wait(5)
+                return read_from_disk(key)
+
+            cache._read_from_disk = slow_read_from_disk
+            miss = threading.Thread(target=cache.get, args=("b",))
+            miss.start()
+            assert reading.wait(5)
+
+            assert cache.get("a") == [{"content": "a"}]
+            release.set()
+            miss.join(5)
+            assert cache.stats()["misses"] == 1
+
+    def test_key_depends_on_model_messages_and_params(self):
+        messages = [{"role": "user", "content": "hi"}]
+        key = ResponseCache.make_key("openai/gpt-4o", messages, {"stream": True})
+
+        assert key == ResponseCache.make_key(
+            "openai/gpt-4o", messages, {"stream": True}
+        )
+        assert key != ResponseCache.make_key("openai/gpt-4", messages, {"stream": True})
+        assert key != ResponseCache.make_key(
+            "openai/gpt-4o", messages, {"stream": True, "temperature": 1}
+        )
+
+    def test_from_config_returns_none_when_disabled(self):
+        assert ResponseCache.from_config(ResponseCacheConfig.from_dict({})) is None
+        assert isinstance(
+            ResponseCache.from_config(
+                ResponseCacheConfig.from_dict({"enabled": "true"})
+            ),
+            ResponseCache,
+        )
+
+
+class TestChatClientWithResponseCache:
+    def test_hit_replays_recorded_chunks_without_calling_provider(self):
+        chat_client = create_chat_client(ResponseCache())
+        messages = [HaivenHumanMessage(content="hi")]
+
+        with patch.object(
+            chat_client, "_stream_from_provider", return_value=iter(RECORDED_CHUNKS)
+        ) as provider:
+            first = list(chat_client.stream(messages))
+            second = list(chat_client.stream(messages))
+
+        assert first == RECORDED_CHUNKS
+        assert second == RECORDED_CHUNKS
+        provider.assert_called_once()
+
+    def test_opt_out_bypasses_cache(self):
+        response_cache = ResponseCache()
+        chat_client = create_chat_client(response_cache)
+        messages = [HaivenHumanMessage(content="hi")]
+
+        with patch.object(
+            chat_client,
+            "_stream_from_provider",
+            side_effect=lambda _: iter(RECORDED_CHUNKS),
+        ) as provider:
+            list(chat_client.stream(messages, use_cache=False))
+            list(chat_client.stream(messages, use_cache=False))
+
+        assert provider.call_count == 2
+        assert response_cache.stats()["entries"] == 0
+
+    def test_interrupted_stream_is_not_cached(self):
+        response_cache = ResponseCache()
+        chat_client = create_chat_client(response_cache)
+
+        with patch.object(
+            chat_client, "_stream_from_provider", return_value=iter(RECORDED_CHUNKS)
+        ):
+            stream = chat_client.stream([HaivenHumanMessage(content="hi")])
+            next(stream)
+            stream.close()
+
+        assert response_cache.stats()["entries"] == 0
+
+    def test_astream_replays_entries_recorded_by_stream(self):
+        chat_client = create_chat_client(ResponseCache())
+        messages = [HaivenHumanMessage(content="hi")]
+
+        with patch.object(
+            chat_client, "_stream_from_provider", return_value=iter(RECORDED_CHUNKS)
+        ):
+            list(chat_client.stream(messages))
+
+        async def collect():
+            return [chunk async for chunk in chat_client.astream(messages)]
+
+        assert asyncio.run(collect()) == RECORDED_CHUNKS
@@ -0,0 +1,124 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import json
+from unittest import mock
+from unittest.mock import MagicMock
+
+from langchain.docstore.document import Document
+
+from embeddings.query_cache import QueryEmbeddingCache
+from knowledge.retrieval_trace import RetrievalTrace
+from llms.chats import StreamingChat
+from tests.test_query_embedding_cache import EMBEDDING, create_embeddings_client
+from tests.utils import create_documents_from_stores, store_from_vectors
+
+QUERY = [1.0, 0.0, 0.0]
+
+
+def create_knowledge_base_documents():
+    embeddings_provider = MagicMock()
+    embeddings_provider.embed_query.return_value = QUERY
+    return create_documents_from_stores(
+        {
+            "first": store_from_vectors(
+                {"first close": [1.0, 0.1, 0.0], "first far": [0.0, 1.0, 0.0]}
+            ),
+            "second": store_from_vectors({"second closest": [1.0, 0.05, 0.0]}),
+        },
+        embeddings_provider,
+    )
+
+
+def metadata_of(event):
+    return json.loads(event.split("data: ", 1)[1])["metadata"]
+
+
+class TestRetrievalTrace:
+    def test_stages_add_up_and_merge(self):
+        trace = RetrievalTrace()
+        trace.add_time("vector_search", 1.0)
+        other = RetrievalTrace()
+        other.add_time("vector_search", 2.5)
+        other.record(candidates=3)
+
+        trace.merge(other)
+
+        assert trace.as_dict() == {
+            "stages_ms": {"vector_search": 3.5},
+            "candidates": 3,
+        }
+
+    def test_search_records_its_stages_and_candidates(self):
+        knowledge_base_documents = create_knowledge_base_documents()
+        trace = RetrievalTrace()
+
+        results = knowledge_base_documents.similarity_search_on_multiple_documents(
+            "close", ["first", "second"], k=2, trace=trace
+        )
+
+        assert [document.page_content for document in results] == [
+            "second closest",
+            "first close",
+        ]
+        assert set(trace.stages_ms) == {
+            "query_embedding",
+            "vector_search",
+            "docstore_lookup",
+        }
+        assert trace.values == {"documents_searched": 2, "candidates": 2}
+        knowledge_base_documents._embeddings_provider.embed_query.assert_called_once_with(
+            "close", trace
+        )
+
+    @mock.patch("embeddings.client.OllamaEmbeddings")
+    def test_query_embedding_cache_hits_are_flagged(self, ollama_embeddings_mock):
+        ollama_embeddings_mock.return_value.embed_query.return_value = EMBEDDING
+        embeddings = create_embeddings_client(QueryEmbeddingCache())
+        first, second = RetrievalTrace(), RetrievalTrace()
+
+        embeddings.embed_query("When was Ingenuity launched?", first)
+        embeddings.embed_query("When was Ingenuity launched?", second)
+
+        assert first.values == {"query_embedding_cached": False}
+        assert second.values == {"query_embedding_cached": True}
+
+
+class TestStreamingChatTimings:
+    def create_chat(self):
+        knowledge_manager = MagicMock()
+        knowledge_manager.get_system_message.return_value = "system"
+        knowledge_manager.knowledge_base_markdown.aggregate_all_contexts.return_value = ""
+        knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents.return_value = [
+            Document(page_content="Ingenuity flew on Mars.")
+        ]
+        chat_client = MagicMock()
+        chat_client.model_config.lite_id = "openai/gpt-4o"
+        chat_client.stream.side_effect = lambda messages, **kwargs: iter(
+            [{"content": "answer"}]
+        )
+        return StreamingChat(chat_client, knowledge_manager)
+
+    @mock.patch("llms.chats.HaivenLogger")
+    def test_timings_are_logged_and_only_streamed_with_debug_timings(
+        self, haiven_logger_mock
+    ):
+        chat = self.create_chat()
+
+        events = [event for event, _ in chat.run_with_document(["ingenuity"], "Mars?")]
+        debug_events = [
+            event for event, _ in chat.run_with_document(["ingenuity"], "Mars?", True)
+        ]
+
+        assert not any("retrieval_timings" in event for event in events)
+        timings = metadata_of(debug_events[-1])["retrieval_timings"]
+        assert {"generation", "total"} <= set(timings["stages_ms"])
+        assert timings["context_chunks"] == 1
+        assert timings["context_tokens"] > 0
+        assert timings["query_rewrite_cached"] is False
+        analytics = haiven_logger_mock.get.return_value.analytics
+        assert analytics.call_count == 2
+        message, extra = analytics.call_args.args
+        assert message == "Knowledge chat timings"
+        assert extra["chat_type"] == "StreamingChat"
+        assert extra["stages_ms"].keys() == timings["stages_ms"].keys()
+        search = chat.knowledge_manager.knowledge_base_documents.similarity_search_on_multiple_documents
+        assert isinstance(search.call_args.kwargs["trace"], RetrievalTrace)
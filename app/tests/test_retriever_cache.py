@@ -0,0 +1,130 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import json
+import os
+from unittest.mock import MagicMock
+
+from embeddings.model import EmbeddingModel
+from knowledge.documents import KnowledgeBaseDocuments
+from knowledge.loading_config import KnowledgeLoadingConfig
+from knowledge.retriever_cache import RetrieverCache
+from tests.utils import get_test_data_path
+
+EMBEDDINGS_PATH = os.path.join(get_test_data_path(), "test_knowledge_pack/embeddings")
+
+
+def create_cache(max_resident=0, popularity_path=None):
+    loaded_paths = []
+
+    def load(key, path):
+        loaded_paths.append(path)
+        return MagicMock(name=path)
+
+    cache = RetrieverCache(load, max_resident, popularity_path, save_popularity_every=1)
+    for key in ["a", "b", "c"]:
+        cache.register(key, f"{key}.kb")
+    return cache, loaded_paths
+
+
+def create_lazy_documents(loading_config):
+    embedding_model = EmbeddingModel(
+        id="ollama-embeddings",
+        name="Ollama Embeddings",
+        provider="ollama",
+        config={"model": "ollama-embeddings"},
+    )
+    embeddings_provider = MagicMock()
+    embeddings_provider.embedding_model = embedding_model
+    embeddings_provider.generate_from_filesystem.return_value.similarity_search_with_score_by_vector.return_value = []
+    return KnowledgeBaseDocuments(
+        MagicMock(), embeddings_provider, loading_config=loading_config
+    ), embeddings_provider
+
+
+class TestRetrieverCache:
+    def test_loads_on_first_use_and_keeps_the_retriever(self):
+        cache, loaded_paths = create_cache()
+
+        assert cache.get("a") is cache.get("a")
+        assert loaded_paths == ["a.kb"]
+        assert cache.stats() == {
+            "documents": 3,
+            "resident": 1,
+            "loads": 1,
+            "evictions": 0,
+        }
+
+    def test_releases_the_least_recently_used_retriever(self):
+        cache, loaded_paths = create_cache(max_resident=2)
+
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        cache.get("c")
+
+        assert cache.resident_keys() == ["a", "c"]
+        assert cache.stats()["evictions"] == 1
+        cache.get("b")
+        assert loaded_paths == ["a.kb", "b.kb", "c.kb", "b.kb"]
+
+    def test_warm_up_loads_the_most_searched_documents(self, tmp_path):
+        popularity_path = str(tmp_path / "popularity.json")
+        cache, _ = create_cache(popularity_path=popularity_path)
+        cache.record_search(["c"])
+        cache.record_search(["c", "b"])
+
+        assert json.loads(open(popularity_path).read()) == {"c": 2, "b": 1}
+
+        restarted, loaded_paths = create_cache(
+            max_resident=2, popularity_path=popularity_path
+        )
+        restarted.warm_up().join(5)
+
+        assert loaded_paths == ["c.kb", "b.kb"]
+        assert not restarted.is_loaded("a")
+
+    def test_unregistered_documents_load_from_their_own_path_without_being_kept(self):
+        cache, loaded_paths = create_cache()
+        cache.unregister("a")
+
+        assert cache.get("a") is None
+        assert cache.get("a", "a.kb") is not None
+        assert loaded_paths == ["a.kb"]
+        assert not cache.is_loaded("a")
+
+    def test_a_load_that_overlaps_a_new_registration_is_not_kept(self):
+        cache, _ = create_cache()
+        cache._load = lambda key, path: cache.register(key, "new.kb") or MagicMock()
+
+        cache.get("a", "a.kb")
+
+        assert not cache.is_loaded("a")
+
+
+class TestLazyKnowledgeDocuments:
+    def test_only_metadata_is_loaded_at_startup(self):
+        documents, embeddings_provider = create_lazy_documents(
+            KnowledgeLoadingConfig(lazy_documents=True)
+        )
+
+        documents.load_documents_for_base(EMBEDDINGS_PATH)
+
+        assert [document.title for document in documents.get_documents()] == [
+            "Wikipedia entry about Ingenuity",
+            "The Thoughtworks guide to agile software delivery",
+        ]
+        embeddings_provider.generate_from_filesystem.assert_not_called()
+
+        documents.similarity_search_on_multiple_documents_by_vector(
+            [0.1, 0.2], ["ingenuity-wikipedia"]
+        )
+
+        embeddings_provider.generate_from_filesystem.assert_called_once()
+        assert documents.retriever_cache.popularity["ingenuity-wikipedia"] == 1
+
+    def test_documents_are_loaded_eagerly_by_default(self):
+        documents, embeddings_provider = create_lazy_documents(None)
+
+        documents.load_documents_for_base(EMBEDDINGS_PATH)
+
+        assert documents.retriever_cache is None
+        assert embeddings_provider.generate_from_filesystem.call_count == 2
@@ -0,0 +1,36 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import threading
+
+from knowledge.search_executor import SearchExecutor
+
+
+def thread_name(_):
+    return threading.current_thread().name
+
+
+class TestSearchExecutor:
+    def test_small_fan_outs_run_on_the_calling_thread(self):
+        executor = SearchExecutor(max_workers=4, min_parallel_searches=3)
+
+        names = executor.map(thread_name, ["first", "second"])
+
+        assert names == [threading.current_thread().name] * 2
+        assert executor.stats()["serial_searches"] == 1
+
+    def test_large_fan_outs_run_on_the_pool_in_order(self):
+        executor = SearchExecutor(max_workers=2, min_parallel_searches=2)
+
+        results = executor.map(lambda item: item * 2, range(10))
+        names = executor.map(thread_name, range(4))
+        executor.shutdown()
+
+        assert results == [item * 2 for item in range(10)]
+        assert all(name.startswith("knowledge-search") for name in names)
+        assert executor.stats()["parallel_searches"] == 2
+
+    def test_a_single_worker_is_always_serial(self):
+        executor = SearchExecutor(max_workers=1, min_parallel_searches=2)
+
+        executor.map(thread_name, range(8))
+
+        assert executor._pool is None
@@ -0,0 +1,202 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from llms.clients import ChatClient, HaivenHumanMessage
+from llms.single_flight import SingleFlight, SingleFlightError
+
+CHUNKS = [{"content": "a"}, {"content": "b"}, {"content": "c"}]
+
+
+class GatedUpstream:
+    """Upstream generator that only yields a chunk once the test releases it"""
+
+    def __init__(self, chunks=CHUNKS):
+        self.chunks = chunks
+        self.gates = [threading.Event() for _ in chunks]
+        self.started = 0
+        self.closed = threading.Event()
+
+    def release(self, count=None):
+        for gate in self.gates[:count]:
+            gate.set()
+
+    def __call__(self):
+        self.started += 1
+        return self._generate()
+
+    def _generate(self):
+        try:
+            for gate, chunk in zip(self.gates, self.chunks):
+                gate.wait(timeout=5)
+                yield chunk
+        finally:
+            self.closed.set()
+
+
+class TestSingleFlight:
+    def test_late_joiner_gets_buffered_prefix_and_shares_upstream(self):
+        single_flight = SingleFlight()
+        upstream = GatedUpstream()
+
+        first = single_flight.stream("key", upstream)
+        upstream.release(1)
+        assert next(first) == CHUNKS[0]
+
+        second = single_flight.stream("key", upstream)
+        upstream.release()
+
+        assert list(second) == CHUNKS
+        assert list(first) == CHUNKS[1:]
+        assert upstream.started == 1
+        assert single_flight.stats() == {
+            "in_flight": 0,
+            "flights_started": 1,
+            "coalesced": 1,
+        }
+
+    def test_upstream_is_cancelled_when_last_subscriber_disconnects(self):
+        single_flight = SingleFlight()
+        upstream = GatedUpstream()
+        upstream.release(1)
+
+        first = single_flight.stream("key", upstream)
+        second = single_flight.stream("key", upstream)
+        next(first)
+        next(second)
+
+        first.close()
+        assert not upstream.closed.is_set()
+
+        second.close()
+        upstream.release()
+        assert upstream.closed.wait(timeout=5)
+        assert single_flight.stats()["in_flight"] == 0
+
+    def test_errors_are_raised_to_every_subscriber(self):
+        single_flight = SingleFlight()
+
+        def failing_upstream():
+            yield {"content": "a"}
+            raise RuntimeError("provider failed")
+
+        for _ in range(2):
+            with pytest.raises(SingleFlightError, match="provider failed") as error:
+                list(single_flight.stream("key", failing_upstream))
+            assert isinstance(error.value.__cause__, RuntimeError)
+
+    def test_each_subscriber_gets_its_own_error(self):
+        single_flight = SingleFlight()
+
+        def failing_upstream():
+            yield {"content": "a"}
+            raise RuntimeError("provider failed")
+
+        first = single_flight.stream("key", failing_upstream)
+        second = single_flight.stream("key", failing_upstream)
+        next(first)
+        next(second)
+        errors = []
+        for stream in [first, second]:
+            with pytest.raises(SingleFlightError) as error:
+                list(stream)
+            errors.append(error.value)
+
+        assert errors[0] is not errors[1]
+        assert errors[0].__cause__ is errors[1].__cause__
+
+    def test_sync_upstream_is_pulled_on_the_subscriber_thread(self):
+        single_flight = SingleFlight()
+        threads = []
+
+        def upstream():
+            for chunk in CHUNKS:
+                threads.append(threading.current_thread())
+                yield chunk
+
+        assert list(single_flight.stream("key", upstream)) == CHUNKS
+        assert threads == [threading.current_thread()] * len(CHUNKS)
+
+    def test_async_subscribers_share_one_upstream(self):
+        single_flight = SingleFlight()
+        started = []
+
+        async def upstream():
+            started.append(True)
+            for chunk in CHUNKS:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def collect():
+            return [chunk async for chunk in single_flight.astream("key", upstream)]
+
+        async def run_concurrently():
+            return await asyncio.gather(collect(), collect(), collect())
+
+        assert asyncio.run(run_concurrently()) == [CHUNKS, CHUNKS, CHUNKS]
+        assert len(started) == 1
+
+    def test_async_upstream_is_cancelled_with_last_subscriber(self):
+        single_flight = SingleFlight()
+        cancelled = []
+
+        async def upstream():
+            try:
+                yield {"content": "a"}
+                await asyncio.sleep(10)
+                yield {"content": "b"}
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            stream = single_flight.astream("key", upstream)
+            await stream.__anext__()
+            await stream.aclose()
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        assert cancelled == [True]
+
+
+class TestChatClientWithSingleFlight:
+    def test_concurrent_identical_requests_share_the_provider_stream(self):
+        model_config = MagicMock()
+        model_config.lite_id = "openai/gpt-4o"
+        model_config.temperature = 0.5
+        chat_client = ChatClient(model_config, single_flight=SingleFlight())
+        upstream = GatedUpstream()
+        messages = [HaivenHumanMessage(content="hi")]
+
+        with patch.object(
+            chat_client, "_stream_from_provider", side_effect=lambda _: upstream()
+        ):
+            first = chat_client.stream(messages)
+            upstream.release(1)
+            assert next(first) == CHUNKS[0]
+            second = chat_client.stream(messages)
+            upstream.release()
+
+            assert list(second) == CHUNKS
+            assert list(first) == CHUNKS[1:]
+
+        assert upstream.started == 1
+
+    def test_opt_out_of_cache_also_opts_out_of_coalescing(self):
+        model_config = MagicMock()
+        model_config.lite_id = "openai/gpt-4o"
+        model_config.temperature = 0.5
+        single_flight = SingleFlight()
+        chat_client = ChatClient(model_config, single_flight=single_flight)
+
+        with patch.object(
+            chat_client, "_stream_from_provider", side_effect=lambda _: iter(CHUNKS)
+        ):
+            list(
+                chat_client.stream([HaivenHumanMessage(content="hi")], use_cache=False)
+            )
+
+        assert single_flight.stats()["flights_started"] == 0
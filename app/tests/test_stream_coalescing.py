@@ -0,0 +1,119 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import asyncio
+
+from api.stream_coalescing import (
+    CoalescingConfig,
+    StreamCoalescingConfig,
+    acoalesce,
+    coalesce,
+    is_json_content,
+    is_text_content,
+)
+
+USAGE_EVENT = 'event: token_usage\ndata: {"prompt_tokens": 1}\n\n'
+
+
+async def from_list(events, pause_after=None, pause_seconds=0.0):
+    for index, event in enumerate(events):
+        yield event
+        if index == pause_after:
+            await asyncio.sleep(pause_seconds)
+
+
+def collect(async_iterator):
+    async def run():
+        return [data async for data in async_iterator]
+
+    return asyncio.run(run())
+
+
+class TestStreamCoalescingConfig:
+    def test_endpoints_override_the_defaults(self):
+        config = StreamCoalescingConfig.from_dict(
+            {
+                "max_bytes": 0,
+                "max_delay_ms": 20,
+                "endpoints": {"scenarios": {"max_bytes": 1024}},
+            }
+        )
+
+        scenarios = config.for_endpoint("scenarios")
+        assert (scenarios.max_bytes, scenarios.max_delay_ms) == (1024, 20)
+        assert config.for_endpoint("boba-chat").max_bytes == 0
+        assert config.for_endpoint("boba-chat").enabled
+
+    def test_missing_block_disables_coalescing(self):
+        assert not StreamCoalescingConfig.from_dict(None).for_endpoint("chat").enabled
+
+
+class TestCoalesce:
+    def test_content_is_flushed_once_max_bytes_are_buffered(self):
+        events = ["Pa", "ris", " is", " the", " capital"]
+
+        result = list(
+            coalesce(iter(events), CoalescingConfig(max_bytes=5), is_text_content)
+        )
+
+        assert result == [b"Paris", b" is the", b" capital"]
+
+    def test_other_events_flush_content_and_are_sent_right_away(self):
+        events = ["Pa", "ris", USAGE_EVENT, "!"]
+
+        result = list(
+            coalesce(iter(events), CoalescingConfig(max_bytes=1024), is_text_content)
+        )
+
+        assert result == [b"Paris", USAGE_EVENT.encode(), b"!"]
+
+    def test_json_errors_and_metadata_are_not_content(self):
+        assert is_json_content('{"data": "ab"}\n\n')
+        assert not is_json_content('{"data": "[ERROR]: failed"}')
+        assert not is_json_content('{"metadata": {"citations": []}}\n\n')
+        assert not is_json_content("data: {'data': '[ERROR]: failed'}\n\n")
+        assert not is_text_content("[ERROR]: failed")
+
+
+class TestAcoalesce:
+    def test_buffered_content_is_flushed_on_time_while_the_source_stalls(self):
+        events = ["Pa", "ris", " is", " the", " capital"]
+        config = CoalescingConfig(max_bytes=1024, max_delay_ms=20)
+
+        result = collect(
+            acoalesce(
+                from_list(events, pause_after=1, pause_seconds=0.2),
+                config,
+                is_text_content,
+            )
+        )
+
+        assert result == [b"Paris", b" is the capital"]
+
+    def test_other_events_are_sent_right_away(self):
+        events = ['{"data": "a"}\n\n', '{"data": "b"}\n\n', USAGE_EVENT]
+        config = CoalescingConfig(max_bytes=1024, max_delay_ms=1000)
+
+        result = collect(acoalesce(from_list(events), config, is_json_content))
+
+        assert result == [b'{"data": "a"}\n\n{"data": "b"}\n\n', USAGE_EVENT.encode()]
+
+    def test_closing_early_closes_the_source(self):
+        closed = []
+
+        async def source():
+            try:
+                while True:
+                    yield "token"
+                    await asyncio.sleep(0.01)
+            finally:
+                closed.append(True)
+
+        async def read_first():
+            stream = acoalesce(
+                source(), CoalescingConfig(max_delay_ms=1), is_text_content
+            )
+            first = await stream.__anext__()
+            await stream.aclose()
+            return first
+
+        assert asyncio.run(read_first()) == b"token"
+        assert closed == [True]
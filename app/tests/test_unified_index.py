@@ -0,0 +1,172 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import os
+from unittest.mock import MagicMock
+
+import faiss
+import pytest
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from embeddings.unified_index import UnifiedIndex, UnifiedIndexRetriever
+from knowledge.search_config import KnowledgeSearchConfig
+from tests.utils import create_knowledge_base_documents, get_test_data_path, load_store
+
+EMBEDDINGS_PATH = os.path.join(get_test_data_path(), "test_knowledge_pack/embeddings")
+
+
+def per_document_results(stores, embedding, k):
+    results = []
+    for store in stores.values():
+        results.extend(store.similarity_search_with_score_by_vector(embedding, k=k))
+    return sorted(results, key=lambda result: result[1])[:k]
+
+
+def create_documents(unified_index):
+    return create_knowledge_base_documents(
+        EMBEDDINGS_PATH,
+        search_config=KnowledgeSearchConfig(unified_index=unified_index),
+    )
+
+
+class TestUnifiedIndex:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.stores = {
+            "ingenuity-wikipedia": load_store(
+                os.path.join(EMBEDDINGS_PATH, "ingenuity_wikipedia.kb")
+            ),
+            "tw-guide-agile-sd": load_store(
+                os.path.join(EMBEDDINGS_PATH, "tw-guide-agile-sd.kb")
+            ),
+        }
+        self.unified_index = UnifiedIndex.from_stores(self.stores)
+        self.embedding = (
+            self.stores["ingenuity-wikipedia"].index.reconstruct(3).tolist()
+        )
+
+    def test_maps_ids_to_document_keys(self):
+        assert self.unified_index.index.ntotal == 44 + 640
+        assert self.unified_index.offsets == [0, 44, 684]
+        assert self.unified_index.document_key(43) == "ingenuity-wikipedia"
+        assert self.unified_index.document_key(44) == "tw-guide-agile-sd"
+
+    def test_search_in_all_documents_matches_per_document_search(self):
+        results = self.unified_index.search(self.embedding, k=8)
+
+        expected = per_document_results(self.stores, self.embedding, 8)
+        assert [document.page_content for document, _ in results] == [
+            document.page_content for document, _ in expected
+        ]
+        assert [score for _, score in results] == pytest.approx(
+            [score for _, score in expected]
+        )
+
+    def test_search_is_filtered_to_the_requested_documents(self):
+        results = self.unified_index.search(
+            self.embedding, k=5, document_keys=["tw-guide-agile-sd"]
+        )
+
+        expected = self.stores[
+            "tw-guide-agile-sd"
+        ].similarity_search_with_score_by_vector(self.embedding, k=5)
+        assert [document.page_content for document, _ in results] == [
+            document.page_content for document, _ in expected
+        ]
+        assert self.unified_index.search(self.embedding, 5, ["unknown"]) == []
+
+    def test_score_threshold_drops_distant_results(self):
+        results = self.unified_index.search(self.embedding, k=5, score_threshold=0.01)
+
+        assert len(results) == 1
+        assert results[0][1] == pytest.approx(0.0)
+
+    def test_chunks_are_only_looked_up_for_the_results(self):
+        for docstore in self.unified_index.docstores:
+            docstore.search = MagicMock(wraps=docstore.search)
+
+        results = self.unified_index.search(self.embedding, k=3)
+
+        assert len(results) == 3
+        assert (
+            sum(docstore.search.call_count for docstore in self.unified_index.docstores)
+            == 3
+        )
+
+    def test_stores_with_different_dimensions_cannot_be_merged(self):
+        other = FAISS.from_texts(["text"], FakeEmbeddings(size=8))
+
+        with pytest.raises(ValueError):
+            UnifiedIndex.from_stores(
+                {"a": self.stores["tw-guide-agile-sd"], "b": other}
+            )
+
+    def test_compressed_indexes_are_not_merged(self):
+        store = self.stores["tw-guide-agile-sd"]
+        compressed = faiss.IndexScalarQuantizer(
+            store.index.d, faiss.ScalarQuantizer.QT_8bit
+        )
+        vectors = store.index.reconstruct_n(0, store.index.ntotal)
+        compressed.train(vectors)
+        compressed.add(vectors)
+        store.index = compressed
+
+        with pytest.raises(ValueError):
+            UnifiedIndex.from_stores(self.stores)
+
+
+class TestKnowledgeBaseDocumentsWithUnifiedIndex:
+    def test_multiple_documents_search_is_one_search_over_the_unified_index(self):
+        knowledge_base_documents = create_documents(unified_index=True)
+        per_document = create_documents(unified_index=False)
+        embedding = (
+            knowledge_base_documents.get_documents()[0]
+            .retriever.index.reconstruct(0)
+            .tolist()
+        )
+        document_keys = ["ingenuity-wikipedia", "tw-guide-agile-sd"]
+
+        results = (
+            knowledge_base_documents.similarity_search_on_multiple_documents_by_vector(
+                embedding, document_keys, k=3
+            )
+        )
+
+        assert knowledge_base_documents._unified_index is not None
+        expected = per_document.similarity_search_on_multiple_documents_by_vector(
+            embedding, document_keys, k=3
+        )
+        assert [document.page_content for document in results] == [
+            document.page_content for document in expected
+        ]
+
+    def test_documents_let_go_of_their_own_indexes_once_merged(self):
+        knowledge_base_documents = create_documents(unified_index=True)
+        per_document = create_documents(unified_index=False)
+        embedding = (
+            per_document.get_documents()[0].retriever.index.reconstruct(0).tolist()
+        )
+
+        retriever = knowledge_base_documents._document_stores.get_document(
+            "tw-guide-agile-sd"
+        ).retriever
+        assert isinstance(retriever, UnifiedIndexRetriever)
+        assert retriever.index.ntotal == 640
+        assert retriever.index.reconstruct(5) == pytest.approx(
+            per_document._document_stores.get_document(
+                "tw-guide-agile-sd"
+            ).retriever.index.reconstruct(5)
+        )
+
+        # Merging the merged documents again, as a reload does
+        knowledge_base_documents._build_unified_index()
+        retriever = knowledge_base_documents._document_stores.get_document(
+            "tw-guide-agile-sd"
+        ).retriever
+        results = retriever.similarity_search_with_score_by_vector(embedding, k=3)
+        expected = per_document._document_stores.get_document(
+            "tw-guide-agile-sd"
+        ).retriever.similarity_search_with_score_by_vector(embedding, k=3)
+        assert knowledge_base_documents._unified_index.index.ntotal == 44 + 640
+        assert [document.page_content for document, _ in results] == [
+            document.page_content for document, _ in expected
+        ]
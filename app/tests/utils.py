@@ -1,5 +1,16 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 import os
+from typing import Callable, Dict
+from unittest.mock import MagicMock
+
+import httpx
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from litellm import RateLimitError
+
+from embeddings.documents import KnowledgeDocument
+from embeddings.model import EmbeddingModel
+from knowledge.documents import KnowledgeBaseDocuments
 
 
 # Because we have our Python applications in subfolders, there are some problems with
@@ -25,3 +36,74 @@ def get_app_root_path():
     if cwd.endswith("/app"):
         return "./"
     return "app/"
+
+
+class FakeClock:
+    """A clock for time.monotonic that only moves when a test sets now"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limit_error(headers=None, model="gpt-4o") -> RateLimitError:
+    """A 429 of the provider, as litellm raises it"""
+    response = httpx.Response(
+        429, headers=headers or {}, request=httpx.Request("POST", "https://x")
+    )
+    return RateLimitError(
+        message="429", llm_provider="openai", model=model, response=response
+    )
+
+
+def load_store(path, size: int = 1536) -> FAISS:
+    """Loads a FAISS index of the test data, its queries are embedded with fake embeddings"""
+    return FAISS.load_local(
+        str(path),
+        embeddings=FakeEmbeddings(size=size),
+        allow_dangerous_deserialization=True,
+    )
+
+
+def store_from_vectors(vectors: Dict[str, list]) -> FAISS:
+    """A FAISS store with a chunk per text and its given vector"""
+    return FAISS.from_embeddings(
+        list(vectors.items()), FakeEmbeddings(size=len(next(iter(vectors.values()))))
+    )
+
+
+def create_embeddings_client(load: Callable[[str], FAISS] = load_store) -> MagicMock:
+    """An embeddings client of the test knowledge pack provider, loading indexes with load"""
+    embeddings_client = MagicMock()
+    embeddings_client.embedding_model = EmbeddingModel(
+        id="ollama-embeddings", name="Ollama", provider="ollama"
+    )
+    embeddings_client.generate_from_filesystem.side_effect = load
+    return embeddings_client
+
+
+def create_knowledge_base_documents(
+    knowledge_pack_path, embeddings_client=None, **kwargs
+) -> KnowledgeBaseDocuments:
+    """The documents of a knowledge pack folder, kwargs are passed to KnowledgeBaseDocuments"""
+    knowledge_base_documents = KnowledgeBaseDocuments(
+        MagicMock(), embeddings_client or create_embeddings_client(), **kwargs
+    )
+    knowledge_base_documents.load_documents_for_base(str(knowledge_pack_path))
+    return knowledge_base_documents
+
+
+def create_documents_from_stores(
+    stores: Dict[str, FAISS], embeddings_client=None, **kwargs
+) -> KnowledgeBaseDocuments:
+    """KnowledgeBaseDocuments with a document per store, kwargs are passed to KnowledgeBaseDocuments"""
+    knowledge_base_documents = KnowledgeBaseDocuments(
+        MagicMock(), embeddings_client or MagicMock(), **kwargs
+    )
+    for key, retriever in stores.items():
+        knowledge_base_documents._document_stores.add_embedding(
+            key, KnowledgeDocument(key, retriever, key, "", "", "", "ollama")
+        )
+    return knowledge_base_documents
@@ -1,6 +1,7 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 import os
 from haiven_cli.models.embedding_model import EmbeddingModel
+from haiven_cli.models.index_options import IndexOptions
 from haiven_cli.services.config_service import ConfigService
 from haiven_cli.services.file_service import FileService
 from haiven_cli.services.knowledge_service import KnowledgeService
@@ -29,6 +30,7 @@ class App:
         output_dir: str,
         description: str,
         pdf_source_link: str = None,
+        index_options: IndexOptions = None,
     ):
         if not source_path:
             raise ValueError("please provide file path for source_path option")
@@ -59,7 +61,9 @@ class App:
 
         file_path_prefix = _format_file_name(source_path)
         output_kb_dir = f"{output_dir}/{file_path_prefix}.kb"
-        self.knowledge_service.index(file_content, file_metadata, model, output_kb_dir)
+        self.knowledge_service.index(
+            file_content, file_metadata, model, output_kb_dir, index_options
+        )
         metadata = self.metadata_service.create_metadata(
             source_path, description, model.provider, output_dir
         )
@@ -74,6 +78,7 @@ class App:
         config_path: str,
         output_dir: str,
         description: str,
+        index_options: IndexOptions = None,
     ):
         if not source_dir:
             raise ValueError("please provide directory path for source_dir option")
@@ -105,7 +110,7 @@ class App:
 
             output_kb_dir = f"{output_dir}/{_format_file_name(file)}.kb"
             self.knowledge_service.index(
-                file_content, first_metadata, model, output_kb_dir
+                file_content, first_metadata, model, output_kb_dir, index_options
             )
             metadata = self.metadata_service.create_metadata(
                 file, description, model.provider, output_dir
@@ -122,6 +127,7 @@ class App:
         output_dir: str,
         description: str,
         authors: str,
+        index_options: IndexOptions = None,
     ):
         if not source_dir:
             raise ValueError("please provide directory path for source_dir option")
@@ -141,7 +147,9 @@ class App:
         )
 
         output_kb_dir = f"{output_dir}/{_format_file_name(directory_name)}.kb"
-        self.knowledge_service.index(file_content, first_metadata, model, output_kb_dir)
+        self.knowledge_service.index(
+            file_content, first_metadata, model, output_kb_dir, index_options
+        )
         metadata = self.metadata_service.create_metadata(
             directory_name, description, model.provider, output_dir
         )
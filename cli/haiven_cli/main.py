@@ -1,11 +1,15 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import json
+
 import typer
 
 from haiven_cli.app.app import App
+from haiven_cli.models.index_options import IndexOptions
 from haiven_cli.services.config_service import ConfigService
 from haiven_cli.services.cli_config_service import CliConfigService
 from haiven_cli.services.embedding_service import EmbeddingService
 from haiven_cli.services.file_service import FileService
+from haiven_cli.services.index_service import read_vectors, recall_report
 from haiven_cli.services.knowledge_service import KnowledgeService
 from haiven_cli.services.token_service import TokenService
 from haiven_cli.services.metadata_service import MetadataService
@@ -24,6 +28,8 @@ Parameters:
     output_dir (optional): The directory where the generated knowledge base files will be saved ("new_knowledge_base" by default).
     pdf_source_link (optional): An optional link to the source PDF file, that you want used when a page is shown to the user as source in the application. 
         Default is "/kp-static/name-of-pdf-file.pdf", served from the "/static" folder of the knowledge pack.
+    index_type (optional): The type of FAISS index to save: flat (exact, default), ivf-flat, ivf-pq, hnsw or sq8. Run index-report on a flat index to compare them.
+    dimensions (optional): The number of leading embedding dimensions to keep in the index, 0 to keep all (default).
 """
 
 
@@ -35,6 +41,8 @@ def index_file(
     description: str = "",
     output_dir: str = "new_knowledge_base",
     pdf_source_link: str = None,
+    index_type: str = "flat",
+    dimensions: int = 0,
 ):
     """Index single file to a given destination directory."""
 
@@ -54,6 +62,7 @@ def index_file(
         output_dir,
         description,
         pdf_source_link,
+        IndexOptions(index_type, dimensions),
     )
 
 
@@ -64,6 +73,8 @@ def index_all_files(
     embedding_model="openai",
     description: str = "",
     config_path: str = "",
+    index_type: str = "flat",
+    dimensions: int = 0,
 ):
     """Index all files in a directory to a given destination directory."""
     cli_config_service = CliConfigService()
@@ -76,7 +87,12 @@ def index_all_files(
     app = create_app(config_service)
     print("Indexing all files")
     app.index_all_files(
-        source_dir, embedding_model, config_path, output_dir, description
+        source_dir,
+        embedding_model,
+        config_path,
+        output_dir,
+        description,
+        IndexOptions(index_type, dimensions),
     )
 
 
@@ -88,6 +104,8 @@ def index_txt_files(
     description: str = "",
     config_path: str = "",
     authors: str = "Unknown",
+    index_type: str = "flat",
+    dimensions: int = 0,
 ):
     """Index all TXT files in a directory into one knowledge base in a given destination directory."""
     cli_config_service = CliConfigService()
@@ -101,10 +119,40 @@ def index_txt_files(
     print("Indexing all files in " + source_dir)
 
     app.index_txts_directory(
-        source_dir, embedding_model, config_path, output_dir, description, authors
+        source_dir,
+        embedding_model,
+        config_path,
+        output_dir,
+        description,
+        authors,
+        IndexOptions(index_type, dimensions),
     )
 
 
+@cli.command(no_args_is_help=True)
+def index_report(
+    kb_path: str,
+    k: int = 10,
+    queries: int = 100,
+    dimensions: int = 0,
+    output: str = "",
+):
+    """Compare recall@k, latency and size of all index types on a flat knowledge base index."""
+    vectors, metric = read_vectors(kb_path)
+    report = recall_report(vectors, metric, k, queries, dimensions=dimensions)
+
+    print(f"{len(vectors)} vectors, recall@{k} against the flat index")
+    for row in report:
+        print(
+            f"{row['index_type']:<9} {row['dimensions']:>5} dims  "
+            f"recall {row['recall_at_k']:.3f}  {row['latency_ms']:.3f} ms/query  "
+            f"{row['bytes'] / 1024 / 1024:.2f} MB"
+        )
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
 @cli.command(no_args_is_help=True)
 def init(
     config_path: str = "",
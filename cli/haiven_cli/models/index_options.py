@@ -0,0 +1,48 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+
+INDEX_TYPES = ["flat", "ivf-flat", "ivf-pq", "hnsw", "sq8"]
+
+
+class IndexOptions:
+    """
+    Represents the type of FAISS index a knowledge base is saved with.
+
+    Attributes:
+        index_type (str): One of INDEX_TYPES. "flat" stores every vector as it is and searches
+            exhaustively. "ivf-flat" only searches the nprobe of nlist clusters closest to the
+            query, "ivf-pq" does the same on vectors compressed with product quantization,
+            "hnsw" searches a graph of the vectors and "sq8" stores each dimension in one byte.
+        dimensions (int): Number of leading dimensions of the embeddings to keep, 0 to keep all.
+            Only useful for embedding models trained for truncation, like text-embedding-3.
+        nlist (int): Number of IVF clusters, 0 for about 4 * sqrt(number of vectors), with at
+            least 39 vectors per cluster.
+        nprobe (int): Number of IVF clusters searched per query, 0 for nlist / 8.
+        hnsw_m (int): Number of neighbours per vector in the HNSW graph.
+        ef_search (int): Size of the HNSW candidate list per query.
+    """
+
+    def __init__(
+        self,
+        index_type: str = "flat",
+        dimensions: int = 0,
+        nlist: int = 0,
+        nprobe: int = 0,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"index type {index_type} is not supported, use one of {', '.join(INDEX_TYPES)}"
+            )
+        if dimensions < 0:
+            raise ValueError("dimensions can not be negative")
+
+        self.index_type = index_type
+        self.dimensions = dimensions
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+
+    def is_flat(self) -> bool:
+        return self.index_type == "flat" and not self.dimensions
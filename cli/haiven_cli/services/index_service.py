@@ -0,0 +1,156 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import math
+import os
+import time
+from typing import List
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from haiven_cli.models.index_options import INDEX_TYPES, IndexOptions
+
+
+def build_index(
+    vectors: np.ndarray, options: IndexOptions, metric: int = faiss.METRIC_L2
+) -> faiss.Index:
+    """
+    Builds a FAISS index of the given type with the vectors, in their order. A truncated index
+    keeps the dimension of the full vectors: it truncates and re-normalizes the vectors and the
+    queries itself, so it is searched like any other index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    number_of_vectors, dimension = vectors.shape
+    if options.dimensions and options.dimensions < dimension:
+        index = _create_index(options, options.dimensions, metric, number_of_vectors)
+        index = faiss.IndexPreTransform(index)
+        index.prepend_transform(faiss.NormalizationTransform(options.dimensions))
+        index.prepend_transform(
+            faiss.RemapDimensionsTransform(dimension, options.dimensions, False)
+        )
+    else:
+        index = _create_index(options, dimension, metric, number_of_vectors)
+
+    if number_of_vectors:
+        index.train(vectors)
+        index.add(vectors)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # Lets the server reconstruct found vectors, for MMR re-ranking
+        ivf.make_direct_map()
+    return index
+
+
+def convert_store(store: FAISS, options: IndexOptions) -> FAISS:
+    """Replaces the flat index of a store with an index of the given type"""
+    if options.is_flat():
+        return store
+
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    store.index = build_index(vectors, options, store.index.metric_type)
+    return store
+
+
+def read_vectors(kb_path: str) -> tuple:
+    """The vectors and metric of the flat index of a knowledge base"""
+    index = faiss.read_index(os.path.join(kb_path, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal), index.metric_type
+
+
+def recall_report(
+    vectors: np.ndarray,
+    metric: int = faiss.METRIC_L2,
+    k: int = 10,
+    number_of_queries: int = 100,
+    index_types: List[str] = None,
+    dimensions: int = 0,
+    seed: int = 1,
+) -> List[dict]:
+    """
+    Compares every index type to the exact results of a flat index. The queries are stored
+    vectors picked at random. Reports recall@k, the mean latency of one query, the size of the
+    serialized index and how long it took to build.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    number_of_vectors = len(vectors)
+    picked = np.random.default_rng(seed).choice(
+        number_of_vectors, min(number_of_queries, number_of_vectors), replace=False
+    )
+    queries = vectors[picked]
+    exact = build_index(vectors, IndexOptions(), metric)
+    _, expected = exact.search(queries, k)
+
+    report = []
+    for index_type in index_types or INDEX_TYPES:
+        started_at = time.perf_counter()
+        index = build_index(vectors, IndexOptions(index_type, dimensions), metric)
+        build_seconds = time.perf_counter() - started_at
+
+        found = []
+        started_at = time.perf_counter()
+        for query in queries:
+            found.append(index.search(query.reshape(1, -1), k)[1][0])
+        latency_ms = (time.perf_counter() - started_at) * 1000 / max(len(queries), 1)
+
+        report.append(
+            {
+                "index_type": index_type,
+                "dimensions": dimensions or vectors.shape[1],
+                "recall_at_k": round(_recall(expected, found), 4),
+                "latency_ms": round(latency_ms, 4),
+                "bytes": int(faiss.serialize_index(index).size),
+                "build_seconds": round(build_seconds, 3),
+            }
+        )
+    return report
+
+
+def _create_index(
+    options: IndexOptions, dimension: int, metric: int, number_of_vectors: int
+) -> faiss.Index:
+    match options.index_type:
+        case "flat":
+            return faiss.IndexFlat(dimension, metric)
+        case "sq8":
+            return faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_8bit, metric
+            )
+        case "hnsw":
+            index = faiss.IndexHNSWFlat(dimension, options.hnsw_m, metric)
+            index.hnsw.efSearch = options.ef_search
+            return index
+
+    # FAISS wants at least 39 training vectors per cluster
+    nlist = options.nlist or min(
+        int(4 * math.sqrt(number_of_vectors)), number_of_vectors // 39
+    )
+    nlist = max(1, min(nlist, number_of_vectors))
+    quantizer = faiss.IndexFlat(dimension, metric)
+    if options.index_type == "ivf-flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+    else:
+        # At most 256 codes per sub-vector, but not more codes than there are vectors to train
+        bits = max(1, min(8, int(math.log2(max(number_of_vectors, 2)))))
+        index = faiss.IndexIVFPQ(
+            quantizer, dimension, nlist, _subquantizers(dimension), bits, metric
+        )
+    index.nprobe = options.nprobe or max(1, math.ceil(nlist / 8))
+    return index
+
+
+def _subquantizers(dimension: int) -> int:
+    """The most sub-vectors of at least 8 dimensions the vectors can be split into"""
+    for count in range(max(dimension // 8, 1), 0, -1):
+        if dimension % count == 0:
+            return count
+
+
+def _recall(expected: np.ndarray, found: List[np.ndarray]) -> float:
+    recalls = []
+    for expected_ids, found_ids in zip(expected, found):
+        expected_ids = set(expected_ids[expected_ids != -1].tolist())
+        if expected_ids:
+            recalls.append(
+                len(expected_ids & set(found_ids.tolist())) / len(expected_ids)
+            )
+    return sum(recalls) / len(recalls) if recalls else 1.0
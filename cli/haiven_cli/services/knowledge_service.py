@@ -1,7 +1,9 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from haiven_cli.models.index_options import IndexOptions
 from haiven_cli.services.embedding_service import EmbeddingService
+from haiven_cli.services.index_service import convert_store
 from haiven_cli.services.token_service import TokenService
 
 
@@ -12,7 +14,14 @@ class KnowledgeService:
         self.token_service = token_service
         self.embedding_service = embedding_service
 
-    def index(self, texts, metadatas, embedding_model, output_dir):
+    def index(
+        self,
+        texts,
+        metadatas,
+        embedding_model,
+        output_dir,
+        index_options: IndexOptions = None,
+    ):
         if texts is None or len(texts) == 0:
             raise ValueError("file content has no value")
 
@@ -40,5 +49,9 @@ class KnowledgeService:
             print("Indexing to new path")
             local_db = db
 
+        if index_options is not None and not index_options.is_flat():
+            print("Converting DB to a", index_options.index_type, "index...")
+            local_db = convert_store(local_db, index_options)
+
         print("Saving DB to", output_dir)
         local_db.save_local(output_dir)
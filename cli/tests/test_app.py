@@ -138,7 +138,7 @@ class TestApp:
 
         file_service.get_text_and_metadata_from_csv.assert_called_once_with(source_path)
         knowledge_service.index.assert_called_once_with(
-            file_content, metadatas, embedding, "output_dir/file.kb"
+            file_content, metadatas, embedding, "output_dir/file.kb", None
         )
         metadata_service.create_metadata.assert_called_once_with(
             source_path, description, embedding.provider, output_dir
@@ -202,7 +202,7 @@ class TestApp:
             file, pdf_source_link
         )
         knowledge_service.index.assert_called_once_with(
-            file_content, metadatas, embedding, "output_dir/file.kb"
+            file_content, metadatas, embedding, "output_dir/file.kb", None
         )
         metadata_service.create_metadata.assert_called_once_with(
             source_path, description, embedding.provider, output_dir
@@ -377,12 +377,14 @@ class TestApp:
                     first_file_metadata,
                     embedding,
                     "output_dir/csv_file_path.kb",
+                    None,
                 ),
                 call(
                     second_file_content,
                     second_file_metadata,
                     embedding,
                     "output_dir/pdf_file_path.kb",
+                    None,
                 ),
             ]
         )
@@ -0,0 +1,82 @@
+# © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
+import faiss
+import numpy as np
+import pytest
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from haiven_cli.models.index_options import INDEX_TYPES, IndexOptions
+from haiven_cli.services.index_service import (
+    build_index,
+    convert_store,
+    read_vectors,
+    recall_report,
+)
+
+VECTORS = np.random.default_rng(7).random((2000, 32), dtype=np.float32)
+
+
+class TestIndexService:
+    def test_index_options_reject_unknown_types(self):
+        with pytest.raises(ValueError) as e:
+            IndexOptions("ivf")
+        assert "ivf-flat" in str(e.value)
+        assert IndexOptions().is_flat()
+        assert not IndexOptions("flat", 16).is_flat()
+
+    @pytest.mark.parametrize("index_type", INDEX_TYPES)
+    def test_every_index_type_finds_the_stored_vector_after_saving(self, index_type):
+        index = build_index(VECTORS, IndexOptions(index_type))
+
+        loaded = faiss.deserialize_index(faiss.serialize_index(index))
+        _, found = loaded.search(VECTORS[:5], 1)
+
+        assert loaded.ntotal == len(VECTORS)
+        assert found[:, 0].tolist() == [0, 1, 2, 3, 4]
+        assert loaded.reconstruct(3).shape == (32,)
+
+    def test_truncated_index_is_searched_with_full_vectors(self):
+        index = build_index(VECTORS, IndexOptions("flat", dimensions=8))
+
+        _, found = index.search(VECTORS[:1], 1)
+
+        assert index.d == 32
+        assert faiss.downcast_index(index.index).d == 8
+        assert found[0][0] == 0
+
+    def test_convert_store_keeps_the_documents(self, tmp_path):
+        store = FAISS.from_embeddings(
+            [
+                (f"chunk {index}", vector)
+                for index, vector in enumerate(VECTORS.tolist())
+            ],
+            FakeEmbeddings(size=32),
+        )
+
+        convert_store(store, IndexOptions("sq8"))
+        store.save_local(str(tmp_path))
+        loaded = FAISS.load_local(
+            str(tmp_path), FakeEmbeddings(size=32), allow_dangerous_deserialization=True
+        )
+
+        assert isinstance(loaded.index, faiss.IndexScalarQuantizer)
+        document, _ = loaded.similarity_search_with_score_by_vector(
+            VECTORS[42].tolist(), k=1
+        )[0]
+        assert document.page_content == "chunk 42"
+
+    def test_recall_report_compares_to_the_flat_index(self, tmp_path):
+        faiss.write_index(
+            build_index(VECTORS, IndexOptions()), f"{tmp_path}/index.faiss"
+        )
+        vectors, metric = read_vectors(str(tmp_path))
+
+        report = recall_report(
+            vectors, metric, k=5, number_of_queries=20, index_types=["flat", "sq8"]
+        )
+
+        assert [row["index_type"] for row in report] == ["flat", "sq8"]
+        assert report[0]["recall_at_k"] == 1.0
+        assert 0 < report[1]["recall_at_k"] <= 1.0
+        assert report[1]["bytes"] < report[0]["bytes"]
+        assert report[0]["latency_ms"] > 0
@@ -1,6 +1,7 @@
 # © 2024 Thoughtworks, Inc. | Licensed under the Apache License, Version 2.0  | See LICENSE.md file for permissions.
 import pytest
 
+from haiven_cli.models.index_options import IndexOptions
 from haiven_cli.services.knowledge_service import KnowledgeService
 from unittest.mock import MagicMock, patch
 
@@ -126,3 +127,24 @@ class TestKnowledgeService:
         mock_faiss.load_local.assert_called_once_with(ouput_dir, embeddings)
         db.merge_from.assert_called_once_with(local_db)
         db.save_local.assert_called_once_with(ouput_dir)
+
+    @patch("haiven_cli.services.knowledge_service.convert_store")
+    @patch("haiven_cli.services.knowledge_service.FAISS")
+    @patch("haiven_cli.services.knowledge_service.RecursiveCharacterTextSplitter")
+    def test_save_knowledge_with_index_type(
+        self, mock_text_splitter, mock_faiss, mock_convert_store
+    ):
+        local_db = MagicMock()
+        mock_faiss.from_documents.return_value = local_db
+        mock_faiss.load_local.side_effect = ValueError("Some Error")
+        converted_db = MagicMock()
+        mock_convert_store.return_value = converted_db
+        index_options = IndexOptions("hnsw")
+
+        knowledge_service = KnowledgeService(MagicMock(), MagicMock())
+        knowledge_service.index(
+            ["something cool"], {}, MagicMock(), "output_dir", index_options
+        )
+
+        mock_convert_store.assert_called_once_with(local_db, index_options)
+        converted_db.save_local.assert_called_once_with("output_dir")
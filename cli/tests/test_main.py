@@ -10,6 +10,7 @@ from haiven_cli.main import (
 
 
 class TestMain:
+    @patch("haiven_cli.main.IndexOptions")
     @patch("haiven_cli.main.MetadataService")
     @patch("haiven_cli.main.EmbeddingService")
     @patch("haiven_cli.main.CliConfigService")
@@ -28,6 +29,7 @@ class TestMain:
         mock_cli_config_service,
         mock_embedding_service,
         mock_metadata_service,
+        mock_index_options,
     ):
         source_path = "source_path.pdf"
         embedding_model = "embedding_model"
@@ -73,10 +75,18 @@ class TestMain:
             knowledge_service,
             mock_metadata_service,
         )
+        mock_index_options.assert_called_once_with("flat", 0)
         app.index_individual_file.assert_called_once_with(
-            source_path, embedding_model, config_path, output_dir, description, None
+            source_path,
+            embedding_model,
+            config_path,
+            output_dir,
+            description,
+            None,
+            mock_index_options.return_value,
         )
 
+    @patch("haiven_cli.main.IndexOptions")
     @patch("haiven_cli.main.MetadataService")
     @patch("haiven_cli.main.EmbeddingService")
     @patch("haiven_cli.main.CliConfigService")
@@ -95,6 +105,7 @@ class TestMain:
         mock_cli_config_service,
         mock_embedding_service,
         mock_metadata_service,
+        mock_index_options,
     ):
         source_dir = "source_dir"
         output_dir = "destination_dir"
@@ -137,8 +148,14 @@ class TestMain:
             knowledge_service,
             mock_metadata_service,
         )
+        mock_index_options.assert_called_once_with("flat", 0)
         app.index_all_files.assert_called_once_with(
-            source_dir, embedding_model, config_path, output_dir, description
+            source_dir,
+            embedding_model,
+            config_path,
+            output_dir,
+            description,
+            mock_index_options.return_value,
         )
 
     @patch("haiven_cli.main.CliConfigService")
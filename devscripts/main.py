@@ -44,6 +44,13 @@ def app_test():
     subprocess.run(command, shell=True)
 
 
+# benchmarks the chat endpoints against the mock provider, arguments are passed on
+def app_benchmark():
+    command = ["poetry", "run", "python", "-m", "benchmarks.chat_endpoints"]
+    command.extend(sys.argv[1:])
+    subprocess.run(command, cwd="app", check=True)
+
+
 def app_coverage():
     command = """
     cd app && \
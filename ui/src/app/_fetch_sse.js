@@ -188,6 +188,16 @@ export const fetchSSE = async (uri, fetchOptions, options) => {
                     parseError,
                   );
                 }
+              } else if (eventType === "metadata" && eventData) {
+                try {
+                  options.onMetadata?.(JSON.parse(eventData));
+                } catch (parseError) {
+                  console.log(
+                    "Failed to parse metadata:",
+                    eventData,
+                    parseError,
+                  );
+                }
               }
             } else {
               // Handle regular text content or JSON objects